@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 
@@ -42,11 +43,15 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Первым, чтобы total в Server-Timing включал остальные middleware
+    'finance.instrumentation.RequestProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    # Пользователь запроса для маршрутизации по шардам (после аутентификации)
+    'finance.sharding.ShardMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -55,7 +60,8 @@ ROOT_URLCONF = 'fin_tracker.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # Шаблоны Django с замером времени рендеринга для Server-Timing
+        'BACKEND': 'finance.instrumentation.TimedDjangoTemplates',
         'DIRS': [BASE_DIR / 'templates']
         ,
         'APP_DIRS': True,
@@ -75,13 +81,74 @@ WSGI_APPLICATION = 'fin_tracker.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# Профиль БД: FIN_TRACKER_DB_PROFILE=production включает настройки SQLite для
+# конкурентной нагрузки (см. SQLITE_PRODUCTION_OPTIONS)
+DB_PROFILE = os.environ.get('FIN_TRACKER_DB_PROFILE', 'development')
+
+# Pragma выполняются на каждом новом соединении: WAL (читатели не блокируют
+# писателя), ожидание блокировки вместо немедленной ошибки, synchronous=NORMAL
+# (в режиме WAL безопасно), кеш страниц 64 МиБ и mmap 256 МиБ.
+# transaction_mode=IMMEDIATE — atomic() сразу берёт блокировку записи;
+# FIN_TRACKER_SQLITE_TRANSACTION_MODE=DEFERRED возвращает поведение SQLite по умолчанию
+SQLITE_PRODUCTION_OPTIONS = {
+    'init_command': (
+        'PRAGMA journal_mode=WAL;'
+        'PRAGMA busy_timeout=5000;'
+        'PRAGMA synchronous=NORMAL;'
+        'PRAGMA cache_size=-65536;'
+        'PRAGMA mmap_size=268435456'
+    ),
+    'transaction_mode': os.environ.get('FIN_TRACKER_SQLITE_TRANSACTION_MODE', 'IMMEDIATE'),
+}
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        # Встроенный бэкенд sqlite3 + init_command и transaction_mode в OPTIONS
+        'ENGINE': 'fin_tracker.sqlite_backend',
         'NAME': BASE_DIR / 'db.sqlite3',
     }
 }
 
+if DB_PROFILE == 'production':
+    DATABASES['default'].update({
+        'OPTIONS': SQLITE_PRODUCTION_OPTIONS,
+        # Постоянные соединения с проверкой перед повторным использованием
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+    })
+
+# Шарды для данных finance (finance.sharding): FIN_TRACKER_SHARDS=4 добавляет
+# базы shard_0…shard_3 с теми же настройками, что и основная. auth, сессии и
+# каталог шардов остаются в основной базе
+FINANCE_SHARDS = [f'shard_{i}' for i in range(int(os.environ.get('FIN_TRACKER_SHARDS', '0')))]
+for _alias in FINANCE_SHARDS:
+    DATABASES[_alias] = {**DATABASES['default'], 'NAME': BASE_DIR / f'db_{_alias}.sqlite3'}
+
+# Реплики для чтения (finance.replicas): FIN_TRACKER_REPLICAS=1 добавляет к
+# основной базе и каждому шарду копию <алиас>_replica только для чтения. Её
+# обновляет manage.py refresh_replicas; дашборд, аналитика, графики и список
+# операций читают из реплики, запись и остальные запросы — из основной базы
+SQLITE_REPLICA_OPTIONS = {
+    'init_command': (
+        'PRAGMA busy_timeout=5000;'
+        'PRAGMA query_only=ON;'
+        'PRAGMA cache_size=-65536;'
+        'PRAGMA mmap_size=268435456'
+    ),
+}
+FINANCE_REPLICAS = {}
+if os.environ.get('FIN_TRACKER_REPLICAS') == '1':
+    for _alias in ['default', *FINANCE_SHARDS]:
+        FINANCE_REPLICAS[_alias] = f'{_alias}_replica'
+        DATABASES[f'{_alias}_replica'] = {
+            **DATABASES[_alias],
+            'NAME': BASE_DIR / f'db_{_alias}_replica.sqlite3',
+            'OPTIONS': SQLITE_REPLICA_OPTIONS,
+            'TEST': {'MIRROR': _alias},
+        }
+
+DATABASE_ROUTERS = ['finance.replicas.ReplicaRouter', 'finance.sharding.ShardRouter']
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -123,10 +190,102 @@ STATICFILES_DIRS = [
     BASE_DIR / "static",
 ]
 
+# Загруженные файлы (выписки, ждущие фонового импорта); наружу не раздаются
+MEDIA_ROOT = os.environ.get("FIN_TRACKER_MEDIA_ROOT", BASE_DIR / "media")
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 LOGIN_REDIRECT_URL = "finance:dashboard"
 LOGOUT_REDIRECT_URL = "login"
-LOGIN_URL = "login"
\ No newline at end of file
+LOGIN_URL = "login"
+
+# Список операций: размер страницы по умолчанию и максимум для ?per_page=
+FINANCE_TRANSACTIONS_PAGE_SIZE = 50
+FINANCE_TRANSACTIONS_MAX_PAGE_SIZE = 200
+
+# Выгрузка операций: сколько строк читать из БД за один раз
+FINANCE_EXPORT_CHUNK_SIZE = 2000
+
+# Импорт выписок: размер пачки для bulk_create
+FINANCE_IMPORT_BATCH_SIZE = 1000
+
+# Кеш. Подойдёт любой бэкенд Django, например
+# 'django.core.cache.backends.filebased.FileBasedCache' с LOCATION = BASE_DIR / 'cache'
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'fin-tracker',
+    }
+}
+
+# Кеш аналитики: алиас из CACHES и время жизни записей (сек)
+FINANCE_CACHE_ALIAS = 'default'
+FINANCE_CACHE_TIMEOUT = 60 * 60
+
+# Профилирование запросов (finance.instrumentation): заголовок Server-Timing
+# и журнал finance.slow_requests для запросов дольше FINANCE_SLOW_REQUEST_MS,
+# с числом SQL от FINANCE_SLOW_REQUEST_QUERIES или с одним SQL, повторённым
+# FINANCE_REPEATED_QUERY_THRESHOLD раз и больше (признак N+1)
+FINANCE_SERVER_TIMING = True
+FINANCE_SLOW_REQUEST_MS = 500
+FINANCE_SLOW_REQUEST_QUERIES = 50
+FINANCE_REPEATED_QUERY_THRESHOLD = 5
+
+# Бюджеты: пороги использования лимита (%), при пересечении которых
+# выставляется предупреждение
+FINANCE_BUDGET_THRESHOLDS = (80, 100)
+
+# Фоновое удаление аккаунтов и категорий (finance.deletion): строк в одной
+# транзакции, пауза между пачками (сек) для остальных писателей и запуск в
+# потоке веб-процесса (False — задачи выполняет только run_deletions)
+FINANCE_DELETION_BATCH_SIZE = 1000
+FINANCE_DELETION_PAUSE = 0.05
+FINANCE_DELETION_IN_PROCESS = True
+
+# Архив операций (finance.archive): переносятся только операции старше
+# FINANCE_ARCHIVE_MIN_AGE_DAYS — запросы за более поздние периоды читают
+# только основную таблицу; строк в одной транзакции переноса
+FINANCE_ARCHIVE_MIN_AGE_DAYS = 365
+FINANCE_ARCHIVE_BATCH_SIZE = 1000
+
+# Шарды: сколько секунд процесс помнит запись каталога (и сколько ждёт
+# перенос после её изменения) и строк в одной пачке переноса
+FINANCE_SHARD_DIRECTORY_TIMEOUT = 30
+FINANCE_SHARD_MOVE_BATCH_SIZE = 1000
+
+# Реплики: сколько секунд после изменения данных пользователь читает из
+# основной базы, допустимое отставание снимка реплики и период refresh_replicas
+FINANCE_REPLICA_STICKY_SECONDS = 30
+FINANCE_REPLICA_MAX_LAG_SECONDS = 30
+FINANCE_REPLICA_REFRESH_INTERVAL = 10
+
+# Фоновые задачи (finance.jobs): попыток до «Ошибки», задержка перед повтором
+# (сек, удваивается с каждой попыткой до максимума), через сколько секунд
+# задачу молчащего исполнителя может взять другой, пауза опроса пустой очереди
+# и пул run_finance_worker по умолчанию. FINANCE_JOBS_IN_PROCESS — выполнять
+# новую задачу и её повторы в потоке веб-процесса (False — только
+# run_finance_worker). Задачи процесса, перезапущенного посреди работы,
+# подбирает только run_finance_worker — в production он нужен в любом случае
+FINANCE_JOB_MAX_ATTEMPTS = 5
+FINANCE_JOB_RETRY_DELAY = 5
+FINANCE_JOB_MAX_RETRY_DELAY = 600
+FINANCE_JOB_TIMEOUT = 30 * 60
+FINANCE_JOB_POLL_INTERVAL = 1.0
+FINANCE_JOB_WORKER_PROCESSES = 1
+FINANCE_JOB_WORKER_THREADS = 2
+FINANCE_JOBS_IN_PROCESS = True
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'finance.slow_requests': {'handlers': ['console'], 'level': 'WARNING', 'propagate': False},
+        'finance.deletion': {'handlers': ['console'], 'level': 'WARNING', 'propagate': False},
+        'finance.jobs': {'handlers': ['console'], 'level': 'WARNING', 'propagate': False},
+    },
+}
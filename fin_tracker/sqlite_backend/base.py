@@ -0,0 +1,62 @@
+"""
+Бэкенд SQLite с настройками соединения из OPTIONS.
+
+Поддерживает те же ключи, что и встроенный бэкенд Django 5.1+:
+
+- "init_command" — SQL (обычно PRAGMA через «;»), выполняемый на каждом
+  новом соединении;
+- "transaction_mode" — режим BEGIN для atomic(): DEFERRED, IMMEDIATE или
+  EXCLUSIVE. IMMEDIATE берёт блокировку записи в начале транзакции, и
+  ожидание busy_timeout срабатывает сразу, а не при первой записи, когда
+  SQLite уже не может подождать и отвечает «database is locked».
+
+Остальные ключи OPTIONS передаются в sqlite3.connect() как обычно.
+"""
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.sqlite3 import base
+from django.utils.asyncio import async_unsafe
+from django.utils.functional import cached_property
+
+TRANSACTION_MODES = frozenset(["DEFERRED", "EXCLUSIVE", "IMMEDIATE"])
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    @cached_property
+    def init_command(self):
+        return self.settings_dict["OPTIONS"].get("init_command")
+
+    @cached_property
+    def transaction_mode(self):
+        mode = self.settings_dict["OPTIONS"].get("transaction_mode")
+        if mode is None:
+            return None
+        mode = mode.upper()
+        if mode not in TRANSACTION_MODES:
+            raise ImproperlyConfigured(
+                "settings.DATABASES is improperly configured. transaction_mode "
+                f"must be one of {', '.join(sorted(TRANSACTION_MODES))} or None."
+            )
+        return mode
+
+    def get_connection_params(self):
+        kwargs = super().get_connection_params()
+        self.transaction_mode  # проверка значения до открытия соединения
+        # Это настройки обёртки, а не аргументы sqlite3.connect()
+        kwargs.pop("init_command", None)
+        kwargs.pop("transaction_mode", None)
+        return kwargs
+
+    @async_unsafe
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        if self.init_command:
+            for statement in self.init_command.split(";"):
+                if statement.strip():
+                    conn.execute(statement)
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        if self.transaction_mode is None:
+            super()._start_transaction_under_autocommit()
+        else:
+            self.cursor().execute(f"BEGIN {self.transaction_mode}")
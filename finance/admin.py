@@ -1,18 +1,104 @@
-from django.contrib import admin
-from .models import Category, Transaction, Goal
+from decimal import Decimal
 
+from django.contrib import admin, messages
+from django.contrib.auth.admin import UserAdmin
+from django.contrib.auth.models import User
+from django.db.models import Q
+
+from .admin_tools import AutocompleteFilter, LargeTableAdmin
+from .deletion import schedule_category_deletion, schedule_user_deletion
+from .goals import save_goal
+from .models import Budget, BudgetSpend, Category, DeletionTask, Job, Transaction, TransactionSearch, Goal, GoalContribution
+from .search import match_expression
+
+
+# Списки админки рассчитаны на миллионы строк (см. finance/admin_tools.py):
+# связанные объекты строк — одним JOIN, пользователи и категории в фильтрах и
+# формах — через автодополнение, а не полным списком в каждой странице
 
 @admin.register(Category)
-class CategoryAdmin(admin.ModelAdmin):
+class CategoryAdmin(LargeTableAdmin):
     list_display = ("id", "name", "user", "is_income")
-    list_filter = ("is_income", "user")
+    list_filter = ("is_income", ("user", AutocompleteFilter))
+    list_select_related = ("user",)
+    autocomplete_fields = ("user",)
     search_fields = ("name", "user__username")
     list_display_links = ("id", "name")
     ordering = ("user", "name")
+    actions = ("delete_in_background",)
+
+    def get_actions(self, request):
+        # Стандартное удаление собирает в память все операции категорий
+        actions = super().get_actions(request)
+        actions.pop("delete_selected", None)
+        return actions
+
+    @admin.action(description="Удалить в фоне пачками", permissions=["delete"])
+    def delete_in_background(self, request, queryset):
+        for category in queryset:
+            schedule_category_deletion(category)
+        self.message_user(request, f"Поставлено в очередь удалений: {len(queryset)}.", messages.INFO)
+
+
+# Удаление пользователей с большой историей — тоже пачками в фоне
+admin.site.unregister(User)
+
+
+@admin.register(User)
+class FinanceUserAdmin(UserAdmin):
+    actions = ("delete_in_background",)
+
+    def get_actions(self, request):
+        actions = super().get_actions(request)
+        actions.pop("delete_selected", None)
+        return actions
+
+    @admin.action(description="Удалить в фоне пачками", permissions=["delete"])
+    def delete_in_background(self, request, queryset):
+        for user in queryset:
+            schedule_user_deletion(user)
+        self.message_user(request, f"Поставлено в очередь удалений: {len(queryset)}.", messages.INFO)
+
+
+# Ход фоновых удалений; задачи создаются действиями выше и страницами сайта
+@admin.register(DeletionTask)
+class DeletionTaskAdmin(admin.ModelAdmin):
+    list_display = ("id", "kind", "label", "user", "status", "processed", "total", "progress_display", "updated_at")
+    list_filter = ("kind", "status")
+    list_select_related = ("user",)
+    ordering = ("-id",)
+    readonly_fields = [field.name for field in DeletionTask._meta.fields]
+
+    def progress_display(self, obj):
+        return f"{obj.progress_percent:.1f}%"
+
+    progress_display.short_description = "Прогресс"
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+# Очередь фоновых задач; задачи ставят страницы сайта, выполняет run_finance_worker
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ("id", "kind", "user", "status", "attempts", "run_at", "locked_by", "updated_at")
+    list_filter = ("kind", "status")
+    list_select_related = ("user",)
+    ordering = ("-id",)
+    readonly_fields = [field.name for field in Job._meta.fields]
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
 
 
 @admin.register(Transaction)
-class TransactionAdmin(admin.ModelAdmin):
+class TransactionAdmin(LargeTableAdmin):
     list_display = (
         "id",
         "user",
@@ -22,11 +108,15 @@ class TransactionAdmin(admin.ModelAdmin):
         "date",
         "description_short",
     )
-    list_filter = ("type", "category", "date", "user")
+    # Вместо date_hierarchy — фильтр по периоду: он не запрашивает годы и
+    # месяцы по всей таблице
+    list_filter = ("type", ("user", AutocompleteFilter), ("category", AutocompleteFilter), "date")
+    list_select_related = ("user", "category")
+    autocomplete_fields = ("user", "category")
     search_fields = ("description", "user__username", "category__name")
     list_display_links = ("id", "description_short")
-    date_hierarchy = "date"
-    ordering = ("-date", "-id")
+    # Новые операции — по первичному ключу, без сортировки всей таблицы по дате
+    ordering = ("-id",)
 
     def description_short(self, obj):
         if not obj.description:
@@ -37,9 +127,33 @@ class TransactionAdmin(admin.ModelAdmin):
 
     description_short.short_description = "Описание"
 
+    def get_search_results(self, request, queryset, search_term):
+        # Описание и категория ищутся по индексу FTS5 (finance/search.py),
+        # а не LIKE по всей таблице операций; имя пользователя — по таблице
+        # пользователей, затем операции по индексу user_id
+        expression = match_expression(search_term)
+        if expression is None:
+            return super().get_search_results(request, queryset, search_term)
+        matches = TransactionSearch.objects.filter(document__match=expression).values("transaction_id")
+        users = User.objects.filter(username__icontains=search_term.strip()).values("pk")
+        return queryset.filter(Q(pk__in=matches) | Q(user__in=users)), False
+
+
+# Журнал взносов только для просмотра: он дополняется лишь через finance.goals
+class GoalContributionInline(admin.TabularInline):
+    model = GoalContribution
+    fields = ("created_at", "amount")
+    readonly_fields = ("created_at", "amount")
+    extra = 0
+    can_delete = False
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
 
 @admin.register(Goal)
-class GoalAdmin(admin.ModelAdmin):
+class GoalAdmin(LargeTableAdmin):
+    inlines = (GoalContributionInline,)
     list_display = (
         "id",
         "name",
@@ -51,10 +165,12 @@ class GoalAdmin(admin.ModelAdmin):
         "created_at",
         "is_completed",
     )
-    list_filter = ("user", "deadline", "created_at")
+    list_filter = (("user", AutocompleteFilter), "deadline", "created_at")
+    list_select_related = ("user",)
+    autocomplete_fields = ("user",)
     search_fields = ("name", "user__username")
     list_display_links = ("id", "name")
-    ordering = ("-created_at",)
+    ordering = ("-id",)
 
     readonly_fields = ("progress_percent_display", "is_completed")
 
@@ -74,3 +190,34 @@ class GoalAdmin(admin.ModelAdmin):
         return f"{obj.progress_percent:.1f}%"
 
     progress_percent_display.short_description = "Прогресс"
+
+    def save_model(self, request, obj, form, change):
+        # Ручная правка накоплений записывается в журнал взносом-исправлением
+        previous = form.initial.get("current_amount") if change else None
+        save_goal(obj, Decimal(previous or 0))
+
+
+# Счётчики бюджета только для просмотра: их ведут сигналы операций, а
+# исправляет команда reconcile_budgets
+class BudgetSpendInline(admin.TabularInline):
+    model = BudgetSpend
+    fields = ("period_start", "spent", "alert_level", "alerted_at")
+    readonly_fields = fields
+    ordering = ("-period_start",)
+    extra = 0
+    can_delete = False
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(Budget)
+class BudgetAdmin(LargeTableAdmin):
+    inlines = (BudgetSpendInline,)
+    list_display = ("id", "category", "user", "period", "limit", "created_at")
+    list_filter = ("period", ("user", AutocompleteFilter))
+    list_select_related = ("user", "category")
+    autocomplete_fields = ("user", "category")
+    search_fields = ("category__name", "user__username")
+    list_display_links = ("id", "category")
+    ordering = ("-id",)
@@ -0,0 +1,125 @@
+"""
+Инструменты админки для больших таблиц.
+
+- ApproximateCountPaginator не считает точный COUNT(*) по всей таблице: для
+  списка без фильтров берёт оценку числа строк из статистики SQLite, а для
+  отфильтрованного считает не дальше count_limit строк.
+- AutocompleteFilter — фильтр по связанной модели через автодополнение
+  админки: при открытии списка варианты не загружаются, запрос к БД — только
+  за подписью выбранного значения.
+- LargeTableAdmin собирает эти настройки для ModelAdmin.
+"""
+from django import forms
+from django.contrib import admin
+from django.contrib.admin.widgets import AutocompleteSelect
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+from django.utils.translation import gettext as _
+
+
+def estimated_row_count(model, using):
+    """
+    Примерное число строк таблицы без её просмотра: из sqlite_stat1 (после
+    ANALYZE или PRAGMA optimize), иначе по максимальному первичному ключу.
+    None — оценить нельзя.
+    """
+    connection = connections[using]
+    if connection.vendor != "sqlite":
+        return None
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1'")
+        if cursor.fetchone():
+            # Первое число stat — строк в индексе, то есть в таблице
+            cursor.execute("SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1", [table])
+            row = cursor.fetchone()
+            if row:
+                return int(row[0].split()[0])
+        if model._meta.pk.get_internal_type() in ("AutoField", "BigAutoField"):
+            cursor.execute(f'SELECT MAX("{model._meta.pk.column}") FROM "{table}"')
+            return cursor.fetchone()[0] or 0
+    return None
+
+
+class ApproximateCountPaginator(Paginator):
+    # Точнее не считаем: дальше этой строки в отфильтрованных списках не листают
+    count_limit = 10_000
+
+    @cached_property
+    def count(self):
+        qs = self.object_list
+        if not qs.query.where:
+            estimate = estimated_row_count(qs.model, qs.db)
+            if estimate is not None and estimate > self.count_limit:
+                return estimate
+        # COUNT по подзапросу с LIMIT просматривает не больше count_limit строк
+        return qs.order_by()[: self.count_limit].count()
+
+
+class AutocompleteFilter(admin.FieldListFilter):
+    """
+    Фильтр по внешнему ключу с полем автодополнения (select2 админки). У
+    ModelAdmin связанной модели должны быть search_fields.
+    """
+
+    template = "admin/finance/autocomplete_filter.html"
+
+    def __init__(self, field, request, params, model, model_admin, field_path):
+        self.lookup_kwarg = f"{field_path}__{field.target_field.name}__exact"
+        self.lookup_kwarg_isnull = f"{field_path}__isnull"
+        super().__init__(field, request, params, model, model_admin, field_path)
+        self.title = field.verbose_name
+        value = self.used_parameters.get(self.lookup_kwarg)
+        self.lookup_val = value[-1] if isinstance(value, list) else value
+        self.form_field = forms.ModelChoiceField(
+            queryset=field.remote_field.model._default_manager.all(),
+            required=False,
+            widget=AutocompleteSelect(field, model_admin.admin_site, attrs={"style": "width: 100%"}),
+        )
+
+    def expected_parameters(self):
+        return [self.lookup_kwarg, self.lookup_kwarg_isnull]
+
+    def choices(self, changelist):
+        # Адрес списка без этого фильтра — к нему скрипт шаблона добавляет выбранное значение
+        self.base_query_string = changelist.get_query_string(
+            remove=[self.lookup_kwarg, self.lookup_kwarg_isnull, "p"]
+        )
+        yield {
+            "selected": self.lookup_val is None and self.lookup_kwarg_isnull not in self.used_parameters,
+            "query_string": changelist.get_query_string(remove=[self.lookup_kwarg, self.lookup_kwarg_isnull]),
+            "display": _("All"),
+        }
+        if self.field.null:
+            yield {
+                "selected": self.lookup_kwarg_isnull in self.used_parameters,
+                "query_string": changelist.get_query_string(
+                    {self.lookup_kwarg_isnull: "True"}, [self.lookup_kwarg]
+                ),
+                "display": changelist.model_admin.get_empty_value_display(),
+            }
+
+    def rendered_widget(self):
+        return self.form_field.widget.render(self.lookup_kwarg, self.lookup_val)
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """
+    ModelAdmin для таблиц на миллионы строк: приблизительное число строк,
+    без повторного COUNT(*) по всей таблице и без фасетов (COUNT на каждый
+    вариант фильтра). Фильтры по внешним ключам — через AutocompleteFilter.
+    """
+
+    paginator = ApproximateCountPaginator
+    show_full_result_count = False
+    show_facets = admin.ShowFacets.NEVER
+
+    @property
+    def media(self):
+        media = super().media
+        for list_filter in self.list_filter:
+            if isinstance(list_filter, tuple) and list_filter[1] is AutocompleteFilter:
+                field = self.model._meta.get_field(list_filter[0])
+                return media + AutocompleteSelect(field, self.admin_site).media
+        return media
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class FinanceConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'finance'
+
+    def ready(self):
+        # Регистрация обработчиков сигналов (поддержание сводок)
+        from . import signals  # noqa: F401
@@ -0,0 +1,126 @@
+"""
+Архив старых операций.
+
+archive_user переносит операции пользователя старше границы из Transaction в
+компактную таблицу ArchivedTransaction пачками в отдельных транзакциях.
+Помесячные сводки, итоги по дням и счётчики бюджетов при этом не меняются —
+они уже учитывают эти операции, поэтому графики по месяцам, список годов и
+суммы дашборда за архивные периоды остаются точными. Основная таблица и её
+индексы перестают расти вместе с возрастом установки.
+
+Отдельные операции за период, затрагивающий архив, читаются через
+представление TransactionHistory (UNION ALL обеих таблиц). В архив попадают
+только операции старше FINANCE_ARCHIVE_MIN_AGE_DAYS, поэтому запросы за более
+поздние периоды (текущий месяц и т. п.) по-прежнему читают одну основную
+таблицу — см. source().
+"""
+import re
+import time
+from datetime import date, timedelta
+from typing import Optional
+
+from django.conf import settings
+from django.db import transaction as db_transaction
+
+from .models import ArchivedTransaction, Transaction, TransactionHistory
+from .rollups import month_start
+from .sharding import db_for_user
+
+HISTORY_VIEW = TransactionHistory._meta.db_table
+
+# Общие столбцы обеих таблиц: архивная строка — копия исходной
+FIELDS = ("id", "user_id", "category_id", "type", "amount", "date", "description", "import_hash")
+
+_COLUMNS = ", ".join(f'"{name}"' for name in FIELDS)
+CREATE_VIEW = (
+    f'CREATE VIEW IF NOT EXISTS "{HISTORY_VIEW}" AS '
+    f'SELECT {_COLUMNS}, 0 AS "archived" FROM "{Transaction._meta.db_table}" '
+    f'UNION ALL SELECT {_COLUMNS}, 1 FROM "{ArchivedTransaction._meta.db_table}"'
+)
+DROP_VIEW = f'DROP VIEW IF EXISTS "{HISTORY_VIEW}"'
+
+_AGE = re.compile(r"^(\d+)([dmy])$")
+
+
+def install_view(connection) -> None:
+    # Миграции, пересоздающие таблицы (ALTER в SQLite), могут оставить
+    # представление со старым списком столбцов — пересоздаём после migrate
+    tables = connection.introspection.table_names()
+    if Transaction._meta.db_table not in tables or ArchivedTransaction._meta.db_table not in tables:
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(DROP_VIEW)
+        cursor.execute(CREATE_VIEW)
+
+
+def horizon(today: Optional[date] = None) -> date:
+    """Все архивные операции старше этой даты."""
+    return (today or date.today()) - timedelta(days=settings.FINANCE_ARCHIVE_MIN_AGE_DAYS)
+
+
+def source(date_from: Optional[date]):
+    """Модель для чтения операций с date_from: основная таблица, если период не затрагивает архив."""
+    if date_from is not None and date_from >= horizon():
+        return Transaction
+    return TransactionHistory
+
+
+def cutoff_for(older_than: str, today: Optional[date] = None) -> date:
+    """
+    Граница архива для возраста вида «400d», «18m» или «2y»: первое число
+    месяца, в который попадает дата «сегодня минус возраст». В архив уходят
+    операции строго раньше границы — целыми месяцами.
+    """
+    match = _AGE.match(older_than.strip().lower())
+    if match is None:
+        raise ValueError(f"Возраст «{older_than}» не распознан: ожидается число с d, m или y, например 18m")
+    count, unit = int(match.group(1)), match.group(2)
+    today = today or date.today()
+    if unit == "d":
+        return month_start(today - timedelta(days=count))
+    months = count * 12 if unit == "y" else count
+    index = today.year * 12 + today.month - 1 - months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def archive_user(
+    user_id: int,
+    before: date,
+    using: Optional[str] = None,
+    batch_size: Optional[int] = None,
+    pause: float = 0,
+) -> int:
+    """
+    Переносит операции пользователя с датой раньше before в архив. Каждая
+    пачка — INSERT в архив и DELETE из основной таблицы в одной короткой
+    транзакции. Возвращает число перенесённых операций.
+    """
+    if before > horizon():
+        raise ValueError(
+            f"Граница архива {before} позже {horizon()}: архивируются только операции "
+            f"старше {settings.FINANCE_ARCHIVE_MIN_AGE_DAYS} дн."
+        )
+    using = using or db_for_user(user_id)
+    batch_size = batch_size or settings.FINANCE_ARCHIVE_BATCH_SIZE
+    qs = (
+        Transaction.objects.using(using)
+        .filter(user_id=user_id, date__lt=before)
+        .order_by("date", "id")
+        .values_list(*FIELDS)
+    )
+    moved = 0
+    while True:
+        with db_transaction.atomic(using=using):
+            rows = list(qs[:batch_size])
+            if rows:
+                ArchivedTransaction.objects.using(using).bulk_create(
+                    [ArchivedTransaction(**dict(zip(FIELDS, row))) for row in rows]
+                )
+                # Без сигналов: сводки и итоги по дням должны остаться как есть.
+                # Строки поиска удаляют триггеры FTS
+                Transaction.objects.using(using).filter(pk__in=[row[0] for row in rows])._raw_delete(using)
+        moved += len(rows)
+        if len(rows) < batch_size:
+            return moved
+        if pause:
+            time.sleep(pause)
@@ -0,0 +1,246 @@
+"""
+Доходы и расходы нарастающим итогом по дням (DailyBalance).
+
+Сумма за любой период [date_from, date_to] — разность итогов на date_to и на
+день перед date_from: два поиска по индексу (user, day) одним запросом вместо
+SUM по операциям периода. Операция за день d меняет итоги дня d и всех следующих
+дней пользователя: операция «задним числом» сдвигает хвост таблицы одним
+UPDATE. Суммы хранятся в копейках.
+"""
+from datetime import date, timedelta
+from decimal import Decimal
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from django.db import IntegrityError, transaction as db_transaction
+from django.db.models import F, OuterRef, Q, Subquery, Sum, Value
+
+from . import archive
+from .models import DailyBalance, TransactionHistory
+from .rollups import CENTS
+
+BalanceKey = Tuple[int, date]
+# Доходы и расходы нарастающим итогом, в копейках
+Totals = Tuple[int, int]
+
+ZERO: Totals = (0, 0)
+
+
+def to_cents(amount) -> int:
+    return int((Decimal(amount) * 100).quantize(Decimal("1")))
+
+
+def from_cents(cents: int) -> Decimal:
+    return (Decimal(cents) / 100).quantize(CENTS)
+
+
+def _state_delta(state: Dict, sign: int) -> Totals:
+    cents = sign * to_cents(state["amount"])
+    return (cents, 0) if state["type"] == "income" else (0, cents)
+
+
+def _cumulative_qs(user_id: int, day: date, using: Optional[str]):
+    return (
+        DailyBalance.objects.using(using)
+        .filter(user_id=user_id, day__lte=day)
+        .order_by("-day")
+        .values_list("income", "expense")
+    )
+
+
+def cumulative(user_id: int, day: Optional[date], using: Optional[str] = None) -> Totals:
+    """Итоги на конец дня day (None — до первой операции)."""
+    if day is None:
+        return ZERO
+    return _cumulative_qs(user_id, day, using).first() or ZERO
+
+
+def _range_qs(user_id: int, date_from: Optional[date], date_to: Optional[date], using: Optional[str]):
+    # Итоги на конец периода и (подзапросом) на день перед его началом —
+    # два поиска по индексу (user, day) одним запросом
+    end = _cumulative_qs(user_id, date_to or date.max, using)
+    if date_from is None:
+        return end.annotate(start_income=Value(0), start_expense=Value(0)).values_list(
+            "income", "expense", "start_income", "start_expense"
+        )
+    start = DailyBalance.objects.filter(user_id=OuterRef("user_id"), day__lt=date_from).order_by("-day")
+    return end.annotate(
+        start_income=Subquery(start.values("income")[:1]),
+        start_expense=Subquery(start.values("expense")[:1]),
+    ).values_list("income", "expense", "start_income", "start_expense")
+
+
+def _difference(row: Optional[Tuple]) -> Tuple[Decimal, Decimal]:
+    # Нет строки на конец периода — до него операций не было вовсе
+    income, expense, start_income, start_expense = row or (0, 0, 0, 0)
+    return from_cents(income - (start_income or 0)), from_cents(expense - (start_expense or 0))
+
+
+def range_totals(
+    user_id: int, date_from: Optional[date], date_to: Optional[date], using: Optional[str] = None
+) -> Tuple[Decimal, Decimal]:
+    """Доходы и расходы пользователя за период (границы включительно)."""
+    if date_from is not None and date_to is not None and date_from > date_to:
+        return Decimal("0.00"), Decimal("0.00")
+    return _difference(_range_qs(user_id, date_from, date_to, using).first())
+
+
+async def arange_totals(
+    user_id: int, date_from: Optional[date], date_to: Optional[date], using: Optional[str] = None
+) -> Tuple[Decimal, Decimal]:
+    if date_from is not None and date_to is not None and date_from > date_to:
+        return Decimal("0.00"), Decimal("0.00")
+    return _difference(await _range_qs(user_id, date_from, date_to, using).afirst())
+
+
+def apply_delta(using: str, user_id: int, day: date, income: int, expense: int) -> None:
+    """Прибавляет суммы (в копейках) к итогам дня day и всех следующих дней."""
+    if not income and not expense:
+        return
+    rows = DailyBalance.objects.using(using).filter(user_id=user_id)
+    if income >= 0 and expense >= 0 and not rows.filter(day=day).exists():
+        # Первая операция дня: строка начинается с итогов предыдущего дня
+        # и дальше сдвигается вместе с хвостом. При вычитании строка дня уже
+        # есть — или удалена каскадом вместе с пользователем, тогда не нужна
+        previous_income, previous_expense = cumulative(user_id, day - timedelta(days=1), using)
+        try:
+            with db_transaction.atomic(using=using):
+                DailyBalance.objects.using(using).create(
+                    user_id=user_id, day=day, income=previous_income, expense=previous_expense
+                )
+        except IntegrityError:
+            # Строку успел создать параллельный запрос
+            pass
+    rows.filter(day__gte=day).update(income=F("income") + income, expense=F("expense") + expense)
+
+
+def record_change(using: str, previous: Optional[Dict], current: Optional[Dict]) -> None:
+    """
+    Переносит изменение операции в итоги: previous — состояние до изменения
+    (None для новой операции), current — после (None для удалённой).
+    Состояния — как в rollups.transaction_state.
+    """
+    if previous is not None and current is not None:
+        if (previous["user_id"], previous["date"], previous["type"]) == (current["user_id"], current["date"], current["type"]):
+            delta = _state_delta(current, 1)
+            old = _state_delta(previous, 1)
+            apply_delta(using, current["user_id"], current["date"], delta[0] - old[0], delta[1] - old[1])
+            return
+    if previous is not None:
+        apply_delta(using, previous["user_id"], previous["date"], *_state_delta(previous, -1))
+    if current is not None:
+        apply_delta(using, current["user_id"], current["date"], *_state_delta(current, 1))
+
+
+def _running(qs, bases: Optional[Dict[int, Totals]] = None) -> Iterator[Tuple[BalanceKey, Totals]]:
+    """
+    Итоги на конец каждого дня с операциями из qs: суммы по дням одним
+    GROUP BY, нарастающий итог — по порядку (пользователь, день), начиная
+    с bases[user_id] (по умолчанию с нуля).
+    """
+    rows = (
+        qs.values("user_id", "date")
+        .annotate(income=Sum("amount", filter=Q(type="income")), expense=Sum("amount", filter=Q(type="expense")))
+        .order_by("user_id", "date")
+    )
+    bases = bases or {}
+    user_id, income, expense = None, 0, 0
+    for row in rows.iterator(chunk_size=2000):
+        if row["user_id"] != user_id:
+            user_id = row["user_id"]
+            income, expense = bases.get(user_id, ZERO)
+        # SUM в SQLite считается в float — в копейки с округлением
+        income += to_cents(row["income"] or 0)
+        expense += to_cents(row["expense"] or 0)
+        yield (user_id, row["date"]), (income, expense)
+
+
+def rebuild_from(using: str, user_id: int, day: date, batch_size: int = 1000) -> int:
+    """Пересчитывает итоги пользователя с дня day по операциям. Возвращает число строк."""
+    with db_transaction.atomic(using=using):
+        base = cumulative(user_id, day - timedelta(days=1), using)
+        DailyBalance.objects.using(using).filter(user_id=user_id, day__gte=day).delete()
+        qs = archive.source(day).objects.using(using).filter(user_id=user_id, date__gte=day)
+        objs = [
+            DailyBalance(user_id=user_id, day=key[1], income=totals[0], expense=totals[1])
+            for key, totals in _running(qs, {user_id: base})
+        ]
+        DailyBalance.objects.using(using).bulk_create(objs, batch_size=batch_size)
+    return len(objs)
+
+
+def record_bulk(using: str, states: Iterable[Dict], sign: int = 1) -> None:
+    """
+    Учитывает пачку операций, вставленных или удалённых в обход сигналов.
+    Операции одного дня сдвигают хвост одним UPDATE; если дней много,
+    хвост пользователя пересчитывается с самого раннего из них — так дешевле,
+    чем сдвигать его много раз.
+    """
+    deltas: Dict[int, Dict[date, Totals]] = {}
+    for state in states:
+        days = deltas.setdefault(state["user_id"], {})
+        income, expense = days.get(state["date"], ZERO)
+        delta = _state_delta(state, sign)
+        days[state["date"]] = (income + delta[0], expense + delta[1])
+    for user_id, days in deltas.items():
+        if len(days) > 1:
+            rebuild_from(using, user_id, min(days))
+        else:
+            for day, (income, expense) in days.items():
+                apply_delta(using, user_id, day, income, expense)
+
+
+def compute(using: str, user_ids: Optional[Iterable[int]] = None) -> Dict[BalanceKey, Totals]:
+    """Итоги по дням заново по исходным операциям, включая архивные."""
+    qs = TransactionHistory.objects.using(using).all()
+    if user_ids is not None:
+        qs = qs.filter(user_id__in=list(user_ids))
+    return dict(_running(qs))
+
+
+def stored(using: str, user_ids: Optional[Iterable[int]] = None) -> Dict[BalanceKey, Totals]:
+    qs = DailyBalance.objects.using(using).all()
+    if user_ids is not None:
+        qs = qs.filter(user_id__in=list(user_ids))
+    return {
+        (row["user_id"], row["day"]): (row["income"], row["expense"])
+        for row in qs.values("user_id", "day", "income", "expense").iterator(chunk_size=2000)
+    }
+
+
+def verify(using: str, user_ids: Optional[Iterable[int]] = None) -> List[Tuple[BalanceKey, Totals, Optional[Totals]]]:
+    """
+    Расхождения (ключ, ожидаемое, сохранённое). Строка дня, операции которого
+    удалены, остаётся с итогами предыдущего дня — это не расхождение.
+    """
+    user_ids = list(user_ids) if user_ids is not None else None
+    expected = compute(using, user_ids)
+    actual = stored(using, user_ids)
+    mismatches = []
+    current_user, running = None, ZERO
+    for key in sorted(set(expected) | set(actual)):
+        if key[0] != current_user:
+            current_user, running = key[0], ZERO
+        running = expected.get(key, running)
+        if actual.get(key) != running:
+            mismatches.append((key, running, actual.get(key)))
+    return mismatches
+
+
+def rebuild(using: str, user_ids: Optional[Iterable[int]] = None, batch_size: int = 1000) -> int:
+    """Пересобирает итоги по исходным операциям. Возвращает число строк."""
+    user_ids = list(user_ids) if user_ids is not None else None
+    with db_transaction.atomic(using=using):
+        existing = DailyBalance.objects.using(using).all()
+        qs = TransactionHistory.objects.using(using).all()
+        if user_ids is not None:
+            existing = existing.filter(user_id__in=user_ids)
+            qs = qs.filter(user_id__in=user_ids)
+        existing.delete()
+        count, batch = 0, []
+        for (user_id, day), (income, expense) in _running(qs):
+            batch.append(DailyBalance(user_id=user_id, day=day, income=income, expense=expense))
+            if len(batch) >= batch_size:
+                DailyBalance.objects.using(using).bulk_create(batch)
+                count, batch = count + len(batch), []
+        DailyBalance.objects.using(using).bulk_create(batch)
+    return count + len(batch)
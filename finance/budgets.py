@@ -0,0 +1,295 @@
+"""
+Счётчики расходов по бюджетам (BudgetSpend).
+
+Как и помесячные сводки (finance/rollups.py), счётчик периода обновляется
+дельтой при каждом создании, изменении и удалении расходной операции — одним
+UPDATE, который тем же запросом выставляет пройденный порог лимита. Строка
+периода создаётся при первой операции в нём и сразу заполняется суммой
+операций периода, поэтому счётчик верен и для бюджета, заведённого посреди
+месяца, и для операций задним числом.
+"""
+from datetime import date
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import IntegrityError, transaction as db_transaction
+from django.db.models import Case, DateField, DateTimeField, DecimalField, F, OuterRef, PositiveSmallIntegerField, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce, TruncMonth
+from django.db.models.lookups import GreaterThanOrEqual
+from django.utils import timezone
+
+from . import archive
+from .models import Budget, BudgetSpend, TransactionHistory
+from .rollups import CENTS
+from .services import WeekStart, next_period, period_start
+
+SpendKey = Tuple[int, date]
+
+
+def thresholds() -> List[int]:
+    return sorted(settings.FINANCE_BUDGET_THRESHOLDS)
+
+
+def level_for(spent: Decimal, limit: Decimal) -> int:
+    """Наибольший порог (в процентах лимита), который прошла сумма spent."""
+    return max((t for t in thresholds() if spent * 100 >= limit * t), default=0)
+
+
+def _threshold_amount(limit: Decimal, threshold: int) -> Value:
+    return Value((limit * threshold / 100).quantize(CENTS))
+
+
+def _level_expression(spent, limit: Decimal) -> Case:
+    return Case(
+        *[
+            When(GreaterThanOrEqual(spent, _threshold_amount(limit, t)), then=Value(t))
+            for t in reversed(thresholds())
+        ],
+        default=Value(0),
+        output_field=PositiveSmallIntegerField(),
+    )
+
+
+def _alerted_expression(spent, limit: Decimal, now) -> Case:
+    # Время меняется, только если пройден порог выше прежнего; alert_level
+    # справа в SET — значение до этого UPDATE
+    return Case(
+        *[
+            When(GreaterThanOrEqual(spent, _threshold_amount(limit, t)), alert_level__lt=t, then=Value(now))
+            for t in reversed(thresholds())
+        ],
+        default=F("alerted_at"),
+        output_field=DateTimeField(),
+    )
+
+
+def _relevant(state: Optional[Dict]) -> bool:
+    return state is not None and state["type"] == "expense" and state["category_id"] is not None
+
+
+def _budgets_for(using: str, pairs: Iterable[Tuple[int, int]]) -> Dict[Tuple[int, int], List[Budget]]:
+    # Бюджеты пар (пользователь, категория) одним запросом
+    result = {pair: [] for pair in pairs}
+    if not result:
+        return result
+    rows = Budget.objects.using(using).filter(
+        user_id__in={user_id for user_id, _ in result},
+        category_id__in={category_id for _, category_id in result},
+    ).only("user_id", "category_id", "period", "limit")
+    for budget in rows:
+        pair = (budget.user_id, budget.category_id)
+        if pair in result:
+            result[pair].append(budget)
+    return result
+
+
+def spent_in_period(using: str, budget: Budget, start: date) -> Decimal:
+    """Сумма расходов категории бюджета за период с началом start — по операциям."""
+    total = archive.source(start).objects.using(using).filter(
+        user_id=budget.user_id,
+        category_id=budget.category_id,
+        type="expense",
+        date__gte=start,
+        date__lt=next_period(start, budget.period),
+    ).aggregate(total=Sum("amount"))["total"]
+    return Decimal(total or 0).quantize(CENTS)
+
+
+def _set_from_transactions(using: str, budget: Budget, start: date) -> None:
+    # Строки периода нет — заводим её сразу с суммой операций периода.
+    # Если её успел создать параллельный запрос, пересчитываем по операциям
+    # ещё раз: к этому моменту обе операции уже в таблице
+    spent = spent_in_period(using, budget, start)
+    level = level_for(spent, budget.limit)
+    try:
+        with db_transaction.atomic(using=using):
+            BudgetSpend.objects.using(using).create(
+                budget_id=budget.pk,
+                period_start=start,
+                spent=spent,
+                alert_level=level,
+                alerted_at=timezone.now() if level else None,
+            )
+    except IntegrityError:
+        rows = BudgetSpend.objects.using(using).filter(budget_id=budget.pk, period_start=start)
+        rows.update(
+            spent=spent,
+            alert_level=_level_expression(Value(spent), budget.limit),
+            alerted_at=_alerted_expression(Value(spent), budget.limit, timezone.now()),
+        )
+
+
+def apply_delta(using: str, budget: Budget, start: date, amount: Decimal) -> None:
+    """Прибавляет amount к счётчику периода и пересчитывает порог тем же UPDATE."""
+    spent = F("spent") + Value(amount)
+    updated = BudgetSpend.objects.using(using).filter(budget_id=budget.pk, period_start=start).update(
+        spent=spent,
+        alert_level=_level_expression(spent, budget.limit),
+        alerted_at=_alerted_expression(spent, budget.limit, timezone.now()),
+    )
+    if not updated:
+        _set_from_transactions(using, budget, start)
+
+
+def _apply(using: str, changes: Iterable[Tuple[Dict, int]]) -> None:
+    # changes — пары (состояние операции, знак); дельты копятся по ячейкам,
+    # чтобы перенос внутри периода стал одним UPDATE на разницу сумм
+    changes = [(state, sign) for state, sign in changes if _relevant(state)]
+    budgets = _budgets_for(using, ((s["user_id"], s["category_id"]) for s, _ in changes))
+    deltas: Dict[SpendKey, Decimal] = {}
+    by_pk: Dict[int, Budget] = {}
+    for state, sign in changes:
+        for budget in budgets[(state["user_id"], state["category_id"])]:
+            by_pk[budget.pk] = budget
+            key = (budget.pk, period_start(state["date"], budget.period))
+            deltas[key] = deltas.get(key, Decimal("0")) + sign * state["amount"]
+    for (pk, start), amount in deltas.items():
+        if amount:
+            apply_delta(using, by_pk[pk], start, amount)
+
+
+def record_change(using: str, previous: Optional[Dict], current: Optional[Dict]) -> None:
+    """
+    Переносит изменение операции в счётчики бюджетов: previous — состояние до
+    изменения (None для новой операции), current — после (None для удалённой).
+    Состояния — как в rollups.transaction_state.
+    """
+    _apply(using, [(previous, -1), (current, 1)])
+
+
+def record_bulk(using: str, states: Iterable[Dict], sign: int = 1) -> None:
+    """Учитывает пачку операций, вставленных или удалённых в обход сигналов."""
+    _apply(using, ((state, sign) for state in states))
+
+
+def budget_changed(using: str, budget: Budget, previous: Optional[Dict]) -> None:
+    """
+    После сохранения бюджета: новый бюджет получает счётчик текущего периода,
+    при смене категории или периода счётчики пересчитываются заново, при смене
+    лимита — пересчитываются пороги.
+    """
+    if previous is not None and (previous["category_id"], previous["period"]) != (budget.category_id, budget.period):
+        BudgetSpend.objects.using(using).filter(budget_id=budget.pk).delete()
+        previous = None
+    if previous is None:
+        _set_from_transactions(using, budget, period_start(date.today(), budget.period))
+    elif previous["limit"] != budget.limit:
+        BudgetSpend.objects.using(using).filter(budget_id=budget.pk).update(
+            alert_level=_level_expression(F("spent"), budget.limit),
+            alerted_at=_alerted_expression(F("spent"), budget.limit, timezone.now()),
+        )
+
+
+def current_budgets(user, today: Optional[date] = None):
+    """
+    Бюджеты пользователя с потраченным за текущий период (spent) и пройденным
+    порогом (alert_level) — одним запросом к счётчикам, без суммирования операций.
+    """
+    today = today or date.today()
+    current = Case(
+        *[When(period=period, then=Value(period_start(today, period))) for period, _ in Budget.PERIOD_CHOICES],
+        output_field=DateField(),
+    )
+    spend = BudgetSpend.objects.filter(budget=OuterRef("pk"), period_start=OuterRef("current_start"))
+    return (
+        Budget.objects.filter(user=user)
+        .select_related("category")
+        .annotate(
+            current_start=current,
+            spent=Coalesce(
+                Subquery(spend.values("spent")[:1]), Value(Decimal("0")),
+                output_field=DecimalField(max_digits=14, decimal_places=2),
+            ),
+            alert_level=Coalesce(Subquery(spend.values("alert_level")[:1]), Value(0)),
+        )
+        .order_by("category__name", "period")
+    )
+
+
+def crossed_since(user, category_id: Optional[int], since) -> List[Tuple[Budget, int]]:
+    """Бюджеты категории, у которых после since пройден новый порог: [(бюджет, порог)]."""
+    if category_id is None:
+        return []
+    rows = (
+        BudgetSpend.objects.filter(budget__user=user, budget__category_id=category_id, alerted_at__gte=since)
+        .select_related("budget__category")
+        .order_by("budget__period")
+    )
+    return [(row.budget, row.alert_level) for row in rows]
+
+
+# Сверка и пересчёт счётчиков по исходным операциям
+
+def compute(using: str, user_ids: Optional[Iterable[int]] = None) -> Dict[SpendKey, Decimal]:
+    """Потраченное по каждому бюджету и периоду заново по операциям."""
+    truncs = {"week": WeekStart, "month": TruncMonth}
+    result: Dict[SpendKey, Decimal] = {}
+    for period, _ in Budget.PERIOD_CHOICES:
+        qs = TransactionHistory.objects.using(using).filter(type="expense", category__budgets__period=period)
+        if user_ids is not None:
+            qs = qs.filter(user_id__in=list(user_ids))
+        rows = (
+            qs.annotate(start=truncs[period]("date", output_field=DateField()))
+            .values("category__budgets", "start")
+            .annotate(spent=Sum("amount"))
+            .order_by()
+        )
+        for row in rows:
+            result[(row["category__budgets"], row["start"])] = Decimal(row["spent"]).quantize(CENTS)
+    return result
+
+
+def stored(using: str, user_ids: Optional[Iterable[int]] = None) -> Dict[SpendKey, BudgetSpend]:
+    qs = BudgetSpend.objects.using(using).select_related("budget")
+    if user_ids is not None:
+        qs = qs.filter(budget__user_id__in=list(user_ids))
+    return {(row.budget_id, row.period_start): row for row in qs}
+
+
+def verify(using: str, user_ids: Optional[Iterable[int]] = None) -> List[Tuple[SpendKey, Decimal, Decimal]]:
+    """Расхождения (ключ, по операциям, в счётчике); отсутствующий счётчик равен нулю."""
+    user_ids = list(user_ids) if user_ids is not None else None
+    expected = compute(using, user_ids)
+    actual = stored(using, user_ids)
+    mismatches = []
+    for key in sorted(set(expected) | set(actual)):
+        exp = expected.get(key, Decimal("0"))
+        act = actual[key].spent if key in actual else Decimal("0")
+        if exp != act:
+            mismatches.append((key, exp, act))
+    return mismatches
+
+
+def reconcile(using: str, user_ids: Optional[Iterable[int]] = None, batch_size: int = 1000) -> int:
+    """
+    Приводит счётчики и пороги к суммам операций. Время прохождения порога
+    ставится только там, где порог вырос. Возвращает число исправленных строк.
+    """
+    user_ids = list(user_ids) if user_ids is not None else None
+    now = timezone.now()
+    with db_transaction.atomic(using=using):
+        expected = compute(using, user_ids)
+        actual = stored(using, user_ids)
+        budgets = {row.budget_id: row.budget for row in actual.values()}
+        missing = {pk for pk, _ in expected} - set(budgets)
+        budgets.update(Budget.objects.using(using).in_bulk(missing))
+
+        changed, created = [], []
+        for key in set(expected) | set(actual):
+            spent = expected.get(key, Decimal("0"))
+            level = level_for(spent, budgets[key[0]].limit)
+            row = actual.get(key)
+            if row is None:
+                created.append(
+                    BudgetSpend(budget_id=key[0], period_start=key[1], spent=spent, alert_level=level,
+                                alerted_at=now if level else None)
+                )
+            elif (row.spent, row.alert_level) != (spent, level):
+                if level > row.alert_level:
+                    row.alerted_at = now
+                row.spent, row.alert_level = spent, level
+                changed.append(row)
+        BudgetSpend.objects.using(using).bulk_update(changed, ["spent", "alert_level", "alerted_at"], batch_size=batch_size)
+        BudgetSpend.objects.using(using).bulk_create(created, batch_size=batch_size)
+    return len(changed) + len(created)
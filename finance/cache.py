@@ -0,0 +1,115 @@
+"""
+Кеш аналитики и дашборда с версионированием по пользователю.
+
+В ключ входит номер версии данных пользователя. Любое изменение его
+операций, категорий или целей увеличивает версию (см. finance/signals.py),
+поэтому инвалидация — одна операция с кешем, а старые записи просто
+вытесняются самим бэкендом. Работает с любым бэкендом Django.
+"""
+import functools
+import hashlib
+import time
+from typing import Optional
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .replicas import pin
+from .sharding import for_user
+
+HITS_KEY = "finance:stats:hits"
+MISSES_KEY = "finance:stats:misses"
+
+# Так в кеше хранится результат None: сам None cache.get() возвращает и при промахе
+NONE_VALUE = "finance:none"
+
+
+def _cache():
+    return caches[settings.FINANCE_CACHE_ALIAS]
+
+
+def _version_key(user_id, scope: Optional[str] = None) -> str:
+    # scope — отдельная версия для данных, меняющихся независимо от операций
+    # (например, правил категоризации)
+    if scope is None:
+        return f"finance:version:{user_id}"
+    return f"finance:version:{scope}:{user_id}"
+
+
+def data_version(user_id, scope: Optional[str] = None) -> int:
+    cache = _cache()
+    key = _version_key(user_id, scope)
+    version = cache.get(key)
+    if version is None:
+        # Начальная версия — текущее время, а не 1: если ключ версии вытеснен,
+        # новая версия не совпадёт ни с одной из старых записей
+        cache.add(key, time.time_ns(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(user_id, scope: Optional[str] = None) -> None:
+    # Пока реплика может не содержать изменения, пользователь читает из основной базы
+    pin(user_id)
+    cache = _cache()
+    key = _version_key(user_id, scope)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, time.time_ns(), timeout=None)
+
+
+def _count(key: str) -> None:
+    cache = _cache()
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, timeout=None)
+
+
+def cache_stats() -> dict:
+    cache = _cache()
+    hits = cache.get(HITS_KEY, 0)
+    misses = cache.get(MISSES_KEY, 0)
+    total = hits + misses
+    return {"hits": hits, "misses": misses, "hit_ratio": hits / total if total else 0.0}
+
+
+def reset_cache_stats() -> None:
+    _cache().delete_many([HITS_KEY, MISSES_KEY])
+
+
+def _user_id(user) -> int:
+    return getattr(user, "pk", user)
+
+
+def user_cached(name: str):
+    """
+    Кеширует результат функции вида f(user, *args, **kwargs) под ключом
+    (имя, пользователь, версия данных пользователя, аргументы).
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(user, *args, **kwargs):
+            user_id = _user_id(user)
+            arguments = repr((args, sorted(kwargs.items())))
+            digest = hashlib.md5(arguments.encode("utf-8")).hexdigest()
+            key = f"finance:{name}:{user_id}:{data_version(user_id)}:{digest}"
+
+            cache = _cache()
+            value = cache.get(key)
+            if value is not None:
+                _count(HITS_KEY)
+                return None if value == NONE_VALUE else value
+            _count(MISSES_KEY)
+            # Запросы функции идут в шард пользователя и вне HTTP-запроса
+            with for_user(user_id):
+                value = func(user, *args, **kwargs)
+            cache.set(key, NONE_VALUE if value is None else value, timeout=settings.FINANCE_CACHE_TIMEOUT)
+            return value
+
+        # Исходная функция без кеша — для бенчмарков и проверок
+        wrapper.uncached = func
+        return wrapper
+
+    return decorator
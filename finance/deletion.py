@@ -0,0 +1,245 @@
+"""
+Фоновое удаление аккаунта или категории с большой историей.
+
+Обычный delete() собирает все связанные строки в память (Collector) и
+удаляет их в одной транзакции — на миллионах операций это рост памяти и
+долгая блокировка записи всей БД SQLite. Здесь операции удаляются (или
+отвязываются от категории) пачками по FINANCE_DELETION_BATCH_SIZE, каждая
+пачка — отдельная короткая транзакция, между пачками пауза
+FINANCE_DELETION_PAUSE, чтобы успевали писать остальные. Сам объект
+удаляется обычным delete(), когда связанных строк почти не осталось.
+
+Задача (DeletionTask) хранит прогресс и выполняется в фоновом потоке
+процесса или командой run_deletions. Каждая пачка закончена сама по себе,
+поэтому прерванную задачу можно просто запустить ещё раз. Пока данные
+пользователя переносятся в другой шард (finance.sharding), задача ждёт.
+"""
+import logging
+import threading
+import time
+from typing import Optional
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connections, router, transaction as db_transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import budgets, rollups
+from .sharding import db_for_user, is_moving
+from .models import ArchivedTransaction, Category, DailyBalance, DeletionTask, MonthlyRollup, Transaction
+
+logger = logging.getLogger("finance.deletion")
+
+# Поля операции, нужные для переноса её в сводки (rollups.transaction_state)
+STATE_FIELDS = ("id", *rollups.TRACKED_FIELDS)
+
+# Операции лежат в основной таблице и в архиве старых операций
+TRANSACTION_MODELS = (Transaction, ArchivedTransaction)
+
+
+def _count(using: str, **filters) -> int:
+    return sum(model.objects.using(using).filter(**filters).count() for model in TRANSACTION_MODELS)
+
+
+def _unfinished(using: str, kind: str, object_id: int) -> Optional[DeletionTask]:
+    return (
+        DeletionTask.objects.using(using)
+        .filter(kind=kind, object_id=object_id, status__in=("pending", "running"))
+        .first()
+    )
+
+
+def schedule_user_deletion(user, using: Optional[str] = None, background: bool = True) -> DeletionTask:
+    """
+    Ставит удаление аккаунта в очередь. Пользователь сразу становится
+    неактивным: войти и открыть старую сессию он уже не сможет. background —
+    запустить задачу в потоке процесса после коммита, иначе её выполнит run().
+    """
+    using = using or router.db_for_write(DeletionTask, instance=user)
+    with db_transaction.atomic(using=using):
+        # Аккаунт и задача могут лежать в разных базах (finance.sharding)
+        User.objects.using(router.db_for_write(User, instance=user)).filter(pk=user.pk).update(is_active=False)
+        task = _unfinished(using, "user", user.pk)
+        if task is None:
+            task = DeletionTask.objects.using(using).create(
+                kind="user",
+                object_id=user.pk,
+                user_id=user.pk,
+                label=user.get_username(),
+                total=_count(using, user_id=user.pk),
+            )
+            if background:
+                start(task, using)
+    return task
+
+
+def schedule_category_deletion(category: Category, using: Optional[str] = None, background: bool = True) -> DeletionTask:
+    """Ставит удаление категории в очередь; её операции станут «Без категории»."""
+    using = using or router.db_for_write(Category, instance=category)
+    with db_transaction.atomic(using=using):
+        task = _unfinished(using, "category", category.pk)
+        if task is None:
+            task = DeletionTask.objects.using(using).create(
+                kind="category",
+                object_id=category.pk,
+                user_id=category.user_id,
+                label=category.name,
+                total=_count(using, user_id=category.user_id, category_id=category.pk),
+            )
+            if background:
+                start(task, using)
+    return task
+
+
+def start(task: DeletionTask, using: str) -> None:
+    # Поток запускается после коммита: иначе он может не увидеть задачу.
+    # Без FINANCE_DELETION_IN_PROCESS задачи выполняет только run_deletions
+    if not settings.FINANCE_DELETION_IN_PROCESS:
+        return
+    db_transaction.on_commit(lambda: _run_later(task.pk, using, task.user_id, 0), using=using)
+
+
+def _run_later(task_id: int, using: Optional[str], user_id: Optional[int], delay: float) -> None:
+    timer = threading.Timer(delay, _run_in_thread, args=(task_id, using, user_id))
+    timer.name = f"finance-deletion-{task_id}"
+    timer.daemon = True
+    timer.start()
+
+
+def _run_in_thread(task_id: int, using: Optional[str], user_id: Optional[int]) -> None:
+    try:
+        # После переноса задача лежит в новой базе пользователя
+        task = run(task_id, using or db_for_user(user_id))
+        if not task.is_finished and is_moving(user_id):
+            _run_later(task_id, None, user_id, max(1, settings.FINANCE_SHARD_DIRECTORY_TIMEOUT))
+    finally:
+        # Соединения с БД у каждого потока свои
+        connections.close_all()
+
+
+def _advance(using: str, task_id: int, count: int) -> None:
+    DeletionTask.objects.using(using).filter(pk=task_id).update(
+        processed=F("processed") + count, updated_at=timezone.now()
+    )
+
+
+def _pause(pause: float) -> None:
+    if pause:
+        time.sleep(pause)
+
+
+def delete_in_batches(qs, using: str, batch_size: int, pause: float = 0, task_id: Optional[int] = None) -> int:
+    """
+    Удаляет строки qs пачками по batch_size: каждая пачка — один
+    DELETE ... WHERE id IN (SELECT id ... LIMIT n) в отдельной транзакции,
+    строки в Python не загружаются. Сигналы не вызываются — вызывающий сам
+    отвечает за производные таблицы. Возвращает число удалённых строк.
+    """
+    model = qs.model
+    total = 0
+    while True:
+        with db_transaction.atomic(using=using):
+            batch = model._base_manager.using(using).filter(pk__in=qs.values("pk")[:batch_size])
+            # _raw_delete — тот же DELETE, которым Collector удаляет строки без зависимостей
+            deleted = batch._raw_delete(using)
+            if task_id is not None and deleted:
+                _advance(using, task_id, deleted)
+        total += deleted
+        if deleted < batch_size:
+            return total
+        _pause(pause)
+
+
+def _delete_user(task: DeletionTask, using: str, batch_size: int, pause: float) -> None:
+    user_id = task.object_id
+    # Сводки, итоги по дням и счётчики бюджетов пользователя удаляются
+    # целиком, поэтому операции можно удалять, не пересчитывая их
+    for model in TRANSACTION_MODELS:
+        delete_in_batches(model.objects.using(using).filter(user_id=user_id), using, batch_size, pause, task.pk)
+    for model in (MonthlyRollup, DailyBalance):
+        delete_in_batches(model.objects.using(using).filter(user_id=user_id), using, batch_size, pause)
+    # Остались категории, цели со взносами, бюджеты и правила — их немного
+    with db_transaction.atomic(using=using):
+        User.objects.using(using).filter(pk=user_id).delete()
+    # С шардами сам аккаунт лежит в основной базе, а в шарде — его копия
+    auth_db = router.db_for_write(User)
+    if auth_db != using:
+        with db_transaction.atomic(using=auth_db):
+            User.objects.using(auth_db).filter(pk=user_id).delete()
+
+
+def _detach_category(model, category: Category, task: DeletionTask, using: str, batch_size: int, pause: float) -> None:
+    # По индексу (user, category, date) или (user, date) в архиве: пачка
+    # покрывает узкий интервал дат и затрагивает мало ячеек помесячной сводки
+    qs = (
+        model.objects.using(using)
+        .filter(user_id=category.user_id, category_id=category.pk)
+        .only(*STATE_FIELDS)
+        .order_by("date", "id")
+    )
+    while True:
+        with db_transaction.atomic(using=using):
+            batch = list(qs[:batch_size])
+            if batch:
+                model.objects.using(using).filter(pk__in=[tx.pk for tx in batch]).update(category=None)
+                previous = [rollups.transaction_state(tx) for tx in batch]
+                current = [dict(state, category_id=None) for state in previous]
+                # Массовый UPDATE не вызывает сигналы; итоги по дням от категории не зависят
+                rollups.record_bulk(using, previous, sign=-1)
+                rollups.record_bulk(using, current)
+                budgets.record_bulk(using, previous, sign=-1)
+                _advance(using, task.pk, len(batch))
+        if len(batch) < batch_size:
+            return
+        _pause(pause)
+
+
+def _delete_category(task: DeletionTask, using: str, batch_size: int, pause: float) -> None:
+    category = Category.objects.using(using).filter(pk=task.object_id).first()
+    if category is None:
+        return
+    for model in TRANSACTION_MODELS:
+        _detach_category(model, category, task, using, batch_size, pause)
+    with db_transaction.atomic(using=using):
+        # Операции, добавленные после последней пачки, отвяжет SET_NULL;
+        # сигналы удаления категории сбросят кеш аналитики и правил
+        category.delete(using=using)
+
+
+def run(
+    task_id: int,
+    using: Optional[str] = None,
+    batch_size: Optional[int] = None,
+    pause: Optional[float] = None,
+) -> DeletionTask:
+    """
+    Выполняет задачу удаления (или продолжает прерванную). Возвращает её
+    итоговое состояние; пока данные пользователя переносятся, задача не
+    выполняется и остаётся незавершённой.
+    """
+    using = using or router.db_for_write(DeletionTask)
+    batch_size = batch_size or settings.FINANCE_DELETION_BATCH_SIZE
+    pause = settings.FINANCE_DELETION_PAUSE if pause is None else pause
+    tasks = DeletionTask.objects.using(using).filter(pk=task_id)
+    task = tasks.get()
+    if task.is_finished:
+        return task
+    if is_moving(task.user_id):
+        # Запись в базу пользователя запрещена на время переноса, как и
+        # запросам (ShardMiddleware) и фоновым задачам (finance.jobs)
+        logger.info("Удаление %s отложено: данные пользователя переносятся", task)
+        return task
+    tasks.update(status="running", updated_at=timezone.now())
+    try:
+        if task.kind == "user":
+            _delete_user(task, using, batch_size, pause)
+        else:
+            _delete_category(task, using, batch_size, pause)
+    except Exception as exc:
+        logger.exception("Удаление %s не завершено", task)
+        tasks.update(status="failed", error=str(exc), updated_at=timezone.now())
+    else:
+        now = timezone.now()
+        tasks.update(status="done", error="", updated_at=now, finished_at=now)
+    return tasks.get()
@@ -1,3 +1,5 @@
+import codecs
+import hashlib
 from datetime import date, timedelta
 from decimal import Decimal
 
@@ -5,7 +7,7 @@ from django import forms
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth.models import User
 
-from .models import Transaction, Goal, Category
+from .models import Budget, CategoryRule, Transaction, Goal, Category
 
 
 class SignUpForm(UserCreationForm):
@@ -16,6 +18,27 @@ class SignUpForm(UserCreationForm):
         fields = ("username", "email", "password1", "password2")
 
 
+# Проверки операции вынесены в функции, чтобы импорт выписок использовал
+# те же правила без создания формы на каждую строку
+def validate_transaction_amount(amount):
+    if amount is None:
+        return amount
+    if amount <= Decimal("0.00"):
+        raise forms.ValidationError("Сумма операции должна быть больше нуля.")
+    return amount
+
+
+def validate_transaction_date(d):
+    if d is None:
+        return d
+    today = date.today()
+    if d > today:
+        raise forms.ValidationError(
+            "Дата операции не может быть в будущем. Укажите сегодняшнюю или прошедшую дату."
+        )
+    return d
+
+
 class TransactionForm(forms.ModelForm):
     class Meta:
         model = Transaction
@@ -56,24 +79,11 @@ class TransactionForm(forms.ModelForm):
 
     # Валидация поля amount — сумма должна быть больше 0
     def clean_amount(self):
-        amount = self.cleaned_data.get("amount")
-        if amount is None:
-            return amount
-        if amount <= Decimal("0.00"):
-            raise forms.ValidationError("Сумма операции должна быть больше нуля.")
-        return amount
+        return validate_transaction_amount(self.cleaned_data.get("amount"))
 
     # Валидация поля date — дата не должна быть в будущем
     def clean_date(self):
-        d = self.cleaned_data.get("date")
-        if d is None:
-            return d
-        today = date.today()
-        if d > today:
-            raise forms.ValidationError(
-                "Дата операции не может быть в будущем. Укажите сегодняшнюю или прошедшую дату."
-            )
-        return d
+        return validate_transaction_date(self.cleaned_data.get("date"))
 
 
 class GoalForm(forms.ModelForm):
@@ -106,6 +116,9 @@ class GoalForm(forms.ModelForm):
         if isinstance(self.fields["current_amount"], forms.DecimalField):
             self.fields["current_amount"].min_value = Decimal("0.00")
             self.fields["current_amount"].widget.attrs["min"] = "0.00"
+            # Сумма на момент открытия формы уходит скрытым полем: правка
+            # накоплений считается от неё, а не от суммы в БД на момент отправки
+            self.fields["current_amount"].show_hidden_initial = True
 
         tomorrow = date.today() + timedelta(days=1)
         self.fields["deadline"].widget.attrs["min"] = tomorrow.isoformat()
@@ -122,6 +135,15 @@ class GoalForm(forms.ModelForm):
             )
         return d
 
+    def shown_amount(self, default: Decimal) -> Decimal:
+        """Накопленная сумма, которую пользователь видел, открывая форму."""
+        value = self.data.get(self.add_initial_prefix("current_amount"))
+        try:
+            shown = self.fields["current_amount"].to_python(value)
+        except forms.ValidationError:
+            shown = None
+        return default if shown is None else shown
+
     # Валидация целевой суммы - должна быть больше нуля
     def clean_target_amount(self):
         value = self.cleaned_data.get("target_amount")
@@ -141,6 +163,26 @@ class GoalForm(forms.ModelForm):
         return value
 
 # Поле для добавления суммы к цели с минимальным значением
+# Удаление аккаунта подтверждается паролем
+class AccountDeleteForm(forms.Form):
+    password = forms.CharField(
+        label="Пароль",
+        strip=False,
+        widget=forms.PasswordInput(attrs={"class": "form-control", "autocomplete": "current-password"}),
+        help_text="Аккаунт и все его данные будут удалены без возможности восстановления.",
+    )
+
+    def __init__(self, *args, **kwargs):
+        self.user = kwargs.pop("user")
+        super().__init__(*args, **kwargs)
+
+    def clean_password(self):
+        password = self.cleaned_data["password"]
+        if not self.user.check_password(password):
+            raise forms.ValidationError("Неверный пароль.")
+        return password
+
+
 class GoalAddAmountForm(forms.Form):
     amount = forms.DecimalField(
         label="Добавить сумму",
@@ -154,3 +196,84 @@ class GoalAddAmountForm(forms.Form):
         super().__init__(*args, **kwargs)
         self.fields["amount"].widget.attrs["class"] = "form-control"
         self.fields["amount"].widget.attrs["min"] = "0.01"
+
+
+# Лимит расходов категории на период; повторная отправка для той же
+# категории и периода меняет лимит существующего бюджета
+class BudgetForm(forms.ModelForm):
+    class Meta:
+        model = Budget
+        fields = ["category", "period", "limit"]
+
+    def __init__(self, *args, **kwargs):
+        user = kwargs.pop("user", None)
+        super().__init__(*args, **kwargs)
+        # Бюджет задаётся только для расходных категорий пользователя
+        if user is not None:
+            self.fields["category"].queryset = Category.objects.filter(user=user, is_income=False).order_by("name")
+        self.fields["limit"].help_text = "Сколько можно потратить в категории за период."
+        self.fields["limit"].min_value = Decimal("0.01")
+        self.fields["limit"].widget.attrs["min"] = "0.01"
+        for name, field in self.fields.items():
+            css = field.widget.attrs.get("class", "")
+            field.widget.attrs["class"] = (css + (" form-select" if name in ("category", "period") else " form-control")).strip()
+
+    def clean_limit(self):
+        value = self.cleaned_data.get("limit")
+        if value is not None and value <= Decimal("0.00"):
+            raise forms.ValidationError("Лимит должен быть больше нуля.")
+        return value
+
+
+class CategoryRuleForm(forms.ModelForm):
+    class Meta:
+        model = CategoryRule
+        fields = ["pattern", "category", "priority"]
+
+    def __init__(self, *args, **kwargs):
+        user = kwargs.pop("user", None)
+        super().__init__(*args, **kwargs)
+        if user is not None:
+            self.fields["category"].queryset = Category.objects.filter(user=user).order_by("name")
+        self.fields["pattern"].help_text = "Например: Яндекс Такси. Регистр и «ё» не учитываются."
+        self.fields["priority"].help_text = "Если подходят несколько правил, выигрывает меньший приоритет."
+        for name, field in self.fields.items():
+            css = field.widget.attrs.get("class", "")
+            field.widget.attrs["class"] = (css + (" form-select" if name == "category" else " form-control")).strip()
+
+    def clean_pattern(self):
+        value = " ".join(self.cleaned_data.get("pattern", "").split())
+        if not value:
+            raise forms.ValidationError("Укажите текст, который встречается в описании операции.")
+        return value
+
+
+# Загрузка банковской выписки в CSV
+class TransactionImportForm(forms.Form):
+    file = forms.FileField(
+        label="Файл выписки (CSV)",
+        help_text="Столбцы: date, type, category, amount, description. "
+                  "Если type не указан, отрицательная сумма считается расходом.",
+    )
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields["file"].widget.attrs["class"] = "form-control"
+        self.fields["file"].widget.attrs["accept"] = ".csv,text/csv"
+
+    def clean_file(self):
+        upload = self.cleaned_data["file"]
+        # Выписка импортируется в фоне из сохранённого файла. Кодировка
+        # проверяется, а хеш (повторная загрузка той же выписки) считается по
+        # частям, без чтения файла в память целиком
+        decoder = codecs.getincrementaldecoder("utf-8-sig")()
+        digest = hashlib.sha256()
+        try:
+            for chunk in upload.chunks():
+                decoder.decode(chunk)
+                digest.update(chunk)
+            decoder.decode(b"", final=True)
+        except UnicodeDecodeError:
+            raise forms.ValidationError("Файл должен быть в кодировке UTF-8.")
+        self.digest = digest.hexdigest()
+        return upload
@@ -0,0 +1,71 @@
+"""
+Взносы в финансовые цели.
+
+Пополнение — это строка журнала GoalContribution и приращение
+Goal.current_amount одним UPDATE ... SET current_amount = current_amount + x
+без чтения цели в Python, поэтому параллельные взносы не теряются, а
+остальные поля строки не перезаписываются.
+"""
+from dataclasses import dataclass
+from decimal import Decimal
+from typing import Optional
+
+from django.db import router, transaction as db_transaction
+from django.db.models import F
+
+from .cache import bump_version
+from .models import Goal, GoalContribution
+
+
+@dataclass
+class ContributionResult:
+    contribution: GoalContribution
+    # Цель достигнута именно этим взносом
+    completed: bool
+
+
+def add_contribution(user, goal_id: int, amount: Decimal) -> Optional[ContributionResult]:
+    """
+    Пополняет цель пользователя на amount. None — цель не найдена или уже
+    достигнута (тогда ничего не меняется).
+    """
+    using = router.db_for_write(Goal, instance=user)
+    with db_transaction.atomic(using=using):
+        goals = Goal.objects.using(using).filter(pk=goal_id, user=user)
+        updated = goals.filter(current_amount__lt=F("target_amount")).update(
+            current_amount=F("current_amount") + amount
+        )
+        if not updated:
+            return None
+        contribution = GoalContribution.objects.using(using).create(goal_id=goal_id, amount=amount)
+        # Строка цели заблокирована нашим UPDATE до конца транзакции, поэтому
+        # проверка видит сумму с этим взносом, а условие UPDATE гарантирует,
+        # что до него цель достигнута не была
+        completed = goals.filter(current_amount__gte=F("target_amount")).exists()
+        db_transaction.on_commit(lambda: bump_version(user.pk), using=using)
+    return ContributionResult(contribution, completed)
+
+
+def save_goal(goal: Goal, previous_amount: Decimal = Decimal("0")) -> Goal:
+    """
+    Сохраняет цель из формы. Изменение накопленной суммы вручную (или
+    начальная сумма новой цели) записывается в журнал взносом-исправлением.
+
+    previous_amount — сумма, которую пользователь видел в форме. Правка
+    применяется к сумме в БД приращением на ту же разницу, как и взнос, —
+    пополнения, сделанные, пока форма была открыта, не теряются.
+    """
+    using = router.db_for_write(Goal, instance=goal)
+    delta = goal.current_amount - previous_amount
+    with db_transaction.atomic(using=using):
+        if goal.pk is None:
+            goal.save(using=using)
+        else:
+            fields = [f.name for f in Goal._meta.concrete_fields if not f.primary_key and f.name != "current_amount"]
+            goal.save(using=using, update_fields=fields)
+            if delta:
+                Goal.objects.using(using).filter(pk=goal.pk).update(current_amount=F("current_amount") + delta)
+            goal.refresh_from_db(using=using, fields=["current_amount"])
+        if delta:
+            GoalContribution.objects.using(using).create(goal=goal, amount=delta)
+    return goal
@@ -0,0 +1,196 @@
+"""
+Профилирование запросов в продакшене (работает и при DEBUG=False).
+
+RequestProfilingMiddleware на время запроса активирует RequestProfile:
+
+- SQL считается обёрткой execute_wrappers соединений: число запросов, суммарное
+  время и повторы одного и того же SQL (признак N+1);
+- время шаблонов — через бэкенд TimedDjangoTemplates;
+- в ответ добавляется заголовок Server-Timing (db, template, total);
+- медленные запросы, запросы со слишком большим числом SQL и с повторами
+  пишутся в журнал finance.slow_requests одной JSON-строкой.
+
+Профиль хранится в ContextVar, поэтому запросы из sync_to_async (async ORM)
+попадают в профиль своего HTTP-запроса.
+"""
+import json
+import logging
+import time
+from collections import Counter
+from contextvars import ContextVar
+from typing import Optional
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.template import TemplateDoesNotExist
+from django.template.backends.django import DjangoTemplates, Template, reraise
+from django.utils.functional import empty
+
+logger = logging.getLogger("finance.slow_requests")
+
+_current: ContextVar[Optional["RequestProfile"]] = ContextVar("finance_request_profile", default=None)
+
+# Длина SQL в журнале
+SQL_PREVIEW = 300
+
+
+class RequestProfile:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.total = 0.0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.queries = 0
+        self.by_sql = Counter()
+        self.identical = Counter()
+
+    def record_query(self, sql, params, duration):
+        self.queries += 1
+        self.db_time += duration
+        self.by_sql[sql] += 1
+        try:
+            self.identical[(sql, repr(params))] += 1
+        except Exception:
+            pass
+
+    def repeated(self, threshold):
+        """SQL, выполненный не меньше threshold раз: [(sql, раз, из них с одинаковыми параметрами)]."""
+        most_identical = Counter()
+        for (sql, _), count in self.identical.items():
+            most_identical[sql] = max(most_identical[sql], count)
+        return [
+            (sql, count, most_identical[sql])
+            for sql, count in self.by_sql.most_common()
+            if count >= threshold
+        ]
+
+    def server_timing(self):
+        return (
+            f'db;dur={self.db_time * 1000:.1f};desc="{self.queries} queries", '
+            f"template;dur={self.template_time * 1000:.1f}, "
+            f"total;dur={self.total * 1000:.1f}"
+        )
+
+
+def _record_query(execute, sql, params, many, context):
+    profile = _current.get()
+    if profile is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        profile.record_query(sql, params, time.perf_counter() - start)
+
+
+def install_query_hook(connection):
+    # Обёртка ставится на соединение один раз (при открытии, см. signals.py)
+    # и пишет в профиль текущего контекста. Вход/выход execute_wrapper() в
+    # middleware не подходит: async ORM выполняет запросы в другом потоке со
+    # своими объектами соединений
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_query)
+
+
+class TimedTemplate(Template):
+    def render(self, context=None, request=None):
+        profile = _current.get()
+        if profile is None:
+            return super().render(context, request)
+        start = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            profile.template_time += time.perf_counter() - start
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """Бэкенд шаблонов Django, который учитывает время рендеринга в профиле запроса."""
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return TimedTemplate(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            reraise(exc, self)
+
+
+def _user_id(request):
+    user = getattr(request, "user", None)
+    # Ленивый request.user не загружаем: из event loop это синхронный запрос к БД
+    if getattr(user, "_wrapped", None) is empty:
+        return None
+    return getattr(user, "pk", None)
+
+
+class RequestProfilingMiddleware:
+    """
+    Считает SQL и время шаблонов запроса, добавляет Server-Timing и пишет
+    проблемные запросы в журнал. Для потоковых ответов учитывается только
+    время до начала отдачи тела.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        profile, token = self._start()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self._finish(request, response, profile)
+
+    async def __acall__(self, request):
+        profile, token = self._start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self._finish(request, response, profile)
+
+    def _start(self):
+        profile = RequestProfile()
+        return profile, _current.set(profile)
+
+    def _finish(self, request, response, profile):
+        profile.total = time.perf_counter() - profile.started
+        if settings.FINANCE_SERVER_TIMING:
+            response["Server-Timing"] = profile.server_timing()
+
+        reasons = []
+        if profile.total * 1000 >= settings.FINANCE_SLOW_REQUEST_MS:
+            reasons.append("slow")
+        if profile.queries >= settings.FINANCE_SLOW_REQUEST_QUERIES:
+            reasons.append("queries")
+        repeated = profile.repeated(settings.FINANCE_REPEATED_QUERY_THRESHOLD)
+        if repeated:
+            reasons.append("repeated_queries")
+        if reasons:
+            record = {
+                "reasons": reasons,
+                "method": request.method,
+                "path": request.path,
+                "status": response.status_code,
+                "user_id": _user_id(request),
+                "total_ms": round(profile.total * 1000, 1),
+                "db_ms": round(profile.db_time * 1000, 1),
+                "template_ms": round(profile.template_time * 1000, 1),
+                "queries": profile.queries,
+                "repeated": [
+                    {"sql": sql[:SQL_PREVIEW], "count": count, "identical": identical}
+                    for sql, count, identical in repeated
+                ],
+            }
+            logger.warning(json.dumps(record, ensure_ascii=False), extra={"profile": record})
+        return response
@@ -0,0 +1,240 @@
+"""
+Очередь фоновых задач finance в базе данных — без внешнего брокера.
+
+enqueue() записывает задачу (Job) в основную базу, а её файл (выписку) —
+в хранилище файлов; когда задача завершена, файл удаляется. Одинаковая
+задача пользователя (тот же вид и параметры), ещё ждущая в очереди, не
+дублируется: возвращается уже поставленная — это гарантирует частичный
+уникальный индекс job_pending_unique. Задачи выполняет run_finance_worker —
+пул процессов и потоков; claim() отдаёт задачу ровно одному исполнителю
+условным UPDATE, без блокировок на время работы.
+
+Упавшая задача возвращается в очередь с задержкой, которая удваивается с
+каждой попыткой; после max_attempts попыток — «Ошибка». С
+FINANCE_JOBS_IN_PROCESS повтор запускает таймер в том же процессе. Задачу
+исполнителя, не отчитавшегося за FINANCE_JOB_TIMEOUT секунд (процесс убит),
+снова может взять любой исполнитель — такие задачи подбирает только
+run_finance_worker.
+
+Данные пользователя обработчик читает и пишет в его базе (finance.sharding).
+Пока они переносятся в другой шард, задачи пользователя откладываются.
+"""
+import hashlib
+import json
+import logging
+import threading
+from datetime import timedelta
+from typing import Callable, Dict, Optional
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import IntegrityError, connections, transaction as db_transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from . import balances, budgets, rollups
+from .cache import bump_version
+from .importers import import_transactions
+from .models import Job
+from .replicas import pin
+from .rules import recategorize
+from .sharding import db_for_user, for_user, is_moving
+
+logger = logging.getLogger("finance.jobs")
+
+# Сколько готовых задач перебирает claim(), если первую уже забрал другой исполнитель
+CLAIM_CANDIDATES = 10
+
+# Сколько ошибок разбора строк выписки сохраняется в результате задачи
+IMPORT_ERRORS_KEPT = 20
+
+# Вид задачи → обработчик f(user_id, **payload), возвращающий результат для JSON
+HANDLERS: Dict[str, Callable] = {}
+
+
+def handler(kind: str):
+    def decorator(func):
+        HANDLERS[kind] = func
+        return func
+
+    return decorator
+
+
+def _key(kind: str, payload: Dict) -> str:
+    raw = json.dumps([kind, payload], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def enqueue(user, kind: str, upload=None, **payload) -> Job:
+    """
+    Ставит задачу в очередь. Если такая же задача пользователя уже ждёт,
+    возвращает её. Файл upload обработчик получает аргументом upload; в
+    ключ задачи он не входит — его содержимое описывают параметры (хеш).
+    """
+    if kind not in HANDLERS:
+        raise ValueError(f"Неизвестный вид задачи «{kind}»")
+    user_id = getattr(user, "pk", user)
+    key = _key(kind, payload)
+    pending = Job.objects.filter(user_id=user_id, kind=kind, key=key, status="pending")
+    job = pending.first()
+    if job is not None:
+        return job
+    job = Job(user_id=user_id, kind=kind, key=key, payload=payload, max_attempts=settings.FINANCE_JOB_MAX_ATTEMPTS)
+    if upload is not None:
+        job.upload = upload
+    try:
+        with db_transaction.atomic(using=pending.db):
+            job.save()
+            start(job)
+    except IntegrityError:
+        # Такую же задачу только что поставил параллельный запрос; файл
+        # сохраняется до вставки строки и больше не нужен
+        if job.upload:
+            job.upload.delete(save=False)
+        return pending.get()
+    # Состояние задачи пользователь видит из основной базы (finance.replicas)
+    pin(user_id)
+    return job
+
+
+def start(job: Job) -> None:
+    # Как и удаления (finance.deletion), задача может выполниться в потоке
+    # веб-процесса после коммита; claim() не даст выполнить её дважды
+    if not settings.FINANCE_JOBS_IN_PROCESS:
+        return
+    db_transaction.on_commit(lambda: _run_later(job.pk, 0), using=job._state.db)
+
+
+def _run_later(job_id: int, delay: float) -> None:
+    timer = threading.Timer(delay, _run_in_thread, args=(job_id,))
+    timer.name = f"finance-job-{job_id}"
+    timer.daemon = True
+    timer.start()
+
+
+def _run_in_thread(job_id: int) -> None:
+    try:
+        job = claim(f"in-process:{threading.get_ident()}", job_id)
+        if job is not None:
+            execute(job)
+    finally:
+        # Соединения с БД у каждого потока свои
+        connections.close_all()
+
+
+def retry_delay(attempt: int) -> timedelta:
+    """Задержка перед повтором после попытки attempt: удваивается, но не больше максимума."""
+    seconds = settings.FINANCE_JOB_RETRY_DELAY * 2 ** (attempt - 1)
+    return timedelta(seconds=min(seconds, settings.FINANCE_JOB_MAX_RETRY_DELAY))
+
+
+def _claimable(now):
+    stale = now - timedelta(seconds=settings.FINANCE_JOB_TIMEOUT)
+    return Job.objects.filter(Q(status="pending", run_at__lte=now) | Q(status="running", locked_at__lt=stale))
+
+
+def claim(worker: str, job_id: Optional[int] = None) -> Optional[Job]:
+    """Забирает для исполнителя worker готовую задачу (или задачу job_id). None — брать нечего."""
+    now = timezone.now()
+    candidates = _claimable(now)
+    if job_id is not None:
+        candidates = candidates.filter(pk=job_id)
+    for pk in candidates.order_by("run_at", "id").values_list("pk", flat=True)[:CLAIM_CANDIDATES]:
+        # Условие повторяется в UPDATE: из исполнителей, выбравших одну задачу, её получит один
+        claimed = _claimable(now).filter(pk=pk).update(
+            status="running", locked_by=worker, locked_at=now, attempts=F("attempts") + 1, updated_at=now
+        )
+        if claimed:
+            return Job.objects.get(pk=pk)
+    return None
+
+
+def _requeue(job: Job, owned, run_at, error: str, **fields) -> None:
+    now = timezone.now()
+    try:
+        with db_transaction.atomic(using=owned.db):
+            requeued = owned.update(
+                status="pending", run_at=run_at, error=error, locked_by="", locked_at=None, updated_at=now, **fields
+            )
+    except IntegrityError:
+        # Такая же задача уже снова в очереди — она и сделает работу
+        owned.update(status="failed", error=error, updated_at=now, finished_at=now)
+        return
+    # Без исполнителя отложенную задачу некому взять — её ждёт таймер
+    if requeued and settings.FINANCE_JOBS_IN_PROCESS:
+        _run_later(job.pk, (run_at - now).total_seconds())
+
+
+def execute(job: Job) -> Job:
+    """Выполняет взятую задачу и записывает результат, ошибку или повтор. Возвращает её состояние."""
+    # Отчитывается только исполнитель, который всё ещё держит задачу
+    owned = Job.objects.filter(pk=job.pk, locked_by=job.locked_by, locked_at=job.locked_at)
+    if is_moving(job.user_id):
+        # Запись в базу пользователя запрещена на время переноса, как и
+        # запросам в ShardMiddleware: задача ждёт, попытка не считается
+        delay = timedelta(seconds=max(1, settings.FINANCE_SHARD_DIRECTORY_TIMEOUT))
+        _requeue(job, owned, timezone.now() + delay, "Данные переносятся, задача отложена.", attempts=F("attempts") - 1)
+        return Job.objects.get(pk=job.pk)
+    try:
+        if job.attempts > job.max_attempts:
+            raise RuntimeError("Исполнитель не завершил задачу за отведённое время")
+        files = {"upload": job.upload} if job.upload else {}
+        with for_user(job.user_id):
+            result = HANDLERS[job.kind](job.user_id, **job.payload, **files)
+    except Exception as exc:
+        logger.exception("Задача %s не выполнена (попытка %s из %s)", job, job.attempts, job.max_attempts)
+        now = timezone.now()
+        if job.attempts < job.max_attempts:
+            _requeue(job, owned, now + retry_delay(job.attempts), str(exc))
+        else:
+            owned.update(status="failed", error=str(exc), updated_at=now, finished_at=now)
+    else:
+        now = timezone.now()
+        owned.update(status="done", result=result, error="", updated_at=now, finished_at=now)
+    job = Job.objects.get(pk=job.pk)
+    if job.is_finished and job.upload:
+        # Файл нужен задаче только до завершения
+        job.upload.delete(save=False)
+        Job.objects.filter(pk=job.pk).update(upload="")
+    return job
+
+
+def run_next(worker: str) -> Optional[Job]:
+    """Берёт и выполняет одну готовую задачу. None — очередь пуста."""
+    job = claim(worker)
+    return execute(job) if job is not None else None
+
+
+# Обработчики
+
+@handler("import_statement")
+def _import_statement(user_id: int, name: str, digest: str, upload) -> Dict:
+    user = User.objects.get(pk=user_id)
+    # Файл читается построчно
+    with upload.open("rb"):
+        result = import_transactions(user, upload)
+    return {
+        "name": name,
+        "created": result.created,
+        "duplicates": result.duplicates,
+        "error_count": len(result.errors),
+        "errors": result.errors[:IMPORT_ERRORS_KEPT],
+    }
+
+
+@handler("recategorize")
+def _recategorize(user_id: int, overwrite: bool = False) -> Dict:
+    return {"changed": recategorize(user_id, overwrite=overwrite)}
+
+
+@handler("rebuild_analytics")
+def _rebuild_analytics(user_id: int) -> Dict:
+    using = db_for_user(user_id)
+    result = {
+        "rollups": rollups.rebuild(using, [user_id]),
+        "balances": balances.rebuild(using, [user_id]),
+        "budgets": budgets.reconcile(using, [user_id]),
+    }
+    # Закешированная аналитика могла быть посчитана по неверным сводкам
+    bump_version(user_id)
+    return result
@@ -0,0 +1,150 @@
+"""
+Общие утилиты для команд-бенчмарков: временная база данных, генерация
+операций и замер времени, числа запросов и пикового потребления памяти.
+"""
+import random
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import date, timedelta
+from decimal import Decimal
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test.utils import CaptureQueriesContext, override_settings
+
+from finance import balances, replicas, rollups, sharding
+from finance.models import DEFAULT_CATEGORIES, Category, Transaction
+
+
+@contextmanager
+def temporary_database(alias=DEFAULT_DB_ALIAS, keepdb=False):
+    """
+    Создаёт тестовую БД (как manage.py test), чтобы бенчмарк не трогал
+    рабочие данные, и удаляет её по завершении.
+    """
+    connection = connections[alias]
+    old_name = connection.settings_dict["NAME"]
+    connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=keepdb)
+    try:
+        yield connection
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=keepdb)
+
+
+@contextmanager
+def temporary_shards(count, directory, options=None):
+    """
+    Подключает count файловых баз shard_0… в каталоге directory (с OPTIONS
+    options или как у основной), применяет к ним миграции и включает
+    шардирование (FINANCE_SHARDS) на время блока. Возвращает список алиасов.
+    """
+    aliases = [f"shard_{i}" for i in range(count)]
+    default = connections[DEFAULT_DB_ALIAS].settings_dict
+    with override_settings(FINANCE_SHARDS=aliases):
+        for alias in aliases:
+            connections.settings[alias] = {
+                **default,
+                "NAME": str(Path(directory) / f"{alias}.sqlite3"),
+                "OPTIONS": default["OPTIONS"] if options is None else options,
+            }
+            call_command("migrate", database=alias, verbosity=0)
+        try:
+            yield aliases
+        finally:
+            for alias in aliases:
+                connections[alias].close()
+                del connections[alias]
+                del connections.settings[alias]
+
+
+@contextmanager
+def temporary_replicas(directory, primaries=None):
+    """
+    Подключает к базам primaries (по умолчанию — основной и шардам) файловые
+    реплики <алиас>_replica в каталоге directory, заполняет их снимками и
+    включает чтение из реплик (FINANCE_REPLICAS) на время блока.
+    """
+    primaries = primaries or sharding.databases()
+    mapping = {primary: f"{primary}_replica" for primary in primaries}
+    with override_settings(FINANCE_REPLICAS=mapping):
+        for primary, alias in mapping.items():
+            connections.settings[alias] = {
+                **connections[primary].settings_dict,
+                "NAME": str(Path(directory) / f"{alias}.sqlite3"),
+                "OPTIONS": settings.SQLITE_REPLICA_OPTIONS,
+            }
+            replicas.refresh(primary)
+        try:
+            yield mapping
+        finally:
+            for alias in mapping.values():
+                connections[alias].close()
+                del connections[alias]
+                del connections.settings[alias]
+
+
+def create_user_with_history(username, n_transactions, years=5, seed=0, batch_size=5000):
+    """
+    Пользователь с базовыми категориями и n_transactions операциями,
+    равномерно распределёнными по последним `years` годам.
+    """
+    rnd = random.Random(seed)
+    user = User.objects.create_user(username)
+    categories = Category.objects.bulk_create(
+        [Category(user=user, name=name, is_income=is_income) for name, is_income in DEFAULT_CATEGORIES]
+    )
+    income_categories = [c for c in categories if c.is_income]
+    expense_categories = [c for c in categories if not c.is_income]
+    today = date.today()
+    span = 365 * years
+
+    batch = []
+    for i in range(n_transactions):
+        is_income = rnd.random() < 0.1
+        batch.append(
+            Transaction(
+                user=user,
+                type="income" if is_income else "expense",
+                category=rnd.choice(income_categories if is_income else expense_categories + [None]),
+                amount=Decimal(rnd.randint(100, 500000)) / 100,
+                date=today - timedelta(days=rnd.randrange(span)),
+                description=f"Операция {i}",
+            )
+        )
+        if len(batch) >= batch_size:
+            Transaction.objects.bulk_create(batch)
+            batch = []
+    if batch:
+        Transaction.objects.bulk_create(batch)
+
+    # bulk_create не вызывает сигналы — сводки и итоги по дням пересобираем явно
+    rollups.rebuild(DEFAULT_DB_ALIAS, [user.pk])
+    balances.rebuild(DEFAULT_DB_ALIAS, [user.pk])
+    return user
+
+
+def measure(func, *args, repeat=3, using=DEFAULT_DB_ALIAS, **kwargs):
+    """
+    Лучшее время из `repeat` запусков, число SQL-запросов и пиковая
+    память Python (tracemalloc) за один запуск.
+    """
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args, **kwargs)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    # Журнал запросов соединения ограничен 9000 записями: если он уже полон,
+    # CaptureQueriesContext насчитает ноль
+    connections[using].queries_log.clear()
+    tracemalloc.start()
+    with CaptureQueriesContext(connections[using]) as ctx:
+        func(*args, **kwargs)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"seconds": best, "queries": len(ctx.captured_queries), "peak_kib": peak / 1024}
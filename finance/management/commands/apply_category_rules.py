@@ -0,0 +1,42 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS
+
+from finance import rules
+
+
+class Command(BaseCommand):
+    help = (
+        "Применяет правила категорий к истории операций пользователей пачками "
+        "(UPDATE по каждой новой категории). По умолчанию — только к операциям без категории."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--user",
+            type=int,
+            action="append",
+            dest="user_ids",
+            help="id пользователя (можно указать несколько раз). По умолчанию — все, у кого есть правила.",
+        )
+        parser.add_argument(
+            "--overwrite",
+            action="store_true",
+            help="Переназначать категорию и операциям, у которых она уже есть.",
+        )
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument("--database", default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, user_ids=None, overwrite=False, batch_size=1000, database=DEFAULT_DB_ALIAS, **options):
+        if not user_ids:
+            user_ids = (
+                User.objects.using(database).filter(category_rules__isnull=False)
+                .distinct().order_by("pk").values_list("pk", flat=True)
+            )
+        total = 0
+        for user_id in user_ids:
+            changed = rules.recategorize(user_id, database, overwrite=overwrite, batch_size=batch_size)
+            if changed:
+                self.stdout.write(f"user={user_id}: изменено операций {changed}")
+            total += changed
+        self.stdout.write(self.style.SUCCESS(f"Категории назначены операциям: {total}."))
@@ -0,0 +1,58 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from finance import archive, sharding
+
+
+class Command(BaseCommand):
+    help = (
+        "Переносит операции старше заданного возраста в архивную таблицу пачками. "
+        "Помесячные сводки и итоги по дням не меняются; архив виден в списке "
+        "операций по ссылке «Архив»."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--older-than",
+            required=True,
+            help="Возраст операций: 400d, 18m или 2y. Граница округляется до начала месяца.",
+        )
+        parser.add_argument(
+            "--user",
+            type=int,
+            action="append",
+            dest="user_ids",
+            help="id пользователя (можно указать несколько раз). По умолчанию — все.",
+        )
+        parser.add_argument("--batch-size", type=int, default=None)
+        parser.add_argument("--pause", type=float, default=0, help="Пауза между пачками, сек.")
+        parser.add_argument("--vacuum", action="store_true", help="После переноса вернуть освободившееся место (VACUUM).")
+        parser.add_argument("--database", default=None, help="По умолчанию — база данных каждого пользователя.")
+
+    def handle(self, *args, older_than, user_ids=None, batch_size=None, pause=0, vacuum=False,
+               database=None, **options):
+        try:
+            before = archive.cutoff_for(older_than)
+        except ValueError as exc:
+            raise CommandError(exc)
+        if before > archive.horizon():
+            raise CommandError(
+                f"Граница архива {before} позже {archive.horizon()}: минимальный возраст — "
+                f"FINANCE_ARCHIVE_MIN_AGE_DAYS"
+            )
+        if not user_ids:
+            user_ids = User.objects.order_by("pk").values_list("pk", flat=True)
+
+        total = 0
+        for user_id in user_ids:
+            moved = archive.archive_user(user_id, before, database, batch_size=batch_size, pause=pause)
+            if moved:
+                self.stdout.write(f"user={user_id}: в архив перенесено операций {moved}")
+            total += moved
+        if vacuum and total:
+            for alias in [database] if database else sharding.databases():
+                if connections[alias].vendor == "sqlite":
+                    with connections[alias].cursor() as cursor:
+                        cursor.execute("VACUUM")
+        self.stdout.write(self.style.SUCCESS(f"Операций до {before} перенесено в архив: {total}."))
@@ -0,0 +1,118 @@
+import logging
+import statistics
+import time
+
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import path
+
+from finance.admin import CategoryAdmin, GoalAdmin, TransactionAdmin
+from finance.models import Category, Goal, Transaction
+from finance.seeding import seed_users
+
+from ._bench import temporary_database
+
+
+# Прежняя конфигурация админки: фильтры со всеми пользователями и категориями,
+# точный COUNT(*), date_hierarchy и сортировка по дате
+class LegacyCategoryAdmin(admin.ModelAdmin):
+    list_display = CategoryAdmin.list_display
+    list_filter = ("is_income", "user")
+    search_fields = CategoryAdmin.search_fields
+    ordering = ("user", "name")
+
+
+class LegacyTransactionAdmin(admin.ModelAdmin):
+    list_display = TransactionAdmin.list_display
+    list_filter = ("type", "category", "date", "user")
+    search_fields = TransactionAdmin.search_fields
+    date_hierarchy = "date"
+    ordering = ("-date", "-id")
+    description_short = TransactionAdmin.description_short
+
+
+class LegacyGoalAdmin(admin.ModelAdmin):
+    list_display = ("id", "name", "user", "target_amount", "current_amount", "deadline", "created_at")
+    list_filter = ("user", "deadline", "created_at")
+    search_fields = GoalAdmin.search_fields
+    ordering = ("-created_at",)
+
+
+legacy_site = admin.AdminSite(name="legacy_admin")
+legacy_site.register(User)
+legacy_site.register(Category, LegacyCategoryAdmin)
+legacy_site.register(Transaction, LegacyTransactionAdmin)
+legacy_site.register(Goal, LegacyGoalAdmin)
+
+# Команда подменяет ROOT_URLCONF этим модулем, чтобы обе админки были доступны
+urlpatterns = [
+    path("legacy-admin/", legacy_site.urls),
+    path("admin/", admin.site.urls),
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Сравнивает время и число SQL-запросов страниц админки (списки операций, "
+        "категорий и целей, форма операции) в прежней и текущей конфигурации на "
+        "сгенерированных данных. Работает на временной БД."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=1000)
+        parser.add_argument("--transactions", type=int, default=1000, help="Операций на пользователя.")
+        parser.add_argument("--repeat", type=int, default=5)
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, users, transactions, repeat, seed, **options):
+        with temporary_database(), override_settings(
+            ROOT_URLCONF=__name__, DEBUG=False, ALLOWED_HOSTS=["testserver"]
+        ):
+            start = time.perf_counter()
+            seed_users(users, transactions, seed=seed, progress=self._progress)
+            self.stdout.write(
+                f"\nДанные: {Transaction.objects.count()} операций за {time.perf_counter() - start:.0f} с"
+            )
+            superuser = User.objects.create_superuser("bench_admin", password="bench")
+            client = Client()
+            # Журнал медленных запросов здесь только мешает выводу
+            logging.getLogger("finance.slow_requests").disabled = True
+            client.force_login(superuser)
+
+            user = User.objects.get(username=f"seed_{users // 2 + 1:05d}")
+            category = user.categories.get(name="Еда")
+            tx = Transaction.objects.filter(user=user).order_by("-id").first()
+            # Страница из середины списка (по 100 строк на странице)
+            middle = max(1, Transaction.objects.count() // 200)
+            pages = {
+                "transactions": "finance/transaction/",
+                "transactions, middle page": f"finance/transaction/?p={middle}",
+                "transactions by user": f"finance/transaction/?user__id__exact={user.pk}",
+                "transactions by category": f"finance/transaction/?category__id__exact={category.pk}",
+                "transaction form": f"finance/transaction/{tx.pk}/change/",
+                "categories": "finance/category/",
+                "goals": "finance/goal/",
+            }
+            self.stdout.write(f"{'page':>26} {'admin':>8} {'queries':>8} {'p50, ms':>9} {'max, ms':>9} {'KiB':>7}")
+            for name, url in pages.items():
+                for site, prefix in (("legacy", "/legacy-admin/"), ("new", "/admin/")):
+                    timings = []
+                    for _ in range(repeat):
+                        with CaptureQueriesContext(connection) as ctx:
+                            started = time.perf_counter()
+                            response = client.get(prefix + url)
+                            timings.append((time.perf_counter() - started) * 1000)
+                        assert response.status_code == 200, (prefix + url, response.status_code)
+                    self.stdout.write(
+                        f"{name:>26} {site:>8} {len(ctx.captured_queries):>8} "
+                        f"{statistics.median(timings):>9.1f} {max(timings):>9.1f} "
+                        f"{len(response.content) / 1024:>7.0f}"
+                    )
+
+    def _progress(self, done, total):
+        self.stdout.write(f"\rПользователей: {done}/{total}", ending="")
+        self.stdout.flush()
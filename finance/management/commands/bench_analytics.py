@@ -0,0 +1,113 @@
+from collections import defaultdict
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand
+
+from finance import services
+from finance.models import Transaction
+
+from ._bench import create_user_with_history, measure, temporary_database
+
+
+# Прежняя реализация на pandas — эталон для сравнения (нужен установленный pandas)
+def legacy_pandas_pipeline(user, pd):
+    qs = Transaction.objects.filter(user=user, type="expense")
+    if qs.exists():
+        df = pd.DataFrame.from_records(qs.values("category__name", "amount"), columns=["category__name", "amount"])
+        df.groupby("category__name", dropna=False)["amount"].sum().reset_index()
+
+    qs = Transaction.objects.filter(user=user)
+    if qs.exists():
+        df = pd.DataFrame.from_records(qs.values("date", "type", "amount"))
+        df["month"] = pd.to_datetime(df["date"]).dt.to_period("M").astype(str)
+        df.pivot_table(index="month", columns="type", values="amount", aggfunc="sum", fill_value=0)
+
+    qs = Transaction.objects.filter(user=user)
+    if qs.exists():
+        df = pd.DataFrame.from_records(qs.values("date"))
+        sorted(df["date"].apply(lambda d: d.year).unique())
+
+
+# Та же аналитика агрегациями в БД по исходным операциям
+def sql_pipeline(user):
+    qs = Transaction.objects.filter(user=user)
+    services.category_totals(qs.filter(type="expense"))
+    services.monthly_totals(qs)
+    services.distinct_years(qs)
+
+
+# Текущая реализация: агрегации в БД по помесячной сводке (без кеша
+# аналитики — иначе после первого повтора замерялись бы попадания в кеш)
+def rollup_pipeline(user):
+    services.expenses_by_category_qs.uncached(user)
+    services.monthly_balance_qs.uncached(user)
+    services.available_years_qs.uncached(user)
+
+
+# Баланс за 5 лет по дням, недели и месяцы: нарастающий итог в Python по
+# исходным строкам против оконной функции в БД (без кеша аналитики)
+FLOW_PERIOD = (date.today() - timedelta(days=5 * 365), date.today())
+
+
+def python_cash_flow_pipeline(user):
+    date_from, date_to = FLOW_PERIOD
+    for step in (1, 7, 30):
+        by_day = defaultdict(float)
+        for day, tx_type, amount in Transaction.objects.filter(user=user).values_list("date", "type", "amount"):
+            if day <= date_to:
+                by_day[(day - date_from).days // step] += float(amount) if tx_type == "income" else -float(amount)
+        running, balance = 0.0, []
+        for index in range(min(by_day, default=0), (date_to - date_from).days // step + 1):
+            running += by_day.get(index, 0.0)
+            balance.append(running)
+
+
+def window_cash_flow_pipeline(user):
+    date_from, date_to = FLOW_PERIOD
+    for period in ("day", "week", "month"):
+        services.cash_flow_qs.uncached(user, date_from, date_to, period)
+
+
+class Command(BaseCommand):
+    help = (
+        "Сравнивает аналитику на pandas, SQL-агрегации по операциям и по "
+        "помесячной сводке, а также баланс и денежный поток в Python и оконными "
+        "функциями на разных объёмах истории. Работает на временной БД."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--sizes",
+            nargs="+",
+            type=int,
+            default=[10_000, 100_000, 1_000_000],
+            help="Количество операций пользователя для каждого прогона.",
+        )
+        parser.add_argument("--repeat", type=int, default=3)
+
+    def handle(self, *args, sizes, repeat, **options):
+        try:
+            import pandas as pd
+        except ImportError:
+            pd = None
+            self.stderr.write("pandas не установлен — эталон на pandas пропущен.")
+
+        pipelines = [
+            ("sql", sql_pipeline),
+            ("rollup", rollup_pipeline),
+            ("py-flow", python_cash_flow_pipeline),
+            ("window", window_cash_flow_pipeline),
+        ]
+        if pd is not None:
+            pipelines.insert(0, ("pandas", lambda user: legacy_pandas_pipeline(user, pd)))
+
+        self.stdout.write(f"{'rows':>10} {'pipeline':>8} {'time, ms':>10} {'queries':>8} {'peak, KiB':>10}")
+        with temporary_database():
+            for i, size in enumerate(sizes):
+                user = create_user_with_history(f"bench_{i}", size, seed=i)
+                for name, pipeline in pipelines:
+                    result = measure(pipeline, user, repeat=repeat)
+                    self.stdout.write(
+                        f"{size:>10} {name:>8} {result['seconds'] * 1000:>10.1f} "
+                        f"{result['queries']:>8} {result['peak_kib']:>10.0f}"
+                    )
@@ -0,0 +1,110 @@
+import asyncio
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test import AsyncClient, Client
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from ._bench import create_user_with_history, temporary_database
+
+URL_NAMES = ("finance:dashboard", "finance:analytics")
+
+
+def percentile(values, q):
+    """Перцентиль методом ближайшего ранга; values отсортированы."""
+    if not values:
+        return 0.0
+    return values[max(0, math.ceil(q / 100 * len(values)) - 1)]
+
+
+def run_wsgi(url, cookies, concurrency, total):
+    """
+    WSGI: пул потоков, как у многопоточного WSGI-сервера; у каждого потока
+    свой клиент и своё соединение с БД.
+    """
+    def worker(n):
+        client = Client()
+        client.cookies.update(cookies)
+        latencies, errors = [], 0
+        for _ in range(n):
+            start = time.perf_counter()
+            response = client.get(url)
+            latencies.append(time.perf_counter() - start)
+            errors += response.status_code != 200
+        return latencies, errors
+
+    shares = [total // concurrency + (i < total % concurrency) for i in range(concurrency)]
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        return list(pool.map(worker, shares))
+
+
+def run_asgi(url, cookies, concurrency, total):
+    """ASGI: один event loop, `concurrency` одновременных запросов."""
+    async def worker(n):
+        client = AsyncClient()
+        client.cookies.update(cookies)
+        latencies, errors = [], 0
+        for _ in range(n):
+            start = time.perf_counter()
+            response = await client.get(url)
+            latencies.append(time.perf_counter() - start)
+            errors += response.status_code != 200
+        return latencies, errors
+
+    async def main():
+        shares = [total // concurrency + (i < total % concurrency) for i in range(concurrency)]
+        return await asyncio.gather(*(worker(n) for n in shares))
+
+    return asyncio.run(main())
+
+
+class Command(BaseCommand):
+    help = (
+        "Нагрузочный тест дашборда и аналитики под WSGI (пул потоков) и ASGI "
+        "(event loop): p50/p99 задержки и пропускная способность при разной "
+        "конкурентности. Работает на временной БД."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--transactions", type=int, default=100_000, help="Размер истории пользователя.")
+        parser.add_argument(
+            "--concurrency",
+            nargs="+",
+            type=int,
+            default=[1, 10, 50],
+            help="Число одновременных запросов для каждого прогона.",
+        )
+        parser.add_argument("--requests", type=int, default=200, help="Запросов на каждый прогон.")
+
+    def handle(self, *args, transactions, concurrency, requests, **options):
+        modes = [("wsgi", run_wsgi), ("asgi", run_asgi)]
+        self.stdout.write(
+            f"{'url':>20} {'mode':>5} {'conc':>5} {'p50, ms':>9} {'p99, ms':>9} {'req/s':>8} {'errors':>7}"
+        )
+        # DEBUG=False — не копить connection.queries; testserver — хост тестовых клиентов
+        with temporary_database(), override_settings(
+            DEBUG=False, ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"]
+        ):
+            user = create_user_with_history("bench_async", transactions)
+            login = Client()
+            login.force_login(user)
+            for url_name in URL_NAMES:
+                url = reverse(url_name)
+                for level in concurrency:
+                    for mode, run in modes:
+                        run(url, login.cookies, level, min(requests, level * 2))  # прогрев
+                        start = time.perf_counter()
+                        results = run(url, login.cookies, level, requests)
+                        elapsed = time.perf_counter() - start
+                        latencies = sorted(lat for lats, _ in results for lat in lats)
+                        errors = sum(err for _, err in results)
+                        self.stdout.write(
+                            f"{url:>20} {mode:>5} {level:>5} "
+                            f"{percentile(latencies, 50) * 1000:>9.1f} "
+                            f"{percentile(latencies, 99) * 1000:>9.1f} "
+                            f"{len(latencies) / elapsed:>8.0f} {errors:>7}"
+                        )
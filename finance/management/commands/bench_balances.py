@@ -0,0 +1,83 @@
+import random
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+
+from finance import balances, services
+from finance.models import Transaction
+
+from ._bench import create_user_with_history, measure, temporary_database
+
+YEARS = 5
+
+
+def random_ranges(rnd, count):
+    # Произвольные периоды внутри истории: от дня до всех пяти лет
+    today = date.today()
+    return [
+        tuple(sorted(today - timedelta(days=rnd.randrange(YEARS * 365)) for _ in range(2)))
+        for _ in range(count)
+    ]
+
+
+# Прежний способ: SUM по операциям периода (или по сводке за целые месяцы)
+def aggregate_totals(user, ranges):
+    for date_from, date_to in ranges:
+        qs, amount_field = services._summary_source(user, date_from, date_to, None, None)
+        services.income_expense_totals(qs, amount_field)
+
+
+def prefix_totals(user, ranges):
+    for date_from, date_to in ranges:
+        balances.range_totals(user.pk, date_from, date_to)
+
+
+def write_at(user, day):
+    # Создание и удаление операции через ORM, с сигналами и сдвигом хвоста
+    tx = Transaction.objects.create(user=user, type="expense", amount=Decimal("1.00"), date=day)
+    tx.delete()
+
+
+class Command(BaseCommand):
+    help = (
+        "Сравнивает суммы доходов и расходов за произвольные периоды по итогам "
+        "на день (два поиска по индексу) с агрегацией по операциям на "
+        "пятилетней истории, а также цену записи операции сегодняшним днём и "
+        "задним числом. Работает на временной БД."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+        parser.add_argument("--ranges", type=int, default=200, help="Случайных периодов на замер.")
+        parser.add_argument("--writes", type=int, default=50)
+        parser.add_argument("--repeat", type=int, default=3)
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, sizes, ranges, writes, repeat, seed, **options):
+        rnd = random.Random(seed)
+        self.stdout.write(f"{'rows':>10} {'method':>12} {'per call, ms':>13} {'queries':>8} {'peak, KiB':>10}")
+        with temporary_database():
+            for i, size in enumerate(sizes):
+                user = create_user_with_history(f"bench_{i}", size, years=YEARS, seed=i)
+                cases = random_ranges(rnd, ranges)
+                # Оба способа должны давать одинаковые суммы
+                for date_from, date_to in cases[:20]:
+                    qs, amount_field = services._summary_source(user, date_from, date_to, None, None)
+                    expected = services._totals_context(*services.income_expense_totals(qs, amount_field))
+                    if balances.range_totals(user.pk, date_from, date_to) != (expected["income_sum"], expected["expense_sum"]):
+                        raise CommandError(f"Суммы за {date_from}..{date_to} не совпадают")
+
+                oldest = date.today() - timedelta(days=YEARS * 365)
+                methods = [
+                    ("aggregate", aggregate_totals, (user, cases), len(cases)),
+                    ("prefix", prefix_totals, (user, cases), len(cases)),
+                    ("write today", lambda n: [write_at(user, date.today()) for _ in range(n)], (writes,), writes),
+                    ("write -5y", lambda n: [write_at(user, oldest) for _ in range(n)], (writes,), writes),
+                ]
+                for name, func, func_args, calls in methods:
+                    result = measure(func, *func_args, repeat=repeat)
+                    self.stdout.write(
+                        f"{size:>10} {name:>12} {result['seconds'] * 1000 / calls:>13.3f} "
+                        f"{result['queries'] // calls:>8} {result['peak_kib']:>10.0f}"
+                    )
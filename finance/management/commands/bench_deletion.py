@@ -0,0 +1,126 @@
+import multiprocessing
+import tempfile
+import threading
+import time
+from datetime import date
+from decimal import Decimal
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connections
+
+from finance import deletion
+from finance.models import Category, Transaction
+
+from ._bench import create_user_with_history, temporary_database
+from .bench_sqlite import _is_lock_error, p99_ms, sqlite_profile
+
+
+def _rss_kib():
+    # Анонимная память процесса (Linux): без страниц файла БД, отображённых
+    # через mmap_size, — они вытесняемы и есть у всех способов одинаково
+    with open("/proc/self/status") as status:
+        for line in status:
+            if line.startswith("RssAnon:"):
+                return int(line.split()[1])
+    return 0
+
+
+def writer(username, stop, results):
+    """Процесс-клиент: пока идёт удаление, создаёт операции другого пользователя и замеряет задержку."""
+    user = User.objects.get(username=username)
+    latencies, errors = [], 0
+    while not stop.is_set():
+        start = time.perf_counter()
+        try:
+            Transaction.objects.create(user=user, type="expense", amount=Decimal("1.00"), date=date.today())
+        except OperationalError as exc:
+            if not _is_lock_error(exc):
+                raise
+            errors += 1
+        else:
+            latencies.append(time.perf_counter() - start)
+        time.sleep(0.01)
+    connections.close_all()
+    results.put((latencies, errors))
+
+
+def deleter(kind, method, username, batch_size, results):
+    """Процесс удаления: время и прирост пикового RSS относительно начала."""
+    base = peak = _rss_kib()
+    done = threading.Event()
+
+    def sample():
+        nonlocal peak
+        while not done.is_set():
+            peak = max(peak, _rss_kib())
+            time.sleep(0.005)
+
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+    start = time.perf_counter()
+    user = User.objects.get(username=username)
+    target = user if kind == "user" else Category.objects.filter(user=user, name="Еда").get()
+    if method == "collector":
+        target.delete()
+    else:
+        schedule = deletion.schedule_user_deletion if kind == "user" else deletion.schedule_category_deletion
+        deletion.run(schedule(target, background=False).pk, batch_size=batch_size)
+    elapsed = time.perf_counter() - start
+    done.set()
+    sampler.join()
+    connections.close_all()
+    results.put((elapsed, peak - base))
+
+
+class Command(BaseCommand):
+    help = (
+        "Сравнивает удаление пользователя и категории с большой историей обычным "
+        "delete() (Collector, одна транзакция) и пачками (finance.deletion) на "
+        "файловой SQLite с профилем production: время, прирост пикового RSS и "
+        "задержку записи параллельного клиента."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--transactions", type=int, default=200_000, help="История удаляемого пользователя.")
+        parser.add_argument("--kinds", nargs="+", choices=["user", "category"], default=["user", "category"])
+        parser.add_argument("--methods", nargs="+", choices=["collector", "batched"], default=["collector", "batched"])
+        parser.add_argument("--batch-size", type=int, default=None)
+
+    def handle(self, *args, transactions, kinds, methods, batch_size, **options):
+        context = multiprocessing.get_context("fork")
+        self.stdout.write(
+            f"{'kind':>9} {'method':>10} {'seconds':>8} {'anon +MiB':>9} "
+            f"{'writes':>7} {'write p99, ms':>14} {'write max, ms':>14} {'lock errors':>12}"
+        )
+        with tempfile.TemporaryDirectory() as tmp:
+            for kind in kinds:
+                for method in methods:
+                    path = Path(tmp) / f"{kind}_{method}.sqlite3"
+                    with sqlite_profile(path, settings.SQLITE_PRODUCTION_OPTIONS), temporary_database():
+                        create_user_with_history("bench_victim", transactions, seed=1)
+                        create_user_with_history("bench_writer", 1000, seed=2)
+                        # Дочерние процессы открывают свои соединения
+                        connections.close_all()
+
+                        results, stop = context.Queue(), context.Event()
+                        writer_proc = context.Process(target=writer, args=("bench_writer", stop, results))
+                        writer_proc.start()
+                        time.sleep(0.5)
+                        deleter_results = context.Queue()
+                        deleter_proc = context.Process(
+                            target=deleter, args=(kind, method, "bench_victim", batch_size, deleter_results)
+                        )
+                        deleter_proc.start()
+                        elapsed, rss_kib = deleter_results.get()
+                        deleter_proc.join()
+                        stop.set()
+                        latencies, errors = results.get()
+                        writer_proc.join()
+
+                    self.stdout.write(
+                        f"{kind:>9} {method:>10} {elapsed:>8.2f} {rss_kib / 1024:>9.1f} {len(latencies):>7} "
+                        f"{p99_ms(latencies):>14.1f} {max(latencies, default=0) * 1000:>14.1f} {errors:>12}"
+                    )
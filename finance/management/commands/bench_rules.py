@@ -0,0 +1,120 @@
+import random
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, connection
+from django.test.utils import CaptureQueriesContext
+
+from finance import balances, rollups, rules
+from finance.models import DEFAULT_CATEGORIES, Category, CategoryRule, Transaction
+
+from ._bench import temporary_database
+
+SYLLABLES = ("ба", "ве", "гро", "да", "жу", "зо", "ки", "ла", "ми", "но", "пру", "ре", "си", "то", "фа", "ху", "це", "ша")
+
+
+def merchant_names(rnd, count):
+    names = set()
+    while len(names) < count:
+        names.add("".join(rnd.choice(SYLLABLES) for _ in range(rnd.randint(2, 4))).capitalize() + rnd.choice(("", " Маркет", " Сервис")))
+    return sorted(names)
+
+
+def descriptions(rnd, merchants, count):
+    # Как в выписке банка: префикс, продавец, город
+    return [
+        f"Оплата картой *{rnd.randint(1000, 9999)} {rnd.choice(merchants)} г. {rnd.choice(('Москва', 'Казань', 'Пермь'))}"
+        for _ in range(count)
+    ]
+
+
+def naive_category(rule_list, description):
+    # Прежний подход: перебор правил по очереди
+    text = rules.normalize(description)
+    for pattern, category_id in rule_list:
+        if pattern in text:
+            return category_id
+    return None
+
+
+class Command(BaseCommand):
+    help = (
+        "Замеряет автокатегоризацию: компиляцию правил пользователя, проверку "
+        "описания объединённым выражением против перебора правил и пересчёт "
+        "истории операций пачками. Работает на временной БД."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rules", type=int, nargs="+", default=[10, 100, 500], dest="rule_counts")
+        parser.add_argument("--transactions", type=int, default=100_000, help="Операций в истории для пересчёта.")
+        parser.add_argument("--samples", type=int, default=20_000, help="Описаний для замера проверки.")
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, rule_counts, transactions, samples, seed, **options):
+        rnd = random.Random(seed)
+        # Половина продавцов в выписке не попадает ни под одно правило
+        merchants = merchant_names(rnd, max(rule_counts) * 2)
+        sample = descriptions(rnd, merchants, samples)
+
+        with temporary_database():
+            user = User.objects.create_user("bench_rules")
+            categories = Category.objects.bulk_create(
+                [Category(user=user, name=name, is_income=is_income) for name, is_income in DEFAULT_CATEGORIES]
+            )
+            expense_categories = [c for c in categories if not c.is_income]
+
+            self.stdout.write(f"{'rules':>6} {'compile, ms':>12} {'trie, us':>9} {'naive, us':>10} {'matched':>8}")
+            for count in rule_counts:
+                CategoryRule.objects.filter(user=user).delete()
+                CategoryRule.objects.bulk_create(
+                    [
+                        CategoryRule(user=user, pattern=name, category=expense_categories[i % len(expense_categories)], priority=i)
+                        for i, name in enumerate(rnd.sample(merchants, count))
+                    ]
+                )
+                started = time.perf_counter()
+                matcher = rules.load_rules(user)
+                compile_ms = (time.perf_counter() - started) * 1000
+                rule_list = [
+                    (rules.normalize(p), c)
+                    for p, c in CategoryRule.objects.filter(user=user).order_by("priority", "id").values_list("pattern", "category_id")
+                ]
+
+                started = time.perf_counter()
+                matched = [matcher.category_for(d, "expense") for d in sample]
+                trie_us = (time.perf_counter() - started) / len(sample) * 1e6
+                started = time.perf_counter()
+                expected = [naive_category(rule_list, d) for d in sample]
+                naive_us = (time.perf_counter() - started) / len(sample) * 1e6
+                assert matched == expected
+                self.stdout.write(
+                    f"{count:>6} {compile_ms:>12.1f} {trie_us:>9.1f} {naive_us:>10.1f} "
+                    f"{sum(m is not None for m in matched) / len(matched):>8.0%}"
+                )
+
+            # Пересчёт истории: операции без категории, правила — последний набор
+            today = date.today()
+            Transaction.objects.bulk_create(
+                [
+                    Transaction(
+                        user=user, type="expense", amount=Decimal(rnd.randint(100, 500000)) / 100,
+                        date=today - timedelta(days=rnd.randrange(5 * 365)), description=description,
+                    )
+                    for description in descriptions(rnd, merchants, transactions)
+                ],
+                batch_size=5000,
+            )
+            rollups.rebuild(DEFAULT_DB_ALIAS, [user.pk])
+            balances.rebuild(DEFAULT_DB_ALIAS, [user.pk])
+            with CaptureQueriesContext(connection) as ctx:
+                started = time.perf_counter()
+                changed = rules.recategorize(user)
+                elapsed = time.perf_counter() - started
+            self.stdout.write(
+                f"\nПересчёт истории: {transactions} операций, {rule_counts[-1]} правил — изменено {changed} "
+                f"за {elapsed:.2f} с ({transactions / elapsed:,.0f} операций/с), запросов {len(ctx.captured_queries)}"
+            )
+            assert rollups.verify(DEFAULT_DB_ALIAS, [user.pk]) == []
@@ -0,0 +1,105 @@
+import random
+import statistics
+import time
+from datetime import date, timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from finance.models import Transaction
+from finance.search import search_transactions
+from finance.seeding import EXPENSE_PROFILES, seed_users
+from finance.services import filtered_transactions_qs
+
+from ._bench import temporary_database
+
+PAGE = 50
+
+# Редкие описания: по RARE_PER_USER операций у каждого пользователя
+RARE_MERCHANTS = ("Аптека Ригла", "Ветклиника Зоодоктор", "Стоматология Улыбка", "Театр Современник", "Леруа Мерлен")
+RARE_PER_USER = 5
+
+
+def query_classes():
+    """Запросы по классам: частые слова выписки (и их начала), редкие и без совпадений."""
+    frequent = [d.split()[0] for *_, descriptions in EXPENSE_PROFILES.values() for d in descriptions]
+    return {
+        "frequent": [w.lower() for w in frequent] + [w[:3].lower() for w in frequent],
+        "rare": [m.split()[1][:5].lower() for m in RARE_MERCHANTS] + [m.lower() for m in RARE_MERCHANTS],
+        "missing": ["несуществующее", "xyzzy", "абвгд"],
+    }
+
+
+def icontains_search(qs, text):
+    # Прежний способ: LIKE по описанию и названию категории
+    return qs.filter(Q(description__icontains=text) | Q(category__name__icontains=text)).order_by("-date", "-id")
+
+
+def add_rare_transactions(rnd, user_ids, end):
+    Transaction.objects.bulk_create(
+        [
+            Transaction(
+                user_id=user_id, type="expense", amount=100, description=rnd.choice(RARE_MERCHANTS),
+                date=end - timedelta(days=rnd.randrange(365)),
+            )
+            for user_id in user_ids
+            for _ in range(RARE_PER_USER)
+        ],
+        batch_size=5000,
+    )
+
+
+class Command(BaseCommand):
+    help = (
+        "Замеряет задержку полнотекстового поиска операций (FTS5) против "
+        "icontains на сгенерированных данных: первая страница результатов "
+        "для случайных пользователей, с фильтрами дашборда и без, отдельно для "
+        "частых слов, редких слов и запросов без совпадений. Работает на временной БД."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=100)
+        parser.add_argument("--transactions", type=int, default=10_000, help="Операций на пользователя.")
+        parser.add_argument("--searches", type=int, default=100, help="Поисковых запросов на класс.")
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, users, transactions, searches, seed, **options):
+        with temporary_database():
+            start = time.perf_counter()
+            seed_users(users, transactions, seed=seed, progress=self._progress)
+            rnd = random.Random(seed)
+            user_ids = list(User.objects.values_list("pk", flat=True))
+            add_rare_transactions(rnd, user_ids, date.today())
+            self.stdout.write(
+                f"\nДанные: {Transaction.objects.count()} операций за {time.perf_counter() - start:.0f} с"
+            )
+
+            methods = {
+                "fts5": lambda qs, text, user_id: search_transactions(qs, text, user_id),
+                "icontains": lambda qs, text, user_id: icontains_search(qs, text),
+            }
+            self.stdout.write(f"{'queries':>10} {'method':>10} {'p50, ms':>9} {'p99, ms':>9} {'max, ms':>9}")
+            for kind, texts in query_classes().items():
+                cases = []
+                for _ in range(searches):
+                    filters = {}
+                    if rnd.random() < 0.5:
+                        filters = {"date_from": date.today() - timedelta(days=rnd.randint(30, 365)), "tx_type": "expense"}
+                    cases.append((rnd.choice(user_ids), rnd.choice(texts), filters))
+                for name, method in methods.items():
+                    timings = []
+                    for user_id, text, filters in cases:
+                        qs = filtered_transactions_qs(user_id, **filters).select_related("category")
+                        started = time.perf_counter()
+                        list(method(qs, text, user_id)[:PAGE])
+                        timings.append((time.perf_counter() - started) * 1000)
+                    timings.sort()
+                    self.stdout.write(
+                        f"{kind:>10} {name:>10} {statistics.median(timings):>9.2f} "
+                        f"{timings[int(len(timings) * 0.99)]:>9.2f} {timings[-1]:>9.2f}"
+                    )
+
+    def _progress(self, done, total):
+        self.stdout.write(f"\rПользователей: {done}/{total}", ending="")
+        self.stdout.flush()
@@ -0,0 +1,99 @@
+import multiprocessing
+import tempfile
+import time
+from collections import Counter
+from datetime import date
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connections
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from finance import sharding
+from finance.models import Category
+
+from ._bench import temporary_database, temporary_shards
+from .bench_sqlite import _is_lock_error, p99_ms, sqlite_profile
+
+
+def writer(username, start_at, deadline, results):
+    """Процесс-клиент: создаёт операции своего пользователя через представление, пока не выйдет время."""
+    user = User.objects.get(username=username)
+    with sharding.for_user(user):
+        category = Category.objects.get(user=user)
+    client = Client()
+    client.force_login(user)
+    stats, latencies = Counter(), []
+    time.sleep(max(0.0, start_at - time.time()))
+    while time.time() < deadline:
+        start = time.perf_counter()
+        try:
+            client.post(
+                reverse("finance:transaction_create"),
+                {"type": "expense", "category": category.pk, "amount": "1.00",
+                 "date": date.today().isoformat(), "description": "bench"},
+            )
+        except OperationalError as exc:
+            if not _is_lock_error(exc):
+                raise
+            stats["lock_errors"] += 1
+            continue
+        stats["writes"] += 1
+        latencies.append(time.perf_counter() - start)
+    connections.close_all()
+    results.put((dict(stats), latencies))
+
+
+class Command(BaseCommand):
+    help = (
+        "Параллельная запись операций через представление при разном числе шардов "
+        "(finance.sharding) на файловых SQLite с профилем production: каждый процесс — "
+        "свой пользователь; 0 шардов — всё в основной базе."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--shards", type=int, nargs="+", default=[0, 1, 2, 4])
+        parser.add_argument("--processes", type=int, default=8)
+        parser.add_argument("--seconds", type=float, default=10.0, help="Длительность прогона.")
+
+    def handle(self, *args, shards, processes, seconds, **options):
+        context = multiprocessing.get_context("fork")
+        options = settings.SQLITE_PRODUCTION_OPTIONS
+        self.stdout.write(f"{'shards':>6} {'writes/s':>9} {'write p99, ms':>14} {'lock errors':>12}")
+        with override_settings(DEBUG=False, ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"]):
+            for count in shards:
+                with tempfile.TemporaryDirectory() as tmp, sqlite_profile(Path(tmp) / "default.sqlite3", options), \
+                        temporary_database(), temporary_shards(count, tmp, options):
+                    usernames = []
+                    for i in range(processes):
+                        # Сигнал создания пользователя выбирает ему шард
+                        user = User.objects.create_user(f"bench_{i}")
+                        with sharding.for_user(user):
+                            Category.objects.create(user=user, name="Еда")
+                        usernames.append(user.username)
+                    connections.close_all()
+
+                    results = context.Queue()
+                    start_at = time.time() + 1.0
+                    deadline = start_at + seconds
+                    workers = [
+                        context.Process(target=writer, args=(username, start_at, deadline, results))
+                        for username in usernames
+                    ]
+                    for proc in workers:
+                        proc.start()
+                    outcomes = [results.get() for _ in workers]
+                    for proc in workers:
+                        proc.join()
+
+                stats, latencies = Counter(), []
+                for worker_stats, worker_latencies in outcomes:
+                    stats.update(worker_stats)
+                    latencies.extend(worker_latencies)
+                self.stdout.write(
+                    f"{count:>6} {stats['writes'] / seconds:>9.1f} {p99_ms(latencies):>14.1f} {stats['lock_errors']:>12}"
+                )
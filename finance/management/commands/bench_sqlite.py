@@ -0,0 +1,168 @@
+import multiprocessing
+import random
+import tempfile
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import date
+from decimal import Decimal
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connections
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from fin_tracker.sqlite_backend.base import DatabaseWrapper
+from finance.models import Category, Goal
+
+from ._bench import create_user_with_history, temporary_database
+
+# default — настройки SQLite по умолчанию (журнал отката, BEGIN DEFERRED);
+# wal — только pragma; production — pragma и BEGIN IMMEDIATE из settings
+PROFILES = {
+    "default": {},
+    "wal": {"init_command": settings.SQLITE_PRODUCTION_OPTIONS["init_command"]},
+    "production": settings.SQLITE_PRODUCTION_OPTIONS,
+}
+
+
+@contextmanager
+def sqlite_profile(path, options, alias=DEFAULT_DB_ALIAS):
+    """Подменяет соединение `alias` на файловую БД `path` с заданными OPTIONS."""
+    original = connections[alias]
+    original.close()
+    settings_dict = {
+        **original.settings_dict,
+        "OPTIONS": options,
+        "TEST": {**original.settings_dict["TEST"], "NAME": str(path)},
+    }
+    connections[alias] = DatabaseWrapper(settings_dict, alias)
+    try:
+        yield connections[alias]
+    finally:
+        connections[alias].close()
+        connections[alias] = original
+
+
+def _is_lock_error(exc):
+    message = str(exc)
+    return "locked" in message or "busy" in message
+
+
+def p99_ms(values):
+    if not values:
+        return 0.0
+    return sorted(values)[int(len(values) * 0.99)] * 1000
+
+
+def worker(username, start_at, deadline, write_ratio, seed, results):
+    """
+    Процесс-клиент: с `start_at` до `deadline` шлёт запросы дашборда, графика, создания
+    операции и пополнения цели в пропорции write_ratio.
+    """
+    rnd = random.Random(seed)
+    user = User.objects.get(username=username)
+    category = Category.objects.filter(user=user, is_income=False).first()
+    goal = Goal.objects.get(user=user)
+    client = Client()
+    client.force_login(user)
+    stats = Counter()
+    latencies = {"reads": [], "writes": []}
+    # Все процессы начинают нагрузку одновременно
+    time.sleep(max(0.0, start_at - time.time()))
+    while time.time() < deadline:
+        roll = rnd.random()
+        start = time.perf_counter()
+        try:
+            if roll < write_ratio / 2:
+                kind = "writes"
+                client.post(
+                    reverse("finance:transaction_create"),
+                    {
+                        "type": "expense",
+                        "category": category.pk,
+                        "amount": f"{rnd.randint(1, 10000) / 100:.2f}",
+                        "date": date.today().isoformat(),
+                        "description": "bench",
+                    },
+                )
+            elif roll < write_ratio:
+                kind = "writes"
+                client.post(reverse("finance:goal_add_amount", args=[goal.pk]), {"amount": "1.00"})
+            else:
+                kind = "reads"
+                client.get(reverse("finance:chart_dashboard") if roll < 0.5 else reverse("finance:dashboard"))
+        except OperationalError as exc:
+            if not _is_lock_error(exc):
+                raise
+            stats["lock_errors"] += 1
+            continue
+        stats[kind] += 1
+        latencies[kind].append(time.perf_counter() - start)
+    connections.close_all()
+    results.put((dict(stats), latencies))
+
+
+class Command(BaseCommand):
+    help = (
+        "Многопроцессный бенчмарк смешанной нагрузки (чтение и запись) на файловой "
+        "SQLite для профилей default, wal и production: пропускная способность и "
+        "доля ошибок «database is locked»."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--processes", type=int, default=8)
+        parser.add_argument("--seconds", type=float, default=10.0, help="Длительность прогона.")
+        parser.add_argument("--write-ratio", type=float, default=0.3, help="Доля запросов на запись.")
+        parser.add_argument("--transactions", type=int, default=5000, help="История каждого пользователя.")
+        parser.add_argument("--profiles", nargs="+", choices=list(PROFILES), default=list(PROFILES))
+
+    def handle(self, *args, processes, seconds, write_ratio, transactions, profiles, **options):
+        # Дочерние процессы наследуют настроенный Django и подменённое соединение
+        context = multiprocessing.get_context("fork")
+        self.stdout.write(
+            f"{'profile':>10} {'reads/s':>8} {'writes/s':>9} {'read p99, ms':>13} {'write p99, ms':>14} "
+            f"{'lock errors':>12} {'error rate':>11}"
+        )
+        with tempfile.TemporaryDirectory() as tmp, override_settings(
+            DEBUG=False, ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"]
+        ):
+            for profile in profiles:
+                path = Path(tmp) / f"{profile}.sqlite3"
+                with sqlite_profile(path, PROFILES[profile]), temporary_database():
+                    usernames = []
+                    for i in range(processes):
+                        user = create_user_with_history(f"bench_{i}", transactions, seed=i)
+                        Goal.objects.create(user=user, name="Отпуск", target_amount=Decimal("1000000000"))
+                        usernames.append(user.username)
+                    connections.close_all()
+
+                    results = context.Queue()
+                    start_at = time.time() + 2
+                    deadline = start_at + seconds
+                    procs = [
+                        context.Process(target=worker, args=(name, start_at, deadline, write_ratio, i, results))
+                        for i, name in enumerate(usernames)
+                    ]
+                    for proc in procs:
+                        proc.start()
+                    stats, latencies = Counter(), {"reads": [], "writes": []}
+                    for _ in procs:
+                        proc_stats, proc_latencies = results.get()
+                        stats.update(proc_stats)
+                        for kind, values in proc_latencies.items():
+                            latencies[kind].extend(values)
+                    for proc in procs:
+                        proc.join()
+
+                attempts = stats["reads"] + stats["writes"] + stats["lock_errors"]
+                self.stdout.write(
+                    f"{profile:>10} {stats['reads'] / seconds:>8.0f} {stats['writes'] / seconds:>9.0f} "
+                    f"{p99_ms(latencies['reads']):>13.1f} {p99_ms(latencies['writes']):>14.1f} "
+                    f"{stats['lock_errors']:>12} "
+                    f"{stats['lock_errors'] / max(attempts, 1):>11.2%}"
+                )
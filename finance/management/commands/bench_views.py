@@ -0,0 +1,249 @@
+import itertools
+import json
+import platform
+import statistics
+import time
+import tracemalloc
+from datetime import date, datetime
+
+import django
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+
+from finance import urls as finance_urls
+from finance.models import Category, Goal, Transaction
+from finance.seeding import seed_users
+
+from ._bench import temporary_database
+
+# Представления, которые принимают только POST
+POST_ONLY = {"transaction_delete", "goal_delete", "goal_add_amount"}
+
+
+class ViewCases:
+    """
+    Запросы ко всем URL finance/urls.py: GET для каждого представления и POST
+    для форм. Объекты для удаления и уникальные данные создаются заново перед
+    каждым прогоном, вне замера.
+    """
+
+    def __init__(self, user):
+        self.user = user
+        self.counter = itertools.count()
+        self.category = Category.objects.filter(user=user, is_income=False).order_by("pk").first()
+        self.transaction = Transaction.objects.filter(user=user).order_by("pk").first()
+        self.goal = Goal.objects.filter(user=user).order_by("pk").first()
+
+    def _transaction_data(self):
+        return {
+            "type": "expense",
+            "category": self.category.pk,
+            "amount": f"{next(self.counter) % 1000 + 1}.00",
+            "date": date.today().isoformat(),
+            "description": "bench",
+        }
+
+    def _statement(self):
+        run = next(self.counter)
+        rows = "".join(f"{date.today():%d.%m.%Y};;Еда;-{i + 1},00;Выписка {run}\n" for i in range(100))
+        content = ("date;type;category;amount;description\n" + rows).encode("utf-8")
+        return {"file": SimpleUploadedFile("statement.csv", content, content_type="text/csv")}
+
+    def _post_data(self, name):
+        run = next(self.counter)
+        return {
+            "signup": lambda: {
+                "username": f"bench_signup_{run}",
+                "email": f"bench_{run}@example.com",
+                "password1": "Bench-pass-123",
+                "password2": "Bench-pass-123",
+            },
+            "transaction_create": self._transaction_data,
+            "transaction_update": self._transaction_data,
+            "transaction_import": self._statement,
+            "goal_create": lambda: {"name": f"Цель {run}", "target_amount": "5000.00", "current_amount": "0"},
+            "goal_update": lambda: {"name": self.goal.name, "target_amount": "900000.00", "current_amount": "10.00"},
+            "goal_add_amount": lambda: {"amount": "1.00"},
+            "transaction_delete": dict,
+            "goal_delete": dict,
+        }.get(name)
+
+    def _url(self, pattern):
+        name = pattern.name
+        if "<int:pk>" not in str(pattern.pattern):
+            return reverse(f"finance:{name}")
+        if name == "transaction_delete":
+            pk = Transaction.objects.create(user=self.user, type="expense", amount=1, date=date.today()).pk
+        elif name == "goal_delete":
+            pk = Goal.objects.create(user=self.user, name="Удаляемая", target_amount=1).pk
+        elif name.startswith("transaction"):
+            pk = self.transaction.pk
+        else:
+            pk = self.goal.pk
+        return reverse(f"finance:{name}", kwargs={"pk": pk})
+
+    def __iter__(self):
+        """(ключ, метод, анонимный запрос, фабрика (url, data))."""
+        for pattern in finance_urls.urlpatterns:
+            name = pattern.name
+            anonymous = name == "signup"
+            if name not in POST_ONLY:
+                yield f"GET {name}", "get", anonymous, lambda pattern=pattern: (self._url(pattern), {})
+            post_data = self._post_data(name)
+            if post_data is not None:
+                yield (
+                    f"POST {name}",
+                    "post",
+                    anonymous,
+                    lambda pattern=pattern, name=name: (self._url(pattern), self._post_data(name)()),
+                )
+
+
+def run_request(client, method, url, data):
+    response = getattr(client, method)(url, data)
+    if response.streaming:
+        b"".join(response.streaming_content)
+    return response
+
+
+def compare(baseline, current, threshold):
+    """
+    Сравнивает результаты с эталоном. Возвращает строки
+    (ключ, время было/стало, запросов было/стало, память было/стало, регрессия).
+    Регрессия — рост числа запросов или времени/памяти больше threshold процентов.
+    """
+    rows = []
+    for key, now in current["views"].items():
+        before = baseline["views"].get(key)
+        if before is None:
+            continue
+        slower = now["median_ms"] > before["median_ms"] * (1 + threshold / 100)
+        heavier = now["peak_kib"] > before["peak_kib"] * (1 + threshold / 100)
+        regression = slower or heavier or now["queries"] > before["queries"]
+        rows.append(
+            (
+                key,
+                (before["median_ms"], now["median_ms"]),
+                (before["queries"], now["queries"]),
+                (before["peak_kib"], now["peak_kib"]),
+                regression,
+            )
+        )
+    return rows
+
+
+class Command(BaseCommand):
+    help = (
+        "Прогоняет все URL finance через тестовый клиент на сгенерированных данных "
+        "и замеряет время, число запросов и пиковую память каждого представления. "
+        "Результаты сохраняются в JSON и могут сравниваться с эталоном. Работает на временной БД."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=5)
+        parser.add_argument("--transactions", type=int, default=10_000, help="Операций на пользователя.")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--repeat", type=int, default=5)
+        parser.add_argument(
+            "--warm",
+            action="store_true",
+            help="Не очищать кеш аналитики перед прогонами (по умолчанию замер без кеша).",
+        )
+        parser.add_argument("--output", default="bench_views.json", help="Куда сохранить результаты.")
+        parser.add_argument("--baseline", help="JSON прошлого прогона для сравнения.")
+        parser.add_argument("--threshold", type=float, default=20.0, help="Допустимый рост времени и памяти, %%.")
+        parser.add_argument(
+            "--fail-on-regression",
+            action="store_true",
+            help="Завершиться с ошибкой, если есть регрессии относительно --baseline.",
+        )
+
+    def handle(self, *args, users, transactions, seed, repeat, warm, output, baseline, threshold,
+               fail_on_regression, **options):
+        results = {
+            "meta": {
+                "created": datetime.now().isoformat(timespec="seconds"),
+                "users": users,
+                "transactions_per_user": transactions,
+                "seed": seed,
+                "repeat": repeat,
+                "warm_cache": warm,
+                "django": django.get_version(),
+                "python": platform.python_version(),
+            },
+            "views": {},
+        }
+        self.stdout.write(f"{'view':>32} {'status':>6} {'median, ms':>11} {'min, ms':>9} {'queries':>8} {'peak, KiB':>10}")
+        with temporary_database(), override_settings(
+            DEBUG=False, ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"]
+        ):
+            seed_users(users, transactions, seed=seed)
+            user = User.objects.order_by("pk").first()
+            user.is_staff = True  # для cache-stats
+            user.save(update_fields=["is_staff"])
+            client = Client()
+            client.force_login(user)
+
+            for key, method, anonymous, make_request in ViewCases(user):
+                timings = []
+                for _ in range(repeat):
+                    # Анонимный клиент — новый на каждый прогон: регистрация выполняет вход
+                    http = Client() if anonymous else client
+                    url, data = make_request()
+                    if not warm:
+                        cache.clear()
+                    start = time.perf_counter()
+                    response = run_request(http, method, url, data)
+                    timings.append((time.perf_counter() - start) * 1000)
+
+                http = Client() if anonymous else client
+                url, data = make_request()
+                if not warm:
+                    cache.clear()
+                tracemalloc.start()
+                with CaptureQueriesContext(connection) as ctx:
+                    run_request(http, method, url, data)
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+
+                row = {
+                    "status": response.status_code,
+                    "median_ms": round(statistics.median(timings), 3),
+                    "min_ms": round(min(timings), 3),
+                    "queries": len(ctx.captured_queries),
+                    "peak_kib": round(peak / 1024, 1),
+                }
+                results["views"][key] = row
+                self.stdout.write(
+                    f"{key:>32} {row['status']:>6} {row['median_ms']:>11.1f} {row['min_ms']:>9.1f} "
+                    f"{row['queries']:>8} {row['peak_kib']:>10.0f}"
+                )
+
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        self.stdout.write(self.style.SUCCESS(f"Результаты сохранены в {output}"))
+
+        if baseline:
+            with open(baseline, encoding="utf-8") as f:
+                rows = compare(json.load(f), results, threshold)
+            regressions = self._report(rows)
+            if regressions and fail_on_regression:
+                raise CommandError(f"Регрессий относительно {baseline}: {regressions}")
+
+    def _report(self, rows):
+        self.stdout.write(f"\n{'view':>32} {'time, ms':>18} {'queries':>10} {'peak, KiB':>16}")
+        regressions = 0
+        for key, (t0, t1), (q0, q1), (m0, m1), regression in rows:
+            line = f"{key:>32} {t0:>8.1f} → {t1:<7.1f} {q0:>4} → {q1:<3} {m0:>7.0f} → {m1:<6.0f}"
+            if regression:
+                regressions += 1
+                line = self.style.ERROR(line + " регрессия")
+            self.stdout.write(line)
+        return regressions
@@ -0,0 +1,43 @@
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from finance.importers import import_transactions
+
+
+class Command(BaseCommand):
+    help = "Импортирует операции пользователя из CSV-выписки банка."
+
+    def add_arguments(self, parser):
+        parser.add_argument("username")
+        parser.add_argument("path", help="Путь к CSV-файлу.")
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=None,
+            help="Размер пачки bulk_create (по умолчанию FINANCE_IMPORT_BATCH_SIZE).",
+        )
+
+    def handle(self, *args, username, path, batch_size=None, **options):
+        try:
+            user = User.objects.get(username=username)
+        except User.DoesNotExist:
+            raise CommandError(f"Пользователь {username} не найден.")
+
+        start = time.perf_counter()
+        try:
+            with open(path, "rb") as f:
+                result = import_transactions(user, f, batch_size=batch_size)
+        except OSError as exc:
+            raise CommandError(str(exc))
+        elapsed = time.perf_counter() - start
+
+        for line_no, message in result.errors:
+            self.stderr.write(f"Строка {line_no}: {message}")
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Добавлено: {result.created}, повторов: {result.duplicates}, "
+                f"ошибок: {len(result.errors)} ({elapsed:.2f} с)."
+            )
+        )
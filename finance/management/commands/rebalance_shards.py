@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from finance import sharding
+
+
+class Command(BaseCommand):
+    help = (
+        "Переносит данные finance пользователей между базами-шардами пачками. "
+        "По умолчанию — всех, кто не в своём шарде (например, созданных до "
+        "включения шардов или после изменения их числа)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--user", type=int, action="append", dest="user_ids", help="id пользователя (можно указать несколько раз)."
+        )
+        parser.add_argument("--to", dest="target", help="База назначения; по умолчанию — шард пользователя по id.")
+        parser.add_argument("--batch-size", type=int, default=None)
+        parser.add_argument("--pause", type=float, default=0, help="Пауза между пачками, сек.")
+        parser.add_argument("--dry-run", action="store_true", help="Только показать, кто куда переедет.")
+
+    def handle(self, *args, user_ids=None, target=None, batch_size=None, pause=0, dry_run=False, **options):
+        if not sharding.enabled():
+            raise CommandError("Шарды не настроены: задайте FIN_TRACKER_SHARDS.")
+        if target is not None:
+            if target not in sharding.databases():
+                raise CommandError(f"Неизвестная база данных «{target}»: {', '.join(sharding.databases())}")
+            if not user_ids:
+                raise CommandError("С --to нужно указать --user.")
+            moves = [(user_id, sharding.db_for_user(user_id), target) for user_id in user_ids]
+        else:
+            moves = sharding.misplaced(user_ids)
+
+        refused = 0
+        for user_id, source, destination in moves:
+            if dry_run or source == destination:
+                self.stdout.write(f"user={user_id}: {source} → {destination}")
+                continue
+            try:
+                copied = sharding.move_user(user_id, destination, batch_size=batch_size, pause=pause)
+            except ValueError as exc:
+                refused += 1
+                self.stderr.write(f"user={user_id}: {exc}")
+                continue
+            self.stdout.write(f"user={user_id}: {source} → {destination}, строк {sum(copied.values())}")
+        if refused:
+            raise CommandError(f"Не перенесено пользователей: {refused}")
+        self.stdout.write(self.style.SUCCESS(f"{'К переносу' if dry_run else 'Перенесено'} пользователей: {len(moves)}."))
@@ -0,0 +1,44 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+
+from finance import balances
+from finance.cache import bump_version
+
+
+class Command(BaseCommand):
+    help = "Пересобирает или проверяет итоги доходов и расходов по дням (DailyBalance)."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--verify",
+            action="store_true",
+            help="Только сравнить итоги с исходными операциями, ничего не меняя.",
+        )
+        parser.add_argument(
+            "--user",
+            type=int,
+            action="append",
+            dest="user_ids",
+            help="id пользователя (можно указать несколько раз). По умолчанию — все.",
+        )
+        parser.add_argument("--database", default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, verify=False, user_ids=None, database=DEFAULT_DB_ALIAS, **options):
+        if verify:
+            mismatches = balances.verify(database, user_ids)
+            for (user_id, day), expected, actual in mismatches:
+                stored = f"{actual[0]}/{actual[1]}" if actual is not None else "нет строки"
+                self.stdout.write(
+                    f"user={user_id} day={day}: ожидалось {expected[0]}/{expected[1]} коп., в итогах {stored}"
+                )
+            if mismatches:
+                raise CommandError(f"Найдено расхождений: {len(mismatches)}")
+            self.stdout.write(self.style.SUCCESS("Итоги по дням совпадают с операциями."))
+            return
+
+        count = balances.rebuild(database, user_ids)
+        # Закешированная аналитика могла быть посчитана по неверным итогам
+        for user_id in user_ids or User.objects.using(database).values_list("pk", flat=True):
+            bump_version(user_id)
+        self.stdout.write(self.style.SUCCESS(f"Итоги по дням пересобраны, строк: {count}."))
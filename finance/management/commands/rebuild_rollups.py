@@ -0,0 +1,44 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+
+from finance import rollups
+from finance.cache import bump_version
+
+
+class Command(BaseCommand):
+    help = "Пересобирает или проверяет помесячные сводки операций (MonthlyRollup)."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--verify",
+            action="store_true",
+            help="Только сравнить сводки с исходными операциями, ничего не меняя.",
+        )
+        parser.add_argument(
+            "--user",
+            type=int,
+            action="append",
+            dest="user_ids",
+            help="id пользователя (можно указать несколько раз). По умолчанию — все.",
+        )
+        parser.add_argument("--database", default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, verify=False, user_ids=None, database=DEFAULT_DB_ALIAS, **options):
+        if verify:
+            mismatches = rollups.verify(database, user_ids)
+            for (user_id, month, tx_type, category_id), expected, actual in mismatches:
+                self.stdout.write(
+                    f"user={user_id} month={month:%Y-%m} type={tx_type} category={category_id}: "
+                    f"ожидалось {expected[0]}/{expected[1]}, в сводке {actual[0]}/{actual[1]}"
+                )
+            if mismatches:
+                raise CommandError(f"Найдено расхождений: {len(mismatches)}")
+            self.stdout.write(self.style.SUCCESS("Сводки совпадают с операциями."))
+            return
+
+        count = rollups.rebuild(database, user_ids)
+        # Закешированная аналитика могла быть посчитана по неверным сводкам
+        for user_id in user_ids or User.objects.using(database).values_list("pk", flat=True):
+            bump_version(user_id)
+        self.stdout.write(self.style.SUCCESS(f"Сводки пересобраны, строк: {count}."))
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+
+from finance import budgets
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает или проверяет счётчики расходов по бюджетам (BudgetSpend) по исходным операциям."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--verify",
+            action="store_true",
+            help="Только сравнить счётчики с операциями, ничего не меняя.",
+        )
+        parser.add_argument(
+            "--user",
+            type=int,
+            action="append",
+            dest="user_ids",
+            help="id пользователя (можно указать несколько раз). По умолчанию — все.",
+        )
+        parser.add_argument("--database", default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, verify=False, user_ids=None, database=DEFAULT_DB_ALIAS, **options):
+        if verify:
+            mismatches = budgets.verify(database, user_ids)
+            for (budget_id, period_start), expected, actual in mismatches:
+                self.stdout.write(
+                    f"budget={budget_id} period={period_start}: ожидалось {expected}, в счётчике {actual}"
+                )
+            if mismatches:
+                raise CommandError(f"Найдено расхождений: {len(mismatches)}")
+            self.stdout.write(self.style.SUCCESS("Счётчики бюджетов совпадают с операциями."))
+            return
+
+        fixed = budgets.reconcile(database, user_ids)
+        self.stdout.write(self.style.SUCCESS(f"Счётчики бюджетов пересчитаны, исправлено строк: {fixed}."))
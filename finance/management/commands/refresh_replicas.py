@@ -0,0 +1,39 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from finance import replicas
+
+
+class Command(BaseCommand):
+    help = (
+        "Обновляет реплики для чтения (FINANCE_REPLICAS) снимками основных баз "
+        "через backup API SQLite: один раз или с --loop каждые --interval секунд."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--database", action="append", dest="databases", help="Основная база (можно указать несколько раз)."
+        )
+        parser.add_argument("--loop", action="store_true", help="Обновлять постоянно.")
+        parser.add_argument("--interval", type=float, default=None, help="Период обновления, сек.")
+
+    def handle(self, *args, databases=None, loop=False, interval=None, **options):
+        if not replicas.enabled():
+            raise CommandError("Реплики не настроены: задайте FIN_TRACKER_REPLICAS=1.")
+        unknown = set(databases or []) - set(settings.FINANCE_REPLICAS)
+        if unknown:
+            raise CommandError(f"Нет реплики у баз: {', '.join(sorted(unknown))}")
+        databases = databases or list(settings.FINANCE_REPLICAS)
+        interval = settings.FINANCE_REPLICA_REFRESH_INTERVAL if interval is None else interval
+
+        while True:
+            started = time.monotonic()
+            for primary in databases:
+                elapsed = replicas.refresh(primary)
+                self.stdout.write(f"{primary} → {settings.FINANCE_REPLICAS[primary]}: {elapsed * 1000:.0f} мс")
+            if not loop:
+                break
+            time.sleep(max(0.0, interval - (time.monotonic() - started)))
+        self.stdout.write(self.style.SUCCESS(f"Реплик обновлено: {len(databases)}."))
@@ -0,0 +1,56 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from finance import deletion, sharding
+from finance.models import Category, DeletionTask
+
+
+class Command(BaseCommand):
+    help = (
+        "Выполняет фоновые удаления аккаунтов и категорий пачками: незавершённые "
+        "задачи (в том числе прерванные) или новые — по --user и --category."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--task", type=int, action="append", dest="task_ids", help="id задачи.")
+        parser.add_argument(
+            "--user", type=int, action="append", dest="user_ids", help="Поставить в очередь удаление пользователя."
+        )
+        parser.add_argument(
+            "--category", type=int, action="append", dest="category_ids", help="Поставить в очередь удаление категории."
+        )
+        parser.add_argument("--batch-size", type=int, default=None)
+        parser.add_argument("--pause", type=float, default=None, help="Пауза между пачками, сек.")
+        parser.add_argument("--database", default=None, help="По умолчанию — все базы с данными finance.")
+
+    def handle(self, *args, task_ids=None, user_ids=None, category_ids=None, batch_size=None, pause=None,
+               database=None, **options):
+        # Задачи лежат в базе данных своего пользователя (finance.sharding):
+        # id ищем во всех базах, задача — пара (база, id)
+        databases = [database] if database else sharding.databases()
+        tasks = []
+        for alias in databases:
+            found = DeletionTask.objects.using(alias).filter(pk__in=task_ids or [])
+            tasks.extend((alias, pk) for pk in found.order_by("pk").values_list("pk", flat=True))
+        for user in User.objects.filter(pk__in=user_ids or []):
+            task = deletion.schedule_user_deletion(user, database, background=False)
+            tasks.append((task._state.db, task.pk))
+        for alias in databases:
+            for category in Category.objects.using(alias).filter(pk__in=category_ids or []):
+                tasks.append((alias, deletion.schedule_category_deletion(category, alias, background=False).pk))
+        if not (task_ids or user_ids or category_ids):
+            for alias in databases:
+                unfinished = DeletionTask.objects.using(alias).filter(status__in=("pending", "running"))
+                tasks.extend((alias, pk) for pk in unfinished.order_by("pk").values_list("pk", flat=True))
+
+        failed = 0
+        for alias, task_id in tasks:
+            task = deletion.run(task_id, alias, batch_size=batch_size, pause=pause)
+            self.stdout.write(
+                f"{task}: обработано операций {task.processed} из {task.total}"
+                + (f" ({task.error})" if task.error else "")
+            )
+            failed += task.status == "failed"
+        if failed:
+            raise CommandError(f"Не завершено удалений: {failed}")
+        self.stdout.write(self.style.SUCCESS(f"Удалений выполнено: {len(tasks)}."))
@@ -0,0 +1,113 @@
+import multiprocessing
+import os
+import signal
+import socket
+import threading
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from finance import jobs
+
+
+class Command(BaseCommand):
+    help = (
+        "Исполнитель фоновых задач finance (импорт выписок, применение правил, "
+        "пересчёт аналитики): --processes процессов по --threads потоков забирают "
+        "задачи из очереди в базе данных. С --burst выходит, когда готовых задач нет."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--processes", type=int, default=None)
+        parser.add_argument("--threads", type=int, default=None, help="Потоков в каждом процессе.")
+        parser.add_argument("--poll", type=float, default=None, help="Пауза опроса пустой очереди, сек.")
+        parser.add_argument("--burst", action="store_true", help="Выполнить готовые задачи и выйти.")
+
+    def _loop(self, worker, poll, burst, stop):
+        done = 0
+        while not stop.is_set():
+            job = jobs.run_next(worker)
+            if job is None:
+                if burst:
+                    break
+                stop.wait(poll)
+                continue
+            done += 1
+            self.stdout.write(f"{worker}: {job}" + (f" ({job.error})" if job.error else ""))
+        return done
+
+    def _thread(self, worker, poll, burst, stop, counts):
+        try:
+            counts.append(self._loop(worker, poll, burst, stop))
+        finally:
+            # Соединения с БД у каждого потока свои
+            connections.close_all()
+
+    def _child(self, index, threads, poll, burst, stop, results):
+        # Ctrl+C получает вся группа процессов: дочерние доделывают текущие
+        # задачи по stop от родителя, SIGTERM останавливает их так же
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGTERM, lambda *_: stop.set())
+        try:
+            results.put(self._process(index, threads, poll, burst, stop))
+        finally:
+            connections.close_all()
+
+    def _process(self, index, threads, poll, burst, stop):
+        name = f"{socket.gethostname()}:{os.getpid()}"
+        counts = []
+        if threads == 1:
+            counts.append(self._loop(f"{name}:{index}.0", poll, burst, stop))
+        else:
+            pool = [
+                threading.Thread(
+                    target=self._thread,
+                    args=(f"{name}:{index}.{i}", poll, burst, stop, counts),
+                    name=f"finance-worker-{index}.{i}",
+                )
+                for i in range(threads)
+            ]
+            for thread in pool:
+                thread.start()
+            for thread in pool:
+                thread.join()
+        return sum(counts)
+
+    def handle(self, *args, processes=None, threads=None, poll=None, burst=False, **options):
+        processes = processes or settings.FINANCE_JOB_WORKER_PROCESSES
+        threads = threads or settings.FINANCE_JOB_WORKER_THREADS
+        poll = settings.FINANCE_JOB_POLL_INTERVAL if poll is None else poll
+        if processes < 1 or threads < 1:
+            raise CommandError("--processes и --threads должны быть не меньше 1.")
+
+        context = multiprocessing.get_context("fork")
+        stop = threading.Event() if processes == 1 else context.Event()
+        # SIGTERM и Ctrl+C — доделать текущие задачи и выйти
+        previous = signal.signal(signal.SIGTERM, lambda *_: stop.set())
+        try:
+            if processes == 1:
+                done = self._process(0, threads, poll, burst, stop)
+            else:
+                # Дочерние процессы наследуют настроенный Django; соединения
+                # с БД открываются в каждом заново
+                connections.close_all()
+                results = context.Queue()
+                pool = [
+                    context.Process(target=self._child, args=(i, threads, poll, burst, stop, results))
+                    for i in range(processes)
+                ]
+                for proc in pool:
+                    proc.start()
+                try:
+                    done = sum(results.get() for _ in pool)
+                finally:
+                    stop.set()
+                    for proc in pool:
+                        proc.join()
+        except KeyboardInterrupt:
+            stop.set()
+            raise
+        finally:
+            signal.signal(signal.SIGTERM, previous)
+        self.stdout.write(self.style.SUCCESS(f"Выполнено задач: {done}."))
@@ -0,0 +1,59 @@
+import time
+from datetime import date
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+
+from finance.seeding import SEED_PASSWORD, seed_users
+
+
+class Command(BaseCommand):
+    help = (
+        "Генерирует синтетических пользователей с базовыми категориями, операциями "
+        "с сезонностью и целями. Результат детерминирован при одинаковых --seed и --end-date."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=10)
+        parser.add_argument("--transactions", type=int, default=10_000, help="Операций на пользователя.")
+        parser.add_argument("--goals", type=int, default=3, help="Целей на пользователя.")
+        parser.add_argument("--years", type=int, default=3, help="Глубина истории.")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument(
+            "--end-date",
+            type=date.fromisoformat,
+            default=None,
+            help="Последний день истории, YYYY-MM-DD (по умолчанию сегодня).",
+        )
+        parser.add_argument("--prefix", default="seed_", help="Префикс имён пользователей.")
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument("--database", default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, users, transactions, goals, years, seed, end_date, prefix, batch_size, database, **options):
+        if User.objects.using(database).filter(username__startswith=prefix).exists():
+            raise CommandError(f"Пользователи с префиксом «{prefix}» уже есть — укажите другой --prefix.")
+
+        def progress(done, total):
+            self.stdout.write(f"Пользователей: {done}/{total}")
+
+        start = time.perf_counter()
+        result = seed_users(
+            users,
+            transactions,
+            goals_per_user=goals,
+            seed=seed,
+            years=years,
+            end_date=end_date,
+            prefix=prefix,
+            batch_size=batch_size,
+            using=database,
+            progress=progress,
+        )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Создано пользователей: {result.users}, операций: {result.transactions}, "
+                f"целей: {result.goals} ({time.perf_counter() - start:.1f} с). "
+                f"Пароль пользователей: {SEED_PASSWORD}."
+            )
+        )
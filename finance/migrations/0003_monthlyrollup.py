@@ -0,0 +1,61 @@
+# Generated by Django 5.0.6 on 2026-10-17 19:53
+
+import django.db.models.deletion
+import django.db.models.functions
+from django.conf import settings
+from django.db import migrations, models
+
+
+# Заполняем сводки по уже существующим операциям
+def build_rollups(apps, schema_editor):
+    Transaction = apps.get_model('finance', 'Transaction')
+    MonthlyRollup = apps.get_model('finance', 'MonthlyRollup')
+    db_alias = schema_editor.connection.alias
+    rows = (
+        Transaction.objects.using(db_alias)
+        .annotate(month=django.db.models.functions.TruncMonth('date'))
+        .values('user_id', 'month', 'type', 'category_id')
+        .annotate(total=models.Sum('amount'), count=models.Count('id'))
+        .order_by()
+    )
+    MonthlyRollup.objects.using(db_alias).bulk_create(
+        [MonthlyRollup(**row) for row in rows],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0002_alter_category_options_alter_goal_options_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MonthlyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(verbose_name='Месяц')),
+                ('type', models.CharField(choices=[('income', 'Доход'), ('expense', 'Расход')], max_length=7, verbose_name='Тип операции')),
+                ('total', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Сумма')),
+                ('count', models.PositiveIntegerField(default=0, verbose_name='Количество операций')),
+                ('category', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='finance.category', verbose_name='Категория')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='monthly_rollups', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Помесячная сводка',
+                'verbose_name_plural': 'Помесячные сводки',
+                'ordering': ['user', 'month'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='monthlyrollup',
+            constraint=models.UniqueConstraint(condition=models.Q(('category__isnull', False)), fields=('user', 'month', 'type', 'category'), name='monthly_rollup_unique_key'),
+        ),
+        migrations.AddConstraint(
+            model_name='monthlyrollup',
+            constraint=models.UniqueConstraint(condition=models.Q(('category__isnull', True)), fields=('user', 'month', 'type'), name='monthly_rollup_unique_uncategorized'),
+        ),
+        migrations.RunPython(build_rollups, migrations.RunPython.noop),
+    ]
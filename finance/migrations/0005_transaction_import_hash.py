@@ -0,0 +1,24 @@
+# Generated by Django 5.0.6 on 2026-10-17 20:06
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0004_transaction_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transaction',
+            name='import_hash',
+            field=models.CharField(blank=True, editable=False, max_length=64, null=True, verbose_name='Хеш импорта'),
+        ),
+        migrations.AddConstraint(
+            model_name='transaction',
+            constraint=models.UniqueConstraint(condition=models.Q(('import_hash__isnull', False)), fields=('user', 'import_hash'), name='tx_user_import_hash_uniq'),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.0.6 on 2026-10-17 20:34
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+# Уже накопленная сумма каждой цели становится её первым взносом
+def backfill_contributions(apps, schema_editor):
+    Goal = apps.get_model('finance', 'Goal')
+    GoalContribution = apps.get_model('finance', 'GoalContribution')
+    db_alias = schema_editor.connection.alias
+    goals = Goal.objects.using(db_alias).exclude(current_amount=0).values_list('pk', 'current_amount', 'created_at')
+    GoalContribution.objects.using(db_alias).bulk_create(
+        [GoalContribution(goal_id=pk, amount=amount, created_at=created_at) for pk, amount, created_at in goals],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0005_transaction_import_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GoalContribution',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=12, verbose_name='Сумма')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Дата взноса')),
+                ('goal', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='contributions', to='finance.goal', verbose_name='Цель')),
+            ],
+            options={
+                'verbose_name': 'Взнос в цель',
+                'verbose_name_plural': 'Взносы в цели',
+                'ordering': ['created_at', 'id'],
+                'indexes': [models.Index(fields=['goal', 'created_at'], name='goal_contribution_goal_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='goalcontribution',
+            constraint=models.CheckConstraint(check=models.Q(('amount', 0), _negated=True), name='goal_contribution_nonzero'),
+        ),
+        migrations.RunPython(backfill_contributions, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,110 @@
+# Generated by Django 5.0.6 on 2026-10-17 20:41
+
+import django.db.models.deletion
+import finance.search
+from django.db import migrations, models
+
+
+# SQL записан как есть, а не взят из finance.search: миграция должна создавать
+# ту схему, что была на момент её написания, как бы ни менялся модуль.
+# Буква «ё» в индексе заменяется на «е»
+CREATE_TABLE = """
+CREATE VIRTUAL TABLE IF NOT EXISTS finance_transaction_fts USING fts5(
+    description, category, owner,
+    tokenize = "unicode61 remove_diacritics 2",
+    prefix = '2 3'
+)
+"""
+
+SET_RANK = "INSERT INTO finance_transaction_fts(finance_transaction_fts, rank) VALUES ('rank', 'bm25(10.0, 5.0, 0.0)')"
+
+TRIGGERS = [
+    """
+    CREATE TRIGGER IF NOT EXISTS finance_transaction_fts_insert AFTER INSERT ON finance_transaction BEGIN
+        INSERT INTO finance_transaction_fts(rowid, description, category, owner)
+        VALUES (
+            new.id,
+            REPLACE(REPLACE(new.description, 'ё', 'е'), 'Ё', 'Е'),
+            REPLACE(REPLACE(COALESCE((SELECT name FROM finance_category WHERE id = new.category_id), ''), 'ё', 'е'), 'Ё', 'Е'),
+            'u' || new.user_id
+        );
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS finance_transaction_fts_delete AFTER DELETE ON finance_transaction BEGIN
+        DELETE FROM finance_transaction_fts WHERE rowid = old.id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS finance_transaction_fts_update
+    AFTER UPDATE OF description, category_id, user_id ON finance_transaction
+    WHEN old.description IS NOT new.description
+        OR old.category_id IS NOT new.category_id
+        OR old.user_id IS NOT new.user_id
+    BEGIN
+        UPDATE finance_transaction_fts
+        SET description = REPLACE(REPLACE(new.description, 'ё', 'е'), 'Ё', 'Е'),
+            category = REPLACE(REPLACE(COALESCE((SELECT name FROM finance_category WHERE id = new.category_id), ''), 'ё', 'е'), 'Ё', 'Е'),
+            owner = 'u' || new.user_id
+        WHERE rowid = new.id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS finance_category_fts_rename
+    AFTER UPDATE OF name ON finance_category WHEN old.name IS NOT new.name BEGIN
+        UPDATE finance_transaction_fts SET category = REPLACE(REPLACE(new.name, 'ё', 'е'), 'Ё', 'Е')
+        WHERE rowid IN (SELECT id FROM finance_transaction WHERE category_id = new.id);
+    END
+    """,
+]
+
+REBUILD = [
+    "DELETE FROM finance_transaction_fts",
+    """
+    INSERT INTO finance_transaction_fts(rowid, description, category, owner)
+    SELECT
+        t.id,
+        REPLACE(REPLACE(t.description, 'ё', 'е'), 'Ё', 'Е'),
+        REPLACE(REPLACE(COALESCE(c.name, ''), 'ё', 'е'), 'Ё', 'Е'),
+        'u' || t.user_id
+    FROM finance_transaction t LEFT JOIN finance_category c ON c.id = t.category_id
+    """,
+]
+
+DROP = [
+    "DROP TRIGGER IF EXISTS finance_transaction_fts_insert",
+    "DROP TRIGGER IF EXISTS finance_transaction_fts_delete",
+    "DROP TRIGGER IF EXISTS finance_transaction_fts_update",
+    "DROP TRIGGER IF EXISTS finance_category_fts_rename",
+    "DROP TABLE IF EXISTS finance_transaction_fts",
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0006_goalcontribution'),
+    ]
+
+    operations = [
+        # Индекс FTS5 и триггеры, затем заполнение по уже существующим операциям
+        migrations.RunSQL(
+            sql=[CREATE_TABLE, SET_RANK, *TRIGGERS, *REBUILD],
+            reverse_sql=DROP,
+        ),
+        migrations.CreateModel(
+            name='TransactionSearch',
+            fields=[
+                ('transaction', models.OneToOneField(db_column='rowid', db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='search_entry', serialize=False, to='finance.transaction')),
+                ('description', models.TextField()),
+                ('category', models.TextField()),
+                ('owner', models.TextField()),
+                ('document', finance.search.SearchDocumentField(db_column='finance_transaction_fts')),
+                ('rank', models.FloatField(db_column='rank')),
+            ],
+            options={
+                'db_table': 'finance_transaction_fts',
+                'managed': False,
+            },
+        ),
+    ]
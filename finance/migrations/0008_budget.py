@@ -0,0 +1,58 @@
+# Generated by Django 5.0.6 on 2026-10-17 21:48
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0007_transaction_search'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Budget',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('month', 'Месяц'), ('week', 'Неделя')], default='month', max_length=5, verbose_name='Период')),
+                ('limit', models.DecimalField(decimal_places=2, max_digits=12, verbose_name='Лимит')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='budgets', to='finance.category', verbose_name='Категория')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='budgets', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Бюджет',
+                'verbose_name_plural': 'Бюджеты',
+            },
+        ),
+        migrations.CreateModel(
+            name='BudgetSpend',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period_start', models.DateField(verbose_name='Начало периода')),
+                ('spent', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Потрачено')),
+                ('alert_level', models.PositiveSmallIntegerField(default=0, verbose_name='Пройденный порог, %')),
+                ('alerted_at', models.DateTimeField(blank=True, null=True, verbose_name='Порог пройден')),
+                ('budget', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='spends', to='finance.budget', verbose_name='Бюджет')),
+            ],
+            options={
+                'verbose_name': 'Расход по бюджету',
+                'verbose_name_plural': 'Расходы по бюджетам',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='budget',
+            constraint=models.UniqueConstraint(fields=('user', 'category', 'period'), name='budget_unique_period'),
+        ),
+        migrations.AddConstraint(
+            model_name='budget',
+            constraint=models.CheckConstraint(check=models.Q(('limit__gt', 0)), name='budget_limit_positive'),
+        ),
+        migrations.AddConstraint(
+            model_name='budgetspend',
+            constraint=models.UniqueConstraint(fields=('budget', 'period_start'), name='budget_spend_unique_period'),
+        ),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 5.0.6 on 2026-10-17 21:58
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+# Заполняем итоги по дням по уже существующим операциям
+def build_daily_balances(apps, schema_editor):
+    Transaction = apps.get_model('finance', 'Transaction')
+    DailyBalance = apps.get_model('finance', 'DailyBalance')
+    db_alias = schema_editor.connection.alias
+    rows = (
+        Transaction.objects.using(db_alias)
+        .values('user_id', 'date')
+        .annotate(
+            income=models.Sum('amount', filter=models.Q(type='income')),
+            expense=models.Sum('amount', filter=models.Q(type='expense')),
+        )
+        .order_by('user_id', 'date')
+    )
+    objs, user_id, income, expense = [], None, 0, 0
+    for row in rows:
+        if row['user_id'] != user_id:
+            user_id, income, expense = row['user_id'], 0, 0
+        income += int(round((row['income'] or 0) * 100))
+        expense += int(round((row['expense'] or 0) * 100))
+        objs.append(DailyBalance(user_id=user_id, day=row['date'], income=income, expense=expense))
+    DailyBalance.objects.using(db_alias).bulk_create(objs, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0008_budget'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyBalance',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='День')),
+                ('income', models.BigIntegerField(default=0, verbose_name='Доходы нарастающим итогом, коп.')),
+                ('expense', models.BigIntegerField(default=0, verbose_name='Расходы нарастающим итогом, коп.')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_balances', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Итог на день',
+                'verbose_name_plural': 'Итоги на день',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='dailybalance',
+            constraint=models.UniqueConstraint(fields=('user', 'day'), name='daily_balance_unique_day'),
+        ),
+        migrations.RunPython(build_daily_balances, migrations.RunPython.noop),
+    ]
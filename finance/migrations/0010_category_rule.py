@@ -0,0 +1,35 @@
+# Generated by Django 5.0.6 on 2026-10-17 22:20
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0009_daily_balance'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CategoryRule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pattern', models.CharField(max_length=100, verbose_name='Текст в описании')),
+                ('priority', models.PositiveSmallIntegerField(default=100, verbose_name='Приоритет')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rules', to='finance.category', verbose_name='Категория')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='category_rules', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Правило категории',
+                'verbose_name_plural': 'Правила категорий',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='categoryrule',
+            constraint=models.UniqueConstraint(fields=('user', 'pattern'), name='category_rule_unique_pattern'),
+        ),
+    ]
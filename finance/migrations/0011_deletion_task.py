@@ -0,0 +1,39 @@
+# Generated by Django 5.0.6 on 2026-10-17 22:39
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0010_category_rule'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeletionTask',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('user', 'Аккаунт'), ('category', 'Категория')], max_length=8, verbose_name='Что удаляется')),
+                ('object_id', models.PositiveBigIntegerField(verbose_name='id объекта')),
+                ('label', models.CharField(max_length=150, verbose_name='Название')),
+                ('status', models.CharField(choices=[('pending', 'В очереди'), ('running', 'Выполняется'), ('done', 'Завершено'), ('failed', 'Ошибка')], default='pending', max_length=7, verbose_name='Состояние')),
+                ('total', models.PositiveBigIntegerField(default=0, verbose_name='Всего операций')),
+                ('processed', models.PositiveBigIntegerField(default=0, verbose_name='Обработано операций')),
+                ('error', models.TextField(blank=True, verbose_name='Ошибка')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Последнее обновление')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='Дата завершения')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='deletion_tasks', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Фоновое удаление',
+                'verbose_name_plural': 'Фоновые удаления',
+                'ordering': ['-id'],
+                'indexes': [models.Index(fields=['kind', 'object_id'], name='deletion_task_object_idx')],
+            },
+        ),
+    ]
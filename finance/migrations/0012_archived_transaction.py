@@ -0,0 +1,67 @@
+# Generated by Django 5.0.6 on 2026-10-17 23:08
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+# Операции вместе с архивом (finance.archive); SQL записан как есть, чтобы
+# миграция не менялась вместе с модулем
+CREATE_VIEW = """
+CREATE VIEW IF NOT EXISTS "finance_transactionhistory" AS
+SELECT "id", "user_id", "category_id", "type", "amount", "date", "description", "import_hash", 0 AS "archived"
+FROM "finance_transaction"
+UNION ALL
+SELECT "id", "user_id", "category_id", "type", "amount", "date", "description", "import_hash", 1
+FROM "finance_archivedtransaction"
+"""
+
+DROP_VIEW = 'DROP VIEW IF EXISTS "finance_transactionhistory"'
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0011_deletion_task'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TransactionHistory',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('type', models.CharField(choices=[('income', 'Доход'), ('expense', 'Расход')], max_length=7)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('date', models.DateField()),
+                ('description', models.CharField(blank=True, max_length=255)),
+                ('import_hash', models.CharField(max_length=64, null=True)),
+                ('archived', models.BooleanField()),
+            ],
+            options={
+                'db_table': 'finance_transactionhistory',
+                'managed': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedTransaction',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('type', models.CharField(choices=[('income', 'Доход'), ('expense', 'Расход')], max_length=7, verbose_name='Тип операции')),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=12, verbose_name='Сумма')),
+                ('date', models.DateField(verbose_name='Дата')),
+                ('description', models.CharField(blank=True, max_length=255, verbose_name='Описание')),
+                ('import_hash', models.CharField(blank=True, editable=False, max_length=64, null=True, verbose_name='Хеш импорта')),
+                ('category', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='archived_transactions', to='finance.category', verbose_name='Категория')),
+                ('user', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='archived_transactions', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Архивная операция',
+                'verbose_name_plural': 'Архивные операции',
+                'ordering': ['-date', '-id'],
+                'indexes': [models.Index(fields=['user', 'date', 'id'], name='archived_tx_user_date_id_idx')],
+            },
+        ),
+        # Представление всей истории поверх основной и архивной таблиц
+        migrations.RunSQL(sql=CREATE_VIEW, reverse_sql=DROP_VIEW),
+    ]
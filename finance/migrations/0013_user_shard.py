@@ -0,0 +1,28 @@
+# Generated by Django 5.0.6 on 2026-10-17 23:22
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('finance', '0012_archived_transaction'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserShard',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='shard', serialize=False, to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+                ('alias', models.CharField(max_length=64, verbose_name='База данных')),
+                ('moving', models.BooleanField(default=False, verbose_name='Переносится')),
+            ],
+            options={
+                'verbose_name': 'Шард пользователя',
+                'verbose_name_plural': 'Шарды пользователей',
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.6 on 2026-10-18 00:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0014_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='job',
+            name='upload',
+            field=models.FileField(blank=True, upload_to='finance/jobs/%Y/%m/', verbose_name='Файл'),
+        ),
+    ]
@@ -1,8 +1,22 @@
-from django.db import models
+from django.db import models, router
+from django.db import transaction as db_transaction
 from django.contrib.auth.models import User
 from django.utils import timezone
 from decimal import Decimal
 
+from .search import FTS_TABLE, SearchDocumentField
+
+
+# Базовые категории, которые создаются каждому новому пользователю: (название, доходная)
+DEFAULT_CATEGORIES = (
+    ("Зарплата", True),
+    ("Еда", False),
+    ("Транспорт", False),
+    ("Развлечения", False),
+    ("Переводы", False),
+    ("Бытовые нужды", False),
+)
+
 
 class Category(models.Model):
     user = models.ForeignKey(
@@ -37,12 +51,14 @@ class Transaction(models.Model):
         ("income", "Доход"),
         ("expense", "Расход"),
     )
-    # Связь транзакции с пользователем
+    # Связь транзакции с пользователем. Отдельный индекс по user_id не нужен:
+    # его заменяют составные индексы ниже, где user стоит первым
     user = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
         related_name="transactions",
         verbose_name="Пользователь",
+        db_index=False,
     )# Категория транзакции (может быть пустой)
     category = models.ForeignKey(
         Category,
@@ -69,6 +85,13 @@ class Transaction(models.Model):
         "Описание",
         max_length=255,
         blank=True,
+    )# Хеш содержимого строки выписки — защита от повторного импорта
+    import_hash = models.CharField(
+        "Хеш импорта",
+        max_length=64,
+        null=True,
+        blank=True,
+        editable=False,
     )
 
     # Сортировка операций по дате и id (последние показываются первыми)
@@ -76,11 +99,244 @@ class Transaction(models.Model):
         ordering = ["-date", "-id"]
         verbose_name = "Операция"
         verbose_name_plural = "Операции"
+        # Все запросы фильтруют по пользователю и диапазону дат, часто ещё
+        # по типу или категории, и сортируют по (-date, -id)
+        indexes = [
+            models.Index(fields=["user", "date", "id"], name="tx_user_date_id_idx"),
+            models.Index(fields=["user", "type", "date"], name="tx_user_type_date_idx"),
+            models.Index(fields=["user", "category", "date"], name="tx_user_category_date_idx"),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "import_hash"],
+                condition=models.Q(import_hash__isnull=False),
+                name="tx_user_import_hash_uniq",
+            ),
+        ]
 
     # Отображение операции строкой с типом и суммой
     def __str__(self) -> str:
         return f"{self.get_type_display()} {self.amount}"
 
+    # Сохранение и удаление выполняются в одной транзакции с обновлением
+    # помесячных сводок (см. finance/signals.py)
+    def save(self, *args, **kwargs):
+        using = kwargs.get("using") or router.db_for_write(type(self), instance=self)
+        with db_transaction.atomic(using=using):
+            super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        using = kwargs.get("using") or router.db_for_write(type(self), instance=self)
+        with db_transaction.atomic(using=using):
+            return super().delete(*args, **kwargs)
+
+
+# Операция, перенесённая из Transaction в архив (см. finance/archive.py).
+# id совпадает с id исходной операции. Сводки и итоги по дням при переносе
+# не меняются — отчёты за архивные периоды по-прежнему точны. Таблица
+# компактнее основной: один индекс для чтения по пользователю и датам, без
+# полнотекстового индекса и без уникальности import_hash.
+class ArchivedTransaction(models.Model):
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name="archived_transactions",
+        verbose_name="Пользователь",
+        db_index=False,
+    )
+    category = models.ForeignKey(
+        Category,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="archived_transactions",
+        verbose_name="Категория",
+    )
+    type = models.CharField(
+        "Тип операции",
+        max_length=7,
+        choices=Transaction.TYPE_CHOICES,
+    )
+    amount = models.DecimalField(
+        "Сумма",
+        max_digits=12,
+        decimal_places=2,
+    )
+    date = models.DateField("Дата")
+    description = models.CharField(
+        "Описание",
+        max_length=255,
+        blank=True,
+    )
+    import_hash = models.CharField(
+        "Хеш импорта",
+        max_length=64,
+        null=True,
+        blank=True,
+        editable=False,
+    )
+
+    class Meta:
+        ordering = ["-date", "-id"]
+        verbose_name = "Архивная операция"
+        verbose_name_plural = "Архивные операции"
+        indexes = [
+            models.Index(fields=["user", "date", "id"], name="archived_tx_user_date_id_idx"),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.get_type_display()} {self.amount}"
+
+
+# Вся история операций: представление UNION ALL основной и архивной таблиц
+# (создаёт миграция, см. finance/archive.py). Условия по пользователю и датам
+# SQLite передаёт внутрь обеих частей, и каждая читается по своему индексу.
+# Только для чтения.
+class TransactionHistory(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    user = models.ForeignKey(
+        User,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        related_name="+",
+    )
+    category = models.ForeignKey(
+        Category,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        null=True,
+        related_name="+",
+    )
+    type = models.CharField(max_length=7, choices=Transaction.TYPE_CHOICES)
+    amount = models.DecimalField(max_digits=12, decimal_places=2)
+    date = models.DateField()
+    description = models.CharField(max_length=255, blank=True)
+    import_hash = models.CharField(max_length=64, null=True)
+    archived = models.BooleanField()
+
+    class Meta:
+        managed = False
+        db_table = "finance_transactionhistory"
+
+    def __str__(self) -> str:
+        return f"{self.get_type_display()} {self.amount}"
+
+
+# Строка полнотекстового индекса операции (виртуальная таблица FTS5, см.
+# finance/search.py). Таблицу создаёт и заполняет миграция, а поддерживают
+# триггеры БД; модель нужна только для запросов из ORM.
+class TransactionSearch(models.Model):
+    transaction = models.OneToOneField(
+        Transaction,
+        on_delete=models.DO_NOTHING,
+        primary_key=True,
+        db_column="rowid",
+        db_constraint=False,
+        related_name="search_entry",
+    )
+    description = models.TextField()
+    category = models.TextField()
+    owner = models.TextField()
+    # Скрытые столбцы FTS5: MATCH по всей строке и релевантность (меньше — лучше)
+    document = SearchDocumentField(db_column=FTS_TABLE)
+    rank = models.FloatField(db_column="rank")
+
+    class Meta:
+        managed = False
+        db_table = FTS_TABLE
+
+
+# Помесячная сводка операций пользователя: сумма и количество операций
+# по ключу (пользователь, месяц, тип, категория). Поддерживается
+# инкрементально при каждом изменении Transaction.
+class MonthlyRollup(models.Model):
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name="monthly_rollups",
+        verbose_name="Пользователь",
+    )# Первый день месяца
+    month = models.DateField("Месяц")
+    type = models.CharField(
+        "Тип операции",
+        max_length=7,
+        choices=Transaction.TYPE_CHOICES,
+    )# Категория; при удалении категории сводка переносится в «Без категории»
+    category = models.ForeignKey(
+        Category,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        verbose_name="Категория",
+    )
+    total = models.DecimalField(
+        "Сумма",
+        max_digits=14,
+        decimal_places=2,
+        default=0,
+    )
+    count = models.PositiveIntegerField(
+        "Количество операций",
+        default=0,
+    )
+
+    class Meta:
+        ordering = ["user", "month"]
+        verbose_name = "Помесячная сводка"
+        verbose_name_plural = "Помесячные сводки"
+        constraints = [
+            # Для NULL-категории уникальность обеспечивается отдельным
+            # частичным индексом: NULL не сравниваются в обычном UNIQUE
+            models.UniqueConstraint(
+                fields=["user", "month", "type", "category"],
+                condition=models.Q(category__isnull=False),
+                name="monthly_rollup_unique_key",
+            ),
+            models.UniqueConstraint(
+                fields=["user", "month", "type"],
+                condition=models.Q(category__isnull=True),
+                name="monthly_rollup_unique_uncategorized",
+            ),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.user_id} {self.month:%Y-%m} {self.type} {self.total}"
+
+
+class DailyBalance(models.Model):
+    """
+    Доходы и расходы пользователя нарастающим итогом на конец дня. Строка есть
+    только у дней с операциями; итог на любую дату — строка с ближайшим днём
+    не позже неё, поэтому сумма за период — разность двух таких строк.
+    """
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name="daily_balances",
+        verbose_name="Пользователь",
+    )
+    day = models.DateField("День")
+    # В копейках: накопленная сумма в REAL-колонке SQLite копила бы ошибку
+    # округления с каждым сдвигом
+    income = models.BigIntegerField(
+        "Доходы нарастающим итогом, коп.",
+        default=0,
+    )
+    expense = models.BigIntegerField(
+        "Расходы нарастающим итогом, коп.",
+        default=0,
+    )
+
+    class Meta:
+        verbose_name = "Итог на день"
+        verbose_name_plural = "Итоги на день"
+        constraints = [
+            models.UniqueConstraint(fields=["user", "day"], name="daily_balance_unique_day"),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.user_id} {self.day} {self.income} {self.expense}"
+
 # Связь цели с пользователем
 class Goal(models.Model):
     user = models.ForeignKey(
@@ -133,3 +389,367 @@ class Goal(models.Model):
     # Отображение цели строкой — выводится её название
     def __str__(self) -> str:
         return self.name
+
+
+# Журнал взносов в цель. Строки только добавляются: пополнение цели, а также
+# начальная сумма и ручные исправления при редактировании (могут быть
+# отрицательными). Сумма взносов цели равна её current_amount.
+class GoalContribution(models.Model):
+    goal = models.ForeignKey(
+        Goal,
+        on_delete=models.CASCADE,
+        related_name="contributions",
+        verbose_name="Цель",
+    )
+    amount = models.DecimalField(
+        "Сумма",
+        max_digits=12,
+        decimal_places=2,
+    )
+    created_at = models.DateTimeField(
+        "Дата взноса",
+        default=timezone.now,
+    )
+
+    class Meta:
+        ordering = ["created_at", "id"]
+        verbose_name = "Взнос в цель"
+        verbose_name_plural = "Взносы в цели"
+        indexes = [
+            # История взносов цели по времени (график темпа накоплений)
+            models.Index(fields=["goal", "created_at"], name="goal_contribution_goal_idx"),
+        ]
+        constraints = [
+            models.CheckConstraint(check=~models.Q(amount=0), name="goal_contribution_nonzero"),
+        ]
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValueError("Взносы не изменяются: добавьте новый взнос-исправление.")
+        super().save(*args, **kwargs)
+
+    def __str__(self) -> str:
+        return f"{self.goal_id} {self.amount}"
+
+
+# Бюджет расходов категории на неделю или месяц. Потраченное за каждый
+# период хранится счётчиком в BudgetSpend и обновляется при изменении
+# операций (см. finance/budgets.py), поэтому дашборд не суммирует операции
+class Budget(models.Model):
+    PERIOD_CHOICES = (
+        ("month", "Месяц"),
+        ("week", "Неделя"),
+    )
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name="budgets",
+        verbose_name="Пользователь",
+    )
+    category = models.ForeignKey(
+        Category,
+        on_delete=models.CASCADE,
+        related_name="budgets",
+        verbose_name="Категория",
+    )
+    period = models.CharField(
+        "Период",
+        max_length=5,
+        choices=PERIOD_CHOICES,
+        default="month",
+    )
+    limit = models.DecimalField(
+        "Лимит",
+        max_digits=12,
+        decimal_places=2,
+    )
+    created_at = models.DateTimeField(
+        "Дата создания",
+        auto_now_add=True,
+    )
+
+    class Meta:
+        verbose_name = "Бюджет"
+        verbose_name_plural = "Бюджеты"
+        constraints = [
+            models.UniqueConstraint(fields=["user", "category", "period"], name="budget_unique_period"),
+            models.CheckConstraint(check=models.Q(limit__gt=0), name="budget_limit_positive"),
+        ]
+
+    # Процент использования лимита за текущий период; spent — аннотация
+    # из budgets.current_budgets
+    @property
+    def progress_percent(self) -> float:
+        return float(getattr(self, "spent", 0) / self.limit * 100)
+
+    def __str__(self) -> str:
+        return f"{self.category} — {self.limit} ₽ / {self.get_period_display().lower()}"
+
+
+# Потрачено по бюджету за один период (неделю или месяц с period_start).
+# alert_level — наибольший пройденный порог из FINANCE_BUDGET_THRESHOLDS,
+# alerted_at — когда он был пройден; оба меняются тем же UPDATE, что и spent
+class BudgetSpend(models.Model):
+    budget = models.ForeignKey(
+        Budget,
+        on_delete=models.CASCADE,
+        related_name="spends",
+        verbose_name="Бюджет",
+    )
+    period_start = models.DateField("Начало периода")
+    spent = models.DecimalField(
+        "Потрачено",
+        max_digits=14,
+        decimal_places=2,
+        default=0,
+    )
+    alert_level = models.PositiveSmallIntegerField(
+        "Пройденный порог, %",
+        default=0,
+    )
+    alerted_at = models.DateTimeField(
+        "Порог пройден",
+        null=True,
+        blank=True,
+    )
+
+    class Meta:
+        verbose_name = "Расход по бюджету"
+        verbose_name_plural = "Расходы по бюджетам"
+        constraints = [
+            models.UniqueConstraint(fields=["budget", "period_start"], name="budget_spend_unique_period"),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.budget_id} {self.period_start} {self.spent}"
+
+
+# Правило автокатегоризации: операции без категории, в описании которой
+# встречается pattern, назначается category
+class CategoryRule(models.Model):
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name="category_rules",
+        verbose_name="Пользователь",
+    )
+    pattern = models.CharField(
+        "Текст в описании",
+        max_length=100,
+    )
+    category = models.ForeignKey(
+        Category,
+        on_delete=models.CASCADE,
+        related_name="rules",
+        verbose_name="Категория",
+    )# Если подходят несколько правил, выигрывает правило с меньшим приоритетом
+    priority = models.PositiveSmallIntegerField(
+        "Приоритет",
+        default=100,
+    )
+    created_at = models.DateTimeField(
+        "Дата создания",
+        auto_now_add=True,
+    )
+
+    class Meta:
+        verbose_name = "Правило категории"
+        verbose_name_plural = "Правила категорий"
+        constraints = [
+            models.UniqueConstraint(fields=["user", "pattern"], name="category_rule_unique_pattern"),
+        ]
+
+    def __str__(self) -> str:
+        return f"«{self.pattern}» → {self.category_id}"
+
+
+# Фоновое удаление аккаунта или категории с большой историей (см.
+# finance/deletion.py): строки удаляются пачками в отдельных транзакциях,
+# processed из total показывает прогресс
+class DeletionTask(models.Model):
+    KIND_CHOICES = (
+        ("user", "Аккаунт"),
+        ("category", "Категория"),
+    )
+    STATUS_CHOICES = (
+        ("pending", "В очереди"),
+        ("running", "Выполняется"),
+        ("done", "Завершено"),
+        ("failed", "Ошибка"),
+    )
+    kind = models.CharField(
+        "Что удаляется",
+        max_length=8,
+        choices=KIND_CHOICES,
+    )# id удаляемого пользователя или категории; не внешний ключ — объект
+    # исчезнет раньше задачи
+    object_id = models.PositiveBigIntegerField("id объекта")
+    # Владелец данных: по нему пользователь видит свои задачи
+    user = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="deletion_tasks",
+        verbose_name="Пользователь",
+    )
+    label = models.CharField(
+        "Название",
+        max_length=150,
+    )
+    status = models.CharField(
+        "Состояние",
+        max_length=7,
+        choices=STATUS_CHOICES,
+        default="pending",
+    )# Операций к обработке и уже обработано
+    total = models.PositiveBigIntegerField("Всего операций", default=0)
+    processed = models.PositiveBigIntegerField("Обработано операций", default=0)
+    error = models.TextField("Ошибка", blank=True)
+    created_at = models.DateTimeField(
+        "Дата создания",
+        auto_now_add=True,
+    )
+    updated_at = models.DateTimeField(
+        "Последнее обновление",
+        auto_now=True,
+    )
+    finished_at = models.DateTimeField(
+        "Дата завершения",
+        null=True,
+        blank=True,
+    )
+
+    class Meta:
+        ordering = ["-id"]
+        verbose_name = "Фоновое удаление"
+        verbose_name_plural = "Фоновые удаления"
+        # Поиск незавершённой задачи для объекта перед постановкой новой
+        indexes = [
+            models.Index(fields=["kind", "object_id"], name="deletion_task_object_idx"),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.get_kind_display()} «{self.label}»: {self.get_status_display()}"
+
+    @property
+    def is_finished(self) -> bool:
+        return self.status in ("done", "failed")
+
+    @property
+    def progress_percent(self) -> float:
+        if self.status == "done":
+            return 100.0
+        if not self.total:
+            return 0.0
+        # Операции, добавленные во время удаления, тоже обрабатываются
+        return min(100.0, self.processed * 100 / self.total)
+
+
+# Каталог шардов (см. finance/sharding.py): в какой базе лежат данные finance
+# пользователя. Хранится в основной базе рядом с auth; пользователи без
+# записи живут в основной базе
+class UserShard(models.Model):
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="shard",
+        verbose_name="Пользователь",
+    )
+    alias = models.CharField("База данных", max_length=64)
+    # Данные переносятся в другую базу: запись для пользователя запрещена
+    moving = models.BooleanField("Переносится", default=False)
+
+    class Meta:
+        verbose_name = "Шард пользователя"
+        verbose_name_plural = "Шарды пользователей"
+
+    def __str__(self) -> str:
+        return f"{self.user_id} → {self.alias}"
+
+
+
+# Очередь фоновых задач (см. finance/jobs.py). Лежит в основной базе: её
+# опрашивает run_finance_worker, а данные пользователя задача читает в его шарде
+class Job(models.Model):
+    KIND_CHOICES = (
+        ("import_statement", "Импорт выписки"),
+        ("recategorize", "Применение правил"),
+        ("rebuild_analytics", "Пересчёт аналитики"),
+    )
+    STATUS_CHOICES = (
+        ("pending", "В очереди"),
+        ("running", "Выполняется"),
+        ("done", "Завершено"),
+        ("failed", "Ошибка"),
+    )
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name="jobs",
+        verbose_name="Пользователь",
+    )
+    kind = models.CharField(
+        "Задача",
+        max_length=32,
+        choices=KIND_CHOICES,
+    )
+    payload = models.JSONField("Параметры", default=dict, blank=True)
+    # Файл задачи (выписка для импорта) хранится вне базы и удаляется, когда
+    # задача завершена
+    upload = models.FileField("Файл", upload_to="finance/jobs/%Y/%m/", blank=True)
+    # Хеш вида и параметров: одинаковые ожидающие задачи пользователя не дублируются
+    key = models.CharField("Ключ", max_length=64)
+    status = models.CharField(
+        "Состояние",
+        max_length=7,
+        choices=STATUS_CHOICES,
+        default="pending",
+    )
+    attempts = models.PositiveSmallIntegerField("Попыток", default=0)
+    max_attempts = models.PositiveSmallIntegerField("Попыток всего", default=1)
+    # Не раньше этого времени задачу можно взять (задержка перед повтором)
+    run_at = models.DateTimeField("Выполнить после", default=timezone.now)
+    # Исполнитель и время, когда он взял задачу
+    locked_by = models.CharField("Исполнитель", max_length=128, blank=True)
+    locked_at = models.DateTimeField("Взята", null=True, blank=True)
+    result = models.JSONField("Результат", null=True, blank=True)
+    error = models.TextField("Ошибка", blank=True)
+    created_at = models.DateTimeField(
+        "Дата создания",
+        auto_now_add=True,
+    )
+    updated_at = models.DateTimeField(
+        "Последнее обновление",
+        auto_now=True,
+    )
+    finished_at = models.DateTimeField(
+        "Дата завершения",
+        null=True,
+        blank=True,
+    )
+
+    class Meta:
+        ordering = ["-id"]
+        verbose_name = "Фоновая задача"
+        verbose_name_plural = "Фоновые задачи"
+        indexes = [
+            # Выборка готовых задач исполнителем: WHERE status = ? AND run_at <= ?
+            models.Index(fields=["status", "run_at"], name="job_queue_idx"),
+            models.Index(fields=["user", "kind"], name="job_user_kind_idx"),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "kind", "key"],
+                condition=models.Q(status="pending"),
+                name="job_pending_unique",
+            ),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.get_kind_display()} #{self.pk}: {self.get_status_display()}"
+
+    @property
+    def is_finished(self) -> bool:
+        return self.status in ("done", "failed")
@@ -0,0 +1,202 @@
+"""
+Чтение аналитики и списков из реплик.
+
+FINANCE_REPLICAS сопоставляет базе (основной или шарду) её реплику — копию
+только для чтения. Запросы на чтение внутри представлений с replica_reads
+(дашборд, аналитика, графики, список операций) ReplicaRouter отправляет в
+реплику той базы, которую выбрали бы остальные роутеры; запись и все прочие
+запросы идут в основную базу, и долгие агрегаты не спорят с записью за
+файл основной базы.
+
+Свои изменения пользователь видит сразу: bump_version, которым отмечается
+любое изменение его данных, закрепляет его за основной базой на
+FINANCE_REPLICA_STICKY_SECONDS. Реплика старше FINANCE_REPLICA_MAX_LAG_SECONDS
+не используется, а закрепление длится не меньше этого срока — когда оно
+истекает, в реплике уже есть изменения пользователя.
+
+Реплика SQLite — файл, который refresh() (команда refresh_replicas)
+перезаписывает снимком основной базы через backup API.
+"""
+import os
+import sqlite3
+import time
+from contextvars import ContextVar
+from functools import wraps
+from typing import Dict, Optional, Tuple
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, connections, router
+
+# Как часто перечитывать время снимка реплики с диска, сек
+FRESHNESS_CHECK_INTERVAL = 1.0
+
+
+class _Reader:
+    """Пользователь представления; закрепление за основной базой проверяется один раз на контекст."""
+
+    def __init__(self, user_id: Optional[int]):
+        self._user_id = user_id
+        self._pinned: Optional[bool] = None
+
+    def pinned(self) -> bool:
+        if self._pinned is None:
+            self._pinned = self._user_id is None or is_pinned(self._user_id)
+        return self._pinned
+
+
+# Чтения текущего контекста можно обслуживать из реплики
+_reader: ContextVar[Optional[_Reader]] = ContextVar("finance_replica_reader", default=None)
+
+# Реплика → (когда проверяли, время снимка или None)
+_freshness: Dict[str, Tuple[float, Optional[float]]] = {}
+
+
+def enabled() -> bool:
+    return bool(settings.FINANCE_REPLICAS)
+
+
+def primary_of(alias: Optional[str]) -> Optional[str]:
+    """Основная база для реплики; для остальных баз — она сама."""
+    for primary, replica in settings.FINANCE_REPLICAS.items():
+        if replica == alias:
+            return primary
+    return alias
+
+
+def _cache():
+    return caches[settings.FINANCE_CACHE_ALIAS]
+
+
+def _pin_key(user_id) -> str:
+    return f"finance:replica:pin:{user_id}"
+
+
+def pin(user_id) -> None:
+    """Чтения пользователя идут в основную базу, пока реплика может не содержать его изменений."""
+    if not enabled():
+        return
+    # Не короче допустимого отставания: по истечении реплика уже свежее записи
+    timeout = max(settings.FINANCE_REPLICA_STICKY_SECONDS, settings.FINANCE_REPLICA_MAX_LAG_SECONDS)
+    _cache().set(_pin_key(user_id), True, timeout=timeout)
+
+
+def is_pinned(user_id) -> bool:
+    return _cache().get(_pin_key(user_id)) is not None
+
+
+def _marker(alias: str) -> Optional[str]:
+    # Время снимка хранится во времени изменения файла-метки рядом с репликой:
+    # сам файл SQLite меняется и при чекпойнтах WAL от читателей
+    name = connections[alias].settings_dict["NAME"]
+    if not name or str(name).startswith("file:") or str(name) == ":memory:":
+        return None
+    return f"{name}.refreshed"
+
+
+def snapshot_time(alias: str) -> Optional[float]:
+    """Время последнего снимка в реплике (Unix time) или None, если его не было."""
+    marker = _marker(alias)
+    try:
+        return os.stat(marker).st_mtime if marker else None
+    except OSError:
+        return None
+
+
+def is_fresh(alias: str) -> bool:
+    now = time.time()
+    checked = _freshness.get(alias)
+    if checked is None or now - checked[0] >= FRESHNESS_CHECK_INTERVAL:
+        checked = (now, snapshot_time(alias))
+        _freshness[alias] = checked
+    return checked[1] is not None and now - checked[1] <= settings.FINANCE_REPLICA_MAX_LAG_SECONDS
+
+
+def refresh(primary: str) -> float:
+    """
+    Перезаписывает реплику базы primary её снимком через backup API SQLite.
+    Возвращает длительность копирования, сек.
+    """
+    replica = settings.FINANCE_REPLICAS[primary]
+    marker = _marker(replica)
+    source = connections[primary]
+    source.ensure_connection()
+    started = time.time()
+    target = sqlite3.connect(connections[replica].settings_dict["NAME"])
+    try:
+        # Одним шагом — согласованный снимок; по частям копирование начиналось
+        # бы заново после каждой записи в основную базу
+        source.connection.backup(target)
+    finally:
+        target.close()
+    with open(marker, "a"):
+        pass
+    os.utime(marker, (started, started))
+    _freshness.pop(replica, None)
+    return time.time() - started
+
+
+def replica_reads(view):
+    """Чтения представления идут в реплику, если пользователь не закреплён за основной базой."""
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def async_wrapper(request, *args, **kwargs):
+            # async_login_required уже подставил загруженного пользователя
+            token = _reader.set(_Reader(getattr(request.user, "pk", None)))
+            try:
+                return await view(request, *args, **kwargs)
+            finally:
+                _reader.reset(token)
+
+        return async_wrapper
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        token = _reader.set(_Reader(getattr(request.user, "pk", None)))
+        try:
+            return view(request, *args, **kwargs)
+        finally:
+            _reader.reset(token)
+
+    return wrapper
+
+
+class ReplicaRouter:
+    """Чтения в replica_reads — из реплики базы, выбранной остальными роутерами."""
+
+    @staticmethod
+    def _primary(model, **hints) -> str:
+        for other in router.routers:
+            if isinstance(other, ReplicaRouter) or not hasattr(other, "db_for_read"):
+                continue
+            chosen = other.db_for_read(model, **hints)
+            if chosen:
+                return chosen
+        return DEFAULT_DB_ALIAS
+
+    def db_for_read(self, model, **hints):
+        reader = _reader.get()
+        if reader is None or not enabled():
+            return None
+        instance = hints.get("instance")
+        if instance is not None and instance._state.db is not None:
+            # Связанные объекты читаются из той же базы, что и сам объект
+            return None
+        replica = settings.FINANCE_REPLICAS.get(self._primary(model, **hints))
+        if replica is None or not is_fresh(replica) or reader.pinned():
+            return None
+        return replica
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Объект из реплики и объект из её основной базы — одни и те же данные
+        if enabled() and obj1._state.db and obj2._state.db:
+            if primary_of(obj1._state.db) == primary_of(obj2._state.db):
+                return True
+        return None
+
+    def allow_migrate(self, db, app_label, **hints):
+        # Реплики получают схему вместе с данными из снимка
+        if db in settings.FINANCE_REPLICAS.values():
+            return False
+        return None
@@ -0,0 +1,197 @@
+"""
+Поддержание помесячных сводок (MonthlyRollup).
+
+Сводка хранит сумму и количество операций по ключу
+(пользователь, месяц, тип, категория) и обновляется дельтами при каждом
+создании, изменении и удалении Transaction, поэтому отчёты за целые месяцы
+читают O(месяцев) строк вместо O(операций).
+"""
+import calendar
+from datetime import date
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from django.db import IntegrityError, transaction as db_transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncMonth
+
+from .models import MonthlyRollup, Transaction, TransactionHistory
+
+# Поля операции, от которых зависит сводка
+TRACKED_FIELDS = ("user_id", "date", "type", "category_id", "amount")
+
+RollupKey = Tuple[int, date, str, Optional[int]]
+
+CENTS = Decimal("0.01")
+
+
+def month_start(d: date) -> date:
+    return d.replace(day=1)
+
+
+def month_end(d: date) -> date:
+    return d.replace(day=calendar.monthrange(d.year, d.month)[1])
+
+
+def covers_whole_months(date_from: Optional[date], date_to: Optional[date]) -> bool:
+    """
+    True, если диапазон начинается с первого дня месяца и заканчивается
+    последним днём месяца — тогда его можно посчитать по сводке.
+    """
+    if date_from is None or date_to is None or date_from > date_to:
+        return False
+    return date_from.day == 1 and date_to == month_end(date_to)
+
+
+def transaction_state(instance: Transaction) -> Dict:
+    """Нормализованный снимок полей операции, влияющих на сводку."""
+    return {
+        "user_id": instance.user_id,
+        # date по умолчанию — timezone.now(), приводим так же, как при сохранении
+        "date": Transaction._meta.get_field("date").to_python(instance.date),
+        "type": instance.type,
+        "category_id": instance.category_id,
+        "amount": Transaction._meta.get_field("amount").to_python(instance.amount),
+    }
+
+
+def _key(state: Dict) -> RollupKey:
+    return (state["user_id"], month_start(state["date"]), state["type"], state["category_id"])
+
+
+def apply_delta(using: str, key: RollupKey, amount: Decimal, count: int) -> None:
+    user_id, month, tx_type, category_id = key
+    rows = MonthlyRollup.objects.using(using).filter(
+        user_id=user_id, month=month, type=tx_type, category_id=category_id
+    )
+    updated = rows.update(total=F("total") + amount, count=F("count") + count)
+    if not updated and count < 0:
+        # Вычитать не из чего: строка сводки уже удалена (например, каскадом
+        # вместе с пользователем)
+        return
+    if not updated:
+        try:
+            with db_transaction.atomic(using=using):
+                MonthlyRollup.objects.using(using).create(
+                    user_id=user_id,
+                    month=month,
+                    type=tx_type,
+                    category_id=category_id,
+                    total=amount,
+                    count=count,
+                )
+        except IntegrityError:
+            # Строку успел создать параллельный запрос — просто прибавляем
+            rows.update(total=F("total") + amount, count=F("count") + count)
+    elif count < 0:
+        # Пустые сводки не храним, чтобы не показывать нулевые категории
+        rows.filter(count__lte=0).delete()
+
+
+def record_change(using: str, previous: Optional[Dict], current: Optional[Dict]) -> None:
+    """
+    Переносит изменение операции в сводку: previous — состояние до изменения
+    (None для новой операции), current — после (None для удалённой).
+    """
+    if previous is not None and current is not None:
+        if _key(previous) == _key(current):
+            delta = current["amount"] - previous["amount"]
+            if delta:
+                apply_delta(using, _key(current), delta, 0)
+            return
+    if previous is not None:
+        apply_delta(using, _key(previous), -previous["amount"], -1)
+    if current is not None:
+        apply_delta(using, _key(current), current["amount"], 1)
+
+
+def record_bulk(using: str, states: Iterable[Dict], sign: int = 1) -> None:
+    """
+    Учитывает пачку операций, вставленных или удалённых в обход сигналов
+    (bulk_create, QuerySet.delete): по одному UPDATE на ячейку сводки.
+    """
+    deltas: Dict[RollupKey, Tuple[Decimal, int]] = {}
+    for state in states:
+        key = _key(state)
+        total, count = deltas.get(key, (Decimal("0"), 0))
+        deltas[key] = (total + state["amount"], count + 1)
+    for key, (total, count) in deltas.items():
+        apply_delta(using, key, sign * total, sign * count)
+
+
+def fold_category(using: str, category_id: int) -> None:
+    """
+    Переносит сводки удаляемой категории в «Без категории» — операции
+    этой категории получат category=NULL через on_delete=SET_NULL.
+    """
+    rows = MonthlyRollup.objects.using(using).filter(category_id=category_id)
+    for row in rows.values("user_id", "month", "type", "total", "count"):
+        apply_delta(using, (row["user_id"], row["month"], row["type"], None), row["total"], row["count"])
+    rows.delete()
+
+
+def compute(using: str, user_ids: Optional[Iterable[int]] = None) -> Dict[RollupKey, Tuple[Decimal, int]]:
+    """Считает сводки заново по исходным операциям, включая архивные."""
+    qs = TransactionHistory.objects.using(using).all()
+    if user_ids is not None:
+        qs = qs.filter(user_id__in=list(user_ids))
+    rows = (
+        qs.annotate(month=TruncMonth("date"))
+        .values("user_id", "month", "type", "category_id")
+        .annotate(total=Sum("amount"), count=Count("id"))
+        .order_by()
+    )
+    # SUM в SQLite считается в float — округляем до копеек, как хранит сводка
+    return {
+        (r["user_id"], r["month"], r["type"], r["category_id"]): (r["total"].quantize(CENTS), r["count"])
+        for r in rows
+    }
+
+
+def stored(using: str, user_ids: Optional[Iterable[int]] = None) -> Dict[RollupKey, Tuple[Decimal, int]]:
+    qs = MonthlyRollup.objects.using(using).all()
+    if user_ids is not None:
+        qs = qs.filter(user_id__in=list(user_ids))
+    result: Dict[RollupKey, Tuple[Decimal, int]] = {}
+    for r in qs.values("user_id", "month", "type", "category_id", "total", "count"):
+        key = (r["user_id"], r["month"], r["type"], r["category_id"])
+        total, count = result.get(key, (Decimal("0"), 0))
+        result[key] = (total + r["total"], count + r["count"])
+    return result
+
+
+def verify(using: str, user_ids: Optional[Iterable[int]] = None) -> List[Tuple[RollupKey, Tuple, Tuple]]:
+    """Список расхождений (ключ, ожидаемое, сохранённое) между сводкой и операциями."""
+    user_ids = list(user_ids) if user_ids is not None else None
+    expected = compute(using, user_ids)
+    actual = stored(using, user_ids)
+    mismatches = []
+    for key in sorted(set(expected) | set(actual), key=lambda k: (k[0], k[1], k[2], k[3] or 0)):
+        exp = expected.get(key, (Decimal("0"), 0))
+        act = actual.get(key, (Decimal("0"), 0))
+        if exp != act:
+            mismatches.append((key, exp, act))
+    return mismatches
+
+
+def rebuild(using: str, user_ids: Optional[Iterable[int]] = None, batch_size: int = 1000) -> int:
+    """Пересобирает сводки по исходным операциям. Возвращает число строк сводки."""
+    user_ids = list(user_ids) if user_ids is not None else None
+    with db_transaction.atomic(using=using):
+        existing = MonthlyRollup.objects.using(using).all()
+        if user_ids is not None:
+            existing = existing.filter(user_id__in=user_ids)
+        existing.delete()
+        objs = [
+            MonthlyRollup(
+                user_id=user_id,
+                month=month,
+                type=tx_type,
+                category_id=category_id,
+                total=total,
+                count=count,
+            )
+            for (user_id, month, tx_type, category_id), (total, count) in compute(using, user_ids).items()
+        ]
+        MonthlyRollup.objects.using(using).bulk_create(objs, batch_size=batch_size)
+    return len(objs)
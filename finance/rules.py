@@ -0,0 +1,232 @@
+"""
+Автокатегоризация операций по правилам пользователя (CategoryRule).
+
+Правило — «в описании встречается текст → категория». Все правила
+пользователя собираются в одно регулярное выражение на каждый вид категорий
+(доходные и расходные): выражение строится по префиксному дереву текстов,
+поэтому проверка описания стоит O(длины описания), а не O(числа правил).
+
+Скомпилированные выражения хранятся в памяти процесса, пока не изменятся
+правила: версия правил пользователя лежит в общем кеше (finance.cache, scope
+RULES_SCOPE), её увеличивают сигналы CategoryRule и Category.
+"""
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from django.db import router, transaction as db_transaction
+from django.db.models import Q
+
+from . import budgets, rollups
+from .cache import _user_id, bump_version, data_version
+from .models import CategoryRule, Transaction
+from .sharding import db_for_user
+
+RULES_SCOPE = "rules"
+
+# Сколько пользователей держать скомпилированными в памяти процесса
+MATCHER_CACHE_SIZE = 1024
+
+
+def normalize(text: str) -> str:
+    # Регистр и «ё» не различаются — как в полнотекстовом поиске
+    return text.lower().replace("ё", "е")
+
+
+def _trie_pattern(words: Iterable[str]) -> str:
+    """
+    Регулярное выражение, совпадающее с любым из words, собранное по
+    префиксному дереву: общие начала проверяются один раз. Необязательные
+    продолжения жадные, поэтому в каждой позиции совпадает самое длинное слово.
+    """
+    trie: Dict = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    def build(node: Dict) -> str:
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        return f"(?:{body})?" if "" in node else body
+
+    return build(trie)
+
+
+class RuleMatcher:
+    """
+    Правила одного вида категорий. rules — пары (текст, id категории) по
+    убыванию важности. Из правил, текст которых встречается в описании,
+    выбирается самое важное.
+    """
+
+    def __init__(self, rules: Sequence[Tuple[str, int]]):
+        ranks: Dict[str, Tuple[int, int]] = {}
+        for rank, (text, category_id) in enumerate(rules):
+            text = normalize(text.strip())
+            if text and text not in ranks:
+                ranks[text] = (rank, category_id)
+        # В одной позиции выражение находит самый длинный текст; остальные
+        # совпавшие там тексты — его префиксы, лучшее из них считаем заранее
+        self._best = {
+            text: min(ranks[text[:i]] for i in range(1, len(text) + 1) if text[:i] in ranks)
+            for text in ranks
+        }
+        # Опережающая проверка не поглощает символы: finditer пробует каждую
+        # позицию, и перекрывающиеся совпадения не теряются
+        self._regex = re.compile(f"(?=({_trie_pattern(ranks)}))") if ranks else None
+
+    def __bool__(self) -> bool:
+        return self._regex is not None
+
+    def match(self, text: str) -> Optional[int]:
+        """id категории для уже нормализованного описания или None."""
+        if self._regex is None:
+            return None
+        best = None
+        for found in self._regex.finditer(text):
+            candidate = self._best[found.group(1)]
+            if best is None or candidate < best:
+                best = candidate
+        return best[1] if best is not None else None
+
+
+class UserRules:
+    """Правила пользователя: отдельные выражения для доходов и расходов."""
+
+    def __init__(self, rules: Iterable[Tuple[str, int, bool]]):
+        by_type: Dict[str, List[Tuple[str, int]]] = {"income": [], "expense": []}
+        for pattern, category_id, is_income in rules:
+            by_type["income" if is_income else "expense"].append((pattern, category_id))
+        self._matchers = {tx_type: RuleMatcher(items) for tx_type, items in by_type.items()}
+
+    def __bool__(self) -> bool:
+        return any(self._matchers.values())
+
+    def category_for(self, description: str, tx_type: str) -> Optional[int]:
+        matcher = self._matchers.get(tx_type)
+        if not matcher or not description:
+            return None
+        return matcher.match(normalize(description))
+
+
+def load_rules(user, using: Optional[str] = None) -> UserRules:
+    rows = (
+        CategoryRule.objects.using(using)
+        .filter(user_id=_user_id(user))
+        .order_by("priority", "id")
+        .values_list("pattern", "category_id", "category__is_income")
+    )
+    return UserRules(rows)
+
+
+_matchers: "OrderedDict[Tuple[str, int], Tuple[int, UserRules]]" = OrderedDict()
+_matchers_lock = threading.Lock()
+
+
+def rules_for(user, using: Optional[str] = None) -> UserRules:
+    """Скомпилированные правила пользователя из памяти процесса или из БД."""
+    user_id = _user_id(user)
+    key = (using or router.db_for_read(CategoryRule), user_id)
+    version = data_version(user_id, RULES_SCOPE)
+    with _matchers_lock:
+        cached = _matchers.get(key)
+        if cached is not None and cached[0] == version:
+            _matchers.move_to_end(key)
+            return cached[1]
+    # Компилируем вне блокировки; если правила поменяются за это время,
+    # версия тоже поменяется и запись не будет использована
+    compiled = load_rules(user_id, using)
+    with _matchers_lock:
+        _matchers[key] = (version, compiled)
+        _matchers.move_to_end(key)
+        while len(_matchers) > MATCHER_CACHE_SIZE:
+            _matchers.popitem(last=False)
+    return compiled
+
+
+def rules_changed(user_id: int, using: str) -> None:
+    # Версию увеличиваем после коммита: иначе параллельный запрос может
+    # скомпилировать ещё старые правила под новой версией
+    db_transaction.on_commit(lambda: bump_version(user_id, RULES_SCOPE), using=using)
+
+
+def apply_rules(user, transactions: Iterable[Transaction], using: Optional[str] = None) -> int:
+    """Назначает категории по правилам операциям без категории (в памяти). Возвращает число назначенных."""
+    matcher = rules_for(user, using)
+    assigned = 0
+    if not matcher:
+        return assigned
+    for tx in transactions:
+        if tx.category_id is None:
+            tx.category_id = matcher.category_for(tx.description, tx.type)
+            assigned += tx.category_id is not None
+    return assigned
+
+
+def recategorize(user, using: Optional[str] = None, overwrite: bool = False, batch_size: int = 1000) -> int:
+    """
+    Применяет правила к истории пользователя пачками по batch_size. Без
+    overwrite трогает только операции без категории. Возвращает число
+    изменённых операций.
+
+    Операции читаются по (дата, id): пачка покрывает узкий интервал дат и
+    затрагивает мало ячеек помесячной сводки. Изменённые операции пачки
+    сохраняются одним UPDATE ... WHERE id IN (...) на каждую новую категорию —
+    bulk_update строил бы CASE по каждой строке, что в разы дороже.
+    """
+    user_id = _user_id(user)
+    using = using or db_for_user(user_id)
+    matcher = load_rules(user_id, using)
+    if not matcher:
+        return 0
+    qs = (
+        Transaction.objects.using(using)
+        .filter(user_id=user_id)
+        .only("id", "user_id", "type", "date", "amount", "category_id", "description")
+        .order_by("date", "id")
+    )
+    if not overwrite:
+        qs = qs.filter(category__isnull=True)
+
+    changed_total, after = 0, None
+    while True:
+        # Пачка читается в той же транзакции, что и записывается: категория,
+        # заданная вручную между чтением и записью, не будет перезаписана, а
+        # сводки вычтут ровно прочитанное состояние
+        with db_transaction.atomic(using=using):
+            page = qs if after is None else qs.filter(Q(date__gt=after[0]) | Q(date=after[0], id__gt=after[1]))
+            batch = list(page[:batch_size])
+            if not batch:
+                break
+            after = (batch[-1].date, batch[-1].pk)
+            previous, changed = [], []
+            by_category: Dict[int, List[int]] = {}
+            for tx in batch:
+                category_id = matcher.category_for(tx.description, tx.type)
+                if category_id is not None and category_id != tx.category_id:
+                    previous.append(rollups.transaction_state(tx))
+                    tx.category_id = category_id
+                    changed.append(tx)
+                    by_category.setdefault(category_id, []).append(tx.pk)
+            if not changed:
+                continue
+            for category_id, ids in by_category.items():
+                targets = Transaction.objects.using(using).filter(pk__in=ids)
+                if not overwrite:
+                    targets = targets.filter(category__isnull=True)
+                targets.update(category_id=category_id)
+            # Массовый UPDATE не вызывает сигналы; итоги по дням от категории не зависят
+            current = [rollups.transaction_state(tx) for tx in changed]
+            rollups.record_bulk(using, previous, sign=-1)
+            rollups.record_bulk(using, current)
+            budgets.record_bulk(using, previous, sign=-1)
+            budgets.record_bulk(using, current)
+        changed_total += len(changed)
+    if changed_total:
+        db_transaction.on_commit(lambda: bump_version(user_id), using=using)
+    return changed_total
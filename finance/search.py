@@ -0,0 +1,118 @@
+"""
+Полнотекстовый поиск операций по описанию и названию категории (SQLite FTS5).
+
+Индекс — виртуальная таблица finance_transaction_fts с rowid = id операции.
+Её поддерживают триггеры в самой БД, поэтому в индекс попадают и save(), и
+bulk_create(), и массовые UPDATE. Пользователь хранится в индексируемом
+столбце owner (токен «u<id>»): условие по нему входит в MATCH, и FTS5
+пересекает списки документов, не перебирая совпадения других пользователей.
+"""
+import re
+from typing import Optional
+
+from django.db import models
+from django.db.models import Lookup
+
+FTS_TABLE = "finance_transaction_fts"
+
+
+# Буква «ё» в индексе и запросе заменяется на «е»: remove_diacritics токенизатора
+# её не трогает, а пишут её непоследовательно
+def _fold(sql_value: str) -> str:
+    return f"REPLACE(REPLACE({sql_value}, 'ё', 'е'), 'Ё', 'Е')"
+
+
+_DESCRIPTION = _fold("new.description")
+_CATEGORY_NAME = _fold("COALESCE((SELECT name FROM finance_category WHERE id = new.category_id), '')")
+
+TRIGGERS = (
+    f"""
+    CREATE TRIGGER IF NOT EXISTS finance_transaction_fts_insert AFTER INSERT ON finance_transaction BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, description, category, owner)
+        VALUES (new.id, {_DESCRIPTION}, {_CATEGORY_NAME}, 'u' || new.user_id);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS finance_transaction_fts_delete AFTER DELETE ON finance_transaction BEGIN
+        DELETE FROM {FTS_TABLE} WHERE rowid = old.id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS finance_transaction_fts_update
+    AFTER UPDATE OF description, category_id, user_id ON finance_transaction
+    WHEN old.description IS NOT new.description
+        OR old.category_id IS NOT new.category_id
+        OR old.user_id IS NOT new.user_id
+    BEGIN
+        UPDATE {FTS_TABLE}
+        SET description = {_DESCRIPTION}, category = {_CATEGORY_NAME}, owner = 'u' || new.user_id
+        WHERE rowid = new.id;
+    END
+    """,
+    # Переименование категории обновляет её операции в индексе; удаление
+    # категории обнуляет category_id операций и срабатывает триггер выше
+    f"""
+    CREATE TRIGGER IF NOT EXISTS finance_category_fts_rename
+    AFTER UPDATE OF name ON finance_category WHEN old.name IS NOT new.name BEGIN
+        UPDATE {FTS_TABLE} SET category = {_fold("new.name")}
+        WHERE rowid IN (SELECT id FROM finance_transaction WHERE category_id = new.id);
+    END
+    """,
+)
+
+# Сколько слов запроса учитывается
+MAX_TERMS = 8
+
+_WORD = re.compile(r"\w+")
+
+
+def install_triggers(connection) -> None:
+    # Миграции, которые пересоздают таблицу операций (ALTER в SQLite),
+    # удаляют её триггеры — поэтому они восстанавливаются после каждого migrate
+    if connection.vendor != "sqlite" or FTS_TABLE not in connection.introspection.table_names():
+        return
+    with connection.cursor() as cursor:
+        for statement in TRIGGERS:
+            cursor.execute(statement)
+
+
+def match_expression(text: str, user_id: Optional[int] = None) -> Optional[str]:
+    """
+    Запрос FTS5 из пользовательского ввода: каждое слово ищется как префикс в
+    описании и категории, все слова обязательны. Кавычки и операторы FTS5 из
+    ввода не попадают в запрос. None — в тексте нет ни одного слова.
+    """
+    terms = _WORD.findall(text.replace("ё", "е").replace("Ё", "Е"))[:MAX_TERMS]
+    if not terms:
+        return None
+    expression = "{description category}: (" + " ".join(f'"{term}"*' for term in terms) + ")"
+    if user_id is not None:
+        expression = f"owner:u{user_id} AND {expression}"
+    return expression
+
+
+class SearchDocumentField(models.TextField):
+    """Скрытый столбец FTS5 с именем таблицы: MATCH по нему ищет по всем столбцам."""
+
+
+@SearchDocumentField.register_lookup
+class Match(Lookup):
+    lookup_name = "match"
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f"{lhs} MATCH {rhs}", [*lhs_params, *rhs_params]
+
+
+def search_transactions(qs, text: str, user_id: Optional[int] = None):
+    """
+    Операции из qs, подходящие под запрос, от наиболее релевантных; при равной
+    релевантности — сначала новые, чтобы страницы по смещению были стабильны.
+    qs может содержать любые фильтры (период, тип, категория) — они применяются
+    к найденным строкам. Если передан user_id, поиск сразу ограничен его операциями.
+    """
+    expression = match_expression(text, user_id)
+    if expression is None:
+        return qs.none()
+    return qs.filter(search_entry__document__match=expression).order_by("search_entry__rank", "-date", "-id")
@@ -0,0 +1,223 @@
+"""
+Генератор синтетических данных для нагрузочного тестирования.
+
+Создаёт пользователей с базовыми категориями (как при регистрации),
+операциями с сезонностью и целями. Данные каждого пользователя строятся
+собственным генератором случайных чисел от (seed, номер пользователя), поэтому
+результат детерминирован при одинаковых seed и end_date и не зависит от
+размера пачек.
+"""
+import calendar
+import random
+from dataclasses import dataclass
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from typing import Iterator, List, Optional
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import DEFAULT_DB_ALIAS, transaction as db_transaction
+from django.utils import timezone
+
+from . import balances, rollups
+from .models import DEFAULT_CATEGORIES, Category, Goal, GoalContribution, Transaction
+
+# Пароль всех сгенерированных пользователей — чтобы можно было войти вручную
+SEED_PASSWORD = "finance"
+
+# Сезонность расходов по месяцам: множитель и числа операций, и сумм
+SEASONALITY = {
+    1: 0.80, 2: 0.85, 3: 0.95, 4: 1.00, 5: 1.05, 6: 1.15,
+    7: 1.25, 8: 1.20, 9: 1.00, 10: 0.95, 11: 1.05, 12: 1.50,
+}
+
+# Расходы: категория (None — без категории) -> (доля операций, типичная сумма, разброс, описания)
+EXPENSE_PROFILES = {
+    "Еда": (0.45, 600, 0.6, ("Продукты", "Кафе", "Обед", "Доставка еды")),
+    "Транспорт": (0.20, 250, 0.5, ("Метро", "Такси", "Бензин")),
+    "Развлечения": (0.12, 1500, 0.8, ("Кино", "Концерт", "Подписка")),
+    "Бытовые нужды": (0.13, 1200, 0.7, ("Хозтовары", "Коммунальные услуги", "Ремонт")),
+    "Переводы": (0.05, 3000, 0.9, ("Перевод другу", "Подарок")),
+    None: (0.05, 500, 0.8, ("Прочее",)),
+}
+
+GOAL_NAMES = ("Отпуск", "Новый телефон", "Подушка безопасности", "Ремонт", "Автомобиль")
+
+# Доля операций-доходов: зарплата и аванс раз в месяц
+MAX_INCOME_SHARE = 0.1
+
+
+@dataclass
+class SeedResult:
+    users: int = 0
+    transactions: int = 0
+    goals: int = 0
+    contributions: int = 0
+
+
+def _months(start: date, end: date) -> List[date]:
+    months = []
+    current = rollups.month_start(start)
+    while current <= end:
+        months.append(current)
+        current = (current + timedelta(days=32)).replace(day=1)
+    return months
+
+
+def _amount(rnd: random.Random, typical: float, sigma: float, factor: float = 1.0) -> Decimal:
+    value = typical * factor * rnd.lognormvariate(0, sigma)
+    return max(Decimal("1.00"), Decimal(f"{value:.2f}"))
+
+
+def generate_transactions(
+    rnd: random.Random,
+    user_id: int,
+    categories: dict,
+    count: int,
+    start: date,
+    end: date,
+) -> Iterator[Transaction]:
+    """
+    `count` операций пользователя в диапазоне [start, end]: зарплата 5-го и
+    аванс 20-го числа (с премией в декабре) и расходы, число и суммы которых
+    следуют SEASONALITY.
+    """
+    months = _months(start, end)
+    salary = rnd.randint(60, 250) * 1000
+
+    incomes = []
+    for month in reversed(months):
+        for day, share in ((20, Decimal("0.4")), (5, Decimal("0.6"))):
+            paid = month.replace(day=day)
+            if start <= paid <= end:
+                amount = salary * share * (2 if month.month == 12 and day == 20 else 1)
+                incomes.append((paid, Decimal(amount).quantize(Decimal("0.01")), "Зарплата"))
+    incomes = incomes[: min(len(incomes), max(1, int(count * MAX_INCOME_SHARE)))] if count else []
+    for paid, amount, description in incomes:
+        yield Transaction(
+            user_id=user_id, type="income", category_id=categories["Зарплата"],
+            amount=amount, date=paid, description=description,
+        )
+
+    # Вес месяца — число его дней в диапазоне с учётом сезонности
+    spans = []
+    for month in months:
+        first = max(month, start)
+        last = min(month.replace(day=calendar.monthrange(month.year, month.month)[1]), end)
+        spans.append((first, (last - first).days + 1))
+    month_weights = [days * SEASONALITY[m.month] for m, (_, days) in zip(months, spans)]
+    names = list(EXPENSE_PROFILES)
+    name_weights = [EXPENSE_PROFILES[name][0] for name in names]
+
+    for _ in range(count - len(incomes)):
+        index = rnd.choices(range(len(months)), month_weights)[0]
+        first, days = spans[index]
+        day = first + timedelta(days=rnd.randrange(days))
+        name = rnd.choices(names, name_weights)[0]
+        _, typical, sigma, descriptions = EXPENSE_PROFILES[name]
+        yield Transaction(
+            user_id=user_id,
+            type="expense",
+            category_id=categories[name] if name else None,
+            amount=_amount(rnd, typical, sigma, SEASONALITY[day.month]),
+            date=day,
+            description=rnd.choice(descriptions),
+        )
+
+
+def generate_goals(rnd: random.Random, user_id: int, count: int, end: date) -> List[Goal]:
+    goals = []
+    for name in rnd.sample(GOAL_NAMES, min(count, len(GOAL_NAMES))):
+        target = Decimal(rnd.randint(20, 1000) * 1000)
+        # Часть целей уже достигнута
+        current = min(target, (target * Decimal(rnd.uniform(0, 1.2))).quantize(Decimal("0.01")))
+        deadline = end + timedelta(days=rnd.randint(30, 720)) if rnd.random() < 0.8 else None
+        goals.append(Goal(user_id=user_id, name=name, target_amount=target, current_amount=current, deadline=deadline))
+    return goals
+
+
+def generate_contributions(rnd: random.Random, goal: Goal, end: date, max_months: int = 12) -> List[GoalContribution]:
+    """Журнал взносов цели: накопленная сумма, разложенная на ежемесячные взносы до end."""
+    if not goal.current_amount:
+        return []
+    months = rnd.randint(1, max_months)
+    share = (goal.current_amount / months).quantize(Decimal("0.01"))
+    amounts = [share] * (months - 1) + [goal.current_amount - share * (months - 1)]
+    contributions = []
+    for i, amount in enumerate(amounts):
+        day = rollups.month_start(end - timedelta(days=30 * (months - 1 - i))) + timedelta(days=rnd.randrange(28))
+        created_at = timezone.make_aware(datetime.combine(min(day, end), time(12)))
+        contributions.append(GoalContribution(goal=goal, amount=amount, created_at=created_at))
+    return [c for c in contributions if c.amount]
+
+
+def seed_users(
+    users: int,
+    transactions_per_user: int,
+    goals_per_user: int = 3,
+    seed: int = 0,
+    years: int = 3,
+    end_date: Optional[date] = None,
+    prefix: str = "seed_",
+    batch_size: int = 5000,
+    users_per_chunk: int = 100,
+    using: str = DEFAULT_DB_ALIAS,
+    progress=None,
+) -> SeedResult:
+    """
+    Создаёт `users` пользователей с именами {prefix}00001… и их данные.
+    Пользователи обрабатываются пачками по users_per_chunk, каждая пачка — в
+    своей транзакции; сводки пересобираются для пачки целиком, потому что
+    bulk_create не вызывает сигналы. progress(done, total) вызывается после
+    каждой пачки.
+    """
+    end = end_date or date.today()
+    start = end - timedelta(days=365 * years - 1)
+    password = make_password(SEED_PASSWORD)
+    result = SeedResult()
+
+    for chunk_start in range(0, users, users_per_chunk):
+        numbers = range(chunk_start, min(users, chunk_start + users_per_chunk))
+        with db_transaction.atomic(using=using):
+            created = User.objects.using(using).bulk_create(
+                [User(username=f"{prefix}{i + 1:05d}", password=password) for i in numbers]
+            )
+            categories = Category.objects.using(using).bulk_create(
+                [
+                    Category(user=user, name=name, is_income=is_income)
+                    for user in created
+                    for name, is_income in DEFAULT_CATEGORIES
+                ]
+            )
+            by_user = {}
+            for category in categories:
+                by_user.setdefault(category.user_id, {})[category.name] = category.pk
+
+            batch, goals, rnds = [], [], []
+            for i, user in zip(numbers, created):
+                rnd = random.Random(f"{seed}:{i}")
+                for tx in generate_transactions(rnd, user.pk, by_user[user.pk], transactions_per_user, start, end):
+                    batch.append(tx)
+                    if len(batch) >= batch_size:
+                        Transaction.objects.using(using).bulk_create(batch)
+                        result.transactions += len(batch)
+                        batch = []
+                user_goals = generate_goals(rnd, user.pk, goals_per_user, end)
+                goals.extend(user_goals)
+                rnds.extend([rnd] * len(user_goals))
+            if batch:
+                Transaction.objects.using(using).bulk_create(batch)
+                result.transactions += len(batch)
+            Goal.objects.using(using).bulk_create(goals, batch_size=batch_size)
+            # Взносы — после вставки целей, когда известны их pk
+            contributions = [c for rnd, goal in zip(rnds, goals) for c in generate_contributions(rnd, goal, end)]
+            GoalContribution.objects.using(using).bulk_create(contributions, batch_size=batch_size)
+            rollups.rebuild(using, [user.pk for user in created])
+            balances.rebuild(using, [user.pk for user in created])
+
+        result.users += len(created)
+        result.goals += len(goals)
+        result.contributions += len(contributions)
+        if progress is not None:
+            progress(result.users, users)
+    return result
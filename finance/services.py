@@ -1,61 +1,482 @@
-from typing import Dict, Any, Optional
-import pandas as pd
+import math
+from datetime import date, timedelta
+from decimal import Decimal
+from typing import Dict, Any, Optional, Tuple
 
-from .models import Transaction
+from django.db.models import Case, DateField, DecimalField, F, Func, QuerySet, Sum, Value, When, Window
+from django.db.models.functions import ExtractYear, TruncMonth, TruncWeek
 
+from . import archive, balances
+from .cache import user_cached
+from .models import ArchivedTransaction, Goal, GoalContribution, MonthlyRollup, Transaction, TransactionHistory
+from .rollups import CENTS, covers_whole_months, month_end, month_start
 
-def expenses_by_category_qs(user) -> Dict[str, Any]:
-    qs = Transaction.objects.filter(user=user, type="expense")
-    if not qs.exists():
-        return {"labels": [], "data": []}
+UNCATEGORIZED_LABEL = "Без категории"
+
+
+# Агрегации выполняются в БД: в Python приходит по строке на группу
+# (категорию, месяц, год), а не по строке на операцию. Функции принимают
+# queryset операций (поля date/amount) или помесячной сводки (month/total).
 
-    df = pd.DataFrame.from_records(
-        qs.values("category__name", "amount"),
-        columns=["category__name", "amount"],
+def _sum_of_type(tx_type: str, amount_field: str) -> Sum:
+    return Sum(
+        Case(
+            When(type=tx_type, then=F(amount_field)),
+            default=Value(Decimal("0")),
+            output_field=DecimalField(max_digits=14, decimal_places=2),
+        )
     )
-    df = df.groupby("category__name")["amount"].sum().reset_index()
-    labels = df["category__name"].fillna("Без категории").tolist()
-    data = [float(x) for x in df["amount"].tolist()]
-    return {"labels": labels, "data": data}
 
 
-def monthly_balance_qs(user, year: Optional[int] = None) -> Dict[str, Any]:
-    qs = Transaction.objects.filter(user=user)
-    if year is not None:
-        qs = qs.filter(date__year=year)  # фильтрация по году [web:159][web:168]
+def _net_amount(amount_field: str) -> Sum:
+    # Доходы со знаком плюс, расходы со знаком минус
+    return Sum(
+        Case(
+            When(type="income", then=F(amount_field)),
+            When(type="expense", then=-F(amount_field)),
+            default=Value(Decimal("0")),
+            output_field=DecimalField(max_digits=14, decimal_places=2),
+        )
+    )
 
-    if not qs.exists():
-        return {"labels": [], "income": [], "expense": []}
 
-    df = pd.DataFrame.from_records(qs.values("date", "type", "amount"))
-    df["month"] = pd.to_datetime(df["date"]).dt.to_period("M").astype(str)
+class RunningTotal(Func):
+    """
+    SUM(...) для OVER (...) над уже сгруппированными строками: Sum() Django не
+    принимает агрегат как аргумент, а оконная сумма агрегатов — обычный SQL.
+    """
 
-    pivot = df.pivot_table(
-        index="month",
-        columns="type",
-        values="amount",
-        aggfunc="sum",
-        fill_value=0,
-    ).reset_index()
+    function = "SUM"
+    window_compatible = True
 
-    labels = pivot["month"].tolist()
-    income_series = pivot.get("income")
-    expense_series = pivot.get("expense")
 
-    income = [float(x) for x in (income_series.tolist() if income_series is not None else [0] * len(labels))]
-    expense = [float(x) for x in (expense_series.tolist() if expense_series is not None else [0] * len(labels))]
+def category_totals(qs: QuerySet, amount_field: str = "amount") -> Dict[str, Any]:
+    rows = (
+        qs.values("category__name")
+        .annotate(total=Sum(amount_field))
+        .order_by(F("category__name").asc(nulls_last=True))
+    )
+    labels, data = [], []
+    for row in rows:
+        labels.append(row["category__name"] or UNCATEGORIZED_LABEL)
+        data.append(float(row["total"]))
+    return {"labels": labels, "data": data}
+
 
+def monthly_totals(qs: QuerySet, date_field: str = "date", amount_field: str = "amount") -> Dict[str, Any]:
+    rows = (
+        qs.annotate(period=TruncMonth(date_field))
+        .values("period")
+        .annotate(
+            income=_sum_of_type("income", amount_field),
+            expense=_sum_of_type("expense", amount_field),
+        )
+        .order_by("period")
+    )
+    labels, income, expense = [], [], []
+    for row in rows:
+        labels.append(row["period"].strftime("%Y-%m"))
+        income.append(float(row["income"]))
+        expense.append(float(row["expense"]))
     return {"labels": labels, "income": income, "expense": expense}
 
 
+def distinct_years(qs: QuerySet, date_field: str = "date") -> list[int]:
+    years = (
+        qs.annotate(year=ExtractYear(date_field))
+        .values_list("year", flat=True)
+        .distinct()
+        .order_by("year")
+    )
+    return list(years)
+
+
+def income_expense_totals(qs: QuerySet, amount_field: str = "amount") -> Tuple[Decimal, Decimal]:
+    totals = qs.aggregate(
+        income=_sum_of_type("income", amount_field),
+        expense=_sum_of_type("expense", amount_field),
+    )
+    return totals["income"] or 0, totals["expense"] or 0
+
+
+# Расходы по категориям за всё время — целые месяцы, поэтому читаем
+# помесячную сводку вместо исходных операций
+@user_cached("expenses_by_category")
+def expenses_by_category_qs(user) -> Dict[str, Any]:
+    return category_totals(MonthlyRollup.objects.filter(user=user, type="expense"), "total")
+
+
+# Год всегда состоит из целых месяцев — строим график по сводке
+@user_cached("monthly_balance")
+def monthly_balance_qs(user, year: Optional[int] = None) -> Dict[str, Any]:
+    qs = MonthlyRollup.objects.filter(user=user)
+    if year is not None:
+        qs = qs.filter(month__year=year)
+    return monthly_totals(qs, "month", "total")
+
+
+@user_cached("available_years")
 def available_years_qs(user) -> list[int]:
     """
     Список годов, в которых есть какие-либо операции пользователя,
     чтобы заполнить селект в аналитике.
     """
-    qs = Transaction.objects.filter(user=user)
-    if not qs.exists():
-        return []
-    df = pd.DataFrame.from_records(qs.values("date"))
-    years = sorted(df["date"].apply(lambda d: d.year).unique())
-    return [int(y) for y in years]
+    return distinct_years(MonthlyRollup.objects.filter(user=user), "month")
+
+
+def filtered_transactions_qs(
+    user,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    tx_type: Optional[str] = None,
+    category_id: Optional[int] = None,
+    archived: bool = False,
+) -> QuerySet:
+    """
+    Операции пользователя с фильтрами дашборда (пустой фильтр не применяется).
+    archived — читать архив старых операций вместо основной таблицы.
+    """
+    qs = (ArchivedTransaction if archived else Transaction).objects.filter(user=user)
+    if date_from is not None:
+        qs = qs.filter(date__gte=date_from)
+    if date_to is not None:
+        qs = qs.filter(date__lte=date_to)
+    if tx_type in ("income", "expense"):
+        qs = qs.filter(type=tx_type)
+    if category_id is not None:
+        qs = qs.filter(category_id=category_id)
+    return qs
+
+
+def _summary_source(
+    user,
+    date_from: date,
+    date_to: date,
+    tx_type: Optional[str],
+    category_id: Optional[int],
+) -> Tuple[QuerySet, str]:
+    # Если период состоит из целых месяцев, считаем по помесячной сводке
+    if covers_whole_months(date_from, date_to):
+        qs = MonthlyRollup.objects.filter(
+            user=user,
+            month__gte=month_start(date_from),
+            month__lte=month_start(date_to),
+        )
+        amount_field = "total"
+    else:
+        # Неполный месяц старше границы архива читается вместе с архивом
+        qs = archive.source(date_from).objects.filter(
+            user=user,
+            date__gte=date_from,
+            date__lte=date_to,
+        )
+        amount_field = "amount"
+    if tx_type in ("income", "expense"):
+        qs = qs.filter(type=tx_type)
+    if category_id is not None:
+        qs = qs.filter(category_id=category_id)
+    return qs, amount_field
+
+
+def _totals_context(income_sum: Decimal, expense_sum: Decimal) -> Dict[str, Decimal]:
+    # Агрегаты SQLite возвращаются без масштаба — приводим к копейкам
+    cents = Decimal("0.01")
+    income_sum = Decimal(income_sum).quantize(cents)
+    expense_sum = Decimal(expense_sum).quantize(cents)
+    return {
+        "income_sum": income_sum,
+        "expense_sum": expense_sum,
+        "balance": income_sum - expense_sum,
+    }
+
+
+@user_cached("dashboard_summary")
+def dashboard_summary_qs(
+    user,
+    date_from: date,
+    date_to: date,
+    tx_type: Optional[str] = None,
+    category_id: Optional[int] = None,
+) -> Dict[str, Any]:
+    """
+    Доходы, расходы, баланс и разбивка по категориям для дашборда одним
+    запросом. Все фильтры применяются одинаково и к суммам, и к графику.
+    Если период состоит из целых месяцев, считаем по помесячной сводке.
+    """
+    qs, amount_field = _summary_source(user, date_from, date_to, tx_type, category_id)
+    rows = (
+        qs.values("category__name")
+        .annotate(
+            income=_sum_of_type("income", amount_field),
+            expense=_sum_of_type("expense", amount_field),
+            total=Sum(amount_field),
+        )
+        .order_by("-total")
+    )
+
+    income_sum = expense_sum = Decimal("0")
+    chart_labels, chart_data = [], []
+    for row in rows:
+        income_sum += row["income"]
+        expense_sum += row["expense"]
+        chart_labels.append(row["category__name"] or UNCATEGORIZED_LABEL)
+        chart_data.append(float(row["total"]))
+
+    return {
+        **_totals_context(income_sum, expense_sum),
+        "chart_labels": chart_labels,
+        "chart_data": chart_data,
+    }
+
+
+# Асинхронные версии для ASGI-представлений: один aaggregate без графика,
+# чтобы суммы можно было запрашивать параллельно с остальными данными страницы
+
+async def aincome_expense_totals(qs: QuerySet, amount_field: str = "amount") -> Tuple[Decimal, Decimal]:
+    totals = await qs.aaggregate(
+        income=_sum_of_type("income", amount_field),
+        expense=_sum_of_type("expense", amount_field),
+    )
+    return totals["income"] or Decimal("0"), totals["expense"] or Decimal("0")
+
+
+async def adashboard_totals(
+    user,
+    date_from: date,
+    date_to: date,
+    tx_type: Optional[str] = None,
+    category_id: Optional[int] = None,
+) -> Dict[str, Decimal]:
+    """
+    Доходы, расходы и баланс дашборда с теми же фильтрами, что и dashboard_summary_qs.
+    Без фильтра по категории суммы берутся из итогов по дням за любой период.
+    """
+    if category_id is None:
+        income_sum, expense_sum = await balances.arange_totals(user.pk, date_from, date_to)
+        return _totals_context(
+            income_sum if tx_type != "expense" else Decimal("0"),
+            expense_sum if tx_type != "income" else Decimal("0"),
+        )
+    qs, amount_field = _summary_source(user, date_from, date_to, tx_type, category_id)
+    return _totals_context(*await aincome_expense_totals(qs, amount_field))
+
+
+async def ayear_totals(user, year: Optional[int] = None) -> Dict[str, Decimal]:
+    """Доходы, расходы и баланс за год (или за всё время) по помесячной сводке."""
+    qs = MonthlyRollup.objects.filter(user=user)
+    if year is not None:
+        qs = qs.filter(month__year=year)
+    return _totals_context(*await aincome_expense_totals(qs, "total"))
+
+@user_cached("goal_savings")
+def goal_savings_qs(user, goal_id: int) -> Optional[Dict[str, Any]]:
+    """
+    Накопления по цели помесячно из журнала взносов: взносы за месяц,
+    накопленная сумма, средний темп в месяц и прогноз месяца достижения цели.
+    None, если цели нет.
+    """
+    goal = Goal.objects.filter(pk=goal_id, user=user).only("target_amount", "created_at").first()
+    if goal is None:
+        return None
+    rows = (
+        GoalContribution.objects.filter(goal_id=goal_id)
+        .annotate(period=TruncMonth("created_at", output_field=DateField()))
+        .values("period")
+        .annotate(total=Sum("amount"))
+        .order_by("period")
+    )
+    by_month = {row["period"]: Decimal(row["total"]).quantize(CENTS) for row in rows}
+
+    labels, contributed, saved = [], [], []
+    if by_month:
+        # Месяцы без взносов заполняются нулями, чтобы темп был честным
+        month, last = min(by_month), max(max(by_month), month_start(date.today()))
+        running = Decimal("0")
+        while month <= last:
+            amount = by_month.get(month, Decimal("0"))
+            running += amount
+            labels.append(month.strftime("%Y-%m"))
+            contributed.append(float(amount))
+            saved.append(float(running))
+            month = (month + timedelta(days=32)).replace(day=1)
+
+    rate = sum(contributed) / len(contributed) if contributed else 0.0
+    remaining = float(goal.target_amount) - (saved[-1] if saved else 0.0)
+    projected = None
+    if remaining <= 0:
+        projected = labels[-1] if labels else None
+    elif rate > 0:
+        today = date.today()
+        months = today.year * 12 + today.month - 1 + math.ceil(remaining / rate)
+        projected = f"{months // 12:04d}-{months % 12 + 1:02d}"
+    return {
+        "labels": labels,
+        "contributed": contributed,
+        "saved": saved,
+        "target": float(goal.target_amount),
+        "monthly_rate": round(rate, 2),
+        "projected_completion": projected,
+    }
+
+
+# На SQLite TruncWeek вызывает Python-функцию django_date_trunc на каждую строку —
+# на миллионе операций это секунды; встроенная date() в разы быстрее. Месяцы
+# усекать не нужно: они выровнены по границам и считаются по сводке
+class WeekStart(TruncWeek):
+    def as_sqlite(self, compiler, connection, **extra_context):
+        sql, params = compiler.compile(self.lhs)
+        return f"date({sql}, '-6 days', 'weekday 1')", params
+
+
+# Денежный поток и баланс: period -> (усечение даты в SQL, формат подписи)
+CASH_FLOW_PERIODS = {
+    "day": (None, "%Y-%m-%d"),
+    "week": (WeekStart, "%Y-%m-%d"),
+    "month": (TruncMonth, "%Y-%m"),
+}
+
+# Больше точек Chart.js не рисует осмысленно: в линии ширины графика
+CASH_FLOW_MAX_POINTS = 400
+
+# Сколько периодов cash_flow_qs строит до прореживания — двадцать лет по дням
+CASH_FLOW_MAX_PERIODS = 20 * 366
+
+
+def period_start(day: date, period: str) -> date:
+    if period == "week":
+        return day - timedelta(days=day.weekday())
+    if period == "month":
+        return month_start(day)
+    return day
+
+
+def next_period(day: date, period: str) -> date:
+    if period == "week":
+        return day + timedelta(days=7)
+    if period == "month":
+        return (day + timedelta(days=32)).replace(day=1)
+    return day + timedelta(days=1)
+
+
+def period_count(date_from: date, date_to: date, period: str) -> int:
+    """Сколько периодов от начала периода date_from до date_to включительно."""
+    start = period_start(date_from, period)
+    if period == "month":
+        return (date_to.year - start.year) * 12 + date_to.month - start.month + 1
+    if period == "week":
+        return (date_to - start).days // 7 + 1
+    return (date_to - start).days + 1
+
+
+def opening_balance(user, before: date) -> Decimal:
+    """Баланс на начало дня before — итоги на предыдущий день."""
+    income, expense = balances.cumulative(user.pk, before - timedelta(days=1))
+    return balances.from_cents(income - expense)
+
+
+def _cash_flow_rows(user, date_from: date, date_to: date, period: str):
+    """
+    Чистый поток и нарастающий итог по периодам одним запросом: GROUP BY
+    периода и SUM(SUM(...)) OVER (ORDER BY период). Приходят только периоды с
+    операциями. Месяцы целиком считаются по помесячной сводке.
+    """
+    if period == "month" and covers_whole_months(date_from, date_to):
+        qs = MonthlyRollup.objects.filter(user=user, month__gte=date_from, month__lte=date_to)
+        date_field, amount_field = "month", "total"
+    else:
+        qs = archive.source(date_from).objects.filter(user=user, date__gte=date_from, date__lte=date_to)
+        date_field, amount_field = "date", "amount"
+    trunc, _ = CASH_FLOW_PERIODS[period]
+    # В сводке дата уже начало месяца
+    if trunc is None or date_field == "month":
+        period_expr = F(date_field)
+    else:
+        period_expr = trunc(date_field, output_field=DateField())
+    output_field = DecimalField(max_digits=14, decimal_places=2)
+    return (
+        qs.order_by()
+        .annotate(period=period_expr)
+        .values("period")
+        .annotate(net=_net_amount(amount_field))
+        # Окно — отдельным annotate(): в одном вызове с агрегатом Django
+        # добавляет его в GROUP BY
+        .annotate(
+            balance=Window(
+                RunningTotal(_net_amount(amount_field), output_field=output_field),
+                order_by=F("period").asc(),
+            ),
+        )
+        .order_by("period")
+    )
+
+
+def _downsample(labels, net, balance, max_points):
+    # Соседние периоды объединяются по size штук: поток суммируется, баланс
+    # берётся на конец группы — последняя точка всегда совпадает с итогом
+    size = math.ceil(len(labels) / max_points)
+    if size <= 1:
+        return labels, net, balance, 1
+    return (
+        labels[::size],
+        [round(sum(net[i:i + size]), 2) for i in range(0, len(net), size)],
+        [balance[min(i + size, len(balance)) - 1] for i in range(0, len(balance), size)],
+        size,
+    )
+
+
+@user_cached("cash_flow")
+def cash_flow_qs(
+    user,
+    date_from: date,
+    date_to: date,
+    period: str = "day",
+    max_points: int = CASH_FLOW_MAX_POINTS,
+) -> Dict[str, Any]:
+    """
+    Чистый денежный поток (доходы минус расходы) по дням, неделям или месяцам
+    и баланс на конец каждого периода за [date_from, date_to]. Суммы и
+    нарастающий итог считает БД; периоды без операций заполняются нулевым
+    потоком и прежним балансом. Если периодов больше max_points, соседние
+    объединяются (bucket — сколько периодов в точке). Больше
+    CASH_FLOW_MAX_PERIODS периодов — ValueError.
+    """
+    _, label_format = CASH_FLOW_PERIODS[period]
+    result = {"period": period, "bucket": 1, "labels": [], "net": [], "balance": [], "opening_balance": 0.0}
+    first = TransactionHistory.objects.filter(user=user).order_by("date").values_list("date", flat=True).first()
+    if first is None:
+        return result
+    # Раньше первой операции баланс нулевой — пустые периоды не строим
+    date_from = max(date_from, first)
+    if date_from > date_to:
+        return result
+    # Ряд строится по периоду в Python — длину проверяем до этого
+    if period_count(date_from, date_to, period) > CASH_FLOW_MAX_PERIODS:
+        raise ValueError(f"Слишком длинный период: больше {CASH_FLOW_MAX_PERIODS} точек")
+    # Границы выравниваются по периодам, чтобы первый и последний не были усечены
+    start = period_start(date_from, period)
+    end = month_end(date_to) if period == "month" else next_period(period_start(date_to, period), period) - timedelta(days=1)
+
+    opening = opening_balance(user, start)
+    by_period = {row["period"]: row for row in _cash_flow_rows(user, start, end, period)}
+
+    labels, net, balance = [], [], []
+    running = Decimal("0")
+    current = start
+    while current <= date_to:
+        row = by_period.get(current)
+        if row is not None:
+            running = Decimal(row["balance"])
+        labels.append(current.strftime(label_format))
+        net.append(float(Decimal(row["net"]).quantize(CENTS)) if row else 0.0)
+        balance.append(float((opening + running).quantize(CENTS)))
+        current = next_period(current, period)
+
+    labels, net, balance, bucket = _downsample(labels, net, balance, max(1, max_points))
+    return {
+        **result,
+        "bucket": bucket,
+        "labels": labels,
+        "net": net,
+        "balance": balance,
+        "opening_balance": float(opening.quantize(CENTS)),
+    }
@@ -0,0 +1,395 @@
+"""
+Шардирование данных finance по пользователям между несколькими базами SQLite.
+
+У файла SQLite одна блокировка записи на всех. С FINANCE_SHARDS данные
+finance каждого пользователя (категории, операции, цели и всё производное)
+лежат в одной из баз-шардов, а auth, сессии, каталог шардов (UserShard) и
+очередь фоновых задач (Job) — в основной базе. Новый пользователь попадает в шард по id; пользователи без
+записи в каталоге (созданные до включения шардов) остаются в основной базе,
+пока их не перенесёт rebalance_shards.
+
+ShardRouter выбирает базу для моделей finance:
+
+- по объекту-подсказке (instance): пользователю, его объекту finance или
+  новому объекту с user_id;
+- иначе по пользователю текущего контекста: его задают ShardMiddleware для
+  HTTP-запроса, user_cached для функций services.py и for_user() для команд
+  и фоновых задач.
+
+id во всех шардах не пересекаются: каждый шард выдаёт id AUTOINCREMENT из
+своего диапазона (reserve_id_range), поэтому move_user переносит строки как
+есть, не переназначая внешние ключи. Внешние ключи на auth_user проверяет
+SQLite, поэтому в шарде хранится копия строки пользователя без пароля.
+"""
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, transaction as db_transaction
+from django.http import HttpResponse
+from django.utils import timezone
+
+from .models import (
+    ArchivedTransaction,
+    Budget,
+    BudgetSpend,
+    Category,
+    CategoryRule,
+    DailyBalance,
+    DeletionTask,
+    Goal,
+    GoalContribution,
+    Job,
+    MonthlyRollup,
+    Transaction,
+    UserShard,
+)
+
+# Диапазон id шарда: shard_N выдаёт id начиная с (N + 1) << ID_RANGE_BITS
+ID_RANGE_BITS = 40
+
+# Модели пользователя в порядке вставки (родители раньше детей) и поле,
+# по которому строка принадлежит пользователю
+OWNED_MODELS = (
+    (Category, "user_id"),
+    (Goal, "user_id"),
+    (GoalContribution, "goal__user_id"),
+    (Budget, "user_id"),
+    (BudgetSpend, "budget__user_id"),
+    (CategoryRule, "user_id"),
+    (Transaction, "user_id"),
+    (ArchivedTransaction, "user_id"),
+    (MonthlyRollup, "user_id"),
+    (DailyBalance, "user_id"),
+    (DeletionTask, "user_id"),
+)
+
+
+class _Owner:
+    """Пользователь контекста; его база определяется один раз на контекст."""
+
+    def __init__(self, get_user_id: Callable[[], Optional[int]]):
+        self._get_user_id = get_user_id
+        self._alias: Optional[str] = None
+
+    def alias(self) -> Optional[str]:
+        if self._alias is None:
+            user_id = self._get_user_id()
+            if user_id is not None:
+                self._alias = db_for_user(user_id)
+        return self._alias
+
+
+# Пользователь, по которому маршрутизируются запросы без подсказки
+_owner: ContextVar[Optional[_Owner]] = ContextVar("finance_shard_owner", default=None)
+
+
+def enabled() -> bool:
+    return bool(settings.FINANCE_SHARDS)
+
+
+def databases() -> List[str]:
+    """Базы, в которых могут лежать данные finance."""
+    return [DEFAULT_DB_ALIAS, *settings.FINANCE_SHARDS]
+
+
+def placement(user_id: int) -> str:
+    """Шард, в который пользователь попадает по умолчанию."""
+    shards = settings.FINANCE_SHARDS
+    return shards[user_id % len(shards)]
+
+
+# Каталог: запись пользователя кешируется на FINANCE_SHARD_DIRECTORY_TIMEOUT
+# секунд. move_user выжидает столько же после каждого изменения записи, чтобы
+# все процессы увидели новое состояние
+
+def _cache():
+    return caches[settings.FINANCE_CACHE_ALIAS]
+
+
+def _directory_key(user_id: int) -> str:
+    return f"finance:shard:{user_id}"
+
+
+def _entry(user_id: int) -> Tuple[str, bool]:
+    key = _directory_key(user_id)
+    entry = _cache().get(key)
+    if entry is None:
+        row = UserShard.objects.using(DEFAULT_DB_ALIAS).filter(user_id=user_id).values_list("alias", "moving").first()
+        entry = tuple(row) if row is not None else (DEFAULT_DB_ALIAS, False)
+        _cache().set(key, entry, timeout=settings.FINANCE_SHARD_DIRECTORY_TIMEOUT)
+    return entry
+
+
+def _set_entry(user_id: int, alias: str, moving: bool) -> None:
+    UserShard.objects.using(DEFAULT_DB_ALIAS).update_or_create(
+        user_id=user_id, defaults={"alias": alias, "moving": moving}
+    )
+    _cache().set(_directory_key(user_id), (alias, moving), timeout=settings.FINANCE_SHARD_DIRECTORY_TIMEOUT)
+
+
+def db_for_user(user) -> str:
+    """База данных finance пользователя (объект или id)."""
+    user_id = getattr(user, "pk", user)
+    if not enabled() or user_id is None:
+        return DEFAULT_DB_ALIAS
+    return _entry(user_id)[0]
+
+
+def is_moving(user) -> bool:
+    user_id = getattr(user, "pk", user)
+    return enabled() and user_id is not None and _entry(user_id)[1]
+
+
+@contextmanager
+def for_user(user):
+    """Запросы finance без подсказки внутри блока идут в базу пользователя user."""
+    user_id = getattr(user, "pk", user)
+    token = _owner.set(_Owner(lambda: user_id))
+    try:
+        yield
+    finally:
+        _owner.reset(token)
+
+
+def _is_sharded(model) -> bool:
+    # Каталог шардов и очередь задач — общие, в основной базе
+    return model._meta.app_label == "finance" and model not in (UserShard, Job)
+
+
+class ShardRouter:
+    """Маршрутизация моделей finance по шардам; остальные модели — в основной базе."""
+
+    def _db(self, model, **hints):
+        if not enabled():
+            return None
+        if not _is_sharded(model):
+            return DEFAULT_DB_ALIAS
+        instance = hints.get("instance")
+        if isinstance(instance, User):
+            return db_for_user(instance)
+        if instance is not None:
+            # Загруженный объект остаётся в своей базе, новый — в базе владельца
+            if instance._state.db is not None:
+                return instance._state.db
+            if getattr(instance, "user_id", None) is not None:
+                return db_for_user(instance.user_id)
+        owner = _owner.get()
+        return owner.alias() if owner is not None else None
+
+    db_for_read = _db
+    db_for_write = _db
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Внешние ключи finance на пользователя ведут из шарда в основную базу
+        if enabled() and (isinstance(obj1, User) or isinstance(obj2, User)):
+            return True
+        return None
+
+
+class ShardMiddleware:
+    """
+    Задаёт пользователя запроса для ShardRouter и отклоняет запросы на
+    изменение данных пользователя, пока они переносятся в другой шард.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    @staticmethod
+    def _owner(request):
+        # request.user читается при первом запросе к finance: async-представления
+        # к тому времени подставляют уже загруженного пользователя
+        return _Owner(lambda: getattr(request.user, "pk", None))
+
+    @staticmethod
+    def _frozen(request, user) -> bool:
+        return request.method not in ("GET", "HEAD", "OPTIONS") and is_moving(user)
+
+    @staticmethod
+    def _unavailable():
+        response = HttpResponse("Данные переносятся, повторите через минуту.", status=503)
+        response["Retry-After"] = str(max(1, settings.FINANCE_SHARD_DIRECTORY_TIMEOUT))
+        return response
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if enabled() and self._frozen(request, request.user):
+            return self._unavailable()
+        token = _owner.set(self._owner(request))
+        try:
+            return self.get_response(request)
+        finally:
+            _owner.reset(token)
+
+    async def __acall__(self, request):
+        if enabled() and await sync_to_async(self._frozen)(request, await request.auser()):
+            return self._unavailable()
+        token = _owner.set(self._owner(request))
+        try:
+            return await self.get_response(request)
+        finally:
+            _owner.reset(token)
+
+
+# Размещение пользователей и перенос между шардами
+
+def ensure_user_copy(alias: str, user: User) -> None:
+    """Копия строки пользователя в шарде — цель внешних ключей finance; войти по ней нельзя."""
+    if alias == DEFAULT_DB_ALIAS:
+        return
+    User.objects.using(alias).bulk_create(
+        [User(pk=user.pk, username=user.get_username(), password="!", is_active=False)],
+        ignore_conflicts=True,
+    )
+
+
+def place_user(user: User) -> str:
+    """Записывает нового пользователя в шард по умолчанию. Возвращает его базу."""
+    if not enabled():
+        return DEFAULT_DB_ALIAS
+    alias = placement(user.pk)
+    ensure_user_copy(alias, user)
+    _set_entry(user.pk, alias, moving=False)
+    return alias
+
+
+def reserve_id_range(connection, index: int) -> None:
+    """
+    Сдвигает счётчики AUTOINCREMENT всех таблиц шарда с номером index в его
+    диапазон id. Повторный вызов ничего не меняет.
+    """
+    base = (index + 1) << ID_RANGE_BITS
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND sql LIKE '%AUTOINCREMENT%'")
+        for (table,) in cursor.fetchall():
+            cursor.execute("UPDATE sqlite_sequence SET seq = %s WHERE name = %s AND seq < %s", [base, table, base])
+            cursor.execute(
+                "INSERT INTO sqlite_sequence (name, seq) SELECT %s, %s "
+                "WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = %s)",
+                [table, base, table],
+            )
+
+
+def _owned(model, owner_field: str, alias: str, user_id: int):
+    return model._base_manager.using(alias).filter(**{owner_field: user_id}).order_by("pk")
+
+
+def _copy(model, owner_field: str, source: str, target: str, user_id: int, batch_size: int, pause: float) -> int:
+    # Строки копируются как есть, вместе с id: диапазоны id шардов не пересекаются
+    fields = [field.attname for field in model._meta.concrete_fields]
+    qs = _owned(model, owner_field, source, user_id).values_list(*fields)
+    copied, after = 0, None
+    while True:
+        rows = list((qs if after is None else qs.filter(pk__gt=after))[:batch_size])
+        if rows:
+            with db_transaction.atomic(using=target):
+                model._base_manager.using(target).bulk_create([model(**dict(zip(fields, row))) for row in rows])
+            after = rows[-1][fields.index(model._meta.pk.attname)]
+            copied += len(rows)
+        if len(rows) < batch_size:
+            return copied
+        if pause:
+            time.sleep(pause)
+
+
+def _delete_owned(alias: str, user_id: int, batch_size: int, pause: float) -> None:
+    from .deletion import delete_in_batches
+
+    # Дети раньше родителей: внешние ключи проверяются при коммите каждой пачки
+    for model, owner_field in reversed(OWNED_MODELS):
+        delete_in_batches(_owned(model, owner_field, alias, user_id), alias, batch_size, pause)
+
+
+def _wait_for_directory() -> None:
+    time.sleep(settings.FINANCE_SHARD_DIRECTORY_TIMEOUT)
+
+
+def _check_deletions(alias: str, user_id: int) -> None:
+    # Удаление пачками (finance.deletion) пишет в базу мимо ShardMiddleware.
+    # Новые пачки при переносе не начинаются, но уже идущее удаление
+    # изменило бы строки после их копирования — такой перенос не делаем
+    running = DeletionTask.objects.using(alias).filter(user_id=user_id, status="running")
+    if running.exists():
+        raise ValueError(
+            f"У пользователя {user_id} идёт удаление данных: дождитесь его или завершите run_deletions"
+        )
+
+
+def _wait_for_jobs(user_id: int) -> None:
+    # Фоновые задачи (finance.jobs) пишут мимо ShardMiddleware: новые при
+    # переносе откладываются, начатые раньше должны доработать
+    while True:
+        stale = timezone.now() - timedelta(seconds=settings.FINANCE_JOB_TIMEOUT)
+        running = Job.objects.using(DEFAULT_DB_ALIAS).filter(user_id=user_id, status="running", locked_at__gte=stale)
+        if not running.exists():
+            return
+        time.sleep(settings.FINANCE_JOB_POLL_INTERVAL)
+
+
+def move_user(user_id: int, target: str, batch_size: Optional[int] = None, pause: float = 0) -> Dict[str, int]:
+    """
+    Переносит данные finance пользователя в базу target пачками. На время
+    переноса запись для пользователя запрещена (ShardMiddleware, фоновые
+    задачи и удаления откладываются), чтение идёт из прежней базы; после переключения каталога строки в прежней базе
+    удаляются. Прерванный перенос можно просто запустить ещё раз. Возвращает
+    число перенесённых строк по моделям. Пока у пользователя идёт удаление
+    данных (finance.deletion), перенос отклоняется с ValueError.
+    """
+    if target not in databases():
+        raise ValueError(f"Неизвестная база данных «{target}»")
+    batch_size = batch_size or settings.FINANCE_SHARD_MOVE_BATCH_SIZE
+    user = User.objects.using(DEFAULT_DB_ALIAS).get(pk=user_id)
+    source = db_for_user(user_id)
+    if source == target:
+        return {}
+
+    _set_entry(user_id, source, moving=True)
+    _wait_for_directory()
+    try:
+        _check_deletions(source, user_id)
+    except ValueError:
+        _set_entry(user_id, source, moving=False)
+        raise
+    _wait_for_jobs(user_id)
+    # Остатки прерванного переноса в target — не действующие данные
+    _delete_owned(target, user_id, batch_size, 0)
+    ensure_user_copy(target, user)
+    copied = {
+        model._meta.label: _copy(model, owner_field, source, target, user_id, batch_size, pause)
+        for model, owner_field in OWNED_MODELS
+    }
+    _set_entry(user_id, target, moving=False)
+    _wait_for_directory()
+
+    _delete_owned(source, user_id, batch_size, pause)
+    if source != DEFAULT_DB_ALIAS:
+        User.objects.using(source).filter(pk=user_id)._raw_delete(source)
+    return copied
+
+
+def misplaced(user_ids: Optional[Iterable[int]] = None) -> List[Tuple[int, str, str]]:
+    """Пользователи не в своём шарде по умолчанию: (id, текущая база, шард)."""
+    users = User.objects.using(DEFAULT_DB_ALIAS).order_by("pk")
+    if user_ids is not None:
+        users = users.filter(pk__in=list(user_ids))
+    directory = dict(UserShard.objects.using(DEFAULT_DB_ALIAS).values_list("user_id", "alias"))
+    result = []
+    for user_id in users.values_list("pk", flat=True):
+        current, target = directory.get(user_id, DEFAULT_DB_ALIAS), placement(user_id)
+        if current != target:
+            result.append((user_id, current, target))
+    return result
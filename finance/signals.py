@@ -0,0 +1,130 @@
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import DEFAULT_DB_ALIAS, connections, transaction as db_transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_migrate, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from . import archive, balances, budgets, rollups, rules, sharding
+from .cache import bump_version
+from .instrumentation import install_query_hook
+from .models import Budget, Category, CategoryRule, Goal, Job, Transaction
+from .search import install_triggers
+
+
+# Перед сохранением запоминаем прежнее состояние операции из БД,
+# чтобы вычесть его из старой ячейки сводки (месяц/категория могли поменяться)
+@receiver(pre_save, sender=Transaction)
+def transaction_pre_save(sender, instance, using, **kwargs):
+    instance._rollup_previous = None
+    if instance.pk is not None:
+        instance._rollup_previous = (
+            sender._base_manager.using(using)
+            .filter(pk=instance.pk)
+            .values(*rollups.TRACKED_FIELDS)
+            .first()
+        )
+
+
+@receiver(post_save, sender=Transaction)
+def transaction_post_save(sender, instance, using, **kwargs):
+    previous = getattr(instance, "_rollup_previous", None)
+    current = rollups.transaction_state(instance)
+    rollups.record_change(using, previous, current)
+    balances.record_change(using, previous, current)
+    budgets.record_change(using, previous, current)
+
+
+@receiver(post_delete, sender=Transaction)
+def transaction_post_delete(sender, instance, using, **kwargs):
+    previous = rollups.transaction_state(instance)
+    rollups.record_change(using, previous, None)
+    balances.record_change(using, previous, None)
+    budgets.record_change(using, previous, None)
+
+
+# Счётчики бюджета зависят от его категории, периода и лимита
+@receiver(pre_save, sender=Budget)
+def budget_pre_save(sender, instance, using, **kwargs):
+    instance._budget_previous = None
+    if instance.pk is not None:
+        instance._budget_previous = (
+            sender._base_manager.using(using)
+            .filter(pk=instance.pk)
+            .values("category_id", "period", "limit")
+            .first()
+        )
+
+
+@receiver(post_save, sender=Budget)
+def budget_post_save(sender, instance, using, **kwargs):
+    budgets.budget_changed(using, instance, getattr(instance, "_budget_previous", None))
+
+
+# Операции удаляемой категории станут «Без категории» — туда же переносим сводки
+@receiver(pre_delete, sender=Category)
+def category_pre_delete(sender, instance, using, **kwargs):
+    rollups.fold_category(using, instance.pk)
+
+
+# Файл задачи удаляется вместе с ней — и когда удаляют пользователя
+@receiver(post_delete, sender=Job)
+def job_post_delete(sender, instance, using, **kwargs):
+    if instance.upload:
+        storage, name = instance.upload.storage, instance.upload.name
+        db_transaction.on_commit(lambda: storage.delete(name), using=using)
+
+
+# Любое изменение данных пользователя делает его кеш аналитики устаревшим.
+# Версию увеличиваем после коммита, чтобы параллельный запрос не успел
+# положить в кеш под новой версией ещё старые данные. bump_version заодно
+# закрепляет пользователя за основной базой (finance.replicas) — бюджеты
+# дашборд тоже читает из реплики.
+@receiver(post_save, sender=Transaction)
+@receiver(post_delete, sender=Transaction)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=Goal)
+@receiver(post_delete, sender=Goal)
+@receiver(post_save, sender=Budget)
+@receiver(post_delete, sender=Budget)
+def invalidate_user_cache(sender, instance, using, **kwargs):
+    user_id = instance.user_id
+    db_transaction.on_commit(lambda: bump_version(user_id), using=using)
+
+
+# Скомпилированные правила категоризации зависят от самих правил и от вида
+# (доход/расход) их категорий
+@receiver(post_save, sender=CategoryRule)
+@receiver(post_delete, sender=CategoryRule)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_user_rules(sender, instance, using, **kwargs):
+    rules.rules_changed(instance.user_id, using)
+
+
+# Учёт SQL для профилирования запросов (finance.instrumentation) — на каждом
+# новом соединении, в каком бы потоке оно ни открылось
+@receiver(connection_created)
+def profile_connection_queries(sender, connection, **kwargs):
+    install_query_hook(connection)
+
+
+# Триггеры поиска и представление всей истории операций живут в самой БД;
+# миграции, пересоздающие таблицы, их теряют
+@receiver(post_migrate)
+def restore_database_objects(sender, using, **kwargs):
+    if sender.name == "finance":
+        install_triggers(connections[using])
+        archive.install_view(connections[using])
+        # Шард выдаёт id из своего диапазона: строки переносятся между шардами с прежними id
+        if using in settings.FINANCE_SHARDS:
+            sharding.reserve_id_range(connections[using], settings.FINANCE_SHARDS.index(using))
+
+
+# Новый пользователь сразу получает шард для данных finance. Копии строки
+# пользователя в шардах (sharding.ensure_user_copy) сигналы не вызывают
+@receiver(post_save, sender=User)
+def place_new_user(sender, instance, created, using, **kwargs):
+    if created and using == DEFAULT_DB_ALIAS:
+        sharding.place_user(instance)
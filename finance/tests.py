@@ -1,3 +1,1980 @@
-from django.test import TestCase
+import json
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import skipUnless
+from unittest.mock import Mock, patch
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import CommandError, call_command
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connection, connections
+from django.db.models import Count, Sum
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from fin_tracker.sqlite_backend.base import DatabaseWrapper as SqliteDatabaseWrapper
+
+from . import archive, balances, budgets, deletion, jobs, replicas, rollups, rules, sharding, urls as finance_urls
+from .admin_tools import ApproximateCountPaginator
+from .goals import add_contribution
+from .instrumentation import RequestProfilingMiddleware
+from .management.commands._bench import temporary_replicas, temporary_shards
+from .rollups import month_start
+from .search import match_expression, search_transactions
+from .models import DEFAULT_CATEGORIES, ArchivedTransaction, Budget, BudgetSpend, Category, CategoryRule, DailyBalance, DeletionTask, Goal, GoalContribution, Job, MonthlyRollup, Transaction, UserShard
+from . import services
+from .services import dashboard_summary_qs, expenses_by_category_qs, monthly_balance_qs
+
+
+class FinanceTestCase(TestCase):
+    # id пользователей в тестах повторяются, поэтому кеш аналитики
+    # между тестами очищаем
+    def _pre_setup(self):
+        super()._pre_setup()
+        cache.clear()
+
+
+class MonthlyRollupTests(FinanceTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("alice", password="pass")
+        self.food = Category.objects.create(user=self.user, name="Еда")
+        self.transport = Category.objects.create(user=self.user, name="Транспорт")
+
+    def assertRollupsConsistent(self):
+        self.assertEqual(rollups.verify(DEFAULT_DB_ALIAS), [])
+
+    def test_create_update_delete_keep_rollup_in_sync(self):
+        t = Transaction.objects.create(
+            user=self.user, type="expense", amount=Decimal("100.00"),
+            date=date(2024, 1, 15), category=self.food,
+        )
+        Transaction.objects.create(
+            user=self.user, type="income", amount=Decimal("500.00"), date=date(2024, 1, 20),
+        )
+        self.assertRollupsConsistent()
+
+        # Перенос операции в другой месяц и категорию
+        t.date = date(2024, 2, 3)
+        t.category = self.transport
+        t.amount = Decimal("70.00")
+        t.save()
+        self.assertRollupsConsistent()
+        self.assertFalse(MonthlyRollup.objects.filter(category=self.food).exists())
+
+        t.delete()
+        self.assertRollupsConsistent()
+        self.assertEqual(MonthlyRollup.objects.filter(type="expense").count(), 0)
+
+    def test_category_delete_moves_rollup_to_uncategorized(self):
+        Transaction.objects.create(
+            user=self.user, type="expense", amount=Decimal("10.00"),
+            date=date(2024, 3, 1), category=self.food,
+        )
+        Transaction.objects.create(
+            user=self.user, type="expense", amount=Decimal("5.00"), date=date(2024, 3, 2),
+        )
+        self.food.delete()
+        self.assertRollupsConsistent()
+        self.assertEqual(expenses_by_category_qs(self.user), {"labels": ["Без категории"], "data": [15.0]})
+
+    def test_reports_read_rollup(self):
+        Transaction.objects.create(
+            user=self.user, type="income", amount=Decimal("300.00"), date=date(2024, 5, 10),
+        )
+        Transaction.objects.create(
+            user=self.user, type="expense", amount=Decimal("120.00"),
+            date=date(2024, 5, 31), category=self.food,
+        )
+        self.assertEqual(
+            monthly_balance_qs(self.user, year=2024),
+            {"labels": ["2024-05"], "income": [300.0], "expense": [120.0]},
+        )
+        # Целые месяцы (сводка) и частичный период (исходные операции)
+        whole = dashboard_summary_qs(self.user, date(2024, 5, 1), date(2024, 5, 31))
+        self.assertEqual((whole["income_sum"], whole["expense_sum"]), (Decimal("300.00"), Decimal("120.00")))
+        partial = dashboard_summary_qs(self.user, date(2024, 5, 10), date(2024, 5, 30))
+        self.assertEqual((partial["income_sum"], partial["expense_sum"]), (Decimal("300.00"), 0))
+
+class AnalyticsAggregationTests(FinanceTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("bob", password="pass")
+        food = Category.objects.create(user=self.user, name="Еда")
+        salary = Category.objects.create(user=self.user, name="Зарплата", is_income=True)
+        rows = [
+            ("income", "1000.00", date(2023, 12, 5), salary),
+            ("expense", "250.50", date(2023, 12, 7), food),
+            ("expense", "40.00", date(2024, 1, 2), None),
+            ("expense", "60.00", date(2024, 1, 28), food),
+            ("income", "1000.00", date(2024, 2, 5), salary),
+        ]
+        for tx_type, amount, day, category in rows:
+            Transaction.objects.create(
+                user=self.user, type=tx_type, amount=Decimal(amount), date=day, category=category,
+            )
+
+    def test_rollup_and_raw_aggregations_agree(self):
+        raw = Transaction.objects.filter(user=self.user)
+        self.assertEqual(
+            expenses_by_category_qs(self.user),
+            services.category_totals(raw.filter(type="expense")),
+        )
+        self.assertEqual(
+            expenses_by_category_qs(self.user),
+            {"labels": ["Еда", "Без категории"], "data": [310.5, 40.0]},
+        )
+        self.assertEqual(monthly_balance_qs(self.user), services.monthly_totals(raw))
+        self.assertEqual(
+            monthly_balance_qs(self.user, year=2024),
+            {"labels": ["2024-01", "2024-02"], "income": [0.0, 1000.0], "expense": [100.0, 0.0]},
+        )
+        self.assertEqual(services.available_years_qs(self.user), [2023, 2024])
+        self.assertEqual(services.distinct_years(raw), [2023, 2024])
+
+    def test_empty_user(self):
+        other = User.objects.create_user("empty")
+        self.assertEqual(expenses_by_category_qs(other), {"labels": [], "data": []})
+        self.assertEqual(monthly_balance_qs(other), {"labels": [], "income": [], "expense": []})
+        self.assertEqual(services.available_years_qs(other), [])
+
+
+class DashboardSummaryTests(FinanceTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("carol", password="pass")
+        self.food = Category.objects.create(user=self.user, name="Еда")
+        salary = Category.objects.create(user=self.user, name="Зарплата", is_income=True)
+        for tx_type, amount, day, category in [
+            ("income", "1000.00", date(2024, 3, 1), salary),
+            ("expense", "200.00", date(2024, 3, 10), self.food),
+            ("expense", "50.00", date(2024, 3, 12), None),
+        ]:
+            Transaction.objects.create(
+                user=self.user, type=tx_type, amount=Decimal(amount), date=day, category=category,
+            )
+
+    def test_filters_apply_to_totals_and_chart(self):
+        for date_to in (date(2024, 3, 31), date(2024, 3, 20)):  # сводка и исходные операции
+            summary = dashboard_summary_qs(
+                self.user, date(2024, 3, 1), date_to, category_id=self.food.pk,
+            )
+            self.assertEqual(summary["income_sum"], 0)
+            self.assertEqual(summary["expense_sum"], Decimal("200.00"))
+            self.assertEqual(summary["balance"], Decimal("-200.00"))
+            self.assertEqual(summary["chart_labels"], ["Еда"])
+
+            summary = dashboard_summary_qs(self.user, date(2024, 3, 1), date_to, tx_type="expense")
+            self.assertEqual((summary["income_sum"], summary["expense_sum"]), (0, Decimal("250.00")))
+            self.assertEqual(summary["chart_labels"], ["Еда", "Без категории"])
+            self.assertEqual(summary["chart_data"], [200.0, 50.0])
+
+    def test_single_query(self):
+        with self.assertNumQueries(1):
+            dashboard_summary_qs(self.user, date(2024, 3, 5), date(2024, 3, 20))
+
+    def test_dashboard_view_query_count(self):
+        self.client.force_login(self.user)
+        # сессия, пользователь, последние операции, категории, цели, бюджеты,
+        # суммы; диаграмма загружается отдельным JSON-запросом
+        with self.assertNumQueries(7):
+            response = self.client.get(
+                "/finance/", {"date_from": "2024-03-01", "date_to": "2024-03-31"}
+            )
+        self.assertEqual(response.status_code, 200)
+
+class QueryPlanTests(FinanceTestCase):
+    """
+    Прогоняет все URL приложения и функции services.py и проверяет через
+    EXPLAIN QUERY PLAN, что ни один запрос к таблицам finance не делает
+    полный просмотр таблицы (SCAN).
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user("dave", password="pass")
+        self.food = Category.objects.create(user=self.user, name="Еда")
+        self.tx = Transaction.objects.create(
+            user=self.user, type="expense", amount=Decimal("10.00"),
+            date=date(2024, 6, 3), category=self.food,
+        )
+        self.goal = Goal.objects.create(user=self.user, name="Отпуск", target_amount=Decimal("1000.00"))
+        self.budget = Budget.objects.create(user=self.user, category=self.food, limit=Decimal("12.00"))
+        self.rule = CategoryRule.objects.create(user=self.user, pattern="кофе", category=self.food)
+        self.deletion = DeletionTask.objects.create(kind="category", object_id=self.food.pk, user=self.user, label="Еда")
+        self.job = jobs.enqueue(self.user, "rebuild_analytics")
+        self.client.force_login(self.user)
+
+    def _requests(self):
+        post_data = {
+            "transaction_create": {"type": "expense", "category": self.food.pk, "amount": "5.00",
+                                   "date": "2024-06-04", "description": "кофе"},
+            "transaction_update": {"type": "income", "amount": "7.00", "date": "2024-05-04"},
+            "goal_create": {"name": "Телефон", "target_amount": "500.00", "current_amount": "0"},
+            "goal_update": {"name": "Отпуск", "target_amount": "900.00", "current_amount": "10.00"},
+            "goal_add_amount": {"amount": "15.00"},
+            "budgets_list": {"category": self.food.pk, "period": "week", "limit": "50.00"},
+            "rules_list": {"pattern": "Пекарня", "category": self.food.pk, "priority": "10"},
+            "rules_apply": {},
+        }
+        pk_for = {
+            "transaction": self.tx.pk, "goal": self.goal.pk, "chart": self.goal.pk,
+            "budget": self.budget.pk, "rule": self.rule.pk, "category": self.food.pk,
+            "deletion": self.deletion.pk, "job": self.job.pk,
+        }
+        delete_last = []
+        for pattern in finance_urls.urlpatterns:
+            name = pattern.name
+            if name == "signup":
+                continue
+            kwargs = {}
+            if "<int:pk>" in str(pattern.pattern):
+                kwargs["pk"] = pk_for[name.split("_")[0]]
+            url = reverse(f"finance:{name}", kwargs=kwargs)
+            if name.endswith("_delete"):
+                delete_last.append(url)
+                continue
+            yield "get", url, {"date_from": "2024-06-02", "date_to": "2024-06-20", "type": "expense",
+                               "category": self.food.pk, "year": "2024", "after": "2024-06-10_999"}
+            yield "get", url, {"date_from": "2024-06-01", "date_to": "2024-06-30"}
+            yield "get", url, {"date_from": "2024-06-01", "type": "expense", "q": "еда коф"}
+            if name in ("transactions_list", "transactions_export"):
+                yield "get", url, {"archive": "1", "date_from": "2022-01-01", "type": "expense",
+                                   "category": self.food.pk, "after": "2022-06-10_999"}
+            if name in post_data:
+                yield "post", url, post_data[name]
+        for url in delete_last:
+            yield "post", url, {}
+
+    def _service_calls(self):
+        from . import services
+        raw = Transaction.objects.filter(user=self.user)
+        services.expenses_by_category_qs(self.user)
+        services.monthly_balance_qs(self.user, year=2024)
+        services.available_years_qs(self.user)
+        services.dashboard_summary_qs(self.user, date(2024, 6, 1), date(2024, 6, 30))
+        services.dashboard_summary_qs(self.user, date(2024, 6, 2), date(2024, 6, 9), "expense", self.food.pk)
+        services.category_totals(raw.filter(type="expense"))
+        services.monthly_totals(raw.filter(date__year=2024))
+        services.distinct_years(raw)
+        # Выборка задачи исполнителем очереди
+        jobs.run_next("plan")
+
+    def test_no_full_table_scans(self):
+        with CaptureQueriesContext(connection) as ctx:
+            self._service_calls()
+            for method, url, data in self._requests():
+                response = getattr(self.client, method)(url, data)
+                self.assertIn(response.status_code, (200, 302, 405), url)
+                if response.streaming:
+                    b"".join(response.streaming_content)
+
+        offenders = []
+        with connection.cursor() as cursor:
+            # Представление (история операций) читается как подзапрос; его
+            # части проверяются отдельными строками того же плана
+            cursor.execute("SELECT name FROM sqlite_master WHERE type = 'view'")
+            views = {row[0] for row in cursor.fetchall()}
+            for query in ctx.captured_queries:
+                sql = query["sql"]
+                if not sql.lstrip().upper().startswith(("SELECT", "UPDATE", "DELETE")):
+                    continue
+                cursor.execute("EXPLAIN QUERY PLAN " + sql)
+                for row in cursor.fetchall():
+                    detail = row[-1]
+                    # FTS5 с MATCH ("M" в плане) читает только совпадения, "=" — поиск по rowid
+                    fts_match = re.search(r"VIRTUAL TABLE INDEX \d+:=?M", detail) is not None
+                    if (
+                        detail.startswith("SCAN ") and "finance_" in detail and not fts_match
+                        and detail.split()[1] not in views
+                    ):
+                        offenders.append(f"{detail}\n    {sql}")
+        self.assertEqual(offenders, [], "\n".join(offenders))
+
+
+class TransactionsListTests(FinanceTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("erin", password="pass")
+        self.food = Category.objects.create(user=self.user, name="Еда")
+        # По две операции на день, чтобы курсор проверял и дату, и id
+        for day in range(1, 11):
+            for tx_type in ("income", "expense"):
+                Transaction.objects.create(
+                    user=self.user, type=tx_type, amount=Decimal("1.00"),
+                    date=date(2024, 7, day), category=self.food if tx_type == "expense" else None,
+                )
+        self.client.force_login(self.user)
+
+    def _walk(self, params):
+        url = reverse("finance:transactions_list")
+        seen = []
+        response = self.client.get(url, params)
+        while True:
+            seen.extend(t.pk for t in response.context["transactions"])
+            if not response.context["has_next"]:
+                return seen
+            response = self.client.get(url + response.context["next_url"])
+
+    def test_keyset_pages_cover_all_rows_in_order(self):
+        seen = self._walk({"per_page": 3})
+        expected = list(
+            Transaction.objects.filter(user=self.user).order_by("-date", "-id").values_list("pk", flat=True)
+        )
+        self.assertEqual(seen, expected)
+
+    def test_filters_and_constant_query_count(self):
+        seen = self._walk({"per_page": 4, "type": "expense", "date_from": "2024-07-03"})
+        self.assertEqual(len(seen), 8)
+        # сессия, пользователь, страница операций с категориями, список категорий
+        cursor = Transaction.objects.filter(user=self.user, date=date(2024, 7, 2)).order_by("-id")[0]
+        with self.assertNumQueries(4):
+            response = self.client.get(
+                reverse("finance:transactions_list"), {"per_page": 5, "after": f"2024-07-02_{cursor.pk}"}
+            )
+        self.assertEqual(len(response.context["transactions"]), 3)
+        self.assertFalse(response.context["has_next"])
+
+
+def _current_rss():
+    # Текущий RSS процесса в байтах (Linux)
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+class TransactionsExportTests(FinanceTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("frank", password="pass")
+        self.food = Category.objects.create(user=self.user, name="Еда")
+        self.client.force_login(self.user)
+
+    def test_csv_and_jsonl(self):
+        Transaction.objects.create(
+            user=self.user, type="expense", amount=Decimal("12.30"), date=date(2024, 8, 2),
+            category=self.food, description="обед, кафе",
+        )
+        Transaction.objects.create(
+            user=self.user, type="income", amount=Decimal("100.00"), date=date(2024, 8, 1),
+        )
+        url = reverse("finance:transactions_export")
+
+        response = self.client.get(url, {"format": "csv"})
+        body = b"".join(response.streaming_content).decode()
+        self.assertEqual(
+            body.splitlines(),
+            [
+                "date,type,category,amount,description",
+                '2024-08-02,expense,Еда,12.30,"обед, кафе"',
+                "2024-08-01,income,,100.00,",
+            ],
+        )
+
+        response = self.client.get(url, {"format": "jsonl", "type": "expense"})
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(
+            [json.loads(line) for line in lines],
+            [{"date": "2024-08-02", "type": "expense", "category": "Еда",
+              "amount": "12.30", "description": "обед, кафе"}],
+        )
+        self.assertEqual(self.client.get(url, {"format": "xml"}).status_code, 400)
+
+    @skipUnless(os.path.exists("/proc/self/statm"), "нужен /proc для замера RSS")
+    def test_million_rows_stream_in_constant_memory(self):
+        rows = 1_000_000
+        with connection.cursor() as cursor:
+            cursor.execute(
+                """
+                INSERT INTO finance_transaction (user_id, category_id, type, amount, date, description)
+                WITH RECURSIVE seq(n) AS (SELECT 1 UNION ALL SELECT n + 1 FROM seq WHERE n < %s)
+                SELECT %s, %s, 'expense', (n % 100000) / 100.0 + 1,
+                       date('2024-01-01', '-' || (n % 3650) || ' days'), 'Операция ' || n
+                FROM seq
+                """,
+                [rows, self.user.pk, self.food.pk],
+            )
+
+        response = self.client.get(reverse("finance:transactions_export"), {"format": "csv"})
+        baseline = _current_rss()
+        peak = baseline
+        lines = 0
+        for chunk in response.streaming_content:
+            lines += chunk.count(b"\n")
+            if lines % 50_000 == 0:
+                peak = max(peak, _current_rss())
+
+        self.assertEqual(lines, rows + 1)
+        # Материализация миллиона строк заняла бы сотни мегабайт
+        self.assertLess(peak - baseline, 64 * 1024 * 1024)
+
+
+class TransactionImportTests(FinanceTestCase):
+    STATEMENT = (
+        "date;type;category;amount;description\n"
+        "2024-09-01;income;Зарплата;100 000,00;Аванс\n"
+        "02.09.2024;;еда;-350,50;Кафе\n"
+        "02.09.2024;;еда;-350,50;Кафе\n"
+        "2024-09-03;expense;Такси;120;Поездка\n"
+        "2999-01-01;expense;;10;Из будущего\n"
+        "2024-09-04;expense;;abc;Ошибка суммы\n"
+    ).encode("utf-8")
+
+    def setUp(self):
+        self.user = User.objects.create_user("gina", password="pass")
+        self.food = Category.objects.create(user=self.user, name="Еда")
+        Category.objects.create(user=self.user, name="Зарплата", is_income=True)
+
+    def _import(self, content=None, **kwargs):
+        from .importers import import_transactions
+        return import_transactions(self.user, (content or self.STATEMENT).splitlines(keepends=True), **kwargs)
+
+    def test_import_validates_and_deduplicates(self):
+        result = self._import(batch_size=2)
+        self.assertEqual(result.created, 4)
+        self.assertEqual(result.duplicates, 0)
+        self.assertEqual([line for line, _ in result.errors], [6, 7])
+
+        cafe = Transaction.objects.filter(user=self.user, description="Кафе")
+        self.assertEqual(cafe.count(), 2)  # одинаковые строки одной выписки сохраняются обе
+        self.assertEqual(set(cafe.values_list("category", flat=True)), {self.food.pk})
+        self.assertEqual(cafe[0].type, "expense")
+        self.assertEqual(cafe[0].amount, Decimal("350.50"))
+        self.assertIsNone(Transaction.objects.get(description="Поездка").category)
+        self.assertEqual(rollups.verify(DEFAULT_DB_ALIAS), [])
+
+        again = self._import()
+        self.assertEqual((again.created, again.duplicates), (0, 4))
+        self.assertEqual(Transaction.objects.filter(user=self.user).count(), 4)
+
+    def test_import_commits_each_batch(self):
+        # Сбой на второй пачке не откатывает первую, а повтор дописывает остальное
+        record_bulk = budgets.record_bulk
+        calls = []
+
+        def failing(using, states):
+            calls.append(len(states))
+            if len(calls) == 2:
+                raise OperationalError("database is locked")
+            record_bulk(using, states)
+
+        with patch.object(budgets, "record_bulk", side_effect=failing), self.assertRaises(OperationalError):
+            self._import(batch_size=2)
+        self.assertEqual(Transaction.objects.filter(user=self.user).count(), 2)
+        self.assertEqual(rollups.verify(DEFAULT_DB_ALIAS), [])
+        self.assertEqual(balances.verify(DEFAULT_DB_ALIAS), [])
+
+        result = self._import(batch_size=2)
+        self.assertEqual((result.created, result.duplicates), (2, 2))
+        self.assertEqual(Transaction.objects.filter(user=self.user).count(), 4)
+        self.assertEqual(rollups.verify(DEFAULT_DB_ALIAS), [])
+
+    def _upload(self, content=None):
+        return self.client.post(
+            reverse("finance:transaction_import"),
+            {"file": SimpleUploadedFile("statement.csv", content or self.STATEMENT, content_type="text/csv")},
+        )
+
+    def test_upload_view_imports_in_background(self):
+        media = self.enterContext(tempfile.TemporaryDirectory())
+        self.enterContext(override_settings(MEDIA_ROOT=media))
+        self.client.force_login(self.user)
+        self.assertRedirects(self._upload(), reverse("finance:transaction_import"))
+        # Та же выписка, ещё ждущая импорта, второй задачей не ставится
+        self._upload()
+        job = Job.objects.get(user=self.user)
+        self.assertEqual((job.kind, job.status), ("import_statement", "pending"))
+        self.assertFalse(Transaction.objects.filter(user=self.user).exists())
+        # Выписка лежит файлом, в параметрах задачи — только имя и хеш
+        self.assertEqual(set(job.payload), {"name", "digest"})
+        path = job.upload.path
+        with open(path, "rb") as saved:
+            self.assertEqual(saved.read(), self.STATEMENT)
+        self.assertEqual(len(os.listdir(os.path.dirname(path))), 1)
+
+        out = StringIO()
+        call_command("run_finance_worker", "--burst", "--threads", "1", stdout=out)
+        self.assertIn("Выполнено задач: 1.", out.getvalue())
+        status = self.client.get(reverse("finance:job_status", args=[job.pk])).json()
+        self.assertEqual((status["status"], status["result"]["created"], status["result"]["error_count"]), ("done", 4, 2))
+        self.assertFalse(os.path.exists(path))
+        self.assertEqual(Job.objects.get(pk=job.pk).upload.name, "")
+        self.assertContains(self.client.get(reverse("finance:transaction_import")), "Добавлено операций: <strong>4</strong>")
+
+        response = self._upload("дата;сумма\n".encode("cp1251"))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "Файл должен быть в кодировке UTF-8.")
+
+
+class AnalyticsCacheTests(FinanceTestCase):
+    def setUp(self):
+        from .cache import reset_cache_stats
+        reset_cache_stats()
+        self.user = User.objects.create_user("hank", password="pass")
+        self.food = Category.objects.create(user=self.user, name="Еда")
+
+    def _add_expense(self, amount):
+        # on_commit в TestCase выполняется только внутри captureOnCommitCallbacks
+        with self.captureOnCommitCallbacks(execute=True):
+            return Transaction.objects.create(
+                user=self.user, type="expense", amount=Decimal(amount),
+                date=date(2024, 10, 1), category=self.food,
+            )
+
+    def test_repeat_calls_hit_cache_until_data_changes(self):
+        from .cache import cache_stats
+        tx = self._add_expense("10.00")
+        self.assertEqual(expenses_by_category_qs(self.user)["data"], [10.0])
+        with self.assertNumQueries(0):
+            self.assertEqual(expenses_by_category_qs(self.user)["data"], [10.0])
+
+        self._add_expense("5.00")
+        self.assertEqual(expenses_by_category_qs(self.user)["data"], [15.0])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            tx.delete()
+        self.assertEqual(expenses_by_category_qs(self.user)["data"], [5.0])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.food.delete()
+        self.assertEqual(expenses_by_category_qs(self.user)["labels"], ["Без категории"])
+        self.assertEqual(cache_stats()["hits"], 1)
+        self.assertEqual(cache_stats()["misses"], 4)
+
+        # Пустой результат (чужая или удалённая цель) тоже кешируется
+        self.assertIsNone(services.goal_savings_qs(self.user, 0))
+        with self.assertNumQueries(0):
+            self.assertIsNone(services.goal_savings_qs(self.user, 0))
+        self.assertEqual(cache_stats()["hits"], 2)
+
+    def test_works_with_file_based_cache(self):
+        import tempfile
+        from django.test import override_settings
+        with tempfile.TemporaryDirectory() as location:
+            caches_setting = {
+                "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+                "files": {"BACKEND": "django.core.cache.backends.filebased.FileBasedCache", "LOCATION": location},
+            }
+            with override_settings(CACHES=caches_setting, FINANCE_CACHE_ALIAS="files"):
+                self._add_expense("7.00")
+                first = services.dashboard_summary_qs(self.user, date(2024, 10, 1), date(2024, 10, 31))
+                with self.assertNumQueries(0):
+                    second = services.dashboard_summary_qs(self.user, date(2024, 10, 1), date(2024, 10, 31))
+                self.assertEqual(first, second)
+                self._add_expense("3.00")
+                third = services.dashboard_summary_qs(self.user, date(2024, 10, 1), date(2024, 10, 31))
+                self.assertEqual(third["expense_sum"], Decimal("10.00"))
+
+
+class ChartDataApiTests(FinanceTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("ivan", password="pass")
+        self.food = Category.objects.create(user=self.user, name="Еда")
+        Transaction.objects.create(
+            user=self.user, type="expense", amount=Decimal("42.00"),
+            date=date(2024, 11, 5), category=self.food,
+        )
+        self.client.force_login(self.user)
+
+    def test_chart_payloads(self):
+        response = self.client.get(
+            reverse("finance:chart_dashboard"), {"date_from": "2024-11-01", "date_to": "2024-11-30"}
+        )
+        self.assertEqual(response.json(), {"chart_labels": ["Еда"], "chart_data": [42.0]})
+        response = self.client.get(reverse("finance:chart_expenses_by_category"))
+        self.assertEqual(response.json(), {"labels": ["Еда"], "data": [42.0]})
+        response = self.client.get(reverse("finance:chart_monthly_balance"), {"year": "2024"})
+        self.assertEqual(response.json(), {"labels": ["2024-11"], "income": [0.0], "expense": [42.0]})
+
+    def test_conditional_get_returns_304_until_data_changes(self):
+        url = reverse("finance:chart_expenses_by_category")
+        first = self.client.get(url)
+        etag = first["ETag"]
+        self.assertIn("private", first["Cache-Control"])
+
+        # сессия и пользователь — данные графика не запрашиваются
+        with self.assertNumQueries(2):
+            cached = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(cached.status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Transaction.objects.create(
+                user=self.user, type="expense", amount=Decimal("1.00"),
+                date=date(2024, 11, 6), category=self.food,
+            )
+        changed = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed["ETag"], etag)
+        self.assertEqual(changed.json()["data"], [43.0])
+
+    def test_etag_depends_on_query(self):
+        url = reverse("finance:chart_monthly_balance")
+        self.assertNotEqual(self.client.get(url, {"year": "2023"})["ETag"], self.client.get(url)["ETag"])
+
+
+class AsyncViewsTests(FinanceTestCase):
+    """Дашборд и аналитика — async-представления: проверяем их через ASGI-клиент."""
+
+    def setUp(self):
+        self.user = User.objects.create_user("erin", password="pass")
+        food = Category.objects.create(user=self.user, name="Еда")
+        Transaction.objects.create(
+            user=self.user, type="income", amount=Decimal("300.00"), date=date(2024, 5, 2),
+        )
+        Transaction.objects.create(
+            user=self.user, type="expense", amount=Decimal("120.50"), date=date(2024, 5, 20), category=food,
+        )
+
+    async def test_dashboard_under_asgi(self):
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(
+            "/finance/", {"date_from": "2024-05-01", "date_to": "2024-05-15"}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context["income_sum"], Decimal("300.00"))
+        self.assertEqual(response.context["expense_sum"], Decimal("0.00"))
+        self.assertEqual([c.name for c in response.context["categories"]], ["Еда"])
+        self.assertContains(response, '<p class="display-6">300,00 ₽</p>')
+
+    async def test_analytics_under_asgi(self):
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(reverse("finance:analytics"), {"year": "2024"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context["years"], [2024])
+        self.assertEqual(response.context["balance"], Decimal("179.50"))
+
+    async def test_anonymous_redirected_to_login(self):
+        for url in ("/finance/", reverse("finance:analytics")):
+            response = await self.async_client.get(url)
+            self.assertEqual(response.status_code, 302)
+            self.assertIn("?next=", response["Location"])
+
+    def test_same_urls_under_wsgi(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse("finance:analytics"))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context["income_sum"], Decimal("300.00"))
+        self.assertEqual(response.context["expense_sum"], Decimal("120.50"))
+
+
+class SqliteBackendTests(SimpleTestCase):
+    """Бэкенд fin_tracker.sqlite_backend: init_command и transaction_mode из OPTIONS."""
+
+    def make_connection(self, options):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        settings_dict = {
+            **connection.settings_dict,
+            "NAME": os.path.join(tmp.name, "db.sqlite3"),
+            "OPTIONS": options,
+        }
+        wrapper = SqliteDatabaseWrapper(settings_dict, "sqlite_backend_test")
+        self.addCleanup(wrapper.close)
+        return wrapper
+
+    def test_init_command_pragmas(self):
+        wrapper = self.make_connection(settings.SQLITE_PRODUCTION_OPTIONS)
+        with wrapper.cursor() as cursor:
+            pragmas = {}
+            for name in ("journal_mode", "busy_timeout", "synchronous", "foreign_keys"):
+                cursor.execute(f"PRAGMA {name}")
+                pragmas[name] = cursor.fetchone()[0]
+        self.assertEqual(pragmas, {"journal_mode": "wal", "busy_timeout": 5000, "synchronous": 1, "foreign_keys": 1})
+
+    def test_immediate_transaction_takes_write_lock(self):
+        for mode, locked in (("IMMEDIATE", True), (None, False)):
+            wrapper = self.make_connection({**settings.SQLITE_PRODUCTION_OPTIONS, "transaction_mode": mode})
+            with wrapper.cursor() as cursor:
+                cursor.execute("CREATE TABLE t (x INTEGER)")
+            other = sqlite3.connect(wrapper.settings_dict["NAME"], timeout=0)
+            self.addCleanup(other.close)
+            # Транзакция ещё ничего не записала: при IMMEDIATE блокировка записи
+            # берётся уже на BEGIN, в WAL с DEFERRED писатель не ждёт
+            wrapper._start_transaction_under_autocommit()
+            try:
+                other.execute("INSERT INTO t VALUES (1)")
+                other.commit()
+            except sqlite3.OperationalError as exc:
+                self.assertTrue(locked, exc)
+            else:
+                self.assertFalse(locked)
+            wrapper.cursor().execute("ROLLBACK")
+
+    def test_invalid_transaction_mode(self):
+        wrapper = self.make_connection({"transaction_mode": "LAZY"})
+        with self.assertRaises(ImproperlyConfigured):
+            wrapper.ensure_connection()
+
+
+class SeedingTests(FinanceTestCase):
+    def _snapshot(self, prefix):
+        rows = Transaction.objects.filter(user__username__startswith=prefix).order_by("user__username", "pk")
+        return [
+            (t.user.username[len(prefix):], t.type, t.category.name if t.category else None, t.amount, t.date)
+            for t in rows.select_related("user", "category")
+        ]
+
+    def test_seed_is_deterministic_and_consistent(self):
+        from .seeding import seed_users
+
+        end = date(2024, 12, 31)
+        result = seed_users(3, 200, goals_per_user=2, seed=7, years=2, end_date=end, prefix="a_", batch_size=50)
+        self.assertEqual((result.users, result.transactions, result.goals), (3, 600, 6))
+        seed_users(3, 200, goals_per_user=2, seed=7, years=2, end_date=end, prefix="b_", users_per_chunk=2)
+        self.assertEqual(self._snapshot("a_"), self._snapshot("b_"))
+        seed_users(1, 200, seed=8, years=2, end_date=end, prefix="c_")
+        self.assertNotEqual(self._snapshot("a_")[:200], self._snapshot("c_"))
+
+        user = User.objects.get(username="a_00001")
+        self.assertTrue(user.check_password("finance"))
+        self.assertEqual(
+            sorted(user.categories.values_list("name", "is_income")), sorted(DEFAULT_CATEGORIES)
+        )
+        dates = Transaction.objects.filter(user=user).values_list("date", flat=True)
+        self.assertTrue(all(date(2023, 1, 2) <= d <= end for d in dates))
+        self.assertEqual(rollups.verify(DEFAULT_DB_ALIAS), [])
+        # Журнал взносов сходится с накоплениями каждой цели
+        for goal in Goal.objects.filter(user__username__startswith="a_").annotate(ledger=Sum("contributions__amount")):
+            self.assertEqual(goal.ledger or 0, goal.current_amount)
+
+    def test_bench_compare_flags_regressions(self):
+        from .management.commands.bench_views import compare
+
+        def run(ms, queries, kib):
+            return {"views": {"GET dashboard": {"median_ms": ms, "queries": queries, "peak_kib": kib}}}
+
+        baseline = run(10.0, 6, 100.0)
+        self.assertFalse(compare(baseline, run(11.0, 6, 110.0), threshold=20)[0][-1])
+        self.assertTrue(compare(baseline, run(13.0, 6, 100.0), threshold=20)[0][-1])
+        self.assertTrue(compare(baseline, run(10.0, 7, 100.0), threshold=20)[0][-1])
+        self.assertEqual(compare(baseline, {"views": {"GET analytics": {}}}, threshold=20), [])
+
+
+class RequestProfilingTests(FinanceTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("hank", password="pass")
+        Transaction.objects.create(user=self.user, type="expense", amount=Decimal("5.00"), date=date(2024, 2, 1))
+        self.client.force_login(self.user)
+
+    def _timing(self, response):
+        phases = {}
+        for part in response["Server-Timing"].split(", "):
+            name, *params = part.split(";")
+            phases[name] = dict(p.split("=", 1) for p in params)
+        return phases
+
+    def test_server_timing_counts_queries_and_templates(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse("finance:transactions_list"))
+        timing = self._timing(response)
+        self.assertEqual(set(timing), {"db", "template", "total"})
+        self.assertEqual(timing["db"]["desc"], f'"{len(ctx.captured_queries)} queries"')
+        self.assertGreater(float(timing["template"]["dur"]), 0)
+        self.assertGreaterEqual(float(timing["total"]["dur"]), float(timing["db"]["dur"]))
+
+    async def test_async_view_queries_are_counted(self):
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get("/finance/")
+        # сессия, пользователь и пять запросов дашборда из потоков async ORM
+        self.assertEqual(self._timing(response)["db"]["desc"], '"7 queries"')
+
+    @override_settings(FINANCE_REPEATED_QUERY_THRESHOLD=3)
+    def test_repeated_queries_logged(self):
+        def n_plus_one_view(request):
+            for category_id in (1, 2, 3):
+                list(Category.objects.filter(pk=category_id))
+            return HttpResponse("ok")
+
+        middleware = RequestProfilingMiddleware(n_plus_one_view)
+        with self.assertLogs("finance.slow_requests", "WARNING") as logs:
+            middleware(RequestFactory().get("/finance/goals/"))
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record["reasons"], ["repeated_queries"])
+        self.assertEqual(record["path"], "/finance/goals/")
+        self.assertEqual((record["repeated"][0]["count"], record["repeated"][0]["identical"]), (3, 1))
+
+    def test_slow_requests_logged_only_above_threshold(self):
+        with self.assertNoLogs("finance.slow_requests"):
+            self.client.get(reverse("finance:goals_list"))
+        with override_settings(FINANCE_SLOW_REQUEST_MS=0), self.assertLogs("finance.slow_requests") as logs:
+            self.client.get(reverse("finance:goals_list"))
+        record = logs.records[0].profile
+        self.assertEqual(record["reasons"], ["slow"])
+        self.assertEqual((record["status"], record["user_id"]), (200, self.user.pk))
+
+
+class GoalContributionTests(FinanceTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("ivan", password="pass")
+        self.goal = Goal.objects.create(user=self.user, name="Отпуск", target_amount=Decimal("100.00"))
+        self.client.force_login(self.user)
+
+    def _ledger(self):
+        return GoalContribution.objects.filter(goal=self.goal).aggregate(total=Sum("amount"))["total"] or 0
+
+    def test_add_amount_updates_ledger_and_detects_completion(self):
+        url = reverse("finance:goal_add_amount", args=[self.goal.pk])
+        self.client.post(url, {"amount": "60.00"})
+        response = self.client.post(url, {"amount": "40.00"}, follow=True)
+        self.assertContains(response, "Ваша цель достигнута")
+        self.goal.refresh_from_db()
+        self.assertEqual(self.goal.current_amount, Decimal("100.00"))
+        self.assertEqual(self._ledger(), self.goal.current_amount)
+
+        # Достигнутую цель больше не пополняем, чужую — 404
+        self.client.post(url, {"amount": "5.00"})
+        self.assertEqual(GoalContribution.objects.filter(goal=self.goal).count(), 2)
+        other = User.objects.create_user("olga", password="pass")
+        self.client.force_login(other)
+        self.assertEqual(self.client.post(url, {"amount": "5.00"}).status_code, 404)
+
+    def test_add_contribution_writes_only_current_amount(self):
+        with CaptureQueriesContext(connection) as ctx:
+            result = add_contribution(self.user, self.goal.pk, Decimal("10.00"))
+        self.assertFalse(result.completed)
+        update = next(q["sql"] for q in ctx.captured_queries if q["sql"].startswith("UPDATE"))
+        assignments = update.split(" SET ")[1].split(" WHERE ")[0]
+        self.assertTrue(assignments.startswith('"current_amount" = '))
+        self.assertIn('"finance_goal"."current_amount" + ', assignments)
+        self.assertNotIn('"name"', assignments)
+
+    def test_form_edits_are_recorded_as_corrections(self):
+        self.client.post(
+            reverse("finance:goal_update", args=[self.goal.pk]),
+            {"name": "Отпуск", "target_amount": "100.00", "current_amount": "30.00"},
+        )
+        self.client.post(
+            reverse("finance:goal_update", args=[self.goal.pk]),
+            {"name": "Отпуск", "target_amount": "100.00", "current_amount": "25.00"},
+        )
+        amounts = list(GoalContribution.objects.filter(goal=self.goal).values_list("amount", flat=True))
+        self.assertEqual(amounts, [Decimal("30.00"), Decimal("-5.00")])
+
+        contribution = GoalContribution.objects.filter(goal=self.goal).first()
+        contribution.amount = Decimal("1.00")
+        with self.assertRaises(ValueError):
+            contribution.save()
+
+    def test_form_edit_keeps_deposit_made_while_form_was_open(self):
+        url = reverse("finance:goal_update", args=[self.goal.pk])
+        self.assertContains(self.client.get(url), 'name="initial-current_amount"')
+        # Пока форма открыта, приходит взнос; пользователь правит сумму с 0 до 30
+        add_contribution(self.user, self.goal.pk, Decimal("20.00"))
+        self.client.post(
+            url,
+            {"name": "Отпуск", "target_amount": "100.00", "current_amount": "30.00", "initial-current_amount": "0.00"},
+        )
+        self.goal.refresh_from_db()
+        self.assertEqual(self.goal.current_amount, Decimal("50.00"))
+        self.assertEqual(self._ledger(), self.goal.current_amount)
+
+    def test_invalid_add_amount_shows_error(self):
+        url = reverse("finance:goal_add_amount", args=[self.goal.pk])
+        response = self.client.post(url, {"amount": "-5"}, follow=True)
+        self.assertContains(response, "Взнос не добавлен")
+        self.assertFalse(GoalContribution.objects.filter(goal=self.goal).exists())
+
+    def test_savings_chart(self):
+        add_contribution(self.user, self.goal.pk, Decimal("20.00"))
+        add_contribution(self.user, self.goal.pk, Decimal("5.00"))
+        data = self.client.get(reverse("finance:chart_goal_savings", args=[self.goal.pk])).json()
+        self.assertEqual(data["labels"], [date.today().strftime("%Y-%m")])
+        self.assertEqual((data["contributed"], data["saved"], data["target"]), ([25.0], [25.0], 100.0))
+        self.assertEqual(data["monthly_rate"], 25.0)
+        # Осталось 75 при 25 в месяц — через три месяца
+        months = date.today().year * 12 + date.today().month - 1 + 3
+        self.assertEqual(data["projected_completion"], f"{months // 12:04d}-{months % 12 + 1:02d}")
+
+        missing = reverse("finance:chart_goal_savings", args=[self.goal.pk + 100])
+        self.assertEqual(self.client.get(missing).status_code, 404)
+
+
+class GoalContributionConcurrencyTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user("jane", password="pass")
+        self.goal = Goal.objects.create(user=self.user, name="Квартира", target_amount=Decimal("1000000.00"))
+
+    def test_parallel_deposits_are_not_lost(self):
+        threads, deposits, amount = 8, 25, Decimal("1.01")
+        barrier = threading.Barrier(threads)
+        errors = []
+
+        def deposit():
+            try:
+                barrier.wait()
+                for _ in range(deposits):
+                    while True:
+                        try:
+                            add_contribution(self.user, self.goal.pk, amount)
+                            break
+                        except OperationalError as exc:
+                            # Тестовая БД — общая in-memory SQLite: конкурирующая
+                            # запись получает SQLITE_LOCKED сразу, без busy_timeout
+                            if "locked" not in str(exc):
+                                raise
+                            time.sleep(0.001)
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                connections.close_all()
+
+        workers = [threading.Thread(target=deposit) for _ in range(threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        self.assertEqual(errors, [])
+        self.goal.refresh_from_db()
+        self.assertEqual(self.goal.current_amount, amount * threads * deposits)
+        self.assertEqual(GoalContribution.objects.filter(goal=self.goal).count(), threads * deposits)
+        self.assertEqual(
+            GoalContribution.objects.filter(goal=self.goal).aggregate(total=Sum("amount"))["total"],
+            self.goal.current_amount,
+        )
+
+
+class TransactionSearchTests(FinanceTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("kate", password="pass")
+        self.food = Category.objects.create(user=self.user, name="Еда")
+        self.taxi = self._tx("Такси до аэропорта", date(2024, 3, 1))
+        self.cafe = self._tx("Кафе «Ёлка»", date(2024, 3, 2), self.food)
+        self.groceries = self._tx("Продукты", date(2024, 3, 3), self.food)
+        other = User.objects.create_user("leo", password="pass")
+        Transaction.objects.create(user=other, type="expense", amount=1, date=date(2024, 3, 1), description="Такси")
+        self.client.force_login(self.user)
+
+    def _tx(self, description, day, category=None):
+        return Transaction.objects.create(
+            user=self.user, type="expense", amount=Decimal("10.00"), date=day,
+            description=description, category=category,
+        )
+
+    def _search(self, text, **filters):
+        qs = services.filtered_transactions_qs(self.user, **filters)
+        return list(search_transactions(qs, text, self.user.pk).values_list("description", flat=True))
+
+    def test_prefix_case_and_user_isolation(self):
+        self.assertEqual(self._search("такс"), ["Такси до аэропорта"])
+        self.assertEqual(self._search("ЕЛКА"), ["Кафе «Ёлка»"])
+        self.assertEqual(self._search("такси аэро"), ["Такси до аэропорта"])
+        self.assertEqual(self._search("такси вокзал"), [])
+        # Описание весит больше категории; фильтры дашборда применяются поверх
+        self._tx("Еда навынос", date(2024, 3, 4))
+        self.assertEqual(self._search("еда")[0], "Еда навынос")
+        self.assertEqual(self._search("еда", date_from=date(2024, 3, 3)), ["Еда навынос", "Продукты"])
+        self.assertEqual(self._search('") OR owner:u* NEAR('), [])
+        self.assertIsNone(match_expression("«»  !"))
+
+    def test_index_follows_changes(self):
+        self.taxi.description = "Метро"
+        self.taxi.save()
+        self.assertEqual(self._search("такси"), [])
+        self.assertEqual(self._search("метро"), ["Метро"])
+
+        self.food.name = "Питание"
+        self.food.save()
+        self.assertEqual(self._search("питан"), ["Продукты", "Кафе «Ёлка»"])
+        self.food.delete()
+        self.assertEqual(self._search("питан"), [])
+
+        Transaction.objects.bulk_create(
+            [Transaction(user=self.user, type="expense", amount=1, date=date(2024, 3, 5), description="Бензин")]
+        )
+        self.assertEqual(self._search("бенз"), ["Бензин"])
+        self.groceries.delete()
+        self.assertEqual(self._search("продукт"), [])
+
+    def test_list_export_and_admin(self):
+        response = self.client.get(reverse("finance:transactions_list"), {"q": "кафе", "type": "expense"})
+        self.assertEqual([t.pk for t in response.context["transactions"]], [self.cafe.pk])
+
+        response = self.client.get(reverse("finance:transactions_list"), {"q": "е", "per_page": 1})
+        self.assertTrue(response.context["has_next"])
+        self.assertIn("page=1", response.context["next_url"])
+
+        response = self.client.get(reverse("finance:transactions_export"), {"q": "такси", "format": "jsonl"})
+        rows = [json.loads(line) for line in b"".join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([row["description"] for row in rows], ["Такси до аэропорта"])
+
+        admin = User.objects.create_superuser("root", password="pass")
+        self.client.force_login(admin)
+        response = self.client.get(reverse("admin:finance_transaction_changelist"), {"q": "такси"})
+        self.assertEqual(response.context["cl"].result_count, 2)
+        response = self.client.get(reverse("admin:finance_transaction_changelist"), {"q": "leo"})
+        self.assertEqual(response.context["cl"].result_count, 1)
+
+
+class AdminLargeTableTests(FinanceTestCase):
+    def setUp(self):
+        self.users = [User.objects.create_user(f"user{i}", password="pass") for i in range(3)]
+        for user in self.users:
+            food = Category.objects.create(user=user, name="Еда")
+            Transaction.objects.bulk_create(
+                [
+                    Transaction(user=user, type="expense", amount=1, date=date(2024, 3, 1), category=food)
+                    for _ in range(5)
+                ]
+            )
+        self.admin = User.objects.create_superuser("root", password="pass")
+        self.client.force_login(self.admin)
+
+    def _changelist_queries(self, params=None):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse("admin:finance_transaction_changelist"), params or {})
+        self.assertEqual(response.status_code, 200)
+        return response, len(ctx.captured_queries)
+
+    def test_changelist_queries_do_not_grow_with_rows(self):
+        response, queries = self._changelist_queries()
+        self.assertEqual(response.context["cl"].result_count, 15)
+        # Фильтры не загружают пользователей и категории целиком
+        self.assertNotContains(response, "user2</option>")
+        for user in self.users:
+            Transaction.objects.create(user=user, type="expense", amount=1, date=date(2024, 3, 2))
+        _, more = self._changelist_queries()
+        self.assertEqual(queries, more)
+
+        user = self.users[1]
+        response, _ = self._changelist_queries({"user__id__exact": user.pk})
+        self.assertEqual(response.context["cl"].result_count, 6)
+        # Выбранный пользователь — единственный вариант в поле фильтра
+        self.assertContains(response, f'<option value="{user.pk}" selected>user1</option>', html=True)
+
+    def test_change_form_uses_autocomplete(self):
+        tx = Transaction.objects.filter(user=self.users[0]).first()
+        response = self.client.get(reverse("admin:finance_transaction_change", args=[tx.pk]))
+        self.assertContains(response, "admin-autocomplete")
+        self.assertNotContains(response, "user2</option>")
+
+    def test_approximate_paginator(self):
+        qs = Transaction.objects.order_by("-id")
+        with patch.object(ApproximateCountPaginator, "count_limit", 4):
+            # Без фильтров — оценка по таблице, с фильтром — не больше count_limit
+            self.assertGreaterEqual(ApproximateCountPaginator(qs, 2).count, 15)
+            self.assertEqual(ApproximateCountPaginator(qs.filter(user=self.users[0]), 2).count, 4)
+            self.assertEqual(ApproximateCountPaginator(qs.filter(user=self.users[0]), 2).num_pages, 2)
+        self.assertEqual(ApproximateCountPaginator(qs.filter(user=self.users[0]), 2).count, 5)
+
+
+class CashFlowTests(FinanceTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("dan", password="pass")
+        rows = [
+            ("income", "1000.00", date(2023, 12, 5)),
+            ("expense", "250.50", date(2023, 12, 7)),
+            ("expense", "40.00", date(2024, 1, 2)),
+            ("expense", "60.00", date(2024, 1, 2)),
+            ("income", "500.00", date(2024, 1, 10)),
+            ("expense", "9.50", date(2024, 2, 29)),
+        ]
+        for tx_type, amount, day in rows:
+            Transaction.objects.create(user=self.user, type=tx_type, amount=Decimal(amount), date=day)
+        self.client.force_login(self.user)
+
+    def test_daily_series_fills_gaps_and_starts_from_opening_balance(self):
+        # первая операция, итог на день перед периодом, ряд
+        with self.assertNumQueries(3):
+            flow = services.cash_flow_qs(self.user, date(2024, 1, 1), date(2024, 1, 10))
+        self.assertEqual(flow["opening_balance"], 749.5)
+        self.assertEqual(flow["labels"][:3], ["2024-01-01", "2024-01-02", "2024-01-03"])
+        self.assertEqual(flow["net"], [0.0, -100.0] + [0.0] * 7 + [500.0])
+        self.assertEqual(flow["balance"], [749.5] + [649.5] * 8 + [1149.5])
+
+    def test_periods_agree(self):
+        # Месяцы — по сводке, недели и дни — по операциям; итог один и тот же
+        daily = services.cash_flow_qs(self.user, date(2023, 1, 1), date(2024, 3, 31), "day")
+        weekly = services.cash_flow_qs(self.user, date(2023, 1, 1), date(2024, 3, 31), "week")
+        monthly = services.cash_flow_qs(self.user, date(2023, 1, 1), date(2024, 3, 31), "month")
+        self.assertEqual(monthly["labels"], ["2023-12", "2024-01", "2024-02", "2024-03"])
+        self.assertEqual(monthly["net"], [749.5, 400.0, -9.5, 0.0])
+        self.assertEqual(weekly["labels"][0], "2023-12-04")
+        for flow in (daily, weekly, monthly):
+            self.assertEqual(flow["opening_balance"], 0.0)
+            self.assertEqual(flow["balance"][-1], 1140.0)
+            self.assertAlmostEqual(sum(flow["net"]), 1140.0)
+
+    def test_downsampling_keeps_totals(self):
+        full = services.cash_flow_qs(self.user, date(2023, 12, 1), date(2024, 2, 29))
+        flow = services.cash_flow_qs(self.user, date(2023, 12, 1), date(2024, 2, 29), max_points=10)
+        self.assertEqual(len(full["labels"]), 87)
+        self.assertEqual(flow["bucket"], 9)
+        self.assertEqual(len(flow["labels"]), 10)
+        self.assertEqual(flow["labels"], full["labels"][::9])
+        self.assertEqual(flow["balance"][-1], full["balance"][-1])
+        self.assertAlmostEqual(sum(flow["net"]), sum(full["net"]))
+
+    def test_chart_endpoint(self):
+        response = self.client.get(
+            reverse("finance:chart_cash_flow"),
+            {"date_from": "2024-01-01", "date_to": "2024-03-31", "period": "month", "points": "2"},
+        )
+        self.assertEqual(response.json()["labels"], ["2024-01", "2024-03"])
+        self.assertEqual(response.json()["balance"], [1140.0, 1140.0])
+        empty = User.objects.create_user("empty", password="pass")
+        self.client.force_login(empty)
+        response = self.client.get(reverse("finance:chart_cash_flow"), {"period": "bogus"})
+        self.assertEqual(response.json()["labels"], [])
+        self.assertEqual(response.json()["period"], "day")
+
+    def test_extreme_date_range(self):
+        # Конец периода в далёком будущем обрезается сегодняшним днём
+        for period, date_to in (("month", "9999-12-31"), ("day", "2600-12-31")):
+            response = self.client.get(
+                reverse("finance:chart_cash_flow"), {"date_from": "2024-01-01", "date_to": date_to, "period": period}
+            )
+            self.assertEqual(response.status_code, 200)
+            self.assertLessEqual(len(response.json()["labels"]), services.CASH_FLOW_MAX_POINTS)
+        self.assertEqual(response.json()["balance"][-1], 1140.0)
+        with self.assertRaises(ValueError):
+            services.cash_flow_qs(self.user, date(2024, 1, 1), date(2600, 12, 31))
+        # Слишком длинная история по дням — отказ, а не сотни тысяч точек
+        Transaction.objects.create(user=self.user, type="income", amount=Decimal("1.00"), date=date(1900, 1, 1))
+        response = self.client.get(reverse("finance:chart_cash_flow"), {"date_from": "1900-01-01", "period": "day"})
+        self.assertEqual(response.status_code, 400)
+
+
+class BudgetTests(FinanceTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("erin", password="pass")
+        self.food = Category.objects.create(user=self.user, name="Еда")
+        self.taxi = Category.objects.create(user=self.user, name="Такси")
+        self.today = date.today()
+        self.month = self.today.replace(day=1)
+        # Расход до появления бюджета тоже учитывается в текущем периоде
+        self._tx("300.00")
+        self.budget = Budget.objects.create(user=self.user, category=self.food, limit=Decimal("1000.00"))
+        self.client.force_login(self.user)
+
+    def _tx(self, amount, day=None, category=None, tx_type="expense"):
+        return Transaction.objects.create(
+            user=self.user, type=tx_type, amount=Decimal(amount),
+            date=day or self.today, category=category or self.food,
+        )
+
+    def _spend(self, start=None):
+        return BudgetSpend.objects.get(budget=self.budget, period_start=start or self.month)
+
+    def test_counter_follows_transaction_changes(self):
+        self.assertEqual(self._spend().spent, Decimal("300.00"))
+        tx = self._tx("200.00")
+        self._tx("50.00", category=self.taxi)
+        self._tx("70.00", tx_type="income")
+        self.assertEqual(self._spend().spent, Decimal("500.00"))
+
+        tx.amount = Decimal("150.00")
+        tx.save()
+        self.assertEqual(self._spend().spent, Decimal("450.00"))
+        # Перенос в прошлый месяц и в другую категорию
+        previous = (self.month - timedelta(days=1)).replace(day=1)
+        tx.date = previous
+        tx.save()
+        self.assertEqual(self._spend().spent, Decimal("300.00"))
+        self.assertEqual(self._spend(previous).spent, Decimal("150.00"))
+        tx.category = self.taxi
+        tx.save()
+        self.assertEqual(self._spend(previous).spent, Decimal("0.00"))
+        tx.delete()
+        self.assertEqual(budgets.verify(DEFAULT_DB_ALIAS), [])
+
+    def test_threshold_alert_is_set_by_the_same_update(self):
+        tx = self._tx("500.00")
+        spend = self._spend()
+        self.assertEqual((spend.spent, spend.alert_level), (Decimal("800.00"), 80))
+        crossed_at = spend.alerted_at
+        self.assertIsNotNone(crossed_at)
+        # Повторный проход того же порога время не меняет
+        with CaptureQueriesContext(connection) as ctx:
+            self._tx("10.00")
+        updates = [q["sql"] for q in ctx.captured_queries if q["sql"].startswith('UPDATE "finance_budgetspend"')]
+        self.assertEqual(len(updates), 1)
+        self.assertIn('"alert_level" = CASE', updates[0])
+        self.assertEqual(self._spend().alerted_at, crossed_at)
+
+        self._tx("190.00")
+        self.assertEqual(self._spend().alert_level, 100)
+        tx.delete()
+        self.assertEqual(self._spend().alert_level, 0)
+        # Изменение лимита пересчитывает порог
+        self.budget.limit = Decimal("500.00")
+        self.budget.save()
+        self.assertEqual(self._spend().alert_level, 100)
+
+    def test_create_view_warns_and_dashboard_shows_bars(self):
+        response = self.client.post(
+            reverse("finance:transaction_create"),
+            {"type": "expense", "category": self.food.pk, "amount": "600.00",
+             "date": self.today.isoformat(), "description": "Продукты"},
+            follow=True,
+        )
+        self.assertContains(response, "израсходован на 80%")
+        with self.assertNumQueries(7):
+            response = self.client.get(reverse("finance:dashboard"))
+        self.assertContains(response, "900,00 / 1000,00 ₽ за месяц")
+        self.assertContains(response, "bg-warning")
+
+        response = self.client.post(
+            reverse("finance:budgets_list"), {"category": self.food.pk, "period": "month", "limit": "800.00"}
+        )
+        self.assertEqual(Budget.objects.get(pk=self.budget.pk).limit, Decimal("800.00"))
+        self.assertEqual(self._spend().alert_level, 100)
+
+    def test_bulk_import_and_reconcile(self):
+        week = Budget.objects.create(user=self.user, category=self.food, period="week", limit=Decimal("100.00"))
+        from .importers import import_transactions
+        import_transactions(self.user, [
+            "date;type;category;amount;description\n", f"{self.today};expense;Еда;40.00;Обед\n",
+        ])
+        self.assertEqual(self._spend().spent, Decimal("340.00"))
+        self.assertEqual(budgets.verify(DEFAULT_DB_ALIAS), [])
+
+        # Счётчики расходятся с операциями, если их обойти (массовый UPDATE)
+        Transaction.objects.filter(user=self.user).update(amount=Decimal("1.00"))
+        mismatches = budgets.verify(DEFAULT_DB_ALIAS, [self.user.pk])
+        self.assertEqual({key[0] for key, _, _ in mismatches}, {self.budget.pk, week.pk})
+        self.assertEqual(budgets.reconcile(DEFAULT_DB_ALIAS), 2)
+        self.assertEqual(budgets.verify(DEFAULT_DB_ALIAS), [])
+        self.assertEqual(self._spend().spent, Decimal("2.00"))
+
+
+class DailyBalanceTests(FinanceTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("fred", password="pass")
+        self.other = User.objects.create_user("gleb", password="pass")
+        self.food = Category.objects.create(user=self.user, name="Еда")
+
+    def _tx(self, amount, day, tx_type="expense", user=None):
+        return Transaction.objects.create(
+            user=user or self.user, type=tx_type, amount=Decimal(amount), date=day, category=self.food
+        )
+
+    def assertTotals(self, date_from, date_to):
+        # Суммы по итогам на день совпадают с SUM по операциям периода
+        qs = Transaction.objects.filter(user=self.user)
+        if date_from is not None:
+            qs = qs.filter(date__gte=date_from)
+        if date_to is not None:
+            qs = qs.filter(date__lte=date_to)
+        expected = services._totals_context(*services.income_expense_totals(qs))
+        self.assertEqual(
+            balances.range_totals(self.user.pk, date_from, date_to),
+            (expected["income_sum"], expected["expense_sum"]),
+        )
+
+    def test_writes_shift_later_days(self):
+        self._tx("1000.00", date(2024, 3, 1), "income")
+        self._tx("100.00", date(2024, 3, 10))
+        self._tx("7.00", date(2024, 3, 10), user=self.other)
+        late = self._tx("50.00", date(2024, 3, 20))
+        # Операция задним числом сдвигает итоги всех следующих дней
+        early = self._tx("25.50", date(2024, 2, 15))
+        self.assertEqual(balances.cumulative(self.user.pk, date(2024, 3, 20)), (100000, 17550))
+        self.assertEqual(balances.cumulative(self.user.pk, date(2024, 3, 19)), (100000, 12550))
+        self.assertEqual(balances.cumulative(self.user.pk, date(2024, 2, 14)), (0, 0))
+
+        late.amount = Decimal("60.00")
+        late.save()
+        early.date, early.type = date(2024, 3, 15), "income"
+        early.save()
+        late.delete()
+        self.assertEqual(balances.verify(DEFAULT_DB_ALIAS), [])
+        for date_from, date_to in [
+            (date(2024, 3, 1), date(2024, 3, 31)), (date(2024, 3, 2), date(2024, 3, 15)),
+            (date(2024, 3, 16), date(2024, 3, 20)), (None, date(2024, 3, 10)), (date(2024, 3, 11), None),
+            (date(2023, 1, 1), date(2023, 12, 31)), (None, None),
+        ]:
+            with self.subTest(date_from=date_from, date_to=date_to):
+                self.assertTotals(date_from, date_to)
+
+    def test_range_totals_is_one_query(self):
+        self._tx("10.00", date(2024, 1, 5))
+        with self.assertNumQueries(1):
+            totals = balances.range_totals(self.user.pk, date(2024, 1, 1), date(2024, 1, 31))
+        self.assertEqual(totals, (Decimal("0.00"), Decimal("10.00")))
+
+    def test_dashboard_totals_come_from_daily_balances(self):
+        self._tx("1000.00", date(2024, 3, 1), "income")
+        self._tx("100.00", date(2024, 3, 10))
+        self._tx("40.00", date(2024, 3, 12))
+        self.client.force_login(self.user)
+        response = self.client.get("/finance/", {"date_from": "2024-03-05", "date_to": "2024-03-11", "type": "expense"})
+        self.assertEqual(
+            (response.context["income_sum"], response.context["expense_sum"], response.context["balance"]),
+            (Decimal("0.00"), Decimal("100.00"), Decimal("-100.00")),
+        )
+
+    def test_bulk_import_and_rebuild_command(self):
+        from .importers import import_transactions
+        self._tx("5.00", date(2024, 5, 1))
+        import_transactions(self.user, [
+            "date;type;category;amount;description\n",
+            "2024-04-02;expense;Еда;10,00;Обед\n",
+            "2024-05-20;expense;Еда;20,00;Ужин\n",
+            "2024-05-20;income;;300,00;Возврат\n",
+        ])
+        self.assertEqual(balances.verify(DEFAULT_DB_ALIAS), [])
+        self.assertTotals(date(2024, 4, 1), date(2024, 5, 19))
+
+        DailyBalance.objects.filter(user=self.user).update(expense=0)
+        with self.assertRaises(CommandError):
+            call_command("rebuild_balances", "--verify", stdout=StringIO())
+        call_command("rebuild_balances", "--user", str(self.user.pk), stdout=StringIO())
+        call_command("rebuild_balances", "--verify", stdout=StringIO())
+        self.assertTotals(None, None)
+
+
+class CategoryRuleTests(FinanceTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("gena", password="pass")
+        self.food = Category.objects.create(user=self.user, name="Еда")
+        self.coffee = Category.objects.create(user=self.user, name="Кофе")
+        self.taxi = Category.objects.create(user=self.user, name="Такси")
+        self.salary = Category.objects.create(user=self.user, name="Зарплата", is_income=True)
+        self.client.force_login(self.user)
+
+    def _rule(self, pattern, category, priority=100):
+        with self.captureOnCommitCallbacks(execute=True):
+            return CategoryRule.objects.create(user=self.user, pattern=pattern, category=category, priority=priority)
+
+    def _tx(self, description, day=None, category=None, tx_type="expense", amount="10.00"):
+        return Transaction.objects.create(
+            user=self.user, type=tx_type, amount=Decimal(amount), date=day or date(2024, 3, 1),
+            category=category, description=description,
+        )
+
+    def test_matcher_semantics(self):
+        matcher = rules.RuleMatcher([("кофе с собой", 3), ("кофе", 1), ("офе", 2), ("c++ (курс)", 4)])
+        # Самое важное из совпавших правил, в том числе перекрывающихся и вложенных
+        self.assertEqual(matcher.match("кофе с собой"), 3)
+        self.assertEqual(matcher.match("кофе"), 1)
+        self.assertEqual(matcher.match("тофее"), 2)
+        self.assertEqual(matcher.match("оплата c++ (курс)"), 4)
+        self.assertIsNone(matcher.match("чай"))
+        self.assertIsNone(rules.RuleMatcher([]).match("кофе"))
+
+        user_rules = rules.UserRules([("Ёлка", 1, False), ("аванс", 2, True)])
+        self.assertEqual(user_rules.category_for("ЕЛКА на Новый год", "expense"), 1)
+        # Правило доходной категории не подходит расходу
+        self.assertIsNone(user_rules.category_for("Аванс за март", "expense"))
+        self.assertEqual(user_rules.category_for("Аванс за март", "income"), 2)
+
+    def test_rules_applied_on_create_and_import(self):
+        from .importers import import_transactions
+        self._rule("кофе", self.coffee)
+        self._rule("такси", self.taxi)
+        self._rule("кофейня", self.food, priority=10)
+        self.client.post(reverse("finance:transaction_create"), {
+            "type": "expense", "amount": "250.00", "date": "2024-03-01", "description": "Такси до дома",
+        })
+        self.client.post(reverse("finance:transaction_create"), {
+            "type": "expense", "amount": "150.00", "date": "2024-03-01", "description": "Такси",
+            "category": self.food.pk,
+        })
+        import_transactions(self.user, [
+            "date;type;category;amount;description\n",
+            "2024-03-02;expense;;200,00;Кофейня у дома\n",
+            "2024-03-02;expense;;100,00;КОФЕ\n",
+            "2024-03-02;expense;Такси;50,00;Кофе в дорогу\n",
+            "2024-03-02;expense;;70,00;Хлеб\n",
+        ])
+        self.assertEqual(
+            list(Transaction.objects.filter(user=self.user).order_by("id").values_list("category__name", flat=True)),
+            ["Такси", "Еда", "Еда", "Кофе", "Такси", None],
+        )
+
+    def test_matcher_cache_follows_rule_changes(self):
+        self._rule("такси", self.taxi)
+        first = rules.rules_for(self.user)
+        with self.assertNumQueries(0):
+            self.assertIs(rules.rules_for(self.user), first)
+        rule = self._rule("кофе", self.coffee)
+        second = rules.rules_for(self.user)
+        self.assertIsNot(second, first)
+        self.assertEqual(second.category_for("кофе", "expense"), self.coffee.pk)
+
+        # Удаление категории каскадом удаляет её правила
+        with self.captureOnCommitCallbacks(execute=True):
+            self.coffee.delete()
+        self.assertFalse(CategoryRule.objects.filter(pk=rule.pk).exists())
+        self.assertIsNone(rules.rules_for(self.user).category_for("кофе", "expense"))
+
+    def test_recategorize_history_in_batches(self):
+        day = date(2024, 3, 1)
+        kept = self._tx("Кофе", day, category=self.food)
+        for i in range(5):
+            self._tx(f"Такси {i}", day + timedelta(days=i // 2), amount="100.00")
+            self._tx(f"Кофе {i}", day + timedelta(days=40 * (i % 2)))
+        self._tx("Аванс", day, tx_type="income", amount="5000.00")
+        self._tx("Хлеб", day)
+        self._rule("такси", self.taxi)
+        self._rule("кофе", self.coffee)
+        self._rule("аванс", self.salary)
+        with self.captureOnCommitCallbacks(execute=True):
+            changed = rules.recategorize(self.user, batch_size=2)
+        self.assertEqual(changed, 11)
+        counts = dict(
+            Transaction.objects.filter(user=self.user).values_list("category__name").annotate(n=Count("id"))
+        )
+        self.assertEqual(counts, {"Такси": 5, "Кофе": 5, "Еда": 1, "Зарплата": 1, None: 1})
+        kept.refresh_from_db()
+        self.assertEqual(kept.category, self.food)
+        self.assertEqual(rollups.verify(DEFAULT_DB_ALIAS), [])
+        self.assertEqual(budgets.verify(DEFAULT_DB_ALIAS), [])
+
+        call_command("apply_category_rules", "--overwrite", "--user", str(self.user.pk), stdout=StringIO())
+        kept.refresh_from_db()
+        self.assertEqual(kept.category, self.coffee)
+        self.assertEqual(rollups.verify(DEFAULT_DB_ALIAS), [])
+
+    def test_recategorize_reads_batch_in_write_transaction(self):
+        manual = self._tx("Кофе")
+        self._rule("кофе", self.coffee)
+        with CaptureQueriesContext(connection) as ctx:
+            rules.recategorize(self.user)
+        statements = [q["sql"] for q in ctx.captured_queries]
+        read = next(i for i, sql in enumerate(statements) if sql.startswith("SELECT") and '"finance_transaction"' in sql)
+        self.assertTrue(any(sql.startswith("SAVEPOINT") for sql in statements[:read]))
+        self.assertEqual(Transaction.objects.get(pk=manual.pk).category, self.coffee)
+        self.assertEqual(rollups.verify(DEFAULT_DB_ALIAS), [])
+
+        # Без overwrite UPDATE не трогает операции, которым уже задали категорию
+        Transaction.objects.filter(pk=manual.pk).update(category=None)
+        matcher = rules.rules_for(self.user)
+
+        def set_by_hand(description, tx_type):
+            Transaction.objects.filter(pk=manual.pk).update(category=self.food)
+            return matcher.category_for(description, tx_type)
+
+        with patch.object(rules, "load_rules", return_value=Mock(category_for=set_by_hand)):
+            rules.recategorize(self.user)
+        self.assertEqual(Transaction.objects.get(pk=manual.pk).category, self.food)
+
+    def test_rules_page(self):
+        response = self.client.post(reverse("finance:rules_list"), {
+            "pattern": "  Яндекс   Такси ", "category": self.taxi.pk, "priority": "5",
+        })
+        self.assertEqual(response.status_code, 302)
+        rule = CategoryRule.objects.get(user=self.user)
+        self.assertEqual(rule.pattern, "Яндекс Такси")
+        # Тот же текст обновляет правило, а не создаёт второе
+        self.client.post(reverse("finance:rules_list"), {
+            "pattern": "Яндекс Такси", "category": self.food.pk, "priority": "5",
+        })
+        self.assertEqual(list(CategoryRule.objects.filter(user=self.user).values_list("category", flat=True)), [self.food.pk])
+        # Чужие категории в форме недоступны
+        other = User.objects.create_user("ira", password="pass")
+        foreign = Category.objects.create(user=other, name="Чужая")
+        response = self.client.post(reverse("finance:rules_list"), {
+            "pattern": "чужое", "category": foreign.pk, "priority": "1",
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(CategoryRule.objects.filter(pattern="чужое").exists())
+
+        self._tx("Яндекс такси")
+        response = self.client.post(reverse("finance:rules_apply"), follow=True)
+        self.assertContains(response, "Правила применяются к операциям в фоне.")
+        jobs.run_next("test")
+        self.assertContains(self.client.get(reverse("finance:rules_list")), "категория назначена операциям: 1")
+        self.client.post(reverse("finance:rule_delete", args=[rule.pk]))
+        self.assertFalse(CategoryRule.objects.filter(pk=rule.pk).exists())
+
+
+class DeletionTests(FinanceTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("kate", password="pass")
+        self.other = User.objects.create_user("liam", password="pass")
+        self.food = Category.objects.create(user=self.user, name="Еда")
+        self.taxi = Category.objects.create(user=self.user, name="Такси")
+        self.other_food = Category.objects.create(user=self.other, name="Еда")
+        today = date.today()
+        for i in range(5):
+            self._tx(self.user, self.food, today - timedelta(days=20 * i))
+        self._tx(self.user, self.taxi, today)
+        self._tx(self.other, self.other_food, today)
+        self.budget = Budget.objects.create(user=self.user, category=self.food, limit=Decimal("100.00"))
+        CategoryRule.objects.create(user=self.user, pattern="кафе", category=self.food)
+        self.client.force_login(self.user)
+
+    def _tx(self, user, category, day, amount="10.00"):
+        return Transaction.objects.create(user=user, type="expense", amount=Decimal(amount), date=day, category=category)
+
+    def test_category_detached_in_batches(self):
+        response = self.client.post(reverse("finance:category_delete", args=[self.food.pk]))
+        self.assertRedirects(response, reverse("finance:categories_list"))
+        task = DeletionTask.objects.get(kind="category", object_id=self.food.pk)
+        self.assertEqual((task.status, task.total, task.user), ("pending", 5, self.user))
+        # Повторный запрос не создаёт вторую задачу; категория скрыта со страницы
+        self.client.post(reverse("finance:category_delete", args=[self.food.pk]))
+        self.assertEqual(DeletionTask.objects.count(), 1)
+        response = self.client.get(reverse("finance:categories_list"))
+        self.assertEqual([c.name for c in response.context["categories"]], ["Такси"])
+
+        task = deletion.run(task.pk, batch_size=2, pause=0)
+        self.assertEqual((task.status, task.processed, task.progress_percent), ("done", 5, 100.0))
+        self.assertFalse(Category.objects.filter(pk=self.food.pk).exists())
+        self.assertFalse(Budget.objects.filter(pk=self.budget.pk).exists())
+        self.assertFalse(CategoryRule.objects.filter(user=self.user).exists())
+        self.assertEqual(Transaction.objects.filter(user=self.user, category__isnull=True).count(), 5)
+        self.assertEqual(rollups.verify(DEFAULT_DB_ALIAS), [])
+        self.assertEqual(balances.verify(DEFAULT_DB_ALIAS), [])
+        self.assertEqual(budgets.verify(DEFAULT_DB_ALIAS), [])
+
+    def test_account_removed_in_batches(self):
+        goal = Goal.objects.create(user=self.user, name="Отпуск", target_amount=Decimal("1000.00"))
+        add_contribution(self.user, goal.pk, Decimal("10.00"))
+        response = self.client.post(reverse("finance:account_delete"), {"password": "wrong"})
+        self.assertContains(response, "Неверный пароль.")
+        response = self.client.post(reverse("finance:account_delete"), {"password": "pass"})
+        self.assertRedirects(response, reverse("login"), fetch_redirect_response=False)
+        # Аккаунт сразу неактивен и разлогинен, данные удаляются позже
+        self.user.refresh_from_db()
+        self.assertFalse(self.user.is_active)
+        self.assertEqual(self.client.get(reverse("finance:dashboard")).status_code, 302)
+        self.assertEqual(Transaction.objects.filter(user=self.user).count(), 6)
+
+        out = StringIO()
+        call_command("run_deletions", "--batch-size", "2", "--pause", "0", stdout=out)
+        self.assertIn("обработано операций 6 из 6", out.getvalue())
+        self.assertFalse(User.objects.filter(pk=self.user.pk).exists())
+        for model in (Transaction, Category, MonthlyRollup, DailyBalance, Goal, Budget, CategoryRule):
+            self.assertFalse(model.objects.filter(user_id=self.user.pk).exists(), model)
+        self.assertFalse(GoalContribution.objects.filter(goal_id=goal.pk).exists())
+        task = DeletionTask.objects.get()
+        self.assertEqual((task.status, task.user), ("done", None))
+        # Данные другого пользователя не тронуты
+        self.assertEqual(Transaction.objects.filter(user=self.other).count(), 1)
+        self.assertEqual(rollups.verify(DEFAULT_DB_ALIAS), [])
+        self.assertEqual(balances.verify(DEFAULT_DB_ALIAS), [])
+
+    def test_status_endpoint_and_resume_after_failure(self):
+        task = deletion.schedule_category_deletion(self.food)
+        url = reverse("finance:deletion_status", args=[task.pk])
+        self.assertEqual(self.client.get(url).json()["status"], "pending")
+        self.client.force_login(self.other)
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+        with patch.object(deletion.budgets, "record_bulk", side_effect=[None, RuntimeError("сбой")]), \
+                self.assertLogs("finance.deletion", "ERROR"):
+            task = deletion.run(task.pk, batch_size=2, pause=0)
+        self.assertEqual((task.status, task.error, task.processed), ("failed", "сбой", 2))
+        # Законченные пачки сохранены, повторный запуск продолжает с места сбоя
+        self.assertEqual(Transaction.objects.filter(category=self.food).count(), 3)
+        with self.assertRaises(CommandError), self.assertLogs("finance.deletion", "ERROR"):
+            with patch.object(deletion.budgets, "record_bulk", side_effect=RuntimeError("сбой")):
+                call_command("run_deletions", "--task", str(task.pk), stdout=StringIO())
+        DeletionTask.objects.filter(pk=task.pk).update(status="pending")
+        task = deletion.run(task.pk, batch_size=2, pause=0)
+        self.assertEqual((task.status, task.processed), ("done", 5))
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(url).json()["percent"], 100.0)
+        self.assertEqual(rollups.verify(DEFAULT_DB_ALIAS), [])
+
+
+@override_settings(FINANCE_DELETION_BATCH_SIZE=2, FINANCE_DELETION_PAUSE=0)
+class BackgroundDeletionTests(TransactionTestCase):
+    def test_task_runs_in_thread_after_commit(self):
+        cache.clear()
+        user = User.objects.create_user("mike", password="pass")
+        Transaction.objects.bulk_create([
+            Transaction(user=user, type="income", amount=Decimal("5.00"), date=date(2024, 1, i + 1)) for i in range(5)
+        ])
+        task = deletion.schedule_user_deletion(user)
+        for thread in threading.enumerate():
+            if thread.name == f"finance-deletion-{task.pk}":
+                thread.join(timeout=10)
+        task.refresh_from_db()
+        self.assertEqual((task.status, task.processed), ("done", 5))
+        self.assertFalse(Transaction.objects.filter(user_id=user.pk).exists())
+
+
+class ArchiveTests(FinanceTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("nora", password="pass")
+        self.food = Category.objects.create(user=self.user, name="Еда")
+        Budget.objects.create(user=self.user, category=self.food, limit=Decimal("100.00"))
+        rows = [
+            ("income", "1000.00", date(2023, 12, 5), None, "Зарплата"),
+            ("expense", "250.50", date(2023, 12, 7), self.food, "Рынок"),
+            ("expense", "40.00", date(2024, 1, 2), self.food, "Кафе"),
+            ("expense", "60.00", date(2024, 6, 15), self.food, "Кафе"),
+            ("expense", "30.00", date(2024, 7, 3), None, "Такси"),
+            ("expense", "5.00", date.today(), self.food, "Кофе"),
+        ]
+        for tx_type, amount, day, category, description in rows:
+            Transaction.objects.create(
+                user=self.user, type=tx_type, amount=Decimal(amount), date=day,
+                category=category, description=description,
+            )
+        self.client.force_login(self.user)
+
+    def _reports(self):
+        cache.clear()
+        return (
+            monthly_balance_qs(self.user, 2024),
+            services.available_years_qs(self.user),
+            dashboard_summary_qs(self.user, date(2024, 1, 2), date(2024, 6, 20), "expense", self.food.pk),
+            dashboard_summary_qs(self.user, date(2023, 12, 1), date(2024, 7, 31)),
+            services.cash_flow_qs(self.user, date(2023, 12, 1), date(2024, 7, 10), "week"),
+        )
+
+    def test_cutoff_for(self):
+        today = date(2026, 10, 17)
+        self.assertEqual(archive.cutoff_for("18m", today), date(2025, 4, 1))
+        self.assertEqual(archive.cutoff_for("2y", today), date(2024, 10, 1))
+        self.assertEqual(archive.cutoff_for("400d", today), date(2025, 9, 1))
+        with self.assertRaises(ValueError):
+            archive.cutoff_for("год", today)
+
+    def test_archived_history_keeps_reports(self):
+        before = self._reports()
+        self.assertEqual(archive.archive_user(self.user.pk, date(2024, 7, 1), batch_size=2), 4)
+        self.assertEqual(Transaction.objects.filter(user=self.user).count(), 2)
+        self.assertEqual(ArchivedTransaction.objects.filter(user=self.user).count(), 4)
+        self.assertEqual(self._reports(), before)
+        for module in (rollups, balances, budgets):
+            self.assertEqual(module.verify(DEFAULT_DB_ALIAS), [], module)
+        # Запросы за период после границы архива читают только основную таблицу
+        with CaptureQueriesContext(connection) as ctx:
+            dashboard_summary_qs(self.user, date.today(), date.today(), "expense", self.food.pk)
+        self.assertNotIn("finance_transactionhistory", ctx.captured_queries[-1]["sql"])
+
+    def test_command_list_and_import(self):
+        from .importers import import_transactions
+        statement = "date;type;category;amount;description\n2024-01-03;expense;Еда;15;Пекарня\n"
+        self.assertEqual(import_transactions(self.user, statement.splitlines(keepends=True)).created, 1)
+        with self.assertRaises(CommandError):
+            call_command("archive_transactions", "--older-than", "3m", stdout=StringIO())
+        with self.assertRaises(ValueError):
+            archive.archive_user(self.user.pk, date.today())
+        out = StringIO()
+        call_command("archive_transactions", "--older-than", "2y", "--user", str(self.user.pk), stdout=out)
+        self.assertIn("перенесено операций 6", out.getvalue())
+
+        url = reverse("finance:transactions_list")
+        with self.assertNumQueries(4):
+            response = self.client.get(url, {"archive": "1", "category": self.food.pk})
+        archived = response.context["transactions"]
+        self.assertEqual([t.description for t in archived], ["Кафе", "Пекарня", "Кафе", "Рынок"])
+        self.assertNotContains(response, reverse("finance:transaction_update", args=[archived[0].pk]))
+        response = self.client.get(url)
+        self.assertEqual([t.description for t in response.context["transactions"]], ["Кофе"])
+
+        # Повторный импорт строки, ушедшей в архив, — дубликат
+        result = import_transactions(self.user, statement.splitlines(keepends=True))
+        self.assertEqual((result.created, result.duplicates), (0, 1))
+        self.assertEqual(rollups.verify(DEFAULT_DB_ALIAS), [])
+
+    def test_category_deletion_detaches_archived(self):
+        archive.archive_user(self.user.pk, date(2024, 7, 1))
+        task = deletion.schedule_category_deletion(self.food, background=False)
+        self.assertEqual(task.total, 4)
+        task = deletion.run(task.pk, batch_size=2, pause=0)
+        self.assertEqual((task.status, task.processed), ("done", 4))
+        self.assertEqual(ArchivedTransaction.objects.filter(user=self.user, category__isnull=True).count(), 4)
+        for module in (rollups, balances, budgets):
+            self.assertEqual(module.verify(DEFAULT_DB_ALIAS), [], module)
+
+
+# Без кеша каталога каждая маршрутизация — запрос к UserShard; журнал
+# повторяющихся запросов здесь не нужен
+@override_settings(FINANCE_SHARD_DIRECTORY_TIMEOUT=0, FINANCE_REPEATED_QUERY_THRESHOLD=1000)
+class ShardingTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        directory = self.enterContext(tempfile.TemporaryDirectory())
+        self.shards = self.enterContext(temporary_shards(2, directory))
+        self.user = User.objects.create_user("pat", password="pass")
+        self.home = sharding.placement(self.user.pk)
+        self.other = next(alias for alias in self.shards if alias != self.home)
+        self.client.force_login(self.user)
+
+    def _count(self, model, alias):
+        return model.objects.using(alias).filter(user_id=self.user.pk).count()
+
+    def test_requests_and_services_use_user_shard(self):
+        self.assertEqual(UserShard.objects.get(user=self.user).alias, self.home)
+        food = Category.objects.using(self.home).create(user=self.user, name="Еда")
+        response = self.client.post(reverse("finance:transaction_create"), {
+            "type": "expense", "category": food.pk, "amount": "12.50",
+            "date": date.today().isoformat(), "description": "Кофейня",
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual([self._count(Transaction, alias) for alias in (DEFAULT_DB_ALIAS, self.home, self.other)], [0, 1, 0])
+        tx = Transaction.objects.using(self.home).get(user=self.user)
+        # id шарда из его диапазона — строки переносятся между шардами с прежними id
+        self.assertGreaterEqual(tx.pk, (self.shards.index(self.home) + 1) << sharding.ID_RANGE_BITS)
+
+        response = self.client.get(reverse("finance:transactions_list"), {"q": "кофе"})
+        self.assertEqual(list(response.context["transactions"]), [tx])
+        response = self.client.get(reverse("finance:dashboard"))
+        self.assertEqual((response.context["expense_sum"], list(response.context["transactions"])), (Decimal("12.50"), [tx]))
+        summary = dashboard_summary_qs(self.user, month_start(date.today()), date.today())
+        self.assertEqual(summary["expense_sum"], Decimal("12.50"))
+
+        # Регистрация: базовые категории создаются в шарде нового пользователя
+        self.client.logout()
+        self.client.post(reverse("finance:signup"), {
+            "username": "quinn", "email": "quinn@example.com", "password1": "Zx9!long-pass", "password2": "Zx9!long-pass",
+        })
+        quinn = User.objects.get(username="quinn")
+        self.assertEqual(Category.objects.using(sharding.placement(quinn.pk)).filter(user=quinn).count(), len(DEFAULT_CATEGORIES))
+        self.assertFalse(Category.objects.using(DEFAULT_DB_ALIAS).filter(user=quinn).exists())
+
+    def test_rebalance_moves_user_between_shards(self):
+        with sharding.for_user(self.user):
+            food = Category.objects.create(user=self.user, name="Еда")
+            Budget.objects.create(user=self.user, category=food, limit=Decimal("100.00"))
+            CategoryRule.objects.create(user=self.user, pattern="кафе", category=food)
+            goal = Goal.objects.create(user=self.user, name="Отпуск", target_amount=Decimal("500.00"))
+            for day in range(1, 6):
+                Transaction.objects.create(
+                    user=self.user, type="expense", amount=Decimal("10.00"),
+                    date=date.today().replace(day=day), category=food, description=f"Кафе {day}",
+                )
+        add_contribution(self.user, goal.pk, Decimal("25.00"))
+
+        # Пока данные переносятся, запись отклоняется, чтение идёт из прежней базы
+        sharding._set_entry(self.user.pk, self.home, moving=True)
+        self.assertEqual(self.client.post(reverse("finance:goal_add_amount", args=[goal.pk]), {"amount": "5"}).status_code, 503)
+        self.assertEqual(self.client.get(reverse("finance:transactions_list")).status_code, 200)
+
+        out = StringIO()
+        call_command("rebalance_shards", "--user", str(self.user.pk), "--to", self.other, "--batch-size", "2", stdout=out)
+        self.assertIn(f"{self.home} → {self.other}", out.getvalue())
+        self.assertEqual(sharding.db_for_user(self.user), self.other)
+        self.assertEqual([self._count(Transaction, self.home), self._count(Transaction, self.other)], [0, 5])
+        self.assertFalse(User.objects.using(self.home).filter(pk=self.user.pk).exists())
+        for module in (rollups, balances, budgets):
+            self.assertEqual(module.verify(self.other, [self.user.pk]), [], module)
+        self.assertEqual(GoalContribution.objects.using(self.other).get(goal_id=goal.pk).amount, Decimal("25.00"))
+        response = self.client.get(reverse("finance:transactions_list"), {"q": "кафе"})
+        self.assertEqual(len(response.context["transactions"]), 5)
+        response = self.client.post(reverse("finance:goal_add_amount", args=[goal.pk]), {"amount": "5"})
+        self.assertEqual(response.status_code, 302)
+
+        # Без --to пользователь возвращается в свой шард по id
+        call_command("rebalance_shards", "--dry-run", stdout=out)
+        self.assertIn(f"user={self.user.pk}: {self.other} → {self.home}", out.getvalue())
+        call_command("rebalance_shards", stdout=StringIO())
+        self.assertEqual([self._count(Transaction, self.home), self._count(Transaction, self.other)], [5, 0])
+        self.assertEqual(sharding.misplaced(), [])
+
+    @override_settings(FINANCE_JOBS_IN_PROCESS=False)
+    def test_jobs_wait_for_move(self):
+        # Задача, взятая во время переноса, откладывается, попытка не считается
+        sharding._set_entry(self.user.pk, self.home, moving=True)
+        job = jobs.enqueue(self.user, "recategorize")
+        job = jobs.run_next("w1")
+        self.assertEqual((job.status, job.attempts, job.locked_by), ("pending", 0, ""))
+        self.assertGreater(job.run_at, timezone.now())
+        self.assertIsNone(jobs.run_next("w1"))
+
+        # Перенос ждёт задачу, начатую до запрета записи
+        Job.objects.filter(pk=job.pk).update(run_at=timezone.now())
+        sharding._set_entry(self.user.pk, self.home, moving=False)
+        running = jobs.claim("w1", job.pk)
+        finish = lambda _: Job.objects.filter(pk=running.pk).update(status="done")
+        with patch.object(sharding, "_wait_for_directory"), \
+                patch.object(sharding.time, "sleep", side_effect=finish) as sleep:
+            sharding.move_user(self.user.pk, self.other)
+        sleep.assert_called_once_with(settings.FINANCE_JOB_POLL_INTERVAL)
+        self.assertEqual(sharding.db_for_user(self.user), self.other)
+
+    def test_deletions_wait_for_move(self):
+        with sharding.for_user(self.user):
+            food = Category.objects.create(user=self.user, name="Еда")
+            Transaction.objects.create(user=self.user, category=food, type="expense", amount=Decimal("3.00"), date=date.today())
+        task = deletion.schedule_category_deletion(food, background=False)
+
+        # Во время переноса удаление не начинается
+        sharding._set_entry(self.user.pk, self.home, moving=True)
+        task = deletion.run(task.pk, self.home)
+        self.assertEqual(task.status, "pending")
+        self.assertTrue(Category.objects.using(self.home).filter(pk=food.pk).exists())
+        sharding._set_entry(self.user.pk, self.home, moving=False)
+
+        # Идущее удаление — перенос отклоняется, запись снова разрешена
+        DeletionTask.objects.using(self.home).filter(pk=task.pk).update(status="running")
+        with self.assertRaises(CommandError):
+            call_command("rebalance_shards", "--user", str(self.user.pk), "--to", self.other, stdout=StringIO(), stderr=StringIO())
+        self.assertEqual((sharding.db_for_user(self.user), sharding.is_moving(self.user)), (self.home, False))
+
+        # Отложенная задача переезжает вместе с данными и выполняется в новой базе
+        DeletionTask.objects.using(self.home).filter(pk=task.pk).update(status="pending")
+        sharding.move_user(self.user.pk, self.other)
+        self.assertEqual(deletion.run(task.pk, self.other).status, "done")
+        self.assertFalse(Category.objects.using(self.other).filter(pk=food.pk).exists())
+        self.assertEqual(rollups.verify(self.other, [self.user.pk]), [])
+
+    def test_account_deletion_clears_shard_and_default(self):
+        with sharding.for_user(self.user):
+            Transaction.objects.create(user=self.user, type="income", amount=Decimal("5.00"), date=date.today())
+        task = deletion.schedule_user_deletion(self.user, background=False)
+        self.assertEqual(task._state.db, self.home)
+        call_command("run_deletions", stdout=StringIO())
+        for alias in (DEFAULT_DB_ALIAS, self.home):
+            self.assertFalse(User.objects.using(alias).filter(pk=self.user.pk).exists(), alias)
+        self.assertEqual(self._count(Transaction, self.home), 0)
+        self.assertFalse(UserShard.objects.filter(user_id=self.user.pk).exists())
+
+
+@override_settings(FINANCE_REPLICA_STICKY_SECONDS=30, FINANCE_REPLICA_MAX_LAG_SECONDS=30)
+class ReplicaTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user("rae", password="pass")
+        self.food = Category.objects.create(user=self.user, name="Еда")
+        self.first = Transaction.objects.create(
+            user=self.user, category=self.food, type="expense", amount=Decimal("5.00"), date=date.today(), description="Булочная"
+        )
+        directory = self.enterContext(tempfile.TemporaryDirectory())
+        self.enterContext(temporary_replicas(directory, [DEFAULT_DB_ALIAS]))
+        self.client.force_login(self.user)
+
+    def _add_silently(self, description):
+        # bulk_create не вызывает сигналов и не закрепляет пользователя за основной базой
+        return Transaction.objects.bulk_create([Transaction(
+            user=self.user, category=self.food, type="expense", amount=Decimal("1.00"), date=date.today(), description=description,
+        )])[0]
+
+    def _listed(self):
+        return list(self.client.get(reverse("finance:transactions_list")).context["transactions"])
+
+    def test_reads_use_replica_except_after_own_writes(self):
+        self._add_silently("Рынок")
+        listed = self._listed()
+        self.assertEqual((listed, listed[0]._state.db), ([self.first], "default_replica"))
+        response = self.client.get(reverse("finance:dashboard"))
+        self.assertEqual(list(response.context["transactions"]), [self.first])
+
+        # После своей записи пользователь читает из основной базы
+        response = self.client.post(reverse("finance:transaction_create"), {
+            "type": "expense", "category": self.food.pk, "amount": "3.00",
+            "date": date.today().isoformat(), "description": "Кофейня",
+        })
+        self.assertEqual(response.status_code, 302)
+        listed = self._listed()
+        self.assertEqual((len(listed), listed[0]._state.db), (3, DEFAULT_DB_ALIAS))
+
+        # Закрепление истекло: снова снимок, после обновления — с новыми операциями
+        cache.delete(replicas._pin_key(self.user.pk))
+        self.assertEqual(self._listed(), [self.first])
+        replicas.refresh(DEFAULT_DB_ALIAS)
+        self.assertEqual(len(self._listed()), 3)
+
+        # Отставшая больше FINANCE_REPLICA_MAX_LAG_SECONDS реплика не используется
+        self._add_silently("Аптека")
+        stale = time.time() - 60
+        os.utime(replicas._marker("default_replica"), (stale, stale))
+        replicas._freshness.clear()
+        listed = self._listed()
+        self.assertEqual((len(listed), listed[0]._state.db), (4, DEFAULT_DB_ALIAS))
+
+    def test_budget_changes_pin_reads_to_primary(self):
+        replicas.refresh(DEFAULT_DB_ALIAS)
+        cache.delete(replicas._pin_key(self.user.pk))
+        self.assertEqual(self.client.get(reverse("finance:dashboard")).context["budgets"], [])
+
+        self.client.post(reverse("finance:budgets_list"), {"category": self.food.pk, "period": "month", "limit": "100"})
+        budgets_shown = self.client.get(reverse("finance:dashboard")).context["budgets"]
+        self.assertEqual([(b.limit, b._state.db) for b in budgets_shown], [(Decimal("100.00"), DEFAULT_DB_ALIAS)])
+
+        # Удаление тоже видно сразу, хотя в реплике бюджет ещё есть
+        replicas.refresh(DEFAULT_DB_ALIAS)
+        cache.delete(replicas._pin_key(self.user.pk))
+        self.client.post(reverse("finance:budget_delete", args=[budgets_shown[0].pk]))
+        self.assertTrue(replicas.is_pinned(self.user.pk))
+        self.assertEqual(self.client.get(reverse("finance:dashboard")).context["budgets"], [])
+
+    def test_refresh_command_and_read_only_replica(self):
+        self._add_silently("Рынок")
+        out = StringIO()
+        call_command("refresh_replicas", stdout=out)
+        self.assertIn("default → default_replica", out.getvalue())
+        self.assertEqual(Transaction.objects.using("default_replica").count(), 2)
+        with self.assertRaises(OperationalError):
+            Category.objects.using("default_replica").create(user=self.user, name="Транспорт")
+        with self.assertRaises(CommandError):
+            call_command("refresh_replicas", "--database", "shard_9")
+
+
+@override_settings(FINANCE_JOB_MAX_ATTEMPTS=2, FINANCE_JOB_RETRY_DELAY=5, FINANCE_JOBS_IN_PROCESS=False)
+class JobTests(FinanceTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("mona", password="pass")
+        self.food = Category.objects.create(user=self.user, name="Еда")
+        Transaction.objects.create(user=self.user, category=self.food, type="expense", amount=Decimal("10.00"), date=date(2024, 5, 3))
+
+    def test_pending_jobs_are_deduplicated_per_user(self):
+        job = jobs.enqueue(self.user, "recategorize")
+        self.assertEqual(jobs.enqueue(self.user, "recategorize").pk, job.pk)
+        self.assertNotEqual(jobs.enqueue(self.user, "recategorize", overwrite=True).pk, job.pk)
+        other = User.objects.create_user("nick", password="pass")
+        self.assertNotEqual(jobs.enqueue(other, "recategorize").pk, job.pk)
+        # Задача уже выполняется — новая ставится: изменения после её начала она не увидит
+        self.assertEqual(jobs.claim("w1", job.pk).status, "running")
+        self.assertNotEqual(jobs.enqueue(self.user, "recategorize").pk, job.pk)
+        with self.assertRaises(ValueError):
+            jobs.enqueue(self.user, "unknown")
+
+    def test_rebuild_retries_with_backoff_then_fails(self):
+        MonthlyRollup.objects.filter(user=self.user).delete()
+        job = jobs.enqueue(self.user, "rebuild_analytics")
+        with patch.object(jobs.rollups, "rebuild", side_effect=RuntimeError("сбой")), self.assertLogs("finance.jobs", "ERROR"):
+            before = timezone.now()
+            job = jobs.run_next("w1")
+        self.assertEqual((job.status, job.attempts, job.error, job.locked_by), ("pending", 1, "сбой", ""))
+        self.assertGreaterEqual(job.run_at, before + timedelta(seconds=5))
+        # До истечения задержки задачу не берут
+        self.assertIsNone(jobs.run_next("w1"))
+        self.assertEqual(jobs.retry_delay(3), timedelta(seconds=20))
+
+        Job.objects.filter(pk=job.pk).update(run_at=timezone.now())
+        with patch.object(jobs.rollups, "rebuild", side_effect=RuntimeError("сбой")), self.assertLogs("finance.jobs", "ERROR"):
+            job = jobs.run_next("w1")
+        self.assertEqual((job.status, job.attempts), ("failed", 2))
+
+        # Без исполнителя повтор в веб-процессе запускает таймер
+        job = jobs.claim("w1", jobs.enqueue(self.user, "rebuild_analytics").pk)
+        with override_settings(FINANCE_JOBS_IN_PROCESS=True), patch.object(jobs.threading, "Timer") as timer, \
+                patch.object(jobs.rollups, "rebuild", side_effect=RuntimeError("сбой")), self.assertLogs("finance.jobs", "ERROR"):
+            jobs.execute(job)
+        delay, target = timer.call_args.args
+        self.assertEqual((target, timer.call_args.kwargs["args"]), (jobs._run_in_thread, (job.pk,)))
+        self.assertAlmostEqual(delay, 5, delta=1)
+        Job.objects.filter(pk=job.pk).update(status="failed")
+
+        job = jobs.execute(jobs.claim("w1", jobs.enqueue(self.user, "rebuild_analytics").pk))
+        self.assertEqual((job.status, job.result["rollups"]), ("done", 1))
+        self.assertEqual(rollups.verify(DEFAULT_DB_ALIAS), [])
+
+    def test_stale_running_job_is_taken_over(self):
+        job = jobs.claim("w1", jobs.enqueue(self.user, "recategorize").pk)
+        self.assertIsNone(jobs.claim("w2"))
+        # Исполнитель w1 молчит дольше FINANCE_JOB_TIMEOUT — задачу берёт w2
+        Job.objects.filter(pk=job.pk).update(locked_at=timezone.now() - timedelta(seconds=settings.FINANCE_JOB_TIMEOUT + 1))
+        taken = jobs.claim("w2")
+        self.assertEqual((taken.pk, taken.locked_by, taken.attempts), (job.pk, "w2", 2))
+        # Запоздалый отчёт w1 не перезаписывает состояние
+        jobs.execute(job)
+        self.assertEqual(Job.objects.get(pk=job.pk).status, "running")
+        self.assertEqual(jobs.execute(taken).status, "done")
+
+    def test_status_endpoint_and_rebuild_page(self):
+        self.client.force_login(self.user)
+        response = self.client.post(reverse("finance:analytics_rebuild"), follow=True)
+        self.assertContains(response, "Аналитика пересчитывается в фоне.")
+        job = Job.objects.get(user=self.user, kind="rebuild_analytics")
+        url = reverse("finance:job_status", args=[job.pk])
+        self.assertEqual(self.client.get(url).json()["status"], "pending")
+        self.assertContains(self.client.get(reverse("finance:analytics")), f'data-job-url="{url}"')
+        self.client.force_login(User.objects.create_user("olga", password="pass"))
+        self.assertEqual(self.client.get(url).status_code, 404)
@@ -11,9 +11,15 @@ urlpatterns = [
     # Отображение списка всех транзакций пользователя через функцию transactions_list_view
     path("transactions/", views.transactions_list_view, name="transactions_list"),
 
+    # Потоковая выгрузка операций: ?format=csv|jsonl и фильтры списка
+    path("transactions/export/", views.transactions_export_view, name="transactions_export"),
+
     # URL для добавления новой транзакции, вызывает transaction_create_view
     path("transactions/add/", views.transaction_create_view, name="transaction_create"),
 
+    # Импорт операций из CSV-выписки банка
+    path("transactions/import/", views.transaction_import_view, name="transaction_import"),
+
     # Редактирование транзакции, параметр pk (primary key) определяет конкретную транзакцию
     path("transactions/<int:pk>/edit/", views.transaction_update_view, name="transaction_update"),
 
@@ -35,6 +41,35 @@ urlpatterns = [
     # Добавление суммы к уже существующей цели (например, внесение денег)
     path("goals/<int:pk>/add_amount/", views.goal_add_amount_view, name="goal_add_amount"),
 
+    # Бюджеты расходов по категориям: список, установка лимита и удаление
+    path("budgets/", views.budgets_list_view, name="budgets_list"),
+    path("budgets/<int:pk>/delete/", views.budget_delete_view, name="budget_delete"),
+
+    # Правила автокатегоризации и их применение к операциям без категории
+    path("rules/", views.rules_list_view, name="rules_list"),
+    path("rules/apply/", views.rules_apply_view, name="rules_apply"),
+    path("rules/<int:pk>/delete/", views.rule_delete_view, name="rule_delete"),
+
+    # Категории и их удаление пачками в фоне, прогресс удаления — JSON
+    path("categories/", views.categories_list_view, name="categories_list"),
+    path("categories/<int:pk>/delete/", views.category_delete_view, name="category_delete"),
+    path("deletions/<int:pk>/", views.deletion_status_view, name="deletion_status"),
+    path("jobs/<int:pk>/", views.job_status_view, name="job_status"),
+
+    # Удаление аккаунта
+    path("account/delete/", views.account_delete_view, name="account_delete"),
+
     # Просмотр аналитики финансов (графики, отчеты)
     path("analytics/", views.analytics_view, name="analytics"),
+    path("analytics/rebuild/", views.analytics_rebuild_view, name="analytics_rebuild"),
+
+    # Данные графиков в JSON (с ETag и ответом 304, если данные не менялись)
+    path("charts/dashboard/", views.dashboard_chart_view, name="chart_dashboard"),
+    path("charts/expenses-by-category/", views.expenses_by_category_chart_view, name="chart_expenses_by_category"),
+    path("charts/monthly-balance/", views.monthly_balance_chart_view, name="chart_monthly_balance"),
+    path("charts/cash-flow/", views.cash_flow_chart_view, name="chart_cash_flow"),
+    path("charts/goals/<int:pk>/savings/", views.goal_savings_chart_view, name="chart_goal_savings"),
+
+    # Статистика кеша аналитики (только для персонала)
+    path("cache-stats/", views.cache_stats_view, name="cache_stats"),
 ]
@@ -1,14 +1,57 @@
-from datetime import datetime
-
-from django.contrib.auth import login
+import asyncio
+import csv
+import hashlib
+import json
+from datetime import datetime, timedelta
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.contrib import messages
+from django.contrib.auth import login, logout
 from django.contrib.auth.decorators import login_required
-from django.db.models import Sum
+from django.contrib.auth.views import redirect_to_login
+from django.db.models import Q
+from django.http import Http404, HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404, redirect, render
-from django.views.decorators.http import require_http_methods
-
-from .forms import GoalAddAmountForm, GoalForm, SignUpForm, TransactionForm
-from .models import Category, Goal, Transaction
-from .services import expenses_by_category_qs, monthly_balance_qs
+from django.utils import timezone
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition, require_GET, require_http_methods
+
+from .cache import cache_stats, data_version
+from .budgets import crossed_since, current_budgets
+from .deletion import schedule_category_deletion, schedule_user_deletion
+from .forms import (
+    AccountDeleteForm,
+    BudgetForm,
+    CategoryRuleForm,
+    GoalAddAmountForm,
+    GoalForm,
+    SignUpForm,
+    TransactionForm,
+    TransactionImportForm,
+)
+from .goals import add_contribution, save_goal
+from .jobs import enqueue
+from .rules import apply_rules
+from .replicas import replica_reads
+from .search import search_transactions
+from .sharding import for_user
+from .models import DEFAULT_CATEGORIES, Budget, Category, CategoryRule, DeletionTask, Goal, Job, Transaction
+from .services import (
+    CASH_FLOW_MAX_POINTS,
+    CASH_FLOW_PERIODS,
+    adashboard_totals,
+    available_years_qs,
+    ayear_totals,
+    cash_flow_qs,
+    dashboard_summary_qs,
+    expenses_by_category_qs,
+    filtered_transactions_qs,
+    goal_savings_qs,
+    monthly_balance_qs,
+)
 
 
 @require_http_methods(["GET", "POST"])
@@ -20,17 +63,12 @@ def signup_view(request):
         form = SignUpForm(request.POST)
         if form.is_valid():
             user = form.save()
-            # При регистрации создаются базовые категории для нового пользователя
-            Category.objects.bulk_create(
-                [
-                    Category(user=user, name="Зарплата", is_income=True),
-                    Category(user=user, name="Еда", is_income=False),
-                    Category(user=user, name="Транспорт", is_income=False),
-                    Category(user=user, name="Развлечения", is_income=False),
-                    Category(user=user, name="Переводы", is_income=False),
-                    Category(user=user, name="Бытовые нужды", is_income=False),
-                ]
-            )
+            # При регистрации создаются базовые категории для нового пользователя;
+            # запрос ещё анонимный, поэтому шард задаём явно
+            with for_user(user):
+                Category.objects.bulk_create(
+                    [Category(user=user, name=name, is_income=is_income) for name, is_income in DEFAULT_CATEGORIES]
+                )
             login(request, user)
             return redirect("finance:dashboard")
     else:
@@ -38,112 +76,247 @@ def signup_view(request):
 
     return render(request, "registration/signup.html", {"form": form})
 
- # Доступ к этой странице возможен только для вошедших пользователей
-@login_required
-def dashboard_view(request):
-    user = request.user
-    # Получаем параметры фильтрации из GET-запроса (диапазон дат, тип операции, категория)
-    date_from_str = request.GET.get("date_from")
-    date_to_str = request.GET.get("date_to")
+def _parse_date(value, default):
+    # Дата из строки YYYY-MM-DD; при пустом или некорректном значении — default
+    if not value:
+        return default
+    try:
+        return datetime.strptime(value, "%Y-%m-%d").date()
+    except ValueError:
+        return default
+
+
+def _parse_filters(request, default_from=None, default_to=None):
+    # Общие фильтры дашборда и списка операций: период, тип и категория
     tx_type = request.GET.get("type")
     category_id = request.GET.get("category")
+    return {
+        "date_from": _parse_date(request.GET.get("date_from"), default_from),
+        "date_to": _parse_date(request.GET.get("date_to"), default_to),
+        "tx_type": tx_type if tx_type in ("income", "expense") else None,
+        # Фильтр по категории учитываем, только если передан корректный id
+        "category_id": int(category_id) if (category_id and category_id.isdigit()) else None,
+    }
 
-    today = datetime.today().date()
-    default_from = today.replace(day=1)
-    default_to = today
-    # Преобразуем даты из строк в объекты date, если переданы, иначе используем значения по умолчанию
-    try:
-        date_from = (
-            datetime.strptime(date_from_str, "%Y-%m-%d").date()
-            if date_from_str
-            else default_from
-        )
-    except ValueError:
-        date_from = default_from
 
-    try:
-        date_to = (
-            datetime.strptime(date_to_str, "%Y-%m-%d").date()
-            if date_to_str
-            else default_to
-        )
-    except ValueError:
-        date_to = default_to
-    # Получаем транзакции пользователя за указанный период
-    transactions_qs = Transaction.objects.filter(
-        user=user,
-        date__gte=date_from,
-        date__lte=date_to,
-    )
-    # Фильтрация по типу (доход/расход) если задана
-    if tx_type in ("income", "expense"):
-        transactions_qs = transactions_qs.filter(type=tx_type)
-    # Фильтрация по категории если указана
-    if category_id and category_id.isdigit():
-        transactions_qs = transactions_qs.filter(category_id=int(category_id))
-    # Показываем последние 5 транзакций для краткости
-    transactions = transactions_qs.order_by("-date", "-id")[:5]
-    # Считаем суммы доходов и расходов за период
-    income_sum = (
-        Transaction.objects.filter(
-            user=user,
-            date__gte=date_from,
-            date__lte=date_to,
-            type="income",
-        ).aggregate(Sum("amount"))["amount__sum"]
-        or 0
-    )
-    expense_sum = (
-        Transaction.objects.filter(
-            user=user,
-            date__gte=date_from,
-            date__lte=date_to,
-            type="expense",
-        ).aggregate(Sum("amount"))["amount__sum"]
-        or 0
-    )
-    balance = income_sum - expense_sum
-    # Получаем агрегированные данные по суммам операций по категориям для графиков и отчетов
-    agg = (
-        transactions_qs.values("category__name")
-        .annotate(total=Sum("amount"))
-        .order_by("-total")
-    )
+def _archive_mode(request):
+    # Архив старых операций читается только по явному запросу
+    return request.GET.get("archive") == "1"
+
+
+def _filters_context(filters):
+    # Значения фильтров для формы в шаблоне
+    return {
+        "date_from": filters["date_from"],
+        "date_to": filters["date_to"],
+        "selected_type": filters["tx_type"] or "",
+        "selected_category_id": filters["category_id"] if filters["category_id"] is not None else "",
+    }
+
+
+def async_login_required(view):
+    # login_required для async-представлений (в Django 5.0 он их не поддерживает).
+    # Пользователь загружается через request.auser() и подставляется в request.user,
+    # чтобы шаблоны не обращались к БД синхронно из event loop
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        user = await request.auser()
+        if not user.is_authenticated:
+            return redirect_to_login(request.get_full_path())
+        request.user = user
+        return await view(request, *args, **kwargs)
 
-    chart_labels = []
-    chart_data = []
-    for row in agg:
-        label = row["category__name"] or "Без категории"
-        chart_labels.append(label)
-        chart_data.append(float(row["total"]))
+    return wrapper
 
-    user_categories = Category.objects.filter(user=user).order_by("name")  # Все категории пользователя
 
-    goals = Goal.objects.filter(user=user).order_by("-created_at")[:3]  # Три последние цели пользователя
+async def _alist(qs):
+    return [obj async for obj in qs]
+
+
+# Представления дашборда и аналитики асинхронные: независимые запросы
+# выполняются через asyncio.gather. Под ASGI это не блокирует воркер, под WSGI
+# Django запускает их в собственном event loop — URL одни и те же.
+ # Доступ к этой странице возможен только для вошедших пользователей
+@async_login_required
+@replica_reads
+async def dashboard_view(request):
+    user = request.user
+    # Получаем параметры фильтрации из GET-запроса (диапазон дат, тип операции, категория);
+    # по умолчанию — с начала текущего месяца по сегодня
+    today = datetime.today().date()
+    filters = _parse_filters(request, default_from=today.replace(day=1), default_to=today)
+    # Получаем транзакции пользователя за указанный период с учётом фильтров
+    transactions_qs = filtered_transactions_qs(user, **filters)
+    # Показываем последние 5 транзакций для краткости
+    transactions, user_categories, goals, user_budgets, totals = await asyncio.gather(
+        _alist(transactions_qs.select_related("category").order_by("-date", "-id")[:5]),
+        _alist(Category.objects.filter(user=user).order_by("name")),  # Все категории пользователя
+        _alist(Goal.objects.filter(user=user).order_by("-created_at")[:3]),  # Три последние цели пользователя
+        _alist(current_budgets(user)),  # Бюджеты с потраченным за текущий период из счётчиков
+        adashboard_totals(user, **filters),
+    )
     # Передаем все данные в шаблон для отображения дашборда
     context = {
         "transactions": transactions,
-        "income_sum": income_sum,
-        "expense_sum": expense_sum,
-        "balance": balance,
         "goals": goals,
-        "date_from": date_from,
-        "date_to": date_to,
-        "chart_labels": chart_labels,
-        "chart_data": chart_data,
+        "budgets": user_budgets,
         "categories": user_categories,
-        "selected_type": tx_type or "",
-        "selected_category_id": int(category_id)
-        if (category_id and category_id.isdigit())
-        else "",
+        **totals,
+        **_filters_context(filters),
     }
+    # Диаграмма подгружается отдельно из dashboard_chart_view
     return render(request, "finance/dashboard.html", context)
 
 
-@login_required # Получаем все транзакции текущего пользователя и показываем в списке
+def _page_size(request):
+    # Размер страницы из ?per_page=, ограниченный сверху
+    value = request.GET.get("per_page", "")
+    if value.isdigit() and int(value) > 0:
+        return min(int(value), settings.FINANCE_TRANSACTIONS_MAX_PAGE_SIZE)
+    return settings.FINANCE_TRANSACTIONS_PAGE_SIZE
+
+
+def _parse_cursor(value):
+    # Курсор страницы — "YYYY-MM-DD_id" последней показанной операции
+    try:
+        date_str, pk = value.split("_", 1)
+        return datetime.strptime(date_str, "%Y-%m-%d").date(), int(pk)
+    except (AttributeError, ValueError):
+        return None
+
+
+def _parse_page(value):
+    # Номер страницы результатов поиска (?page=), с нуля
+    return int(value) if value and value.isdigit() else 0
+
+
+@login_required # Операции пользователя постранично (keyset-пагинация по (-date, -id))
+@replica_reads
 def transactions_list_view(request):
-    transactions = Transaction.objects.filter(user=request.user)
-    return render(request, "finance/transactions_list.html", {"transactions": transactions})
+    filters = _parse_filters(request)
+    page_size = _page_size(request)
+    archived = _archive_mode(request)
+    # В архиве нет полнотекстового индекса — только фильтры
+    query = "" if archived else request.GET.get("q", "").strip()
+    cursor = _parse_cursor(request.GET.get("after"))
+
+    transactions_qs = filtered_transactions_qs(request.user, **filters, archived=archived).select_related("category")
+    params = request.GET.copy()
+    if query:
+        # Поиск по описанию и категории (FTS5): результаты по релевантности,
+        # поэтому страницы по смещению — глубоко по ним обычно не листают
+        page = _parse_page(request.GET.get("page"))
+        offset = page * page_size
+        found = search_transactions(transactions_qs, query, request.user.pk)
+        transactions = list(found[offset: offset + page_size + 1])
+        params["page"] = page + 1
+        is_first_page = page == 0
+    else:
+        if cursor is not None:
+            # Следующая страница начинается строго после последней показанной
+            # операции — стоимость не зависит от того, как глубоко листает пользователь
+            cursor_date, cursor_id = cursor
+            transactions_qs = transactions_qs.filter(
+                Q(date__lt=cursor_date) | Q(date=cursor_date, id__lt=cursor_id)
+            )
+        # Берём на одну строку больше, чтобы узнать о следующей странице без COUNT(*)
+        transactions = list(transactions_qs.order_by("-date", "-id")[: page_size + 1])
+        is_first_page = cursor is None
+    has_next = len(transactions) > page_size
+    transactions = transactions[:page_size]
+
+    next_url = None
+    if has_next:
+        if not query:
+            last = transactions[-1]
+            params["after"] = f"{last.date:%Y-%m-%d}_{last.pk}"
+        next_url = "?" + params.urlencode()
+    first_params = request.GET.copy()
+    first_params.pop("after", None)
+    first_params.pop("page", None)
+
+    context = {
+        "transactions": transactions,
+        "categories": Category.objects.filter(user=request.user).order_by("name"),
+        "has_next": has_next,
+        "next_url": next_url,
+        "first_url": "?" + first_params.urlencode(),
+        "is_first_page": is_first_page,
+        "query": query,
+        "archived": archived,
+        "export_query": first_params.urlencode(),
+        "per_page": page_size,
+        **_filters_context(filters),
+    }
+    return render(request, "finance/transactions_list.html", context)
+
+
+class _Echo:
+    # Псевдо-буфер для csv.writer: возвращает строку вместо записи
+    def write(self, value):
+        return value
+
+
+EXPORT_FIELDS = ("date", "type", "category__name", "amount", "description")
+EXPORT_HEADER = ("date", "type", "category", "amount", "description")
+
+
+def _export_rows(qs):
+    # Читаем только нужные столбцы кусками — память не зависит от числа строк
+    return qs.order_by("-date", "-id").values_list(*EXPORT_FIELDS).iterator(
+        chunk_size=settings.FINANCE_EXPORT_CHUNK_SIZE
+    )
+
+
+def _csv_stream(qs):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(EXPORT_HEADER)
+    for row_date, tx_type, category, amount, description in _export_rows(qs):
+        yield writer.writerow((row_date.isoformat(), tx_type, category or "", amount, description))
+
+
+def _jsonl_stream(qs):
+    for row_date, tx_type, category, amount, description in _export_rows(qs):
+        yield json.dumps(
+            {
+                "date": row_date.isoformat(),
+                "type": tx_type,
+                "category": category,
+                "amount": str(amount),
+                "description": description,
+            },
+            ensure_ascii=False,
+        ) + "\n"
+
+
+@login_required # Потоковая выгрузка операций в CSV или JSON Lines с фильтрами списка
+def transactions_export_view(request):
+    export_format = request.GET.get("format", "csv")
+    if export_format not in ("csv", "jsonl"):
+        return HttpResponseBadRequest("Неизвестный формат выгрузки")
+
+    archived = _archive_mode(request)
+    qs = filtered_transactions_qs(request.user, **_parse_filters(request), archived=archived)
+    query = request.GET.get("q", "").strip()
+    if query and not archived:
+        qs = search_transactions(qs, query, request.user.pk)
+    if export_format == "csv":
+        response = StreamingHttpResponse(_csv_stream(qs), content_type="text/csv; charset=utf-8")
+    else:
+        response = StreamingHttpResponse(_jsonl_stream(qs), content_type="application/x-ndjson; charset=utf-8")
+    response["Content-Disposition"] = f'attachment; filename="transactions.{export_format}"'
+    return response
+
+
+def _warn_budget_thresholds(request, transaction, since):
+    # Порог бюджета выставляется тем же UPDATE, что и счётчик (finance/budgets.py);
+    # здесь только сообщаем о порогах, пройденных этой операцией
+    for budget, level in crossed_since(request.user, transaction.category_id, since):
+        period = budget.get_period_display().lower()
+        if level >= 100:
+            messages.warning(request, f"Бюджет «{budget.category.name}» на {period} исчерпан.")
+        else:
+            messages.warning(request, f"Бюджет «{budget.category.name}» на {period} израсходован на {level}%.")
 
 
 @login_required
@@ -154,13 +327,33 @@ def transaction_create_view(request): # Создание новой транза
         if form.is_valid():
             transaction = form.save(commit=False)
             transaction.user = request.user  # Привязка к текущему пользователю
+            # Категория не выбрана — назначаем по правилам пользователя
+            apply_rules(request.user, [transaction])
+            saved_at = timezone.now()
             transaction.save()
+            _warn_budget_thresholds(request, transaction, saved_at)
             return redirect("finance:transactions_list")
     else:
         form = TransactionForm(user=request.user)  # Показать пустую форму
     return render(request, "finance/transaction_form.html", {"form": form})
 
 
+@login_required
+@require_http_methods(["GET", "POST"])
+def transaction_import_view(request): # Загрузка CSV-выписки банка; импорт идёт в фоне
+    if request.method == "POST":
+        form = TransactionImportForm(request.POST, request.FILES)
+        if form.is_valid():
+            upload = form.cleaned_data["file"]
+            enqueue(request.user, "import_statement", upload=upload, name=upload.name, digest=form.digest)
+            messages.info(request, "Выписка загружена и импортируется, результат появится ниже.")
+            return redirect("finance:transaction_import")
+    else:
+        form = TransactionImportForm()
+    jobs = list(Job.objects.filter(user=request.user, kind="import_statement").order_by("-id")[:5])
+    return render(request, "finance/transaction_import.html", {"form": form, "jobs": jobs})
+
+
 @login_required
 @require_http_methods(["GET", "POST"])
 def transaction_update_view(request, pk): # Редактирование транзакции по ее id (pk)
@@ -172,7 +365,9 @@ def transaction_update_view(request, pk): # Редактирование тра
             user=request.user,
         )
         if form.is_valid():
-            form.save()
+            saved_at = timezone.now()
+            transaction = form.save()
+            _warn_budget_thresholds(request, transaction, saved_at)
             return redirect("finance:transactions_list")
     else:
         form = TransactionForm(instance=transaction, user=request.user)
@@ -201,7 +396,7 @@ def goal_create_view(request):# Создание новой финансовой
         if form.is_valid():
             goal = form.save(commit=False)
             goal.user = request.user
-            goal.save()
+            save_goal(goal)  # начальная сумма попадает в журнал взносов
             return redirect("finance:goals_list")
     else:
         form = GoalForm()
@@ -213,10 +408,11 @@ def goal_create_view(request):# Создание новой финансовой
 def goal_update_view(request, pk):# Редактирование финансовой цели
     goal = get_object_or_404(Goal, pk=pk, user=request.user)
     completed_before = goal.is_completed
+    previous_amount = goal.current_amount
     if request.method == "POST":
         form = GoalForm(request.POST, instance=goal)
         if form.is_valid():
-            goal = form.save()
+            goal = save_goal(form.save(commit=False), form.shown_amount(previous_amount))
             completed_after = goal.is_completed
             message = None # Если цель стала достигнутой после редактирования — показать сообщение успеха
             if not completed_before and completed_after:
@@ -240,52 +436,264 @@ def goal_delete_view(request, pk):
 
 
 @login_required
-def analytics_view(request):
-    user = request.user# Отображение страницы аналитики финансов
+@require_http_methods(["GET", "POST"])
+def budgets_list_view(request): # Бюджеты пользователя и форма установки лимита
+    if request.method == "POST":
+        form = BudgetForm(request.POST, user=request.user)
+        if form.is_valid():
+            # Лимит для уже заданных категории и периода просто меняется
+            Budget.objects.update_or_create(
+                user=request.user,
+                category=form.cleaned_data["category"],
+                period=form.cleaned_data["period"],
+                defaults={"limit": form.cleaned_data["limit"]},
+            )
+            return redirect("finance:budgets_list")
+    else:
+        form = BudgetForm(user=request.user)
+    return render(
+        request,
+        "finance/budgets_list.html",
+        {"budgets": current_budgets(request.user), "form": form},
+    )
+
+
+@login_required
+@require_http_methods(["POST"]) # Удаление бюджета вместе с его счётчиками
+def budget_delete_view(request, pk):
+    budget = get_object_or_404(Budget, pk=pk, user=request.user)
+    budget.delete()
+    return redirect("finance:budgets_list")
+
+
+@login_required
+@require_http_methods(["GET", "POST"])
+def rules_list_view(request): # Правила автокатегоризации и форма добавления
+    if request.method == "POST":
+        form = CategoryRuleForm(request.POST, user=request.user)
+        if form.is_valid():
+            # Правило с тем же текстом заменяется
+            CategoryRule.objects.update_or_create(
+                user=request.user,
+                pattern=form.cleaned_data["pattern"],
+                defaults={"category": form.cleaned_data["category"], "priority": form.cleaned_data["priority"]},
+            )
+            return redirect("finance:rules_list")
+    else:
+        form = CategoryRuleForm(user=request.user)
+    rules = CategoryRule.objects.filter(user=request.user).select_related("category").order_by("priority", "id")
+    # Последнее применение правил к истории (фоновая задача)
+    job = Job.objects.filter(user=request.user, kind="recategorize").first()
+    return render(request, "finance/rules_list.html", {"rules": rules, "form": form, "job": job})
+
+
+@login_required
+@require_http_methods(["POST"])
+def rule_delete_view(request, pk):
+    rule = get_object_or_404(CategoryRule, pk=pk, user=request.user)
+    rule.delete()
+    return redirect("finance:rules_list")
+
+
+@login_required
+@require_http_methods(["POST"]) # Применение правил к операциям без категории
+def rules_apply_view(request):
+    enqueue(request.user, "recategorize")
+    messages.info(request, "Правила применяются к операциям в фоне.")
+    return redirect("finance:rules_list")
+
+
+@login_required
+@require_GET # Категории пользователя и ход их фонового удаления
+def categories_list_view(request):
+    tasks = list(DeletionTask.objects.filter(user=request.user, kind="category").order_by("-id")[:10])
+    deleting = [task.object_id for task in tasks if not task.is_finished]
+    categories = Category.objects.filter(user=request.user).exclude(pk__in=deleting).order_by("-is_income", "name")
+    return render(request, "finance/categories_list.html", {"categories": categories, "tasks": tasks})
+
+
+@login_required
+@require_http_methods(["POST"]) # Удаление категории пачками в фоне
+def category_delete_view(request, pk):
+    category = get_object_or_404(Category, pk=pk, user=request.user)
+    schedule_category_deletion(category)
+    messages.info(request, f"Категория «{category.name}» удаляется, её операции станут «Без категории».")
+    return redirect("finance:categories_list")
 
-    year_str = request.GET.get("year")
-    selected_year = None
-    if year_str and year_str.isdigit():
-        selected_year = int(year_str)
 
-    from .services import expenses_by_category_qs, monthly_balance_qs, available_years_qs
+@login_required
+@require_GET # Состояние фоновой задачи для опроса со страницы
+def job_status_view(request, pk):
+    job = get_object_or_404(Job, pk=pk, user=request.user)
+    return JsonResponse({
+        "id": job.pk,
+        "kind": job.kind,
+        "status": job.status,
+        "status_display": job.get_status_display(),
+        "attempts": job.attempts,
+        "max_attempts": job.max_attempts,
+        "run_at": job.run_at.isoformat(),
+        "result": job.result,
+        "error": job.error,
+    })
 
-    by_cat = expenses_by_category_qs(user)
-    by_month = monthly_balance_qs(user, year=selected_year)
 
-    if by_cat["labels"] and by_cat["data"]:
-        max_value = max(by_cat["data"])
-        max_index = by_cat["data"].index(max_value)
-        main_category = by_cat["labels"][max_index]
+@login_required
+@require_GET # Прогресс фонового удаления для опроса со страницы
+def deletion_status_view(request, pk):
+    task = get_object_or_404(DeletionTask, pk=pk, user=request.user)
+    return JsonResponse({
+        "id": task.pk,
+        "kind": task.kind,
+        "status": task.status,
+        "status_display": task.get_status_display(),
+        "processed": task.processed,
+        "total": task.total,
+        "percent": round(task.progress_percent, 1),
+    })
+
+
+@login_required
+@require_http_methods(["GET", "POST"]) # Удаление аккаунта: данные удаляются в фоне
+def account_delete_view(request):
+    if request.method == "POST":
+        form = AccountDeleteForm(request.POST, user=request.user)
+        if form.is_valid():
+            schedule_user_deletion(request.user)
+            logout(request)
+            messages.info(request, "Аккаунт удаляется. Все данные будут удалены в течение нескольких минут.")
+            return redirect("login")
     else:
-        main_category = None
+        form = AccountDeleteForm(user=request.user)
+    return render(request, "finance/account_delete.html", {"form": form})
 
-    years = available_years_qs(user)
+
+@async_login_required
+@replica_reads
+async def analytics_view(request):
+    user = request.user# Отображение страницы аналитики финансов
+
+    selected_year = _parse_year(request)
+    # Графики подгружаются из chart_*_view, здесь каркас страницы и итоги за год;
+    # список годов берётся из кеша аналитики (синхронный API кеша — в потоке)
+    years, totals, rebuild_job = await asyncio.gather(
+        sync_to_async(available_years_qs)(user),
+        ayear_totals(user, selected_year),
+        Job.objects.filter(user=user, kind="rebuild_analytics").afirst(),  # Последний пересчёт в фоне
+    )
 
     return render(
         request,
         "finance/analytics.html",
         {
-            "by_cat": by_cat,
-            "by_month": by_month,
-            "main_category": main_category,
             "years": years,
             "selected_year": selected_year,
+            "rebuild_job": rebuild_job,
+            **totals,
         },
     )
 
 
+@login_required
+@require_http_methods(["POST"]) # Пересборка сводок, итогов по дням и счётчиков бюджетов в фоне
+def analytics_rebuild_view(request):
+    enqueue(request.user, "rebuild_analytics")
+    messages.info(request, "Аналитика пересчитывается в фоне.")
+    return redirect("finance:analytics")
+
+
+def _parse_year(request):
+    year_str = request.GET.get("year")
+    if year_str and year_str.isdigit():
+        return int(year_str)
+    return None
+
+
+# ETag данных графика: путь, параметры запроса и версия данных пользователя,
+# которая меняется при любом изменении его операций, категорий и целей
+def _chart_etag(request, *args, **kwargs):
+    if not request.user.is_authenticated:
+        return None
+    raw = f"{request.path}?{request.GET.urlencode()}:{data_version(request.user.pk)}"
+    return hashlib.md5(raw.encode("utf-8")).hexdigest()
+
+
+def chart_data_view(view):
+    # JSON с данными графика: только GET, условный запрос по ETag (304 Not Modified),
+    # приватный кеш браузера с обязательной перепроверкой; данные читаются из реплики
+    return login_required(
+        require_GET(
+            cache_control(private=True, no_cache=True)(condition(etag_func=_chart_etag)(replica_reads(view)))
+        )
+    )
+
+
+@chart_data_view
+def dashboard_chart_view(request):
+    today = datetime.today().date()
+    filters = _parse_filters(request, default_from=today.replace(day=1), default_to=today)
+    summary = dashboard_summary_qs(request.user, **filters)
+    # Суммы страница уже показывает из итогов по дням (adashboard_totals) — здесь только диаграмма
+    return JsonResponse({"chart_labels": summary["chart_labels"], "chart_data": summary["chart_data"]})
+
+
+@chart_data_view
+def expenses_by_category_chart_view(request):
+    return JsonResponse(expenses_by_category_qs(request.user))
+
+
+@chart_data_view
+def monthly_balance_chart_view(request):
+    return JsonResponse(monthly_balance_qs(request.user, year=_parse_year(request)))
+
+
+@chart_data_view
+def cash_flow_chart_view(request):
+    # ?period=day|week|month, период date_from/date_to (по умолчанию — последний
+    # год) и points — сколько точек помещается в график
+    today = datetime.today().date()
+    date_from = _parse_date(request.GET.get("date_from"), today - timedelta(days=365))
+    # Операций в будущем не бывает: дальше сегодняшнего дня ряд не строится
+    date_to = min(_parse_date(request.GET.get("date_to"), today), today)
+    period = request.GET.get("period")
+    if period not in CASH_FLOW_PERIODS:
+        period = "day"
+    points = request.GET.get("points", "")
+    max_points = min(int(points), CASH_FLOW_MAX_POINTS) if points.isdigit() and int(points) > 1 else CASH_FLOW_MAX_POINTS
+    try:
+        flow = cash_flow_qs(request.user, date_from, date_to, period=period, max_points=max_points)
+    except ValueError as exc:
+        return HttpResponseBadRequest(str(exc))
+    return JsonResponse(flow)
+
+
+@chart_data_view
+def goal_savings_chart_view(request, pk):
+    data = goal_savings_qs(request.user, pk)
+    if data is None:
+        raise Http404
+    return JsonResponse(data)
+
+
 @login_required
 @require_http_methods(["POST"])
 def goal_add_amount_view(request, pk):
-    goal = get_object_or_404(Goal, pk=pk, user=request.user)
-    # Добавление суммы к финансовой цели
-    if goal.is_completed:
-        return redirect("finance:goals_list")
-
+    # Добавление суммы к финансовой цели: взнос в журнал и атомарное увеличение
+    # накоплений в БД, без чтения и пересохранения всей цели
     form = GoalAddAmountForm(request.POST)
-    if form.is_valid():# Если цель уже достигнута, переадресуем на список целей
-        amount = form.cleaned_data["amount"]# Увеличиваем текущую сумму накоплений по цели
-        goal.current_amount = goal.current_amount + amount
-        goal.save()
+    if not form.is_valid():
+        get_object_or_404(Goal, pk=pk, user=request.user)
+        messages.error(request, "Взнос не добавлен: " + " ".join(form.errors.get("amount", [])))
+        return redirect("finance:goals_list")
+    result = add_contribution(request.user, pk, form.cleaned_data["amount"])
+    if result is None:
+        # Чужая или несуществующая цель — 404; уже достигнутая — просто к списку
+        get_object_or_404(Goal, pk=pk, user=request.user)
+    elif result.completed:
+        messages.success(request, "Ваша цель достигнута, вы можете воплотить её!")
     return redirect("finance:goals_list")
+
+
+@staff_member_required # Счётчики попаданий/промахов кеша аналитики для мониторинга
+def cache_stats_view(request):
+    return JsonResponse(cache_stats())